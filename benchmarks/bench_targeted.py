@@ -0,0 +1,57 @@
+"""targeted モードと diarize モードの声紋解析ステップの比較ベンチマーク
+
+合成音声に対して、フォールバック話者分離 → セグメント照合（diarize）と、
+ウィンドウごとの直接照合（targeted）の所要時間を比較する。
+
+使い方:
+    python -m benchmarks.bench_targeted --minutes 20
+"""
+
+import argparse
+import time
+
+from benchmarks.bench_diarizer import SAMPLE_RATE, synth_conversation
+from src.audio.diarizer import Diarizer
+from src.audio.slicer import AudioSlicer
+from src.audio.targeted import TargetedDetector
+from src.audio.vad import detect_speech
+from src.audio.voice_matcher import VoiceMatcher
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, default=20.0, help="合成音声の長さ（分）")
+    args = parser.parse_args()
+
+    wav = synth_conversation(args.minutes, seed=1)
+    matcher = VoiceMatcher(threshold=0.75)
+    # 基準話者として冒頭 30 秒の声紋を登録する
+    matcher.reference_embeddings = {"person_a": matcher.embed_wav(wav[:30 * SAMPLE_RATE],
+                                                                  SAMPLE_RATE)}
+    mask = detect_speech(wav, SAMPLE_RATE)
+    diarizer = Diarizer(use_pyannote=False, clustering="auto")
+    detector = TargetedDetector(matcher)
+    detector.detect(wav[:10 * SAMPLE_RATE], SAMPLE_RATE)  # ウォームアップ
+
+    start = time.perf_counter()
+    segments = diarizer.diarize(wav, SAMPLE_RATE, speech_mask=mask)
+    slicer = AudioSlicer(wav, sample_rate=SAMPLE_RATE)
+    matcher.compare_segments([
+        {"start": s.start, "end": s.end, "wav": slicer.slice(s.start, s.end),
+         "sample_rate": SAMPLE_RATE}
+        for s in segments
+    ])
+    diarize_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    detector.detect(wav, SAMPLE_RATE, mask)
+    targeted_sec = time.perf_counter() - start
+
+    print(f"音声長: {args.minutes:.1f} 分")
+    print(f"diarize:  {diarize_sec:8.1f} 秒 ({len(segments)} セグメント)")
+    print(f"targeted: {targeted_sec:8.1f} 秒")
+    print(f"高速化:   {diarize_sec / targeted_sec:8.1f} 倍")
+
+
+if __name__ == "__main__":
+    main()
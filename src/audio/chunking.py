@@ -0,0 +1,169 @@
+"""長時間音声の分割話者分離 - 重なりのあるチャンクに分けて処理し、話者を声紋でつなぐ"""
+
+import logging
+from dataclasses import dataclass, field
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChunkPlan:
+    """1チャンクの処理範囲と担当範囲（秒）"""
+    start: float        # 処理する範囲（前後のチャンクと重なる）
+    end: float
+    own_start: float    # 結果を採用する範囲（重なりの中央で隣と分ける）
+    own_end: float
+
+
+@dataclass
+class ChunkResult:
+    """1チャンクの話者分離結果（時刻は元の時間軸）"""
+    plan: ChunkPlan
+    segments: list[tuple[float, float, str]]
+    embeddings: dict[str, np.ndarray] = field(default_factory=dict)
+
+
+def plan_chunks(duration: float, chunk_sec: float, overlap_sec: float) -> list[ChunkPlan]:
+    """音声全体を overlap_sec ずつ重なる chunk_sec 秒のチャンクに分ける。
+
+    Raises:
+        ValueError: 重なりがチャンク長以上の場合
+    """
+    if overlap_sec >= chunk_sec:
+        raise ValueError(f"重なり({overlap_sec}秒)はチャンク長({chunk_sec}秒)より短くしてください")
+    if duration <= chunk_sec:
+        return [ChunkPlan(0.0, duration, 0.0, duration)]
+
+    step = chunk_sec - overlap_sec
+    starts = [0.0]
+    while starts[-1] + chunk_sec < duration:
+        starts.append(starts[-1] + step)
+
+    plans = []
+    for i, start in enumerate(starts):
+        last = i == len(starts) - 1
+        end = duration if last else start + chunk_sec
+        plans.append(ChunkPlan(
+            start=start,
+            end=end,
+            own_start=0.0 if i == 0 else start + overlap_sec / 2,
+            own_end=duration if last else end - overlap_sec / 2,
+        ))
+    return plans
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.nan_to_num(np.asarray(vector, dtype=np.float64).reshape(-1))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def stitch_chunks(chunks: list[ChunkResult], max_speakers: int,
+                  threshold: float = 0.5) -> tuple[list[tuple[float, float, str]],
+                                                   dict[str, np.ndarray]]:
+    """チャンクごとの話者ラベルを声紋ベクトルの類似度で全体の話者に対応付ける。
+
+    各チャンクの話者を、それまでに見つかった全体話者（発話時間で重み付けした
+    声紋の平均）と貪欲に対応付け、類似度が threshold 未満なら新しい話者とする。
+    全体話者が max_speakers を超えた場合は最も似た組から統合する。
+
+    Args:
+        chunks: 時系列順のチャンク結果
+        max_speakers: 最大話者数
+        threshold: 同一話者とみなす最低コサイン類似度
+
+    Returns:
+        ([(開始, 終了, 話者ラベル), ...], {話者ラベル: 声紋ベクトル})。
+        ラベルは初出順に "SPEAKER_00", "SPEAKER_01", ...
+    """
+    sums: list[np.ndarray] = []     # 全体話者ごとの 声紋×発話時間 の和
+    weights: list[float] = []
+    pieces: list[tuple[float, float, int]] = []
+
+    for chunk in chunks:
+        plan = chunk.plan
+        owned = [
+            (max(s, plan.own_start), min(e, plan.own_end), label)
+            for s, e, label in chunk.segments
+            if min(e, plan.own_end) > max(s, plan.own_start)
+        ]
+        durations: dict[str, float] = {}
+        for s, e, label in owned:
+            durations[label] = durations.get(label, 0.0) + (e - s)
+
+        local_labels = list(durations)
+        local_vecs = [_unit(chunk.embeddings[l]) if l in chunk.embeddings else None
+                      for l in local_labels]
+
+        mapping: dict[str, int] = {}
+        known = [g for g, v in enumerate(sums) if v is not None]
+        if known:
+            centroids = np.array([_unit(sums[g]) for g in known])
+            candidates = []
+            for i, vec in enumerate(local_vecs):
+                if vec is None or not vec.any():
+                    continue
+                for g, sim in zip(known, centroids @ vec):
+                    if sim >= threshold:
+                        candidates.append((float(sim), i, g))
+            used = set()
+            for sim, i, g in sorted(candidates, reverse=True):
+                if local_labels[i] not in mapping and g not in used:
+                    mapping[local_labels[i]] = g
+                    used.add(g)
+
+        for label, vec in zip(local_labels, local_vecs):
+            if label not in mapping:
+                mapping[label] = len(sums)
+                sums.append(np.zeros_like(vec) if vec is not None else None)
+                weights.append(0.0)
+            g = mapping[label]
+            if vec is not None:
+                sums[g] = vec * durations[label] if sums[g] is None else sums[g] + vec * durations[label]
+            weights[g] += durations[label]
+
+        pieces.extend((s, e, mapping[label]) for s, e, label in owned)
+
+    # 全体話者が多すぎる場合は最も似た組から統合する
+    parent = list(range(len(sums)))
+    active = list(range(len(sums)))
+    while len(active) > max_speakers:
+        best = None
+        for a_idx, a in enumerate(active):
+            for b in active[a_idx + 1:]:
+                va = _unit(sums[a]) if sums[a] is not None else None
+                vb = _unit(sums[b]) if sums[b] is not None else None
+                sim = float(va @ vb) if va is not None and vb is not None else -1.0
+                if best is None or sim > best[0]:
+                    best = (sim, a, b)
+        _, a, b = best
+        if sums[b] is not None:
+            sums[a] = sums[b] if sums[a] is None else sums[a] + sums[b]
+        weights[a] += weights[b]
+        parent[b] = a
+        active.remove(b)
+
+    def root(g: int) -> int:
+        while parent[g] != g:
+            g = parent[g]
+        return g
+
+    # 初出順にラベルを振り、チャンク境界で分かれた同一話者の区間をつなぐ
+    names: dict[int, str] = {}
+    segments: list[tuple[float, float, str]] = []
+    for s, e, g in sorted(pieces):
+        name = names.setdefault(root(g), f"SPEAKER_{len(names):02d}")
+        if segments and segments[-1][2] == name and s - segments[-1][1] <= 1e-6:
+            segments[-1] = (segments[-1][0], max(segments[-1][1], e), name)
+        else:
+            segments.append((s, e, name))
+
+    embeddings = {
+        name: (sums[g] / weights[g]).astype(np.float32)
+        for g, name in names.items()
+        if sums[g] is not None and weights[g] > 0
+    }
+    logger.debug("チャンク結合: %d チャンク → %d 話者", len(chunks), len(names))
+    return segments, embeddings
@@ -0,0 +1,128 @@
+"""声紋ベクトルのクラスタリング - 長時間音声でもメモリが線形に収まる手法を含む"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("auto", "ward", "minibatch_kmeans", "two_stage")
+# auto で ward を使うウィンドウ数の上限（距離行列 約 n²/2 × 8 バイト ≒ 100MB）
+WARD_MAX_WINDOWS = 5000
+
+
+def cluster_embeddings(embeddings: np.ndarray, max_speakers: int,
+                       engine: str = "auto", seed: int = 0) -> list[int]:
+    """声紋ベクトルを最大 max_speakers 個のクラスタに分ける。
+
+    Args:
+        embeddings: (ウィンドウ数 × 次元) の声紋ベクトル
+        max_speakers: 最大クラスタ数
+        engine: "ward" / "minibatch_kmeans" / "two_stage" / "auto"
+            （auto はウィンドウ数が WARD_MAX_WINDOWS 以下なら ward、超えれば two_stage）
+        seed: 乱数シード（k-means 系のみ）
+
+    Returns:
+        ウィンドウごとのクラスタ番号（0 始まり）
+
+    Raises:
+        ValueError: 未知のエンジン名
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"未対応のクラスタリング手法です: {engine}（{' / '.join(ENGINES)}）")
+    if len(embeddings) <= 1:
+        return [0] * len(embeddings)
+
+    if engine == "auto":
+        engine = "ward" if len(embeddings) <= WARD_MAX_WINDOWS else "two_stage"
+    logger.debug("クラスタリング: %s (%d ウィンドウ, 最大 %d 話者)",
+                 engine, len(embeddings), max_speakers)
+
+    if engine == "ward":
+        return ward(embeddings, max_speakers)
+    if engine == "minibatch_kmeans":
+        return minibatch_kmeans(embeddings, max_speakers, seed=seed)
+    return two_stage(embeddings, max_speakers)
+
+
+def ward(embeddings: np.ndarray, max_speakers: int) -> list[int]:
+    """ward 法の階層的クラスタリング（O(n²) メモリ）"""
+    from scipy.cluster.hierarchy import fcluster, linkage
+
+    if len(embeddings) <= 1:
+        return [0] * len(embeddings)
+
+    linkage_matrix = linkage(embeddings, method="ward")
+    labels = fcluster(linkage_matrix, t=max_speakers, criterion="maxclust")
+    return [int(l) - 1 for l in labels]
+
+
+def _relabel(labels: np.ndarray) -> list[int]:
+    """クラスタ番号を出現順に 0, 1, 2, ... と振り直す"""
+    mapping: dict[int, int] = {}
+    return [mapping.setdefault(int(l), len(mapping)) for l in labels]
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, block: int = 4096) -> np.ndarray:
+    """各ベクトルに最も近い（ユークリッド距離）セントロイドの番号"""
+    sq_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block):
+        chunk = vectors[start:start + block]
+        labels[start:start + len(chunk)] = np.argmin(sq_norms - 2 * chunk @ centroids.T, axis=1)
+    return labels
+
+
+def minibatch_kmeans(embeddings: np.ndarray, max_speakers: int, batch_size: int = 1024,
+                     n_iter: int = 100, seed: int = 0) -> list[int]:
+    """ミニバッチ k-means（O(n·k) 時間・O(n) メモリ）。
+
+    k-means++ で初期化し、ランダムなミニバッチごとにセントロイドを
+    割り当て回数に応じた学習率で更新する。
+    """
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    k = min(max_speakers, len(vectors))
+    rng = np.random.default_rng(seed)
+
+    # k-means++ 初期化
+    centroids = [vectors[rng.integers(len(vectors))]]
+    dist = ((vectors - centroids[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        if dist.sum() <= 0:
+            break
+        centroids.append(vectors[rng.choice(len(vectors), p=dist / dist.sum())])
+        dist = np.minimum(dist, ((vectors - centroids[-1]) ** 2).sum(axis=1))
+    centroids = np.array(centroids)
+    counts = np.zeros(len(centroids))
+
+    for _ in range(n_iter):
+        batch = vectors[rng.integers(len(vectors), size=min(batch_size, len(vectors)))]
+        labels = _nearest(batch, centroids)
+        for c in np.unique(labels):
+            members = batch[labels == c]
+            counts[c] += len(members)
+            lr = len(members) / counts[c]
+            centroids[c] = (1 - lr) * centroids[c] + lr * members.mean(axis=0)
+
+    return _relabel(_nearest(vectors, centroids))
+
+
+def two_stage(embeddings: np.ndarray, max_speakers: int, chunk_size: int = 2000,
+              sub_clusters: int = 16) -> list[int]:
+    """2段階クラスタリング（O(chunk_size²) メモリ）。
+
+    時系列順のチャンクごとに ward 法で sub_clusters 個の小クラスタを作り、
+    全チャンクの小クラスタのセントロイドを改めて ward 法で max_speakers 個にまとめる。
+    """
+    vectors = np.asarray(embeddings, dtype=np.float64)
+    sub_labels = np.empty(len(vectors), dtype=np.int64)
+    centroids = []
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        labels = np.array(ward(chunk, min(sub_clusters, len(chunk))))
+        for local in np.unique(labels):
+            sub_labels[start:start + len(chunk)][labels == local] = len(centroids)
+            centroids.append(chunk[labels == local].mean(axis=0))
+
+    merged = np.array(ward(np.array(centroids), max_speakers))
+    return _relabel(merged[sub_labels])
@@ -1,5 +1,6 @@
 """話者ダイアライゼーション - 音声内の話者交代を検出し時間区間で分離"""
 
+import hashlib
 import logging
 import tempfile
 from dataclasses import dataclass
@@ -8,6 +9,12 @@ from pathlib import Path
 import numpy as np
 from resemblyzer import VoiceEncoder, preprocess_wav
 
+from src.audio.chunking import ChunkResult, plan_chunks, stitch_chunks
+from src.audio.clustering import ENGINES, cluster_embeddings
+from src.audio.embedding import embed_windows, normalize_wav
+from src.audio.vad import SpeechMask
+from src.models import PYANNOTE_DIARIZATION, PYANNOTE_EMBEDDING, VOICE_ENCODER, registry
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,6 +30,70 @@ class SpeakerSegment:
         return self.end - self.start
 
 
+def _acquire_embedding_inference(hf_token: str | None):
+    """pyannote の話者埋め込みモデル（音声全体を1ベクトルにする Inference）を取得する。
+
+    使い終わったら registry.release(PYANNOTE_EMBEDDING) で返却すること。
+    """
+    from pyannote.audio import Inference, Model
+
+    return registry.acquire(
+        PYANNOTE_EMBEDDING,
+        lambda: Inference(Model.from_pretrained(PYANNOTE_EMBEDDING, use_auth_token=hf_token),
+                          window="whole"),
+    )
+
+
+def embed_waveform(wav: np.ndarray, sample_rate: int,
+                   hf_token: str | None = None) -> np.ndarray | None:
+    """メモリ上の波形全体を pyannote の話者埋め込みモデルでベクトル化する。
+
+    embed_reference_files と同じ空間のベクトルになる。波形が空なら None。
+    """
+    if len(wav) == 0:
+        return None
+    import torch
+
+    inference = _acquire_embedding_inference(hf_token)
+    try:
+        embedding = inference({
+            "waveform": torch.from_numpy(np.ascontiguousarray(wav, dtype=np.float32))[None, :],
+            "sample_rate": sample_rate,
+        })
+    finally:
+        registry.release(PYANNOTE_EMBEDDING)
+    return np.asarray(embedding, dtype=np.float32).reshape(-1)
+
+
+def embed_reference_files(paths: list[str], hf_token: str | None = None) -> np.ndarray:
+    """基準音声ファイルを pyannote の話者埋め込みモデルでベクトル化する。
+
+    Diarizer.diarize_with_embeddings が返す声紋ベクトルと同じ空間になるため、
+    model="pyannote" の話者ストア構築に使う。
+
+    Returns:
+        (ファイル数 × 次元) の float32 行列。読み込めないファイルの行はゼロベクトル
+    """
+    inference = _acquire_embedding_inference(hf_token)
+    rows: list[np.ndarray | None] = []
+    try:
+        for path in paths:
+            try:
+                rows.append(np.asarray(inference(str(path)), dtype=np.float32).reshape(-1))
+            except Exception as e:
+                logger.warning("基準音声の埋め込みに失敗: %s (%s)", path, e)
+                rows.append(None)
+    finally:
+        registry.release(PYANNOTE_EMBEDDING)
+
+    dim = next((len(r) for r in rows if r is not None), 0)
+    matrix = np.zeros((len(rows), dim), dtype=np.float32)
+    for i, row in enumerate(rows):
+        if row is not None:
+            matrix[i] = row
+    return matrix
+
+
 class Diarizer:
     """話者ダイアライゼーションを行うクラス。
 
@@ -31,17 +102,34 @@ class Diarizer:
     """
 
     def __init__(self, max_speakers: int = 3, min_segment_duration: float = 1.0,
-                 use_pyannote: bool = True, hf_token: str | None = None):
+                 use_pyannote: bool = True, hf_token: str | None = None,
+                 clustering: str = "auto", cache=None, chunk_sec: float | None = None,
+                 chunk_overlap_sec: float = 30.0, stitch_threshold: float = 0.5):
         """
         Args:
             max_speakers: 最大話者数
             min_segment_duration: 最短セグメント長（秒）
             use_pyannote: pyannote-audio を使用するか
             hf_token: HuggingFace トークン（pyannote使用時に必要）
+            clustering: フォールバック時のクラスタリング手法
+                （"auto" / "ward" / "minibatch_kmeans" / "two_stage"）
+            cache: DiarizationCache インスタンス（省略時はキャッシュ無効）
+            chunk_sec: pyannote に一度に渡す最大の長さ（秒）。これより長い波形は
+                重なりのあるチャンクに分けて処理する（None で分割しない）
+            chunk_overlap_sec: 隣り合うチャンクの重なり（秒）
+            stitch_threshold: チャンク間で同一話者とみなす声紋の最低コサイン類似度
         """
+        if clustering not in ENGINES:
+            raise ValueError(f"未対応のクラスタリング手法です: {clustering}")
         self.max_speakers = max_speakers
         self.min_segment_duration = min_segment_duration
+        self.clustering = clustering
+        self.cache = cache
+        self.chunk_sec = chunk_sec
+        self.chunk_overlap_sec = chunk_overlap_sec
+        self.stitch_threshold = stitch_threshold
         self.pipeline = None
+        self.encoder = None
 
         if use_pyannote:
             try:
@@ -54,52 +142,209 @@ class Diarizer:
         """pyannote-audio パイプラインを初期化"""
         from pyannote.audio import Pipeline
 
-        self.pipeline = Pipeline.from_pretrained(
-            "pyannote/speaker-diarization-3.1",
-            use_auth_token=hf_token,
+        self.pipeline = registry.acquire(
+            PYANNOTE_DIARIZATION,
+            lambda: Pipeline.from_pretrained(PYANNOTE_DIARIZATION, use_auth_token=hf_token),
         )
 
-    def diarize(self, audio_path: str) -> list[SpeakerSegment]:
-        """音声ファイルの話者ダイアライゼーションを実行。
+    def _ensure_encoder(self):
+        """フォールバック用 VoiceEncoder を共有レジストリから取得する（初回のみ）"""
+        if self.encoder is None:
+            self.encoder = registry.acquire(VOICE_ENCODER, VoiceEncoder)
+        return self.encoder
+
+    def close(self) -> None:
+        """共有レジストリから取得したモデルを返却する。"""
+        if self.pipeline is not None:
+            registry.release(PYANNOTE_DIARIZATION)
+            self.pipeline = None
+        if self.encoder is not None:
+            registry.release(VOICE_ENCODER)
+            self.encoder = None
+
+    def diarize(self, audio: str | np.ndarray, sample_rate: int = 16000,
+                speech_mask: SpeechMask | None = None) -> list[SpeakerSegment]:
+        """音声の話者ダイアライゼーションを実行。
 
         Args:
-            audio_path: WAVファイルのパス
+            audio: WAVファイルのパス、またはメモリ上のモノラル float32 波形
+            sample_rate: audio が波形の場合のサンプリングレート
+            speech_mask: 音声区間マスク（波形指定時のみ有効）。指定時は音声区間だけを
+                連結して処理し、結果の時刻を元の時間軸に戻す
 
         Returns:
             SpeakerSegment のリスト（時系列順）
         """
+        return self.diarize_with_embeddings(audio, sample_rate, speech_mask)[0]
+
+    def diarize_with_embeddings(
+        self, audio: str | np.ndarray, sample_rate: int = 16000,
+        speech_mask: SpeechMask | None = None,
+    ) -> tuple[list[SpeakerSegment], dict[str, np.ndarray]]:
+        """話者ダイアライゼーションを行い、話者ごとの声紋ベクトルも返す。
+
+        声紋ベクトルは pyannote 使用時のみ得られる（埋め込みモデルは
+        models.PYANNOTE_EMBEDDING）。フォールバック時は空の辞書を返す。
+
+        Returns:
+            (SpeakerSegment のリスト, {話者ラベル: 声紋ベクトル})
+        """
+        if self.cache is None:
+            return self._diarize_audio(audio, sample_rate, speech_mask)
+
+        key = self._cache_key(audio, sample_rate, speech_mask)
+        cached = self.cache.get_entry(key)
+        if cached is not None:
+            segments, embeddings = cached
+            logger.info("話者分離キャッシュを使用します (%d セグメント)", len(segments))
+            return ([SpeakerSegment(start=s, end=e, speaker_label=l) for s, e, l in segments],
+                    embeddings)
+
+        segments, embeddings = self._diarize_audio(audio, sample_rate, speech_mask)
+        self.cache.put(key, [(seg.start, seg.end, seg.speaker_label) for seg in segments],
+                       embeddings)
+        return segments, embeddings
+
+    @property
+    def backend(self) -> str:
+        """使用中の分離バックエンド名（キャッシュキーに使う）"""
+        if self.pipeline is not None:
+            return PYANNOTE_DIARIZATION
+        return f"resemblyzer/{self.clustering}"
+
+    def _cache_key(self, audio: str | np.ndarray, sample_rate: int,
+                   speech_mask: SpeechMask | None) -> str:
+        """音声内容と分離パラメータからキャッシュキーを作る"""
+        from src.cache import DiarizationCache, audio_fingerprint
+
+        params = {}
+        if speech_mask is not None and isinstance(audio, np.ndarray):
+            params["speech_mask"] = hashlib.blake2b(
+                np.ascontiguousarray(speech_mask.intervals, dtype=np.float64).tobytes(),
+                digest_size=16,
+            ).hexdigest()
+        if self.pipeline is not None and self.chunk_sec:
+            params["chunk"] = [self.chunk_sec, self.chunk_overlap_sec, self.stitch_threshold]
+        return DiarizationCache.make_key(
+            audio_fingerprint(audio, sample_rate),
+            backend=self.backend,
+            max_speakers=self.max_speakers,
+            min_segment_duration=self.min_segment_duration,
+            **params,
+        )
+
+    def _diarize_audio(self, audio: str | np.ndarray, sample_rate: int,
+                       speech_mask: SpeechMask | None
+                       ) -> tuple[list[SpeakerSegment], dict[str, np.ndarray]]:
+        if speech_mask is not None and isinstance(audio, np.ndarray):
+            voiced = speech_mask.extract(audio, sample_rate)
+            if len(voiced) == 0:
+                return [], {}
+            segments, embeddings = self._diarize(voiced, sample_rate, trim_silence=False)
+            return self._to_original_timeline(segments, speech_mask, sample_rate), embeddings
+        return self._diarize(audio, sample_rate)
+
+    def _diarize(self, audio: str | np.ndarray, sample_rate: int,
+                 trim_silence: bool = True
+                 ) -> tuple[list[SpeakerSegment], dict[str, np.ndarray]]:
         if self.pipeline is not None:
             logger.info("pyannote-audio でダイアライゼーション実行中...")
-            return self._diarize_pyannote(audio_path)
+            return self._diarize_pyannote(audio, sample_rate)
         logger.info("resemblyzer でダイアライゼーション実行中（フォールバック）...")
-        return self._diarize_resemblyzer(audio_path)
+        return self._diarize_resemblyzer(audio, sample_rate, trim_silence=trim_silence), {}
 
-    def _diarize_pyannote(self, audio_path: str) -> list[SpeakerSegment]:
-        """pyannote-audio による高精度ダイアライゼーション"""
-        diarization = self.pipeline(
-            audio_path,
-            max_speakers=self.max_speakers,
-        )
+    @staticmethod
+    def _to_original_timeline(segments: list[SpeakerSegment], speech_mask: SpeechMask,
+                              sample_rate: int) -> list[SpeakerSegment]:
+        """音声区間だけを連結した時間軸のセグメントを元の時間軸に戻す。
 
-        segments = []
-        for turn, _, speaker in diarization.itertracks(yield_label=True):
-            if turn.duration >= self.min_segment_duration:
-                segments.append(SpeakerSegment(
-                    start=turn.start,
-                    end=turn.end,
-                    speaker_label=speaker,
+        詰めた非音声区間をまたぐセグメントは音声区間ごとに分割する。
+        """
+        mapped = []
+        for seg in segments:
+            for start, end in speech_mask.to_original(seg.start, seg.end, sample_rate):
+                mapped.append(SpeakerSegment(start=start, end=end,
+                                             speaker_label=seg.speaker_label))
+        return mapped
+
+    def _diarize_pyannote(self, audio: str | np.ndarray, sample_rate: int = 16000
+                          ) -> tuple[list[SpeakerSegment], dict[str, np.ndarray]]:
+        """pyannote-audio による高精度ダイアライゼーション
+
+        chunk_sec より長い波形は chunk_overlap_sec ずつ重なるチャンクに分けて
+        1つずつ処理し（ピークメモリはチャンク長で頭打ちになる）、pyannote が返す
+        話者ごとの声紋ベクトルでチャンク間の話者を対応付ける。
+        """
+        duration = len(audio) / sample_rate if isinstance(audio, np.ndarray) else 0.0
+        if not self.chunk_sec or duration <= self.chunk_sec:
+            turns, embeddings = self._run_pyannote(audio, sample_rate)
+        else:
+            plans = plan_chunks(duration, self.chunk_sec, self.chunk_overlap_sec)
+            chunks = []
+            for i, plan in enumerate(plans):
+                logger.debug("pyannote チャンク %d/%d (%.0f〜%.0f秒)",
+                             i + 1, len(plans), plan.start, plan.end)
+                piece = audio[int(plan.start * sample_rate):int(plan.end * sample_rate)]
+                local, local_embeddings = self._run_pyannote(piece, sample_rate)
+                chunks.append(ChunkResult(
+                    plan=plan,
+                    segments=[(s + plan.start, e + plan.start, l) for s, e, l in local],
+                    embeddings=local_embeddings,
                 ))
+            turns, embeddings = stitch_chunks(chunks, self.max_speakers, self.stitch_threshold)
+
+        segments = [
+            SpeakerSegment(start=start, end=end, speaker_label=speaker)
+            for start, end, speaker in turns
+            if end - start >= self.min_segment_duration
+        ]
+        return segments, embeddings
+
+    def _run_pyannote(self, audio: str | np.ndarray, sample_rate: int
+                      ) -> tuple[list[tuple[float, float, str]], dict[str, np.ndarray]]:
+        """pyannote パイプラインを1回実行し、発話区間と話者ごとの声紋ベクトルを返す"""
+        if isinstance(audio, np.ndarray):
+            import torch
+
+            # pyannote はメモリ上の波形を {"waveform": (channel, time), "sample_rate"} で受け付ける
+            audio = {
+                "waveform": torch.from_numpy(np.ascontiguousarray(audio, dtype=np.float32))[None, :],
+                "sample_rate": sample_rate,
+            }
+
+        diarization, centroids = self.pipeline(
+            audio,
+            max_speakers=self.max_speakers,
+            return_embeddings=True,
+        )
 
-        return segments
-
-    def _diarize_resemblyzer(self, audio_path: str) -> list[SpeakerSegment]:
+        turns = [(turn.start, turn.end, speaker)
+                 for turn, _, speaker in diarization.itertracks(yield_label=True)]
+        # centroids の行は diarization.labels() の順。発話の無い話者は NaN になる
+        embeddings = {
+            label: np.asarray(centroids[i], dtype=np.float32)
+            for i, label in enumerate(diarization.labels())
+            if i < len(centroids) and np.isfinite(centroids[i]).all()
+        }
+        return turns, embeddings
+
+    def _diarize_resemblyzer(self, audio: str | np.ndarray, sample_rate: int = 16000,
+                             trim_silence: bool = True) -> list[SpeakerSegment]:
         """resemblyzer ベースの簡易ダイアライゼーション（フォールバック）
 
         固定長ウィンドウで音声を分割し、声紋ベクトルのクラスタリングで
-        話者を推定する簡易的な手法。
+        話者を推定する簡易的な手法。ウィンドウの声紋ベクトルはまとめて推論する。
+
+        trim_silence=False の場合は preprocess_wav の無音短縮を行わず、
+        入力と同じ時間軸のまま処理する（VAD で非音声区間を除いた波形向け）。
         """
-        encoder = VoiceEncoder()
-        wav = preprocess_wav(Path(audio_path))
+        encoder = self._ensure_encoder()
+        if isinstance(audio, np.ndarray) and not trim_silence:
+            wav = normalize_wav(audio, sample_rate)
+        elif isinstance(audio, np.ndarray):
+            wav = preprocess_wav(audio, source_sr=sample_rate if sample_rate != 16000 else None)
+        else:
+            wav = preprocess_wav(Path(audio))
 
         if len(wav) == 0:
             return []
@@ -111,26 +356,20 @@ class Diarizer:
         window_samples = int(window_sec * sr)
         step_samples = int(step_sec * sr)
 
-        embeddings = []
-        timestamps = []
-
-        pos = 0
-        while pos + window_samples <= len(wav):
-            chunk = wav[pos:pos + window_samples]
-            emb = encoder.embed_utterance(chunk)
-            embeddings.append(emb)
-            timestamps.append(pos / sr)
-            pos += step_samples
-
-        if not embeddings:
+        # 全ウィンドウの声紋ベクトルを1回のバッチ推論で求める
+        embeddings_array, starts = embed_windows(encoder, wav, window_samples, step_samples)
+        if len(starts) == 0:
             return []
+        timestamps = [int(pos) / sr for pos in starts]
 
-        embeddings_array = np.array(embeddings)
-
-        # コサイン類似度に基づく簡易クラスタリング
+        # 声紋ベクトルのクラスタリング（長時間音声では線形メモリの手法に切り替わる）
         labels = self._cluster_embeddings(embeddings_array)
 
-        # ラベルをセグメントに変換
+        return self._labels_to_segments(labels, timestamps, window_sec)
+
+    def _labels_to_segments(self, labels: list[int], timestamps: list[float],
+                            window_sec: float) -> list[SpeakerSegment]:
+        """ウィンドウごとの話者ラベルを連続区間にまとめ、短すぎる区間を除く"""
         segments = []
         current_label = labels[0]
         segment_start = timestamps[0]
@@ -159,14 +398,5 @@ class Diarizer:
         return segments
 
     def _cluster_embeddings(self, embeddings: np.ndarray) -> list[int]:
-        """声紋ベクトルを簡易クラスタリングする（k-means 的手法）"""
-        from scipy.cluster.hierarchy import fcluster, linkage
-
-        if len(embeddings) <= 1:
-            return [0] * len(embeddings)
-
-        # 階層的クラスタリング
-        linkage_matrix = linkage(embeddings, method="ward")
-        labels = fcluster(linkage_matrix, t=self.max_speakers, criterion="maxclust")
-
-        return [int(l) - 1 for l in labels]
+        """声紋ベクトルを最大 max_speakers 個の話者にクラスタリングする"""
+        return cluster_embeddings(embeddings, self.max_speakers, engine=self.clustering)
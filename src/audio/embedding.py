@@ -0,0 +1,164 @@
+"""声紋埋め込みのバッチ推論 - 多数の発話を少数の大きな forward にまとめる"""
+
+import logging
+
+import numpy as np
+
+from src.audio.slicer import pcm_to_float32
+
+logger = logging.getLogger(__name__)
+
+# 1回の forward に載せる部分発話（160フレーム = 1.6秒）の最大数
+DEFAULT_BATCH_SIZE = 256
+
+
+def normalize_wav(wav: np.ndarray, sample_rate: int) -> np.ndarray:
+    """preprocess_wav から無音短縮を除いた前処理（再サンプリング・音量正規化）。
+
+    VAD で非音声区間を除いた波形など、時間軸を保ったまま埋め込みたい場合に使う。
+    """
+    from resemblyzer.audio import normalize_volume
+    from resemblyzer.hparams import audio_norm_target_dBFS, sampling_rate
+
+    wav = pcm_to_float32(wav)
+    if sample_rate != sampling_rate:
+        import librosa
+        wav = librosa.resample(wav, orig_sr=sample_rate, target_sr=sampling_rate)
+    return normalize_volume(wav, audio_norm_target_dBFS, increase_only=True)
+
+
+def forward_mels(encoder, mels: np.ndarray,
+                 batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+    """(N × フレーム数 × メル次元) のメル窓をまとめて VoiceEncoder に通す。
+
+    Args:
+        encoder: resemblyzer.VoiceEncoder
+        mels: 同じフレーム数に揃えたメルスペクトログラム窓
+        batch_size: 1回の forward に載せる窓数の上限
+
+    Returns:
+        (N × 埋め込み次元) の L2 正規化済み埋め込み
+    """
+    import torch
+
+    outputs = []
+    with torch.no_grad():
+        for start in range(0, len(mels), batch_size):
+            batch = torch.from_numpy(np.ascontiguousarray(mels[start:start + batch_size]))
+            outputs.append(encoder(batch.to(encoder.device)).cpu().numpy())
+    return np.concatenate(outputs) if outputs else np.zeros((0, 0), dtype=np.float32)
+
+
+def embed_utterances(encoder, wavs: list[np.ndarray],
+                     batch_size: int = DEFAULT_BATCH_SIZE,
+                     rate: float = 1.3, min_coverage: float = 0.75) -> np.ndarray:
+    """複数の前処理済み発話を一括で埋め込む。
+
+    VoiceEncoder.embed_utterance と同じ部分発話分割・平均・正規化を行うが、
+    全発話の部分発話を連結して batch_size 単位の forward にまとめる。
+
+    Args:
+        encoder: resemblyzer.VoiceEncoder
+        wavs: preprocess_wav 済みの float32 波形のリスト
+        batch_size: 1回の forward に載せる部分発話数の上限
+        rate: 1秒あたりの部分発話数（embed_utterance と同じ意味）
+        min_coverage: 末尾の部分発話を採用する最低被覆率
+
+    Returns:
+        (len(wavs) × 埋め込み次元) の行列。空の波形の行はゼロベクトル
+    """
+    from resemblyzer.audio import wav_to_mel_spectrogram
+
+    partials = []
+    counts = []
+    for wav in wavs:
+        if len(wav) == 0:
+            counts.append(0)
+            continue
+        wav_slices, mel_slices = encoder.compute_partial_slices(len(wav), rate, min_coverage)
+        max_wave_length = wav_slices[-1].stop
+        if max_wave_length >= len(wav):
+            wav = np.pad(wav, (0, max_wave_length - len(wav)), "constant")
+        mel = wav_to_mel_spectrogram(wav)
+        partials.extend(mel[s] for s in mel_slices)
+        counts.append(len(mel_slices))
+
+    if not partials:
+        return np.zeros((len(wavs), 0), dtype=np.float32)
+
+    partial_embeds = forward_mels(encoder, np.stack(partials), batch_size=batch_size)
+    logger.debug("バッチ埋め込み: %d 発話 / %d 部分発話", len(wavs), len(partials))
+
+    embeddings = np.zeros((len(wavs), partial_embeds.shape[1]), dtype=np.float32)
+    offset = 0
+    for i, count in enumerate(counts):
+        if count == 0:
+            continue
+        raw = partial_embeds[offset:offset + count].mean(axis=0)
+        embeddings[i] = raw / np.linalg.norm(raw, 2)
+        offset += count
+    return embeddings
+
+
+def _mel_batch(chunks: np.ndarray) -> np.ndarray:
+    """(B × サンプル数) の波形をまとめて (B × フレーム数 × メル次元) に変換する。
+
+    resemblyzer.audio.wav_to_mel_spectrogram と同じパラメータで、各行を独立に計算する。
+    """
+    import librosa
+    from resemblyzer import hparams
+
+    frames = librosa.feature.melspectrogram(
+        y=chunks,
+        sr=hparams.sampling_rate,
+        n_fft=int(hparams.sampling_rate * hparams.mel_window_length / 1000),
+        hop_length=int(hparams.sampling_rate * hparams.mel_window_step / 1000),
+        n_mels=hparams.mel_n_channels,
+    )
+    return frames.astype(np.float32).transpose(0, 2, 1)
+
+
+def embed_windows(encoder, wav: np.ndarray, window_samples: int, step_samples: int,
+                  batch_size: int = DEFAULT_BATCH_SIZE,
+                  rate: float = 1.3, min_coverage: float = 0.75) -> tuple[np.ndarray, np.ndarray]:
+    """固定長スライディングウィンドウの声紋ベクトルをまとめて計算する。
+
+    各ウィンドウに embed_utterance を呼んだ場合と同じ結果を、
+    ウィンドウ群のメル変換と forward をブロック単位でまとめて得る。
+    ウィンドウ長は全て同じなので部分発話の切り方は1回だけ計算すればよい。
+
+    Args:
+        encoder: resemblyzer.VoiceEncoder
+        wav: preprocess_wav 済みの float32 波形
+        window_samples: ウィンドウ長（サンプル数）
+        step_samples: ウィンドウの移動幅（サンプル数）
+        batch_size: 1回の forward に載せる部分発話数の上限
+
+    Returns:
+        (埋め込み行列 (ウィンドウ数 × 次元), 各ウィンドウの開始サンプル位置)
+    """
+    starts = np.arange(0, len(wav) - window_samples + 1, step_samples, dtype=np.int64)
+    if len(starts) == 0:
+        return np.zeros((0, 0), dtype=np.float32), starts
+
+    wav_slices, mel_slices = encoder.compute_partial_slices(window_samples, rate, min_coverage)
+    padded_len = max(wav_slices[-1].stop, window_samples)
+    n_partials = len(mel_slices)
+    block = max(1, batch_size // n_partials)
+
+    outputs = []
+    for offset in range(0, len(starts), block):
+        block_starts = starts[offset:offset + block]
+        chunks = np.zeros((len(block_starts), padded_len), dtype=np.float32)
+        for row, pos in enumerate(block_starts):
+            chunks[row, :window_samples] = wav[pos:pos + window_samples]
+        mels = _mel_batch(chunks)
+        partials = np.stack([mels[:, s] for s in mel_slices], axis=1)
+        partial_embeds = forward_mels(
+            encoder, partials.reshape(-1, *partials.shape[2:]), batch_size=batch_size
+        ).reshape(len(block_starts), n_partials, -1)
+        raw = partial_embeds.mean(axis=1)
+        outputs.append(raw / np.linalg.norm(raw, axis=1, keepdims=True))
+
+    logger.debug("ウィンドウ埋め込み: %d ウィンドウ / %d 部分発話", len(starts), len(starts) * n_partials)
+    return np.concatenate(outputs), starts
@@ -3,10 +3,18 @@
 import logging
 import subprocess
 import tempfile
+from collections.abc import Iterator
 from pathlib import Path
 
+import numpy as np
+
+from src.audio.slicer import pcm_to_float32
+
 logger = logging.getLogger(__name__)
 
+# エラーメッセージに含める ffmpeg の stderr の末尾のバイト数
+_STDERR_TAIL = 4096
+
 
 def extract_audio(video_path: str, output_path: str | None = None,
                   sample_rate: int = 16000) -> Path:
@@ -50,6 +58,97 @@ def extract_audio(video_path: str, output_path: str | None = None,
     return output_path
 
 
+def iter_audio_chunks(video_path: str, sample_rate: int = 16000,
+                      chunk_sec: float = 30.0) -> Iterator[np.ndarray]:
+    """動画の音声を一時ファイルを介さずに固定長チャンクで逐次読み出す。
+
+    ffmpeg の標準出力から raw s16le を直接読み込むため、デコード完了を
+    待たずに後段の処理を開始できる。
+
+    Args:
+        video_path: 入力動画ファイルのパス
+        sample_rate: サンプリングレート（デフォルト16kHz）
+        chunk_sec: 1チャンクの長さ（秒）。最後のチャンクは短くなりうる
+
+    Yields:
+        モノラル float32 波形（値域 [-1.0, 1.0)）
+    """
+    video_path = Path(video_path)
+    if not video_path.exists():
+        raise FileNotFoundError(f"動画ファイルが見つかりません: {video_path}")
+
+    cmd = [
+        "ffmpeg", "-nostdin",
+        "-loglevel", "error",       # エラーのみ出力
+        "-i", str(video_path),
+        "-vn",
+        "-f", "s16le",              # ヘッダなし raw PCM
+        "-acodec", "pcm_s16le",
+        "-ar", str(sample_rate),
+        "-ac", "1",
+        "pipe:1",
+    ]
+    chunk_bytes = max(1, int(chunk_sec * sample_rate)) * 2
+
+    logger.debug("FFmpeg ストリーム抽出: %s", " ".join(cmd))
+    # 壊れた入力では ffmpeg がパケットごとにエラーを出し続ける。stderr をパイプにすると
+    # 標準出力を読んでいる間にパイプが埋まって双方が止まるため、一時ファイルに書かせる
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            remainder = b""
+            while True:
+                data = proc.stdout.read(chunk_bytes)
+                if not data:
+                    break
+                data = remainder + data
+                usable = len(data) - (len(data) % 2)
+                remainder = data[usable:]
+                if usable:
+                    yield pcm_to_float32(np.frombuffer(data[:usable], dtype="<i2"))
+
+            if proc.wait() != 0:
+                stderr.seek(0)
+                message = stderr.read()[-_STDERR_TAIL:].decode(errors="replace")
+                raise RuntimeError(f"FFmpeg エラー: {message}")
+        finally:
+            # 途中で読み捨てられた場合も ffmpeg を残さない
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+
+def extract_audio_array(video_path: str, sample_rate: int = 16000,
+                        duration: float | None = None) -> np.ndarray:
+    """動画ファイルから音声全体をメモリ上の波形として抽出する。
+
+    チャンクを溜めて連結すると一時的に2倍のメモリを使うため、動画長から見積もった
+    バッファに直接書き込む（見積もりを超えた場合だけ広げ直す）。
+
+    Args:
+        video_path: 入力動画ファイルのパス
+        sample_rate: サンプリングレート（デフォルト16kHz）
+        duration: ffprobe で取得済みの動画長（秒）。省略時はチャンクごとに広げる
+
+    Returns:
+        モノラル float32 波形
+    """
+    # コンテナの長さと音声ストリームの長さのずれを見込んで1秒余分に確保する
+    capacity = int((duration + 1.0) * sample_rate) if duration else 0
+    wav = np.empty(capacity, dtype=np.float32)
+    length = 0
+    for chunk in iter_audio_chunks(video_path, sample_rate=sample_rate):
+        end = length + len(chunk)
+        if end > len(wav):
+            grown = np.empty(max(end, len(wav) * 3 // 2), dtype=np.float32)
+            grown[:length] = wav[:length]
+            wav = grown
+        wav[length:end] = chunk
+        length = end
+    logger.info("音声抽出完了: %s (%.1f秒)", video_path, length / sample_rate)
+    return wav[:length]
+
+
 def extract_audio_segment(video_path: str, start_sec: float, end_sec: float,
                           output_path: str | None = None,
                           sample_rate: int = 16000) -> Path:
@@ -0,0 +1,49 @@
+"""音声区間スライサー - 抽出済み PCM を一度だけ読み込み、区間をメモリ上で切り出す"""
+
+import numpy as np
+
+
+def pcm_to_float32(samples: np.ndarray) -> np.ndarray:
+    """16bit PCM を [-1.0, 1.0) の float32 に変換する。float の場合はそのまま返す。"""
+    if np.issubdtype(samples.dtype, np.integer):
+        return samples.astype(np.float32) / 32768.0
+    return samples.astype(np.float32, copy=False)
+
+
+class AudioSlicer:
+    """抽出済みの音声全体を保持し、区間をゼロコピーのビューとして切り出すクラス。
+
+    セグメントごとに ffmpeg を起動して動画を先頭からデコードし直す代わりに、
+    一度だけ抽出した PCM をメモリ上で区間スライスする。
+    """
+
+    def __init__(self, samples: np.ndarray, sample_rate: int = 16000):
+        """
+        Args:
+            samples: モノラル波形（int16 PCM または float32）
+            sample_rate: サンプリングレート
+        """
+        self.samples = samples
+        self.sample_rate = sample_rate
+
+    @property
+    def duration(self) -> float:
+        """音声の長さ（秒）"""
+        return len(self.samples) / self.sample_rate
+
+    def slice(self, start_sec: float, end_sec: float) -> np.ndarray:
+        """指定区間の波形をビューとして返す（コピーしない）。
+
+        範囲外の指定は音声の長さにクリップされる。
+
+        Args:
+            start_sec: 開始時刻（秒）
+            end_sec: 終了時刻（秒）
+
+        Returns:
+            元の波形を参照する ndarray
+        """
+        n = len(self.samples)
+        start = min(max(int(round(start_sec * self.sample_rate)), 0), n)
+        end = min(max(int(round(end_sec * self.sample_rate)), start), n)
+        return self.samples[start:end]
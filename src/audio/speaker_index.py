@@ -0,0 +1,214 @@
+"""話者近似最近傍インデックス - 大規模な基準話者集合に対する IVF 検索"""
+
+import hashlib
+import logging
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_INDEX_VERSION = 1
+# 割り当て計算時に一度に扱うベクトル数（メモリ使用量の上限）
+_ASSIGN_BLOCK = 4096
+
+
+def index_path_for(reference_dir: str) -> Path:
+    """基準音声ディレクトリに対応するインデックスの保存先を返す。
+
+    例: data/reference_voices → data/reference_voices.index.npz
+    """
+    ref_path = Path(reference_dir)
+    return ref_path.parent / f"{ref_path.name}.index.npz"
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def _matrix_checksum(ids: list[str], matrix: np.ndarray) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update("\0".join(ids).encode("utf-8"))
+    h.update(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+    return h.hexdigest()
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """各ベクトルを最もコサイン類似度の高いセントロイドに割り当てる。"""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK):
+        block = vectors[start:start + _ASSIGN_BLOCK]
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def _spherical_kmeans(vectors: np.ndarray, n_clusters: int,
+                      n_iter: int = 20, seed: int = 0) -> np.ndarray:
+    """正規化ベクトルに対する球面 k-means。セントロイド（正規化済み）を返す。"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        labels = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=n_clusters)
+
+        empty = counts == 0
+        if empty.any():
+            # 空クラスタはランダムな点で再初期化する
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        new_centroids = _normalize(sums)
+        if np.allclose(new_centroids, centroids, atol=1e-6):
+            break
+        centroids = new_centroids
+
+    return centroids
+
+
+class SpeakerIndex:
+    """基準話者の声紋ベクトルに対する転置ファイル（IVF）型の近似最近傍インデックス。
+
+    ベクトルを球面 k-means で n_lists 個のリストに分け、検索時は
+    クエリに近い n_probe 個のリストだけを総当たりする。
+    """
+
+    def __init__(self, ids: list[str], vectors: np.ndarray, centroids: np.ndarray,
+                 order: np.ndarray, offsets: np.ndarray, checksum: str):
+        self.ids = list(ids)
+        self.vectors = vectors
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.checksum = checksum
+
+    @classmethod
+    def build(cls, ids: list[str], matrix: np.ndarray,
+              n_lists: int | None = None, seed: int = 0) -> "SpeakerIndex":
+        """声紋行列からインデックスを構築する。
+
+        Args:
+            ids: 各行の話者ID
+            matrix: (話者数 × 次元) の声紋行列
+            n_lists: リスト数（省略時は √話者数）
+            seed: k-means 初期化の乱数シード
+
+        Returns:
+            SpeakerIndex
+        """
+        if len(ids) != len(matrix):
+            raise ValueError(f"ID 数と行数が一致しません: {len(ids)} != {len(matrix)}")
+        if len(ids) == 0:
+            raise ValueError("空の話者集合からはインデックスを構築できません")
+
+        vectors = _normalize(matrix)
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(vectors)))
+        n_lists = max(1, min(n_lists, len(vectors)))
+
+        centroids = _spherical_kmeans(vectors, n_lists, seed=seed)
+        labels = _assign(vectors, centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=n_lists))])
+
+        logger.info("話者インデックス構築: %d 話者 / %d リスト", len(ids), n_lists)
+        return cls(ids, vectors, centroids, order, offsets.astype(np.int64),
+                   _matrix_checksum(list(ids), matrix))
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    def matches(self, ids: list[str], matrix: np.ndarray) -> bool:
+        """このインデックスが指定の声紋行列から構築されたものか判定する。"""
+        return self.checksum == _matrix_checksum(list(ids), matrix)
+
+    def search(self, queries: np.ndarray, k: int = 5,
+               n_probe: int = 8) -> list[list[tuple[str, float]]]:
+        """近似最近傍検索で各クエリの上位 k 人を返す。
+
+        Args:
+            queries: (N × 次元) のクエリ行列、または単一ベクトル
+            k: 返す候補数
+            n_probe: 探索するリスト数（大きいほど正確で遅い）
+
+        Returns:
+            クエリごとの [(話者ID, コサイン類似度), ...]（降順）
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        n_probe = max(1, min(n_probe, self.n_lists))
+        probe_lists = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :n_probe]
+
+        results = []
+        for query, lists in zip(queries, probe_lists):
+            candidates = np.concatenate(
+                [self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists]
+            )
+            results.append(self._rank(query, candidates, k))
+        return results
+
+    def exact_search(self, queries: np.ndarray, k: int = 5) -> list[list[tuple[str, float]]]:
+        """全話者を総当たりする厳密検索（リコール評価用）。"""
+        queries = _normalize(np.atleast_2d(queries))
+        all_candidates = np.arange(len(self.ids))
+        return [self._rank(query, all_candidates, k) for query in queries]
+
+    def recall_at_k(self, queries: np.ndarray, k: int = 5, n_probe: int = 8) -> float:
+        """厳密検索の上位 k 件のうち近似検索で得られた割合の平均を返す。"""
+        approx = self.search(queries, k=k, n_probe=n_probe)
+        exact = self.exact_search(queries, k=k)
+        recalls = []
+        for a, e in zip(approx, exact):
+            expected = {sid for sid, _ in e}
+            if expected:
+                recalls.append(len(expected & {sid for sid, _ in a}) / len(expected))
+        return float(np.mean(recalls)) if recalls else 1.0
+
+    def _rank(self, query: np.ndarray, candidates: np.ndarray,
+              k: int) -> list[tuple[str, float]]:
+        if len(candidates) == 0:
+            return []
+        scores = self.vectors[candidates] @ query
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[candidates[i]], float(scores[i])) for i in top]
+
+    def save(self, path: str | Path) -> Path:
+        """インデックスを .npz として保存する。"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                version=np.array(_INDEX_VERSION),
+                ids=np.array(self.ids, dtype=str),
+                vectors=self.vectors,
+                centroids=self.centroids,
+                order=self.order,
+                offsets=self.offsets,
+                checksum=np.array(self.checksum),
+            )
+        logger.debug("話者インデックス保存: %s", path)
+        return path
+
+    @classmethod
+    def load(cls, path: str | Path) -> "SpeakerIndex":
+        """保存済みインデックスを読み込む。
+
+        Raises:
+            ValueError: バージョンが異なる場合
+        """
+        with np.load(Path(path), allow_pickle=False) as data:
+            if int(data["version"]) != _INDEX_VERSION:
+                raise ValueError(f"未対応のインデックスバージョンです: {path}")
+            return cls(
+                ids=[str(i) for i in data["ids"]],
+                vectors=data["vectors"],
+                centroids=data["centroids"],
+                order=data["order"],
+                offsets=data["offsets"],
+                checksum=str(data["checksum"]),
+            )
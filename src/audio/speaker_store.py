@@ -0,0 +1,210 @@
+"""基準話者ストア - 基準音声の声紋ベクトルを1ファイルにまとめて永続化する"""
+
+import logging
+import os
+from collections.abc import Callable
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_STORE_VERSION = 1
+AUDIO_PATTERNS = ("*.wav", "*.mp3")
+
+
+def store_path_for(reference_dir: str, model: str = "resemblyzer") -> Path:
+    """基準音声ディレクトリに対応するストアの保存先を返す。
+
+    例: data/reference_voices → data/reference_voices.resemblyzer.npz
+    """
+    ref_path = Path(reference_dir)
+    return ref_path.parent / f"{ref_path.name}.{model}.npz"
+
+
+def scan_reference_dir(reference_dir: str) -> list[tuple[str, Path]]:
+    """基準音声ディレクトリを走査し (話者ID, ファイルパス) のリストを返す。
+
+    register_speakers_from_dir と同じく、直下のサブディレクトリ名を話者IDとし、
+    その中の *.wav / *.mp3 を基準音声とみなす。
+    """
+    ref_path = Path(reference_dir)
+    if not ref_path.exists():
+        raise FileNotFoundError(f"基準音声ディレクトリが見つかりません: {ref_path}")
+
+    entries = []
+    for speaker_dir in sorted(ref_path.iterdir()):
+        if not speaker_dir.is_dir():
+            continue
+        for pattern in AUDIO_PATTERNS:
+            for audio_file in sorted(speaker_dir.glob(pattern)):
+                entries.append((speaker_dir.name, audio_file))
+    return entries
+
+
+class SpeakerStore:
+    """話者ごとのセントロイドとファイルごとの声紋ベクトルを保持するストア。
+
+    各基準音声はディレクトリからの相対パス・サイズ・更新時刻（ns）で識別し、
+    sync() ではそれらが変わったファイルだけを再計算する。
+    """
+
+    def __init__(self, model: str = "resemblyzer"):
+        """
+        Args:
+            model: 声紋ベクトルを計算したモデル名（異なるモデルのストアは再利用しない）
+        """
+        self.model = model
+        self.files: list[str] = []
+        self.speakers: list[str] = []
+        self.sizes = np.zeros(0, dtype=np.int64)
+        self.mtimes = np.zeros(0, dtype=np.int64)
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+
+    @classmethod
+    def load(cls, path: str | Path, model: str = "resemblyzer") -> "SpeakerStore":
+        """ストアを読み込む。存在しない・形式やモデルが異なる場合は空のストアを返す。"""
+        store = cls(model=model)
+        path = Path(path)
+        if not path.exists():
+            return store
+
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data["version"]) != _STORE_VERSION or str(data["model"]) != model:
+                    logger.info("話者ストアの形式が異なるため再構築します: %s", path)
+                    return store
+                store.files = [str(f) for f in data["files"]]
+                store.speakers = [str(s) for s in data["speakers"]]
+                store.sizes = data["sizes"]
+                store.mtimes = data["mtimes"]
+                store.embeddings = data["embeddings"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("話者ストアを読み込めません。再構築します: %s", e)
+            return cls(model=model)
+
+        return store
+
+    def save(self, path: str | Path) -> Path:
+        """ストアを書き出す（一時ファイルに書いてから置き換える）。"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        centroids = self.centroids()
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                version=np.array(_STORE_VERSION),
+                model=np.array(self.model),
+                files=np.array(self.files, dtype=str),
+                speakers=np.array(self.speakers, dtype=str),
+                sizes=self.sizes,
+                mtimes=self.mtimes,
+                embeddings=self.embeddings,
+                centroid_ids=np.array(list(centroids), dtype=str),
+                centroids=(np.array(list(centroids.values()), dtype=np.float32)
+                           if centroids else np.zeros((0, 0), dtype=np.float32)),
+            )
+        os.replace(tmp_path, path)
+        logger.debug("話者ストア保存: %s", path)
+        return path
+
+    def sync(self, reference_dir: str,
+             embed_fn: Callable[[list[str]], np.ndarray]) -> bool:
+        """基準音声ディレクトリとストアを同期する。
+
+        追加・変更されたファイルのみ embed_fn で声紋ベクトルを計算し、
+        削除されたファイルはストアから取り除く。
+
+        Args:
+            reference_dir: 基準音声ディレクトリ
+            embed_fn: ファイルパスのリストを受け取り (N × 次元) の声紋行列を返す関数。
+                音声が残らなかったファイルの行はゼロベクトル（ストアには含めず、次の
+                sync で再び計算する）
+
+        Returns:
+            ストアの内容が変わった場合 True
+        """
+        ref_path = Path(reference_dir)
+        known = {
+            f: (int(size), int(mtime), i)
+            for i, (f, size, mtime) in enumerate(zip(self.files, self.sizes, self.mtimes))
+        }
+
+        files, speakers, sizes, mtimes = [], [], [], []
+        reuse: list[int | None] = []
+        to_embed: list[str] = []
+        for speaker_id, audio_file in scan_reference_dir(reference_dir):
+            rel = audio_file.relative_to(ref_path).as_posix()
+            st = audio_file.stat()
+            files.append(rel)
+            speakers.append(speaker_id)
+            sizes.append(st.st_size)
+            mtimes.append(st.st_mtime_ns)
+
+            entry = known.get(rel)
+            if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                reuse.append(entry[2])
+            else:
+                reuse.append(None)
+                to_embed.append(str(audio_file))
+
+        if not to_embed and files == self.files:
+            return False
+
+        new_embeddings = embed_fn(to_embed) if to_embed else None
+        dim = (new_embeddings.shape[1] if new_embeddings is not None and new_embeddings.size
+               else self.embeddings.shape[1])
+        rows: list[np.ndarray] = []
+        kept: list[int] = []
+        skipped: list[str] = []
+        new_row = 0
+        for i, old_row in enumerate(reuse):
+            if old_row is not None:
+                rows.append(self.embeddings[old_row])
+                kept.append(i)
+                continue
+            row = new_embeddings[new_row] if new_embeddings.size else None
+            new_row += 1
+            if row is None or not np.any(row):
+                # 短すぎる・無音で声紋を計算できないファイルはストアに含めない
+                skipped.append(files[i])
+                continue
+            rows.append(row)
+            kept.append(i)
+        if skipped:
+            logger.warning("声紋を計算できない基準音声を除外しました: %s", ", ".join(skipped))
+
+        files = [files[i] for i in kept]
+        if len(kept) == len(reuse) - len(to_embed) and files == self.files:
+            return False
+        logger.info("話者ストア更新: %d ファイル再計算 / %d ファイル再利用 / %d ファイル削除",
+                    len(to_embed) - len(skipped), len(files) - len(to_embed) + len(skipped),
+                    len(set(self.files) - set(files)))
+        self.files = files
+        self.speakers = [speakers[i] for i in kept]
+        self.sizes = np.array([sizes[i] for i in kept], dtype=np.int64)
+        self.mtimes = np.array([mtimes[i] for i in kept], dtype=np.int64)
+        self.embeddings = (np.array(rows, dtype=np.float32) if rows
+                           else np.zeros((0, dim), dtype=np.float32))
+        return True
+
+    def centroids(self) -> dict[str, np.ndarray]:
+        """{話者ID: 声紋ベクトルの平均} を返す。音声のないファイルは除外する。"""
+        result: dict[str, np.ndarray] = {}
+        if len(self.speakers) == 0:
+            return result
+        valid = np.linalg.norm(self.embeddings, axis=1) > 0
+        speakers = np.array(self.speakers)
+        for speaker_id in dict.fromkeys(self.speakers):
+            rows = self.embeddings[(speakers == speaker_id) & valid]
+            if len(rows):
+                result[speaker_id] = rows.mean(axis=0)
+        return result
+
+    def file_counts(self) -> dict[str, int]:
+        """{話者ID: 基準音声ファイル数} を返す。"""
+        counts: dict[str, int] = {}
+        for speaker_id in self.speakers:
+            counts[speaker_id] = counts.get(speaker_id, 0) + 1
+        return counts
@@ -0,0 +1,134 @@
+"""対象話者検出 - 話者分離を行わず、ウィンドウごとに基準話者と直接照合する"""
+
+import logging
+
+import numpy as np
+
+from src.audio.embedding import embed_utterances, embed_windows, normalize_wav
+from src.audio.vad import SpeechMask
+
+logger = logging.getLogger(__name__)
+
+_SAMPLE_RATE = 16000
+
+
+def smooth_scores(scores: np.ndarray, width: int) -> np.ndarray:
+    """(ウィンドウ数 × 話者数) のスコアを時間方向に移動平均する（端は有効範囲のみで平均）。"""
+    if width <= 1 or len(scores) == 0:
+        return scores
+    kernel = np.ones(width)
+    pad = width // 2
+    sums = np.apply_along_axis(lambda col: np.convolve(col, kernel, mode="full"), 0, scores)
+    counts = np.convolve(np.ones(len(scores)), kernel, mode="full")
+    start = pad
+    return (sums[start:start + len(scores)] / counts[start:start + len(scores), None]).astype(
+        scores.dtype
+    )
+
+
+def active_intervals(active: np.ndarray, starts: np.ndarray, window_sec: float,
+                     min_interval_sec: float) -> list[tuple[float, float]]:
+    """ウィンドウごとの判定列を連続区間 [開始, 終了] にまとめ、短い区間を除く。"""
+    edges = np.diff(np.concatenate([[0], active.astype(np.int8), [0]]))
+    intervals = []
+    for first, last in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1):
+        start, end = float(starts[first]), float(starts[last] + window_sec)
+        if end - start >= min_interval_sec:
+            intervals.append((start, end))
+    return intervals
+
+
+class TargetedDetector:
+    """既知の出演者だけを対象に、発話区間を直接検出するクラス。
+
+    音声区間にスライディングウィンドウを掛けて各ウィンドウの声紋ベクトルを
+    一括推論し、VoiceMatcher の参照行列とのスコア行列を時間方向に平滑化して
+    閾値判定する。教師なしの話者分離・クラスタリングは行わない。
+    """
+
+    def __init__(self, matcher, window_sec: float = 1.5, step_sec: float = 0.75,
+                 smoothing_windows: int = 5, min_interval_sec: float = 1.0):
+        """
+        Args:
+            matcher: 基準話者登録済みの VoiceMatcher
+            window_sec: ウィンドウ長（秒）
+            step_sec: ウィンドウの移動幅（秒）
+            smoothing_windows: スコアを平滑化するウィンドウ数
+            min_interval_sec: これより短い発話区間は捨てる
+        """
+        self.matcher = matcher
+        self.window_sec = window_sec
+        self.step_sec = step_sec
+        self.smoothing_windows = smoothing_windows
+        self.min_interval_sec = min_interval_sec
+
+    def detect(self, wav: np.ndarray, sample_rate: int,
+               speech_mask: SpeechMask | None = None) -> dict[str, dict]:
+        """波形から各出演者の発話を検出する。
+
+        Args:
+            wav: 動画全体のモノラル波形
+            sample_rate: 波形のサンプリングレート
+            speech_mask: VAD の音声区間マスク（指定時は音声区間だけを対象にする）
+
+        Returns:
+            {話者ID: {"max_score", "avg_score", "matching_segments", "total_segments",
+                      "speaking_time", "intervals"}} の辞書。
+            compare_segments と同じキーに加え、intervals に元の時間軸の発話区間を持つ
+        """
+        if not self.matcher.reference_embeddings:
+            raise RuntimeError("基準話者が登録されていません。先にregister_speakerを呼んでください。")
+
+        voiced = speech_mask.extract(wav, sample_rate) if speech_mask is not None else wav
+        voiced = normalize_wav(voiced, sample_rate) if len(voiced) else voiced
+        embeddings, starts = self._embed(voiced)
+        if len(starts) == 0:
+            return {
+                sid: {"max_score": 0.0, "avg_score": 0.0, "matching_segments": 0,
+                      "total_segments": 0, "speaking_time": 0.0, "intervals": []}
+                for sid in self.matcher.speaker_ids
+            }
+
+        scores = smooth_scores(self.matcher.score_matrix(embeddings), self.smoothing_windows)
+        active = scores >= self.matcher.threshold
+        start_sec = starts / _SAMPLE_RATE
+        window_sec = min(self.window_sec, len(voiced) / _SAMPLE_RATE)
+
+        results = {}
+        for j, sid in enumerate(self.matcher.speaker_ids):
+            intervals = []
+            for start, end in active_intervals(active[:, j], start_sec, window_sec,
+                                               self.min_interval_sec):
+                if speech_mask is not None:
+                    intervals.extend(speech_mask.to_original(start, end, _SAMPLE_RATE))
+                else:
+                    intervals.append((start, end))
+            results[sid] = {
+                "max_score": float(scores[:, j].max()),
+                "avg_score": float(scores[:, j].mean()),
+                "matching_segments": len(intervals),
+                "total_segments": len(starts),
+                "speaking_time": float(sum(e - s for s, e in intervals)),
+                "intervals": intervals,
+            }
+
+        logger.info("対象話者検出: %d ウィンドウ / 検出 %d 名", len(starts),
+                    sum(1 for r in results.values() if r["intervals"]))
+        return results
+
+    def _embed(self, voiced: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """前処理済み波形をウィンドウ単位で埋め込む。
+
+        ウィンドウ長に満たない短い音声は全体を1ウィンドウとして扱う。
+        """
+        window = int(self.window_sec * _SAMPLE_RATE)
+        step = int(self.step_sec * _SAMPLE_RATE)
+        encoder = self.matcher.encoder
+        batch_size = self.matcher.batch_size
+
+        if len(voiced) >= window:
+            return embed_windows(encoder, voiced, window, step, batch_size=batch_size)
+        if len(voiced) == 0:
+            return np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int64)
+        return (embed_utterances(encoder, [voiced], batch_size=batch_size),
+                np.zeros(1, dtype=np.int64))
@@ -0,0 +1,168 @@
+"""音声区間検出（VAD） - 無音・BGM などの非音声区間を埋め込み計算の前に除外する"""
+
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.audio.slicer import pcm_to_float32
+
+logger = logging.getLogger(__name__)
+
+# webrtcvad が受け付けるサンプリングレート
+_WEBRTC_RATES = (8000, 16000, 32000, 48000)
+
+
+@dataclass
+class SpeechMask:
+    """音声区間の集合（元の音声の時間軸、秒）"""
+    intervals: np.ndarray   # (区間数 × 2) の [開始, 終了]。時系列順で重ならない
+    duration: float         # 元の音声の長さ（秒）
+
+    @classmethod
+    def full(cls, duration: float) -> "SpeechMask":
+        """全体を音声区間とみなすマスク"""
+        intervals = np.array([[0.0, duration]]) if duration > 0 else np.zeros((0, 2))
+        return cls(intervals=intervals, duration=duration)
+
+    @property
+    def speech_time(self) -> float:
+        """音声区間の合計（秒）"""
+        return float((self.intervals[:, 1] - self.intervals[:, 0]).sum())
+
+    @property
+    def skipped_ratio(self) -> float:
+        """除外された（非音声の）割合"""
+        if self.duration <= 0:
+            return 0.0
+        return max(0.0, 1.0 - self.speech_time / self.duration)
+
+    def sample_bounds(self, sample_rate: int) -> np.ndarray:
+        """音声区間をサンプル位置の (区間数 × 2) 整数配列で返す"""
+        return np.round(self.intervals * sample_rate).astype(np.int64)
+
+    def extract(self, wav: np.ndarray, sample_rate: int) -> np.ndarray:
+        """音声区間だけを連結した波形を返す。"""
+        bounds = self.sample_bounds(sample_rate)
+        if len(bounds) == 1:
+            return wav[bounds[0, 0]:bounds[0, 1]]
+        if len(bounds) == 0:
+            return wav[:0]
+        return np.concatenate([wav[s:e] for s, e in bounds])
+
+    def clip(self, start: float, end: float) -> list[tuple[float, float]]:
+        """元の時間軸の区間 [start, end) のうち音声区間に含まれる部分を返す。"""
+        starts = np.maximum(self.intervals[:, 0], start)
+        ends = np.minimum(self.intervals[:, 1], end)
+        keep = ends > starts
+        return [(float(s), float(e)) for s, e in zip(starts[keep], ends[keep])]
+
+    def to_original(self, start: float, end: float,
+                    sample_rate: int = 16000) -> list[tuple[float, float]]:
+        """extract() 後の時間軸の区間 [start, end) を元の時間軸の区間群に戻す。
+
+        連結時に詰めた非音声区間をまたぐ場合は複数の区間に分かれる。
+        """
+        bounds = self.sample_bounds(sample_rate) / sample_rate
+        lengths = bounds[:, 1] - bounds[:, 0]
+        offsets = np.concatenate([[0.0], np.cumsum(lengths)])
+
+        pieces = []
+        for i, (orig_start, _) in enumerate(bounds):
+            lo = max(start, offsets[i])
+            hi = min(end, offsets[i + 1])
+            if hi > lo:
+                pieces.append((float(orig_start + lo - offsets[i]),
+                               float(orig_start + hi - offsets[i])))
+        return pieces
+
+
+def _webrtc_flags(wav: np.ndarray, sample_rate: int, frame_len: int,
+                  aggressiveness: int) -> np.ndarray | None:
+    """webrtcvad によるフレームごとの音声判定。使えない場合は None"""
+    if sample_rate not in _WEBRTC_RATES:
+        return None
+    try:
+        import webrtcvad
+    except ImportError:
+        return None
+
+    vad = webrtcvad.Vad(aggressiveness)
+    pcm = (np.clip(wav, -1.0, 1.0) * 32767).astype("<i2")
+    n_frames = len(pcm) // frame_len
+    return np.array([
+        vad.is_speech(pcm[i * frame_len:(i + 1) * frame_len].tobytes(), sample_rate)
+        for i in range(n_frames)
+    ], dtype=bool)
+
+
+def _energy_flags(wav: np.ndarray, frame_len: int) -> np.ndarray:
+    """フレームの RMS（dBFS）による簡易な音声判定"""
+    n_frames = len(wav) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool)
+    frames = wav[:n_frames * frame_len].reshape(n_frames, frame_len).astype(np.float64)
+    db = 10 * np.log10((frames ** 2).mean(axis=1) + 1e-12)
+    # ノイズフロアより十分大きく、ピークから大きく離れていないフレームを音声とみなす
+    threshold = max(-50.0, min(np.percentile(db, 10) + 12.0, db.max() - 30.0))
+    return db > threshold
+
+
+def _flags_to_intervals(flags: np.ndarray, frame_sec: float, duration: float,
+                        min_speech_sec: float, merge_gap_sec: float,
+                        pad_sec: float) -> np.ndarray:
+    """フレーム判定列を区間に変換し、前後の余白付与・近接区間の結合・短区間の除去を行う"""
+    if not flags.any():
+        return np.zeros((0, 2))
+
+    edges = np.diff(np.concatenate([[0], flags.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1) * frame_sec - pad_sec
+    ends = np.flatnonzero(edges == -1) * frame_sec + pad_sec
+
+    merged: list[list[float]] = []
+    for s, e in zip(np.maximum(starts, 0.0), np.minimum(ends, duration)):
+        if merged and s - merged[-1][1] <= merge_gap_sec:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+
+    intervals = np.array([iv for iv in merged if iv[1] - iv[0] >= min_speech_sec])
+    return intervals.reshape(-1, 2)
+
+
+def detect_speech(wav: np.ndarray, sample_rate: int = 16000,
+                  aggressiveness: int = 2, frame_ms: int = 30,
+                  min_speech_sec: float = 0.3, merge_gap_sec: float = 0.3,
+                  pad_sec: float = 0.1) -> SpeechMask:
+    """波形から音声区間を検出する。
+
+    webrtcvad が使えればそれを使い、使えない場合（未導入・非対応のサンプリングレート）は
+    フレームエネルギーによる簡易判定にフォールバックする。
+
+    Args:
+        wav: モノラル float32 波形
+        sample_rate: サンプリングレート
+        aggressiveness: webrtcvad の判定の厳しさ（0〜3）
+        frame_ms: 判定フレーム長（10 / 20 / 30 ミリ秒）
+        min_speech_sec: これより短い音声区間は捨てる
+        merge_gap_sec: これ以下の隙間で隣り合う音声区間は結合する
+        pad_sec: 各音声区間の前後に付ける余白
+
+    Returns:
+        SpeechMask
+    """
+    wav = pcm_to_float32(wav)
+    duration = len(wav) / sample_rate
+    frame_len = sample_rate * frame_ms // 1000
+
+    flags = _webrtc_flags(wav, sample_rate, frame_len, aggressiveness)
+    if flags is None:
+        logger.debug("webrtcvad が使えないためエネルギーで音声区間を判定します")
+        flags = _energy_flags(wav, frame_len)
+
+    intervals = _flags_to_intervals(flags, frame_len / sample_rate, duration,
+                                    min_speech_sec, merge_gap_sec, pad_sec)
+    mask = SpeechMask(intervals=intervals, duration=duration)
+    logger.info("音声区間検出: %d 区間 / 音声 %.1f秒 / 除外 %.1f%%",
+                len(intervals), mask.speech_time, mask.skipped_ratio * 100)
+    return mask
@@ -1,27 +1,158 @@
 """声紋照合モジュール - 基準音声と動画音声を比較して出演者を判定"""
 
+import hashlib
 import logging
+from collections.abc import Callable
+from importlib import metadata
 from pathlib import Path
 
 import numpy as np
 from resemblyzer import VoiceEncoder, preprocess_wav
 
+from src.audio.embedding import DEFAULT_BATCH_SIZE, embed_utterances
+from src.audio.slicer import pcm_to_float32
+from src.audio.speaker_index import SpeakerIndex, index_path_for
+from src.audio.speaker_store import SpeakerStore, store_path_for
+from src.models import VOICE_ENCODER, registry
+
 logger = logging.getLogger(__name__)
 
+_ENCODER_SAMPLE_RATE = 16000
+_EMBEDDING_DIM = 256
+# 前処理済み波形をメモリに溜める上限（発話数）。超えたらまとめて推論する
+_PENDING_UTTERANCES = 64
+
+
+def _encoder_model_id() -> str:
+    """声紋ベクトルのキャッシュキーに含めるエンコーダの識別子（resemblyzer のバージョン）"""
+    try:
+        return f"resemblyzer-{metadata.version('resemblyzer')}"
+    except metadata.PackageNotFoundError:
+        return "resemblyzer"
+
+
+ENCODER_MODEL_ID = _encoder_model_id()
+
 
 class VoiceMatcher:
     """声紋ベクトルによる話者照合を行うクラス。"""
 
-    def __init__(self, threshold: float = 0.75, cache=None):
+    # 声紋ベクトルのキャッシュキーに含めるモデルの識別子
+    model_id = ENCODER_MODEL_ID
+
+    def __init__(self, threshold: float = 0.75, cache=None,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 ann_min_speakers: int = 1000, ann_probe: int = 8):
         """
         Args:
             threshold: 声紋一致と判定する最低コサイン類似度
             cache: EmbeddingCache インスタンス（省略時はキャッシュ無効）
+            batch_size: バッチ推論で1回の forward に載せる部分発話数
+            ann_min_speakers: この人数以上を登録したら近似最近傍インデックスを使う
+            ann_probe: 近似検索で探索するリスト数
         """
-        self.encoder = VoiceEncoder()
+        self._encoder = None
         self.threshold = threshold
-        self.reference_embeddings: dict[str, np.ndarray] = {}
+        self.batch_size = batch_size
+        self._reference_embeddings: dict[str, np.ndarray] = {}
+        self._speaker_ids: list[str] = []
+        self._reference_matrix: np.ndarray | None = None
+        self._shared_references = None
+        # このプロセスが公開した共有行列（close で削除する）
+        self._published = None
         self._cache = cache
+        self.ann_min_speakers = ann_min_speakers
+        self.ann_probe = ann_probe
+        self.index: SpeakerIndex | None = None
+
+    @property
+    def encoder(self) -> VoiceEncoder:
+        """VoiceEncoder（初回アクセス時に共有レジストリから取得する）。
+
+        声紋ベクトルを外部から与える場合（pyannote の話者埋め込みの再利用など）は
+        読み込まれない。
+        """
+        if self._encoder is None:
+            self._encoder = registry.acquire(VOICE_ENCODER, VoiceEncoder)
+        return self._encoder
+
+    def close(self) -> None:
+        """共有レジストリから取得した VoiceEncoder を返却し、公開した共有行列を削除する。"""
+        if self._encoder is not None:
+            registry.release(VOICE_ENCODER)
+            self._encoder = None
+        if self._published is not None:
+            # /dev/shm はメモリ上にあるため、終了後に残さない（他のプロセスは開いたまま読める）
+            self._published.unlink()
+            self._published = None
+
+    @property
+    def reference_embeddings(self) -> dict[str, np.ndarray]:
+        """{話者ID: 声紋ベクトル（平均）} の辞書。
+
+        更新は register_speaker か再代入で行うこと（参照行列が再構築される）。
+        """
+        return self._reference_embeddings
+
+    @reference_embeddings.setter
+    def reference_embeddings(self, value: dict[str, np.ndarray]) -> None:
+        self._reference_embeddings = dict(value)
+        self._invalidate_references()
+
+    @property
+    def speaker_ids(self) -> list[str]:
+        """参照行列の行と対応する話者IDのリスト（登録順で安定）"""
+        return list(self._reference_embeddings)
+
+    @property
+    def reference_matrix(self) -> np.ndarray:
+        """L2 正規化済みの (話者数 × 次元) float32 連続行列。必要時に一度だけ構築する。"""
+        if self._reference_matrix is None or self._speaker_ids != list(self._reference_embeddings):
+            self._speaker_ids = list(self._reference_embeddings)
+            if self._speaker_ids:
+                refs = np.array([self._reference_embeddings[sid] for sid in self._speaker_ids],
+                                dtype=np.float32)
+                refs /= np.maximum(np.linalg.norm(refs, axis=1, keepdims=True), 1e-10)
+            else:
+                refs = np.zeros((0, _EMBEDDING_DIM), dtype=np.float32)
+            self._reference_matrix = np.ascontiguousarray(refs)
+        return self._reference_matrix
+
+    def _invalidate_references(self) -> None:
+        """参照行列を破棄し、次回アクセス時に再構築させる。"""
+        self._reference_matrix = None
+        self.index = None
+
+    def build_index(self, n_lists: int | None = None,
+                    path: str | Path | None = None) -> SpeakerIndex:
+        """登録済み話者から近似最近傍インデックスを構築する。
+
+        path に同じ声紋行列から構築済みのインデックスがあれば再利用し、
+        なければ構築して保存する。
+
+        Args:
+            n_lists: IVF のリスト数（省略時は √話者数）
+            path: インデックスの保存先（省略時は保存しない）
+
+        Returns:
+            SpeakerIndex
+        """
+        ids = self.speaker_ids
+        matrix = self.reference_matrix
+        if path is not None and Path(path).exists():
+            try:
+                index = SpeakerIndex.load(path)
+                if index.matches(ids, matrix):
+                    logger.info("話者インデックス読み込み: %s", path)
+                    self.index = index
+                    return index
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("話者インデックスを読み込めません。再構築します: %s", e)
+
+        self.index = SpeakerIndex.build(ids, matrix, n_lists=n_lists)
+        if path is not None:
+            self.index.save(path)
+        return self.index
 
     def register_speaker(self, speaker_id: str, audio_paths: list[str]) -> None:
         """基準音声から話者の声紋ベクトルを登録する。
@@ -30,19 +161,14 @@ class VoiceMatcher:
             speaker_id: 話者ID（例: "person_a"）
             audio_paths: 基準音声ファイルパスのリスト
         """
-        embeddings = []
-        for path in audio_paths:
-            cached = self._cache.get(path, prefix="voice") if self._cache else None
-            if cached is not None:
-                embeddings.append(cached)
-                continue
-            wav = preprocess_wav(Path(path))
-            embedding = self.encoder.embed_utterance(wav)
-            if self._cache:
-                self._cache.put(path, embedding, prefix="voice")
-            embeddings.append(embedding)
+        matrix = self.embed_segments([{"audio_path": path} for path in audio_paths])
+        embeddings = matrix[np.linalg.norm(matrix, axis=1) > 0]
+        if len(embeddings) == 0:
+            logger.warning("有効な音声がないため登録をスキップ: %s", speaker_id)
+            return
 
-        self.reference_embeddings[speaker_id] = np.mean(embeddings, axis=0)
+        self._reference_embeddings[speaker_id] = np.mean(embeddings, axis=0)
+        self._invalidate_references()
         logger.info("話者登録完了: %s (%d ファイル)", speaker_id, len(audio_paths))
 
     def register_speakers_from_dir(self, reference_dir: str) -> None:
@@ -72,11 +198,87 @@ class VoiceMatcher:
 
             self.register_speaker(speaker_dir.name, [str(f) for f in audio_files])
 
-    def compare(self, audio_path: str) -> dict[str, float]:
+        self._maybe_build_index(reference_dir)
+
+    def register_speakers_from_store(
+        self, reference_dir: str, store_path: str | Path | None = None,
+        model: str = "resemblyzer",
+        embed_fn: Callable[[list[str]], np.ndarray] | None = None,
+        shared: bool = False,
+    ) -> None:
+        """永続化された話者ストアを使って全話者を一括登録する。
+
+        register_speakers_from_dir と同じディレクトリ構成を読むが、
+        声紋ベクトルはストアから読み込み、追加・変更された基準音声だけを再計算する。
+
+        Args:
+            reference_dir: 基準音声ディレクトリ
+            store_path: ストアの保存先（省略時は reference_dir の隣）
+            model: 声紋ベクトルのモデル名（ストアはモデルごとに分かれる）
+            embed_fn: ファイルパスのリストから (N × 次元) の声紋行列を返す関数。
+                省略時は VoiceEncoder を使う（別モデルのストアでは必須）
+            shared: 参照行列をプロセス間の共有メモリ（SharedMatrix）に置き、
+                同じストアを読む他のワーカーと物理メモリを共有するか
+        """
+        if store_path is None:
+            store_path = store_path_for(reference_dir, model)
+        if embed_fn is None:
+            def embed_fn(paths: list[str]) -> np.ndarray:
+                return self.embed_segments([{"audio_path": p} for p in paths])
+
+        store = SpeakerStore.load(store_path, model=model)
+        changed = store.sync(reference_dir, embed_fn)
+        if changed:
+            store.save(store_path)
+
+        counts = store.file_counts()
+        for speaker_id, centroid in store.centroids().items():
+            self._reference_embeddings[speaker_id] = centroid
+            logger.info("話者登録完了: %s (%d ファイル)", speaker_id, counts[speaker_id])
+        self._invalidate_references()
+        if shared:
+            self._share_references(store_path, model)
+
+        self._maybe_build_index(reference_dir)
+
+    def _share_references(self, store_path: str | Path, model: str) -> None:
+        """参照行列を共有メモリの行列に置き換える（他のワーカーが公開済みならそれを使う）。
+
+        ストアのファイルが変わる（保存される）と version が変わり、最初に読んだワーカーが
+        公開し直す。
+        """
+        from src.embedding_store import SharedMatrix
+
+        path = Path(store_path)
+        if not path.exists():
+            return
+        st = path.stat()
+        ids = self.speaker_ids
+        ids_digest = hashlib.blake2b("\n".join(ids).encode(), digest_size=8).hexdigest()
+        name = f"speakers-{model}-{path.resolve()}"
+        version = f"{st.st_size}:{st.st_mtime_ns}:{ids_digest}"
+        shared = SharedMatrix.open(name, version)
+        if shared is None or shared.rows != ids:
+            shared = SharedMatrix.publish(name, ids, self.reference_matrix, version)
+            self._published = shared
+            logger.info("参照行列を共有メモリに公開しました: %s", shared.path)
+        # 行は共有メモリのビュー（正規化済み。コサイン類似度は変わらない）
+        self._shared_references = shared
+        self._reference_embeddings = dict(zip(shared.rows, shared.matrix))
+        self._speaker_ids = list(shared.rows)
+        self._reference_matrix = shared.matrix
+
+    def _maybe_build_index(self, reference_dir: str) -> None:
+        """話者数が多い場合は近似最近傍インデックスを基準音声ディレクトリの隣に保存する。"""
+        if len(self.reference_embeddings) >= self.ann_min_speakers:
+            self.build_index(path=index_path_for(reference_dir))
+
+    def compare(self, audio_path: str, top_k: int | None = None) -> dict[str, float]:
         """音声ファイルを全登録話者と照合し、類似度スコアを返す。
 
         Args:
             audio_path: 照合対象の音声ファイルパス
+            top_k: 指定時は類似度上位 k 人のみを返す（インデックスがあれば近似検索）
 
         Returns:
             {話者ID: コサイン類似度} の辞書
@@ -84,69 +286,285 @@ class VoiceMatcher:
         if not self.reference_embeddings:
             raise RuntimeError("基準話者が登録されていません。先にregister_speakerを呼んでください。")
 
+        embedding = self.embed_file(audio_path)
+        if embedding is None:
+            return {sid: 0.0 for sid in self.reference_embeddings}
+        return self._score(embedding, top_k)
+
+    def embed_file(self, audio_path: str) -> np.ndarray | None:
+        """音声ファイルから声紋ベクトルを計算する（キャッシュ有効時はキャッシュを利用）。
+
+        Returns:
+            声紋ベクトル。前処理後に音声が残らなければ None
+        """
         cached = self._cache.get(audio_path, prefix="voice") if self._cache else None
         if cached is not None:
-            embedding = cached
-        else:
-            wav = preprocess_wav(Path(audio_path))
-            if len(wav) == 0:
-                return {sid: 0.0 for sid in self.reference_embeddings}
-            embedding = self.encoder.embed_utterance(wav)
-            if self._cache:
-                self._cache.put(audio_path, embedding, prefix="voice")
-        scores = {}
-        for speaker_id, ref_embedding in self.reference_embeddings.items():
-            similarity = np.dot(embedding, ref_embedding) / (
-                np.linalg.norm(embedding) * np.linalg.norm(ref_embedding)
-            )
-            scores[speaker_id] = float(similarity)
-
-        return scores
+            return cached
+        wav = preprocess_wav(Path(audio_path))
+        if len(wav) == 0:
+            return None
+        embedding = self.encoder.embed_utterance(wav)
+        if self._cache:
+            self._cache.put(audio_path, embedding, prefix="voice")
+        return embedding
 
-    def compare_segments(self, segments: list[dict]) -> dict[str, dict]:
-        """複数の音声セグメントを一括照合する。
+    def compare_wav(self, wav: np.ndarray, sample_rate: int | None = None,
+                    top_k: int | None = None) -> dict[str, float]:
+        """メモリ上の波形を全登録話者と照合する（一時ファイル不要）。
 
         Args:
-            segments: [{"start": float, "end": float, "audio_path": str}, ...] のリスト
+            wav: モノラル波形（int16 PCM または float32、ビュー可）
+            sample_rate: 波形のサンプリングレート（16kHz 以外なら再サンプリング）
+            top_k: 指定時は類似度上位 k 人のみを返す
 
         Returns:
-            {話者ID: {"max_score": float, "avg_score": float, "segments": int}} の辞書
+            {話者ID: コサイン類似度} の辞書
         """
-        all_scores: dict[str, list[float]] = {
-            sid: [] for sid in self.reference_embeddings
-        }
+        if not self.reference_embeddings:
+            raise RuntimeError("基準話者が登録されていません。先にregister_speakerを呼んでください。")
 
-        for segment in segments:
-            scores = self.compare(segment["audio_path"])
-            for sid, score in scores.items():
-                all_scores[sid].append(score)
+        embedding = self.embed_wav(wav, sample_rate)
+        if embedding is None:
+            return {sid: 0.0 for sid in self.reference_embeddings}
+        return self._score(embedding, top_k)
 
-        results = {}
-        for sid, scores in all_scores.items():
-            if scores:
-                results[sid] = {
-                    "max_score": float(np.max(scores)),
-                    "avg_score": float(np.mean(scores)),
-                    "matching_segments": int(np.sum(np.array(scores) >= self.threshold)),
-                    "total_segments": len(scores),
-                }
+    def compare_embedding(self, embedding: np.ndarray | None) -> dict[str, float]:
+        """計算済みの声紋ベクトルを全登録話者と照合する（None なら全話者 0）"""
+        if embedding is None:
+            return {sid: 0.0 for sid in self.speaker_ids}
+        return self._score(embedding)
+
+    def embed_wav(self, wav: np.ndarray, sample_rate: int | None = None) -> np.ndarray | None:
+        """メモリ上の波形から声紋ベクトルを計算する。
+
+        Returns:
+            声紋ベクトル。前処理後に音声が残らなければ None
+        """
+        processed = self._preprocess(wav, sample_rate)
+        if len(processed) == 0:
+            return None
+        return self.encoder.embed_utterance(processed)
+
+    def compare_segment(self, segment: dict) -> dict[str, float]:
+        """セグメント辞書を照合する。
+
+        "wav"（メモリ上の波形）があればそれを、なければ "audio_path" を使う。
+        """
+        if segment.get("wav") is not None:
+            return self.compare_wav(segment["wav"], segment.get("sample_rate"))
+        return self.compare(segment["audio_path"])
+
+    def embed_segment(self, segment: dict) -> np.ndarray | None:
+        """セグメント辞書の声紋ベクトルを計算する。音声が残らなければ None。"""
+        if segment.get("wav") is not None:
+            return self.embed_wav(segment["wav"], segment.get("sample_rate"))
+        return self.embed_file(segment["audio_path"])
+
+    def embed_segments(self, segments: list[dict]) -> np.ndarray:
+        """複数セグメントの声紋ベクトルを (N_segments × 次元) の行列として計算する。
+
+        キャッシュにない発話は embed_batch でまとめて推論する。
+        音声が残らなかったセグメントはゼロベクトル（全話者とのスコア 0）になる。
+        "cache_key"（EmbeddingCache.segment_key）のあるセグメントはそのキーで、
+        ファイルのセグメントは内容のハッシュでキャッシュを引く。
+        """
+        rows: list[np.ndarray | None] = [None] * len(segments)
+        pending: list[tuple[int, np.ndarray, str | None]] = []
+
+        keys: list[str | None] = [None] * len(segments)
+        if self._cache:
+            for i, segment in enumerate(segments):
+                if segment.get("cache_key"):
+                    keys[i] = segment["cache_key"]
+                elif segment.get("wav") is None:
+                    keys[i] = self._cache.file_key(segment["audio_path"], "voice")
+            cached_rows = [i for i, key in enumerate(keys) if key is not None]
+            if cached_rows:
+                cached = self._cache.get_keys([keys[i] for i in cached_rows])
+                for i, embedding in zip(cached_rows, cached):
+                    rows[i] = embedding
+
+        empty: list[str] = []
+        for i, segment in enumerate(segments):
+            if rows[i] is not None:
+                continue
+            if segment.get("wav") is not None:
+                wav = self._preprocess(segment["wav"], segment.get("sample_rate"))
             else:
-                results[sid] = {
+                wav = preprocess_wav(Path(segment["audio_path"]))
+
+            if len(wav) == 0:
+                if segment.get("cache_key"):
+                    empty.append(keys[i])
+                continue
+            pending.append((i, wav, keys[i]))
+            if len(pending) >= _PENDING_UTTERANCES:
+                self._flush_pending(pending, rows)
+                pending = []
+        self._flush_pending(pending, rows)
+
+        dim = next((len(r) for r in rows if r is not None), self._embedding_dim())
+        if self._cache and empty:
+            # 音声が残らない区間もゼロベクトルとして記録し、次回は前処理もしない
+            self._cache.put_keys({key: np.zeros(dim, dtype=np.float32) for key in empty})
+        matrix = np.zeros((len(segments), dim), dtype=np.float32)
+        for i, row in enumerate(rows):
+            if row is not None:
+                matrix[i] = row
+        return matrix
+
+    def embed_batch(self, wavs: list[np.ndarray]) -> np.ndarray:
+        """前処理済みの複数発話を少数の大きな forward でまとめて埋め込む。
+
+        Args:
+            wavs: preprocess_wav 済みの float32 波形のリスト
+
+        Returns:
+            (len(wavs) × 次元) の声紋行列
+        """
+        return embed_utterances(self.encoder, wavs, batch_size=self.batch_size)
+
+    def _flush_pending(self, pending: list[tuple[int, np.ndarray, str | None]],
+                       rows: list[np.ndarray | None]) -> None:
+        """溜まった発話をバッチ推論し、結果を rows に書き戻す（キーのあるものは保存する）。"""
+        if not pending:
+            return
+        embeddings = self.embed_batch([wav for _, wav, _ in pending])
+        for (i, _, _), embedding in zip(pending, embeddings):
+            rows[i] = embedding
+        if self._cache:
+            vectors = {key: e for (_, _, key), e in zip(pending, embeddings) if key is not None}
+            if vectors:
+                self._cache.put_keys(vectors)
+
+    def _preprocess(self, wav: np.ndarray, sample_rate: int | None) -> np.ndarray:
+        """メモリ上の波形を resemblyzer 用に前処理する。"""
+        source_sr = sample_rate if sample_rate and sample_rate != _ENCODER_SAMPLE_RATE else None
+        return preprocess_wav(pcm_to_float32(wav), source_sr=source_sr)
+
+    def _embedding_dim(self) -> int:
+        """声紋ベクトルの次元数"""
+        if self.reference_embeddings:
+            return len(next(iter(self.reference_embeddings.values())))
+        return _EMBEDDING_DIM
+
+    def _score(self, embedding: np.ndarray, top_k: int | None = None) -> dict[str, float]:
+        """声紋ベクトルと全登録話者のコサイン類似度を計算する。"""
+        if top_k is not None:
+            if self.index is not None:
+                return dict(self.index.search(embedding, k=top_k, n_probe=self.ann_probe)[0])
+            return dict(self.top_k(embedding, top_k)[0])
+        scores = self.score_matrix(embedding)[0]
+        return {sid: float(score) for sid, score in zip(self.speaker_ids, scores)}
+
+    def score_matrix(self, embeddings: np.ndarray) -> np.ndarray:
+        """声紋ベクトル群と全登録話者のコサイン類似度を1回の行列積で計算する。
+
+        Args:
+            embeddings: (N × 次元) の声紋行列、または単一の声紋ベクトル
+
+        Returns:
+            (N × 話者数) の float32 スコア行列（列順は speaker_ids）。
+            ゼロベクトルの行は全話者に対して 0
+        """
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        normalized = np.divide(embeddings, norms, out=np.zeros_like(embeddings), where=norms > 0)
+        return normalized @ self.reference_matrix.T
+
+    def top_k(self, embeddings: np.ndarray, k: int = 5) -> list[list[tuple[str, float]]]:
+        """各声紋ベクトルについて類似度上位 k 人の話者を返す。
+
+        Args:
+            embeddings: (N × 次元) の声紋行列、または単一の声紋ベクトル
+            k: 返す候補数（登録話者数を超える場合は全員）
+
+        Returns:
+            行ごとの [(話者ID, 類似度), ...]（類似度の降順）
+        """
+        scores = self.score_matrix(embeddings)
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            return [[] for _ in range(len(scores))]
+
+        ids = self.speaker_ids
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(scores, top):
+            ordered = candidates[np.argsort(-row[candidates])]
+            results.append([(ids[j], float(row[j])) for j in ordered])
+        return results
+
+    def compare_segments(self, segments: list[dict]) -> dict[str, dict]:
+        """複数の音声セグメントを一括照合する。
+
+        各セグメントの声紋ベクトルは1回だけ計算し、全話者とのスコアは
+        (N_segments × 話者数) の行列としてまとめて求める。
+
+        Args:
+            segments: [{"start": float, "end": float, "audio_path": str}, ...] のリスト。
+                "audio_path" の代わりに "wav"（ndarray）と "sample_rate" も指定可。
+                "duration" があれば発話時間として end - start の代わりに使う
+
+        Returns:
+            {話者ID: {"max_score": float, "avg_score": float, "matching_segments": int,
+                      "total_segments": int, "speaking_time": float}} の辞書。
+            speaking_time は閾値以上だったセグメントの長さの合計（秒）
+        """
+        if not segments:
+            return {
+                sid: {
                     "max_score": 0.0,
                     "avg_score": 0.0,
                     "matching_segments": 0,
                     "total_segments": 0,
+                    "speaking_time": 0.0,
                 }
+                for sid in self.reference_embeddings
+            }
+        if not self.reference_embeddings:
+            raise RuntimeError("基準話者が登録されていません。先にregister_speakerを呼んでください。")
+
+        scores = self.score_matrix(self.embed_segments(segments))
+        durations = np.array(
+            [seg.get("duration", seg.get("end", 0.0) - seg.get("start", 0.0)) for seg in segments],
+            dtype=np.float64,
+        )
+        return self.summarize_scores(scores, durations)
+
+    def summarize_scores(self, scores: np.ndarray, durations: np.ndarray) -> dict[str, dict]:
+        """(セグメント数 × 話者数) のスコア行列を話者ごとの照合結果にまとめる。
+
+        Args:
+            scores: score_matrix の結果（1行以上）
+            durations: 各セグメントの発話時間（秒）
+
+        Returns:
+            compare_segments と同じ形式の辞書
+        """
+        matches = scores >= self.threshold
+        durations = np.asarray(durations, dtype=np.float64)
+        results = {}
+        for j, sid in enumerate(self.speaker_ids):
+            results[sid] = {
+                "max_score": float(scores[:, j].max()),
+                "avg_score": float(scores[:, j].mean()),
+                "matching_segments": int(matches[:, j].sum()),
+                "total_segments": len(scores),
+                "speaking_time": float(durations[matches[:, j]].sum()),
+            }
 
         return results
 
     def identify(self, audio_path: str) -> tuple[str | None, float]:
         """音声ファイルから最も一致する話者を特定する。
 
+        近似最近傍インデックスがある場合は上位候補のみを検索する。
+
         Returns:
             (話者ID, 類似度) のタプル。閾値未満の場合は (None, 最大スコア)
         """
-        scores = self.compare(audio_path)
+        scores = self.compare(audio_path, top_k=1 if self.index is not None else None)
         if not scores:
             return None, 0.0
 
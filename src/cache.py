@@ -1,41 +1,194 @@
-"""埋め込みキャッシュ - 声紋・視覚特徴ベクトルの再計算を回避"""
+"""埋め込みキャッシュ - 声紋・視覚特徴ベクトルや話者分離結果の再計算を回避"""
 
 import hashlib
+import json
 import logging
+import os
+import re
+import tempfile
+from collections.abc import Iterable
 from pathlib import Path
 
 import numpy as np
 
+from src.embedding_store import PackedEmbeddingStore
+from src.fingerprint import FingerprintIndex, full_hash
+
 logger = logging.getLogger(__name__)
 
 _DEFAULT_CACHE_DIR = Path(".cache/embeddings")
+_DEFAULT_DIARIZATION_DIR = Path(".cache/diarization")
+_DIARIZATION_VERSION = 1
+# これより大きいファイルは全体を読まず簡易フィンガープリントで識別する
+_FULL_HASH_LIMIT = 256 * 1024 * 1024
+# 動画ごとの区間リスト（segment_key の一覧）を置くサブディレクトリ
+_PLAN_DIR = "plans"
+# ファイル全体の MD5 をキーにしていた頃の .npy（<プレフィックス>_<MD5 32桁>.npy）
+_MD5_NPY = re.compile(r"_[0-9a-f]{32}$")
+# MD5 の .npy を削除済みであることを示すファイル（開くたびに走査しない）
+_MD5_REMOVED_MARKER = ".md5-npy-removed"
+
+
+def _write_atomic(path: Path, write) -> None:
+    """write(f) で同じディレクトリの一時ファイルに書いてから path に置き換える。
+
+    一時ファイルはプロセス・スレッドごとに別名なので、同じキーを同時に書いても
+    読み手が書きかけのファイルを見ることはない。
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _load_npy(path: Path) -> np.ndarray | None:
+    """.npy を読む（ない・置き換え中に削除された場合は None）"""
+    try:
+        return np.load(path)
+    except FileNotFoundError:
+        return None
+
+
+def audio_fingerprint(audio: str | Path | np.ndarray, sample_rate: int = 16000) -> str:
+    """音声内容のフィンガープリント（blake2b）を返す。
+
+    Args:
+        audio: 音声ファイルのパス、またはメモリ上の波形
+        sample_rate: audio が波形の場合のサンプリングレート
+    """
+    if not isinstance(audio, np.ndarray):
+        return full_hash(audio)
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{audio.dtype.str}:{sample_rate}:".encode())
+    h.update(memoryview(np.ascontiguousarray(audio)).cast("B"))
+    return h.hexdigest()
 
 
 class EmbeddingCache:
-    """ファイルベースの埋め込みキャッシュ。
+    """埋め込みベクトルのキャッシュ。
+
+    音声ファイルの内容のハッシュ（blake2b）をキーとして、計算済みの埋め込み
+    ベクトルを保存する。保存形式は backend で選ぶ。
+
+    - "packed"（既定）: 1つのアリーナファイルに詰めて保存する（PackedEmbeddingStore）
+    - "npy": ベクトルごとに .npy ファイルを書く（旧形式）
 
-    音声ファイルの MD5 ハッシュをキーとして、
-    計算済みの埋め込みベクトルを .npy 形式で保存する。
+    packed で見つからないキーは旧形式の .npy も探し、あればストアに移す。
+    ファイル全体の MD5 をキーにしていた頃の .npy は参照されないため、初回に開いたときに削除する。
+    packed では容量の上限・プレフィックス（"voice" など）ごとの上限・有効期限を
+    指定でき、超えた分は lru / lfu の順に追い出される（PackedEmbeddingStore）。
+
+    ハッシュはファイルごとに (パス, サイズ, 更新時刻, inode) が変わらない限り
+    1回だけ計算し、キャッシュディレクトリの fingerprints.sqlite に記録する。
+    full_hash_limit を超える大きなファイルは先頭・中央・末尾だけを読む
+    簡易フィンガープリントで識別する。
+
+    動画内の区間は segment_key（動画のフィンガープリント・区間・サンプリング
+    レート・モデル）をキーにするので、区間の音声をファイルに書き出さずに
+    保存・取得できる。動画ごとの区間の一覧は put_plan / get_plan で保存する。
     """
 
-    def __init__(self, cache_dir: Path | str = _DEFAULT_CACHE_DIR):
+    def __init__(self, cache_dir: Path | str = _DEFAULT_CACHE_DIR,
+                 full_hash_limit: int | None = _FULL_HASH_LIMIT,
+                 backend: str = "packed", dtype: str = "float32",
+                 max_bytes: int | None = None, max_entries: int | None = None,
+                 quotas: dict[str, int] | None = None, policy: str = "lru",
+                 ttl_sec: float | None = None):
+        """
+        Args:
+            cache_dir: キャッシュの保存先
+            full_hash_limit: ファイル全体をハッシュする上限サイズ（バイト）。None で常に全体
+            backend: 保存形式（"packed" / "npy"）
+            dtype: packed で保存する精度（"float32" / "float16"）
+            max_bytes: packed の合計バイト数の上限（None で無制限）
+            max_entries: packed のベクトル数の上限（None で無制限）
+            quotas: プレフィックスごとの合計バイト数の上限（例: {"voice": ..., "visual": ...}）
+            policy: 上限を超えたときに追い出す順（"lru" / "lfu"）
+            ttl_sec: 保存からこの秒数を過ぎたベクトルを無効にする（None で無期限）
+        """
+        if backend not in ("packed", "npy"):
+            raise ValueError(f"backend は packed / npy のいずれかを指定してください: {backend}")
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.full_hash_limit = full_hash_limit
+        self.backend = backend
+        self.dtype = dtype
+        self._limits = {"max_bytes": max_bytes, "max_entries": max_entries,
+                        "quotas": quotas, "policy": policy, "ttl_sec": ttl_sec}
+        self._index: FingerprintIndex | None = None
+        self._store: PackedEmbeddingStore | None = None
         self._hits = 0
         self._misses = 0
+        self._remove_md5_npy()
+
+    def _remove_md5_npy(self) -> None:
+        """MD5 をキーにしていた頃の .npy を一度だけ削除する（今のキーでは参照されない）"""
+        marker = self.cache_dir / _MD5_REMOVED_MARKER
+        if marker.exists():
+            return
+        removed = 0
+        for path in self.cache_dir.glob("*.npy"):
+            if _MD5_NPY.search(path.stem):
+                path.unlink(missing_ok=True)
+                removed += 1
+        marker.touch()
+        if removed:
+            logger.info("旧形式（MD5 キー）のキャッシュ %d 件を削除しました: %s",
+                        removed, self.cache_dir)
+
+    @classmethod
+    def from_config(cls, cache_cfg: dict) -> "EmbeddingCache":
+        """config.yaml の cache セクションから作る（cache.embeddings の上限を使う）"""
+        emb_cfg = cache_cfg.get("embeddings") or {}
+        return cls(
+            Path(cache_cfg.get("dir", ".cache")) / "embeddings",
+            dtype=emb_cfg.get("dtype", "float32"),
+            max_bytes=emb_cfg.get("max_bytes"),
+            max_entries=emb_cfg.get("max_entries"),
+            quotas=emb_cfg.get("quotas"),
+            policy=emb_cfg.get("policy", "lru"),
+            ttl_sec=emb_cfg.get("ttl_sec"),
+        )
+
+    @property
+    def index(self) -> FingerprintIndex:
+        """ハッシュの記録（初回アクセスで開く）"""
+        if self._index is None:
+            self._index = FingerprintIndex(self.cache_dir / "fingerprints.sqlite")
+        return self._index
+
+    @property
+    def store(self) -> PackedEmbeddingStore:
+        """packed のストア（初回アクセスで開く）"""
+        if self._store is None:
+            self._store = PackedEmbeddingStore(self.cache_dir, dtype=self.dtype, **self._limits)
+        return self._store
+
+    def close(self) -> None:
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+        if self._index is not None:
+            self._index.close()
+            self._index = None
 
     def _file_hash(self, file_path: str) -> str:
-        """ファイルの MD5 ハッシュを計算する。"""
-        h = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(8192), b""):
-                h.update(chunk)
-        return h.hexdigest()
+        """ファイルの内容のハッシュ（記録済みで変わっていなければ読み直さない）。"""
+        if self.full_hash_limit is not None and os.path.getsize(file_path) > self.full_hash_limit:
+            return "s" + self.index.fingerprint(file_path)
+        return self.index.full_fingerprint(file_path)
+
+    def file_key(self, file_path: str, prefix: str) -> str:
+        """ファイルのキャッシュキー（npy ではファイル名の拡張子を除いた部分）"""
+        return f"{prefix}_{self._file_hash(file_path)}"
 
     def _cache_path(self, file_path: str, prefix: str) -> Path:
-        """キャッシュファイルのパスを生成する。"""
-        file_hash = self._file_hash(file_path)
-        return self.cache_dir / f"{prefix}_{file_hash}.npy"
+        """npy のキャッシュファイルのパスを生成する。"""
+        return self.cache_dir / f"{self.file_key(file_path, prefix)}.npy"
 
     def get(self, file_path: str, prefix: str = "emb") -> np.ndarray | None:
         """キャッシュから埋め込みベクトルを取得する。
@@ -47,13 +200,48 @@ class EmbeddingCache:
         Returns:
             キャッシュがあれば ndarray、なければ None
         """
-        cache_file = self._cache_path(file_path, prefix)
-        if cache_file.exists():
-            self._hits += 1
-            logger.debug("キャッシュヒット: %s", file_path)
-            return np.load(cache_file)
-        self._misses += 1
-        return None
+        return self.get_many([file_path], prefix)[0]
+
+    def get_many(self, file_paths: list[str], prefix: str = "emb") -> list[np.ndarray | None]:
+        """複数ファイルの埋め込みベクトルをまとめて取得する（入力順。なければ None）"""
+        return self.get_keys([self.file_key(p, prefix) for p in file_paths])
+
+    def get_keys(self, keys: list[str]) -> list[np.ndarray | None]:
+        """キャッシュキーで埋め込みベクトルをまとめて取得する（入力順。なければ None）"""
+        if self.backend == "packed":
+            found = self.store.get_many(keys)
+            missing = [k for k in keys if k not in found]
+            if missing:
+                found.update(self._migrate_npy(missing))
+        else:
+            found = {}
+            for key in keys:
+                embedding = _load_npy(self.cache_dir / f"{key}.npy")
+                if embedding is not None:
+                    found[key] = embedding
+
+        embeddings = [found.get(key) for key in keys]
+        for key, embedding in zip(keys, embeddings):
+            if embedding is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                logger.debug("キャッシュヒット: %s", key)
+        return embeddings
+
+    def _migrate_npy(self, keys: list[str]) -> dict[str, np.ndarray]:
+        """旧形式の .npy があればストアに移して返す"""
+        migrated = {}
+        for key in keys:
+            embedding = _load_npy(self.cache_dir / f"{key}.npy")
+            if embedding is not None:
+                migrated[key] = embedding
+        if migrated:
+            self.store.put_many(migrated)
+            for key in migrated:
+                (self.cache_dir / f"{key}.npy").unlink(missing_ok=True)
+            logger.debug("旧形式のキャッシュ %d 件をストアに移しました", len(migrated))
+        return migrated
 
     def put(self, file_path: str, embedding: np.ndarray, prefix: str = "emb") -> None:
         """埋め込みベクトルをキャッシュに保存する。
@@ -63,21 +251,212 @@ class EmbeddingCache:
             embedding: 保存する埋め込みベクトル
             prefix: キャッシュキーのプレフィックス
         """
-        cache_file = self._cache_path(file_path, prefix)
-        np.save(cache_file, embedding)
-        logger.debug("キャッシュ保存: %s", file_path)
+        self.put_many([file_path], [embedding], prefix)
+
+    def put_many(self, file_paths: list[str], embeddings: Iterable[np.ndarray],
+                 prefix: str = "emb") -> None:
+        """複数ファイルの埋め込みベクトルをまとめて保存する"""
+        self.put_keys({self.file_key(p, prefix): e for p, e in zip(file_paths, embeddings)})
+
+    def put_keys(self, vectors: dict[str, np.ndarray]) -> None:
+        """{キャッシュキー: 埋め込みベクトル} をまとめて保存する"""
+        if self.backend == "packed":
+            self.store.put_many(vectors)
+        else:
+            for key, embedding in vectors.items():
+                _write_atomic(self.cache_dir / f"{key}.npy",
+                              lambda f, e=embedding: np.save(f, e))
+        logger.debug("キャッシュ保存: %d 件", len(vectors))
+
+    @staticmethod
+    def segment_key(fingerprint: str, start: float, end: float, sample_rate: int,
+                    model: str, variant: str = "", prefix: str = "voice") -> str:
+        """動画内の区間の埋め込みベクトルのキャッシュキー（区間の WAV を作らずに決まる）。
+
+        Args:
+            fingerprint: 動画ファイルのフィンガープリント
+            start: 区間の開始（秒）
+            end: 区間の終了（秒）
+            sample_rate: 音声を展開したサンプリングレート
+            model: 埋め込みモデルの識別子（バージョンを含む）
+            variant: 区間の波形に影響するその他の条件（VAD の設定など）
+            prefix: キャッシュキーのプレフィックス
+        """
+        payload = f"{fingerprint}:{start:.3f}:{end:.3f}:{sample_rate}:{model}:{variant}"
+        return f"{prefix}_seg{hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()}"
+
+    @staticmethod
+    def plan_key(fingerprint: str, **params) -> str:
+        """動画の区間リストのキャッシュキー（params は区間に影響する設定。JSON 化できる値）"""
+        payload = json.dumps({"fingerprint": fingerprint, **params}, sort_keys=True)
+        return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+    def get_plan(self, key: str) -> dict | None:
+        """保存済みの区間リスト（put_plan で保存した辞書）。なければ None"""
+        try:
+            with open(self.cache_dir / _PLAN_DIR / f"{key}.json", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("区間リストのキャッシュを読み込めません: %s (%s)", key, e)
+            return None
+
+    def put_plan(self, key: str, plan: dict) -> None:
+        """動画の区間リスト（各区間のキャッシュキーなど）を保存する"""
+        plan_dir = self.cache_dir / _PLAN_DIR
+        plan_dir.mkdir(exist_ok=True)
+        data = json.dumps(plan, ensure_ascii=False).encode("utf-8")
+        _write_atomic(plan_dir / f"{key}.json", lambda f: f.write(data))
 
     def clear(self) -> int:
         """キャッシュを全て削除する。
 
         Returns:
-            削除したファイル数
+            削除したベクトル数
         """
         count = 0
         for f in self.cache_dir.glob("*.npy"):
             f.unlink()
             count += 1
-        logger.info("キャッシュクリア: %d ファイル削除", count)
+        if self.backend == "packed":
+            count += self.store.clear()
+        for f in (self.cache_dir / _PLAN_DIR).glob("*.json"):
+            f.unlink()
+        logger.info("キャッシュクリア: %d 件削除", count)
+        return count
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """キャッシュ統計を返す。"""
+        return {"hits": self._hits, "misses": self._misses}
+
+    @property
+    def counters(self) -> dict[str, int]:
+        """ヒット・ミスに加え、packed の件数・容量・追い出し・期限切れ・整理の回数"""
+        counters = dict(self.stats)
+        if self.backend == "packed":
+            counters.update(self.store.stats)
+        return counters
+
+    def evict(self) -> int:
+        """期限切れのベクトルを削除し、上限を超えていれば追い出す（packed のみ）"""
+        return self.store.evict() if self.backend == "packed" else 0
+
+
+class DiarizationCache:
+    """話者分離結果のファイルキャッシュ。
+
+    音声のフィンガープリントと分離パラメータ（バックエンド・最大話者数・
+    最短セグメント長など）から作ったキーごとに、セグメントを
+    開始/終了時刻とラベル番号の配列として .npz に保存する。
+    """
+
+    def __init__(self, cache_dir: Path | str = _DEFAULT_DIARIZATION_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def make_key(fingerprint: str, backend: str, max_speakers: int,
+                 min_segment_duration: float, **params) -> str:
+        """フィンガープリントと分離パラメータからキャッシュキーを作る。
+
+        Args:
+            fingerprint: audio_fingerprint() の値
+            backend: 分離バックエンド名
+            max_speakers: 最大話者数
+            min_segment_duration: 最短セグメント長（秒）
+            **params: 結果に影響するその他のパラメータ（JSON 化できる値）
+        """
+        payload = json.dumps({
+            "version": _DIARIZATION_VERSION,
+            "fingerprint": fingerprint,
+            "backend": backend,
+            "max_speakers": max_speakers,
+            "min_segment_duration": min_segment_duration,
+            **params,
+        }, sort_keys=True)
+        return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+    def _cache_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npz"
+
+    def get(self, key: str) -> list[tuple[float, float, str]] | None:
+        """キャッシュからセグメントを取得する。
+
+        Returns:
+            [(開始, 終了, 話者ラベル), ...]。なければ None
+        """
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str) -> tuple[list[tuple[float, float, str]],
+                                           dict[str, np.ndarray]] | None:
+        """キャッシュからセグメントと話者ごとの声紋ベクトルを取得する。
+
+        Returns:
+            ([(開始, 終了, 話者ラベル), ...], {話者ラベル: 声紋ベクトル})。なければ None
+        """
+        cache_file = self._cache_path(key)
+        try:
+            with np.load(cache_file, allow_pickle=False) as data:
+                labels = [str(l) for l in data["labels"]]
+                segments = [
+                    (float(s), float(e), labels[i])
+                    for s, e, i in zip(data["starts"], data["ends"], data["label_ids"])
+                ]
+                embeddings = {}
+                if "embedding_labels" in data.files:
+                    embeddings = {
+                        str(l): vec for l, vec in zip(data["embedding_labels"], data["embeddings"])
+                    }
+        except FileNotFoundError:
+            self._misses += 1
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("話者分離キャッシュを読み込めません: %s (%s)", cache_file, e)
+            self._misses += 1
+            return None
+
+        self._hits += 1
+        logger.debug("話者分離キャッシュヒット: %s", key)
+        return segments, embeddings
+
+    def put(self, key: str, segments: list[tuple[float, float, str]],
+            embeddings: dict[str, np.ndarray] | None = None) -> None:
+        """セグメントと話者ごとの声紋ベクトルをキャッシュに保存する
+        （一時ファイルに書いてから置き換える）。"""
+        labels = list(dict.fromkeys(label for _, _, label in segments))
+        index = {label: i for i, label in enumerate(labels)}
+        arrays = {}
+        if embeddings:
+            arrays["embedding_labels"] = np.array(list(embeddings), dtype=str)
+            arrays["embeddings"] = np.stack(
+                [np.asarray(v, dtype=np.float32) for v in embeddings.values()]
+            )
+        _write_atomic(self._cache_path(key), lambda f: np.savez(
+            f,
+            starts=np.array([s for s, _, _ in segments], dtype=np.float64),
+            ends=np.array([e for _, e, _ in segments], dtype=np.float64),
+            label_ids=np.array([index[l] for _, _, l in segments], dtype=np.int32),
+            labels=np.array(labels, dtype=str),
+            **arrays,
+        ))
+        logger.debug("話者分離キャッシュ保存: %s (%d セグメント)", key, len(segments))
+
+    def clear(self) -> int:
+        """キャッシュを全て削除する。
+
+        Returns:
+            削除したファイル数
+        """
+        count = 0
+        for f in self.cache_dir.glob("*.npz"):
+            f.unlink()
+            count += 1
+        logger.info("話者分離キャッシュクリア: %d ファイル削除", count)
         return count
 
     @property
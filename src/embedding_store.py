@@ -0,0 +1,803 @@
+"""パック形式の埋め込みストア - 多数のベクトルを1つのファイルにまとめて保存する
+
+ベクトルごとに .npy を書くと、数百万の発話の埋め込みが数百万の小さなファイルになり、
+ディレクトリ操作や clear が遅く、inode とページキャッシュも無駄に消費する。
+PackedEmbeddingStore はベクトルを追記専用のアリーナファイル（float32 / float16 の
+生データ）に詰めて書き、キー → (位置, 形状) の対応を SQLite に記録する。
+読み出しはアリーナを mmap して必要な範囲だけをコピーする。
+
+    embeddings.arena   ベクトルの生データ（追記のみ。compact 後は embeddings.<世代>.arena）
+    embeddings.sqlite  キー → 位置・形状・最終アクセス時刻・参照回数の索引
+    embeddings.lock    書き込み用のロックファイル
+
+同じキーを再保存した場合は新しい位置を指すよう索引を書き換える（古いデータは
+アリーナに残る）。データを書いてから索引をコミットするため、途中で止まっても
+索引が書きかけのデータを指すことはない。
+
+容量の上限（バイト数・件数・プレフィックスごとのバイト数）を超えたら、最終アクセスが
+古いもの（lru）または参照回数が少ないもの（lfu）から索引を削除する。ttl_sec を
+指定すると保存から時間が経ったベクトルは見つからない扱いになる。削除で空いた
+アリーナの領域は compact（既定では保存時に別スレッドで実行）で詰め直す。
+
+複数プロセスから同じストアを開いてよい。書き込み（追記・追い出し・compact の切り替え）は
+ロックファイルの flock で直列化し、読み出しはロックを取らない。アリーナは切り詰めずに
+新しい世代のファイルへ切り替えるため、古い世代を mmap 中の読み手も壊れたデータを
+読まない（索引のスナップショットと同じ世代のアリーナを読む）。
+
+SharedMatrix は基準話者の声紋行列のように全ワーカーが常に読む小さな行列を、
+/dev/shm 上のファイルの mmap でプロセス間共有するホット層。
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterable, Iterator, Mapping
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARENA_FILENAME = "embeddings.arena"
+INDEX_FILENAME = "embeddings.sqlite"
+LOCK_FILENAME = "embeddings.lock"
+DTYPES = ("float32", "float16")
+EVICTION_POLICIES = ("lru", "lfu")
+# 上限を超えたら、この割合まで減らす（保存のたびに追い出しが走らないようにする）
+EVICT_TO = 0.9
+# 削除済みの領域がこのバイト数以上、かつ有効なデータ以上になったら compact する
+COMPACT_MIN_DEAD = 1 << 20
+# 1回の SELECT ... IN (...) で問い合わせるキーの数
+_QUERY_CHUNK = 500
+# 最終アクセス時刻・参照回数はこの件数たまってからまとめて書く
+_TOUCH_FLUSH = 256
+# 追い出し候補を一度に読む件数
+_EVICT_BATCH = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    key TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    shape TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS totals (
+    prefix TEXT PRIMARY KEY,
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+"""
+# 追い出し用の列（容量制限を入れる前に作られた索引には後から足す）
+_EVICTION_COLUMNS = {
+    "prefix": "TEXT NOT NULL DEFAULT ''",
+    "nbytes": "INTEGER NOT NULL DEFAULT 0",
+    "created_at": "REAL NOT NULL DEFAULT 0",
+    "accessed_at": "REAL NOT NULL DEFAULT 0",
+    "hits": "INTEGER NOT NULL DEFAULT 0",
+}
+_EVICTION_INDEXES = """
+CREATE INDEX IF NOT EXISTS vectors_lru ON vectors (accessed_at);
+CREATE INDEX IF NOT EXISTS vectors_lfu ON vectors (hits, accessed_at);
+CREATE INDEX IF NOT EXISTS vectors_prefix ON vectors (prefix, accessed_at);
+"""
+_ORDER = {"lru": "accessed_at, key", "lfu": "hits, accessed_at, key"}
+
+
+def _shape_text(shape: tuple[int, ...]) -> str:
+    return ",".join(map(str, shape))
+
+
+def _parse_shape(text: str) -> tuple[int, ...]:
+    return tuple(int(n) for n in text.split(",")) if text else ()
+
+
+def _low_water(limit: int) -> int:
+    """上限を超えたときに減らす先（小さな上限では上限そのもの）"""
+    return int(limit * EVICT_TO) or limit
+
+
+def _in_chunks(keys: list[str]) -> Iterator[tuple[str, list[str]]]:
+    """キーを _QUERY_CHUNK 件ずつに分け、(プレースホルダ, キー) を返す"""
+    for start in range(0, len(keys), _QUERY_CHUNK):
+        chunk = keys[start:start + _QUERY_CHUNK]
+        yield ",".join("?" * len(chunk)), chunk
+
+
+def key_prefix(key: str) -> str:
+    """キーのプレフィックス（"voice_ab12" → "voice"。"_" がなければ空文字）"""
+    prefix, sep, _ = key.partition("_")
+    return prefix if sep else ""
+
+
+class PackedEmbeddingStore:
+    """キーごとのベクトルを1つのアリーナファイルに詰めて保存するストア。
+
+    使い方:
+        store = PackedEmbeddingStore(".cache/embeddings", max_bytes=2 << 30,
+                                     quotas={"visual": 512 << 20})
+        store.put_many({"voice_ab12": emb1, "voice_cd34": emb2})
+        vectors = store.get_many(["voice_ab12", "voice_ef56"])   # 見つかったキーだけ
+    """
+
+    def __init__(self, directory: str | Path, dtype: str = "float32",
+                 max_bytes: int | None = None, max_entries: int | None = None,
+                 quotas: Mapping[str, int] | None = None, policy: str = "lru",
+                 ttl_sec: float | None = None, auto_compact: bool = True):
+        """
+        Args:
+            directory: アリーナと索引を置くディレクトリ
+            dtype: 保存する精度（"float32" / "float16"）。既存のストアは作成時の精度を使う
+            max_bytes: 有効なベクトルの合計バイト数の上限（None で無制限）
+            max_entries: ベクトル数の上限（None で無制限）
+            quotas: プレフィックスごとの合計バイト数の上限（例: {"voice": ..., "visual": ...}）
+            policy: 追い出す順（"lru": 最終アクセスが古い順 / "lfu": 参照回数が少ない順）
+            ttl_sec: 保存からこの秒数を過ぎたベクトルを無効にする（None で無期限）
+            auto_compact: 空き領域が増えたら保存時に別スレッドで compact するか
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype は {DTYPES} のいずれかを指定してください: {dtype}")
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"policy は {EVICTION_POLICIES} のいずれかを指定してください: {policy}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.quotas = dict(quotas or {})
+        self.policy = policy
+        self.ttl_sec = ttl_sec
+        self.auto_compact = auto_compact
+        self._conn = sqlite3.connect(str(self.directory / INDEX_FILENAME), timeout=30.0,
+                                     check_same_thread=False)
+        self._lock = threading.Lock()
+        self._lock_fd = os.open(self.directory / LOCK_FILENAME, os.O_RDWR | os.O_CREAT, 0o644)
+        self._fd = -1
+        self._map: mmap.mmap | None = None
+        self.arena_path = self.directory / ARENA_FILENAME
+        self._touches: dict[str, float] = {}
+        self._touch_counts: Counter[str] = Counter()
+        self._compactor: threading.Thread | None = None
+        self.evictions = 0
+        self.expired = 0
+        self.compactions = 0
+        with self._writing():
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            with self._conn:
+                self._conn.executescript(_SCHEMA)
+                for name, value in (("dtype", dtype), ("arena", ARENA_FILENAME),
+                                    ("generation", "0")):
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO meta (name, value) VALUES (?, ?)", (name, value))
+            stored = self._meta("dtype")
+            self.dtype = np.dtype(stored)
+            self._upgrade_schema()
+            self._open_arena(self._meta("arena"), create=True)
+            self._remove_stale_arenas()
+        if stored != dtype:
+            logger.info("既存の埋め込みストアの精度 %s を使います: %s", stored, self.directory)
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """スレッド間・プロセス間で書き込みを直列化する"""
+        with self._lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _meta(self, name: str) -> str:
+        return self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()[0]
+
+    def _upgrade_schema(self) -> None:
+        """追い出し用の列・合計の表がない索引を更新する（書き込みロック中に呼ぶ）"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(vectors)")}
+        missing = [c for c in _EVICTION_COLUMNS if c not in columns]
+        with self._conn:
+            for column in missing:
+                self._conn.execute(
+                    f"ALTER TABLE vectors ADD COLUMN {column} {_EVICTION_COLUMNS[column]}")
+            if missing:
+                now = time.time()
+                rows = self._conn.execute("SELECT key, shape FROM vectors").fetchall()
+                self._conn.executemany(
+                    "UPDATE vectors SET prefix = ?, nbytes = ?, created_at = ?, accessed_at = ?"
+                    " WHERE key = ?",
+                    [(key_prefix(key), int(np.prod(_parse_shape(shape))) * self.dtype.itemsize,
+                      now, now, key) for key, shape in rows])
+            if self._conn.execute(
+                    "SELECT 1 FROM meta WHERE name = 'totals'").fetchone() is None:
+                self._conn.execute("DELETE FROM totals")
+                self._conn.execute(
+                    "INSERT INTO totals (prefix, entries, bytes)"
+                    " SELECT prefix, COUNT(*), SUM(nbytes) FROM vectors GROUP BY prefix")
+                self._conn.execute("INSERT INTO meta (name, value) VALUES ('totals', '1')")
+        self._conn.executescript(_EVICTION_INDEXES)
+
+    def _remove_stale_arenas(self) -> None:
+        """compact の途中で止まって残った古い・書きかけのアリーナを削除する（書き込みロック中）"""
+        for path in self.directory.glob("embeddings*.arena*"):
+            if path != self.arena_path:
+                path.unlink(missing_ok=True)
+
+    def _open_arena(self, name: str, create: bool = False) -> bool:
+        """索引が指す世代のアリーナを開く（開いているものと同じなら何もしない）。
+
+        Returns:
+            開けたか（他のプロセスの compact で既に削除された世代なら False）
+        """
+        path = self.directory / name
+        if self._fd >= 0 and path == self.arena_path:
+            return True
+        flags = os.O_RDWR | (os.O_CREAT if create else 0)
+        try:
+            fd = os.open(path, flags, 0o644)
+        except FileNotFoundError:
+            return False
+        self._unmap()
+        if self._fd >= 0:
+            os.close(self._fd)
+        self._fd = fd
+        self.arena_path = path
+        return True
+
+    def close(self) -> None:
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            if self._lock_fd < 0:
+                return
+            self._flush_touches()
+            self._unmap()
+            if self._fd >= 0:
+                os.close(self._fd)
+                self._fd = -1
+            os.close(self._lock_fd)
+            self._lock_fd = -1
+            self._conn.close()
+
+    def __enter__(self) -> "PackedEmbeddingStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._totals()[1]
+
+    def __contains__(self, key: str) -> bool:
+        expires = time.time() - self.ttl_sec if self.ttl_sec is not None else -1.0
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM vectors WHERE key = ? AND created_at >= ?",
+                (key, expires)).fetchone() is not None
+
+    def _totals(self) -> tuple[Counter[str], int, int]:
+        """(プレフィックスごとのバイト数, 件数, バイト数)"""
+        rows = self._conn.execute("SELECT prefix, entries, bytes FROM totals").fetchall()
+        return (Counter({p: b for p, _, b in rows}),
+                sum(n for _, n, _ in rows), sum(b for _, _, b in rows))
+
+    def _add_totals(self, rows: Iterable[tuple[str, int]], sign: int) -> None:
+        """(プレフィックス, バイト数) の行の分だけ合計を増減する（トランザクション内で呼ぶ）"""
+        deltas: dict[str, list[int]] = {}
+        for prefix, nbytes in rows:
+            delta = deltas.setdefault(prefix, [0, 0])
+            delta[0] += sign
+            delta[1] += sign * nbytes
+        self._conn.executemany(
+            "INSERT INTO totals (prefix, entries, bytes) VALUES (?, ?, ?)"
+            " ON CONFLICT (prefix) DO UPDATE SET entries = entries + excluded.entries,"
+            " bytes = bytes + excluded.bytes",
+            [(p, n, b) for p, (n, b) in deltas.items()])
+
+    def _existing(self, keys: list[str]) -> list[tuple[str, int]]:
+        """索引にあるキーの (プレフィックス, バイト数)"""
+        rows = []
+        for marks, chunk in _in_chunks(keys):
+            rows += self._conn.execute(
+                f"SELECT prefix, nbytes FROM vectors WHERE key IN ({marks})", chunk).fetchall()
+        return rows
+
+    def _unmap(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _view(self, end: int) -> mmap.mmap | None:
+        """end バイト目までを含む読み取り専用のマップ（アリーナが伸びていれば張り直す）"""
+        if self._map is None or len(self._map) < end:
+            self._unmap()
+            if os.fstat(self._fd).st_size < end:
+                return None
+            self._map = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def get(self, key: str) -> np.ndarray | None:
+        """キーのベクトル（float32）。なければ None"""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, np.ndarray]:
+        """複数キーのベクトルをまとめて取得する（見つからない・期限切れのキーは含まない）。
+
+        書き込みロックは取らず、索引の1つのスナップショットとその世代のアリーナから読む。
+        """
+        keys = list(dict.fromkeys(keys))
+        found: dict[str, np.ndarray] = {}
+        now = time.time()
+        expires = now - self.ttl_sec if self.ttl_sec is not None else None
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                arena = self._meta("arena")
+                rows = []
+                for marks, chunk in _in_chunks(keys):
+                    rows += self._conn.execute(
+                        "SELECT key, offset, shape, created_at FROM vectors"
+                        f" WHERE key IN ({marks})", chunk).fetchall()
+            finally:
+                self._conn.commit()
+            if rows and not self._open_arena(arena):
+                return found
+            for key, offset, shape_text, created_at in rows:
+                if expires is not None and created_at < expires:
+                    continue
+                shape = _parse_shape(shape_text)
+                count = int(np.prod(shape))
+                view = self._view(offset + count * self.dtype.itemsize)
+                if view is None:
+                    logger.warning("埋め込みストアのデータが欠けています: %s", key)
+                    continue
+                # マップを指すビューは残さない（残っているとマップを張り直せない）
+                found[key] = np.frombuffer(view, dtype=self.dtype, count=count,
+                                           offset=offset).astype(np.float32).reshape(shape)
+                self._touches[key] = now
+                self._touch_counts[key] += 1
+            if len(self._touches) >= _TOUCH_FLUSH:
+                self._flush_touches()
+        return found
+
+    def _flush_touches(self) -> None:
+        """たまった最終アクセス時刻・参照回数を索引に書く（ロック取得済みで呼ぶ）"""
+        if not self._touches:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE vectors SET accessed_at = MAX(accessed_at, ?), hits = hits + ?"
+                " WHERE key = ?",
+                [(t, self._touch_counts[k], k) for k, t in self._touches.items()])
+        self._touches.clear()
+        self._touch_counts.clear()
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        """1件のベクトルを保存する"""
+        self.put_many({key: vector})
+
+    def put_many(self, vectors: Mapping[str, np.ndarray]) -> None:
+        """複数のベクトルを1回の追記と1回のコミットで保存する。
+
+        上限を超えたら追い出し、空き領域が増えていれば compact を始める。
+        """
+        if not vectors:
+            return
+        arrays = {key: np.ascontiguousarray(v, dtype=self.dtype) for key, v in vectors.items()}
+        now = time.time()
+        with self._writing():
+            self._open_arena(self._meta("arena"), create=True)
+            end = os.fstat(self._fd).st_size
+            # 途中で切れた書き込みがあっても要素の境界に揃える
+            offset = end + (-end % self.dtype.itemsize)
+            rows = []
+            for key, array in arrays.items():
+                rows.append((key, key_prefix(key), offset, _shape_text(array.shape),
+                             array.nbytes, now, now))
+                offset += array.nbytes
+            data = b"".join(memoryview(a).cast("B") for a in arrays.values())
+            os.pwrite(self._fd, data, rows[0][2])
+            with self._conn:
+                self._add_totals(self._existing(list(arrays)), -1)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO vectors (key, prefix, offset, shape, nbytes,"
+                    " created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                self._add_totals(((r[1], r[4]) for r in rows), 1)
+            self._enforce(protect=set(arrays))
+        if self.auto_compact and self.needs_compaction():
+            self.compact_in_background()
+
+    def _delete(self, keys: list[str]) -> None:
+        """索引から行を削除する（書き込みロック中に呼ぶ）"""
+        with self._conn:
+            self._add_totals(self._existing(keys), -1)
+            self._conn.executemany("DELETE FROM vectors WHERE key = ?", [(k,) for k in keys])
+        for key in keys:
+            self._touches.pop(key, None)
+            self._touch_counts.pop(key, None)
+
+    def evict(self) -> int:
+        """期限切れのベクトルを削除し、上限を超えていれば追い出す。
+
+        Returns:
+            削除した件数
+        """
+        with self._writing():
+            return self._enforce(protect=set())
+
+    def _enforce(self, protect: set[str]) -> int:
+        """期限切れの削除と上限までの追い出し（書き込みロック中に呼ぶ）。
+
+        Args:
+            protect: 最後に追い出すキー（保存したばかりのベクトル）
+        """
+        removed = 0
+        if self.ttl_sec is not None:
+            expired = [row[0] for row in self._conn.execute(
+                "SELECT key FROM vectors WHERE created_at < ?", (time.time() - self.ttl_sec,))]
+            if expired:
+                self._delete(expired)
+                self.expired += len(expired)
+                removed += len(expired)
+
+        prefix_bytes, entries, total = self._totals()
+        over_quota = [p for p, limit in self.quotas.items() if prefix_bytes[p] > limit]
+        over_total = ((self.max_bytes is not None and total > self.max_bytes)
+                      or (self.max_entries is not None and entries > self.max_entries))
+        if not over_quota and not over_total:
+            return removed
+
+        self._flush_touches()
+        for prefix in over_quota:
+            target = _low_water(self.quotas[prefix])
+            used = prefix_bytes[prefix]
+            evicted = self._evict_until(
+                lambda freed, _, u=used, t=target: u - freed <= t, protect, prefix)
+            self.evictions += evicted
+            removed += evicted
+        if over_total:
+            _, entries, total = self._totals()
+            max_bytes = _low_water(self.max_bytes) if self.max_bytes is not None else None
+            max_entries = _low_water(self.max_entries) if self.max_entries is not None else None
+            evicted = self._evict_until(
+                lambda freed, count: ((max_bytes is None or total - freed <= max_bytes)
+                                      and (max_entries is None
+                                           or entries - count <= max_entries)),
+                protect)
+            self.evictions += evicted
+            removed += evicted
+        if removed:
+            logger.debug("埋め込みストアから %d 件を追い出しました（%s）", removed, self.policy)
+        return removed
+
+    def _evict_until(self, satisfied, protect: set[str], prefix: str | None = None) -> int:
+        """satisfied(削除したバイト数, 件数) が真になるまで policy の順に削除する"""
+        where, params = ("WHERE prefix = ?", (prefix,)) if prefix is not None else ("", ())
+        evicted = 0
+        freed = 0
+        skipped = 0     # 先頭に残る保護されたキーの数
+        while not satisfied(freed, evicted):
+            candidates = self._conn.execute(
+                f"SELECT key, nbytes FROM vectors {where} ORDER BY {_ORDER[self.policy]}"
+                " LIMIT ? OFFSET ?", (*params, _EVICT_BATCH, skipped)).fetchall()
+            if not candidates:
+                break
+            victims = []
+            for key, nbytes in candidates:
+                if key in protect:
+                    skipped += 1
+                    continue
+                victims.append(key)
+                freed += nbytes
+                if satisfied(freed, evicted + len(victims)):
+                    break
+            if victims:
+                self._delete(victims)
+                evicted += len(victims)
+        if protect and not satisfied(freed, evicted):
+            # 保存したばかりのベクトルだけで上限を超える場合はそれも追い出す
+            evicted += self._evict_until(
+                lambda more, count: satisfied(freed + more, evicted + count), set(), prefix)
+        return evicted
+
+    @property
+    def live_bytes(self) -> int:
+        """有効なベクトルの合計バイト数"""
+        with self._lock:
+            return self._totals()[2]
+
+    @property
+    def arena_bytes(self) -> int:
+        """アリーナファイルのサイズ（削除・上書きされたデータを含む）"""
+        with self._lock:
+            return os.fstat(self._fd).st_size
+
+    def needs_compaction(self) -> bool:
+        arena, live = self.arena_bytes, self.live_bytes
+        dead = arena - live
+        if self.max_bytes is not None and arena > self.max_bytes and dead > 0:
+            return True
+        return dead >= COMPACT_MIN_DEAD and dead >= live
+
+    def _new_generation(self) -> Path:
+        """次の世代のアリーナのパス（世代番号は索引に記録し、名前を使い回さない）"""
+        generation = int(self._meta("generation")) + 1
+        return self.directory / f"embeddings.{generation}.arena"
+
+    def _switch_arena(self, new_path: Path, moved: list[tuple[int, str]]) -> None:
+        """索引を新しい世代のアリーナに切り替え、古い世代を削除する（書き込みロック中）"""
+        generation = new_path.name.split(".")[1]
+        with self._conn:
+            self._conn.executemany("UPDATE vectors SET offset = ? WHERE key = ?", moved)
+            self._conn.execute("UPDATE meta SET value = ? WHERE name = 'arena'", (new_path.name,))
+            self._conn.execute("UPDATE meta SET value = ? WHERE name = 'generation'",
+                               (generation,))
+        old_path = self.arena_path
+        self._open_arena(new_path.name)
+        # 古い世代を mmap 中の他のプロセスは、閉じるまで削除前のデータを読める
+        old_path.unlink(missing_ok=True)
+
+    def compact(self) -> int:
+        """有効なベクトルだけを新しい世代のアリーナに詰め直す。
+
+        コピーの大半は書き込みロックを外して行う。ロック中に索引のスナップショットを取り、
+        そのベクトルを一時ファイルに書き写したあと、再びロックを取ってコピー中に保存された
+        ベクトルだけを書き足し、索引と同じトランザクションで新しい世代に切り替える。
+        コピー中も get / put は止まらず、途中で止まっても元のアリーナと索引はそのまま使える。
+
+        Returns:
+            減ったバイト数
+        """
+        with self._writing():
+            self._flush_touches()
+            arena = self._meta("arena")
+            self._open_arena(arena, create=True)
+            before = os.fstat(self._fd).st_size
+            rows = self._conn.execute(
+                "SELECT key, offset, nbytes FROM vectors ORDER BY offset").fetchall()
+            source = os.dup(self._fd)
+        # 途中で止まって残っても、次に開いたときに書きかけのアリーナとして削除される
+        tmp_path = self.directory / f"{arena}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            copied, end = self._copy_records(source, before, rows, tmp_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        finally:
+            os.close(source)
+
+        with self._writing():
+            if self._meta("arena") != arena or not tmp_path.exists():
+                # コピー中に他の compact・clear が先に世代を切り替えた
+                tmp_path.unlink(missing_ok=True)
+                logger.debug("埋め込みストアの整理を取りやめました（世代が変わりました）")
+                return 0
+            self._open_arena(arena)
+            size = os.fstat(self._fd).st_size
+            current = self._conn.execute(
+                "SELECT key, offset, nbytes FROM vectors ORDER BY offset").fetchall()
+            moved, added, lost = [], [], []
+            for key, old_offset, nbytes in current:
+                new_offset = copied.get((key, old_offset))
+                if new_offset is not None:
+                    moved.append((new_offset, key))
+                elif old_offset + nbytes <= size:
+                    added.append((key, old_offset, nbytes))
+                else:
+                    lost.append(key)
+            if added:
+                view = self._view(size)
+                with open(tmp_path, "ab") as f:
+                    for key, old_offset, nbytes in added:
+                        f.write(view[old_offset:old_offset + nbytes])
+                        moved.append((end, key))
+                        end += nbytes
+                    f.flush()
+                    os.fsync(f.fileno())
+            new_path = self._new_generation()
+            os.replace(tmp_path, new_path)
+            self._switch_arena(new_path, moved)
+            if lost:
+                self._delete(lost)
+            self.compactions += 1
+            saved = size - end
+        logger.info("埋め込みストアを整理しました: %d 件, %d バイト削減", len(moved), saved)
+        return saved
+
+    @staticmethod
+    def _copy_records(source: int, size: int, rows: list[tuple[str, int, int]],
+                      path: Path) -> tuple[dict[tuple[str, int], int], int]:
+        """スナップショットのベクトルを path に詰めて書く（書き込みロックの外で呼ぶ）。
+
+        アリーナは追記のみで、キーを再保存すると位置が変わるため、(キー, 元の位置) が
+        切り替え時の索引と一致すれば同じデータとみなせる。
+
+        Returns:
+            ((キー, 元の位置) → 新しい位置, 書いたバイト数)
+        """
+        copied: dict[tuple[str, int], int] = {}
+        offset = 0
+        view = mmap.mmap(source, size, access=mmap.ACCESS_READ) if size else None
+        try:
+            with open(path, "wb") as f:
+                for key, old_offset, nbytes in rows:
+                    if view is None or old_offset + nbytes > size:
+                        continue
+                    f.write(view[old_offset:old_offset + nbytes])
+                    copied[(key, old_offset)] = offset
+                    offset += nbytes
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            if view is not None:
+                view.close()
+        return copied, offset
+
+    def compact_in_background(self) -> threading.Thread:
+        """別スレッドで compact する（実行中ならそのスレッドを返す）"""
+        with self._lock:
+            if self._compactor is None or not self._compactor.is_alive():
+                self._compactor = threading.Thread(
+                    target=self._compact_quietly, name="embedding-compactor", daemon=True)
+                self._compactor.start()
+            return self._compactor
+
+    def _compact_quietly(self) -> None:
+        try:
+            self.compact()
+        except Exception as e:
+            logger.warning("埋め込みストアの整理に失敗しました: %s", e)
+
+    def clear(self) -> int:
+        """全てのベクトルを削除する（空の新しい世代のアリーナに切り替える）。
+
+        Returns:
+            削除した件数
+        """
+        with self._writing():
+            with self._conn:
+                count = self._conn.execute("DELETE FROM vectors").rowcount
+                self._conn.execute("DELETE FROM totals")
+            new_path = self._new_generation()
+            new_path.touch()
+            self._switch_arena(new_path, [])
+            self._touches.clear()
+            self._touch_counts.clear()
+        return count
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """件数・容量と追い出し・期限切れ・整理の回数"""
+        with self._lock:
+            _, entries, total = self._totals()
+        return {
+            "entries": entries,
+            "bytes": total,
+            "arena_bytes": self.arena_bytes,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "compactions": self.compactions,
+        }
+
+
+def shared_memory_dir() -> Path:
+    """プロセス間で共有するファイルの置き場所（/dev/shm があればメモリ上）"""
+    shm = Path("/dev/shm")
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        return shm
+    return Path(tempfile.gettempdir())
+
+
+class SharedMatrix:
+    """名前付きの読み取り専用 float32 行列をプロセス間で共有するホット層。
+
+    行列は /dev/shm（なければ一時ディレクトリ）のファイルに書き、各プロセスは
+    それを mmap して読むため、同じ行列を読む全ワーカーが同じ物理ページを共有する。
+    書き込みは一時ファイルからの置き換えなので、読み手が書きかけの行列を見ることはない。
+
+    ファイル形式: マジック（8 バイト）+ ヘッダ長（8 バイト）+ JSON ヘッダ
+    （rows・shape・version）+ 64 バイト境界に揃えた行列のデータ
+
+    使い方:
+        shared = SharedMatrix.open("speakers", version) or SharedMatrix.publish(
+            "speakers", ids, matrix, version)
+        shared.matrix     # 読み取り専用のビュー（コピーしない）
+    """
+
+    MAGIC = b"EMBSHM1\0"
+
+    def __init__(self, path: Path, rows: list[str], matrix: np.ndarray, version: str,
+                 buffer: mmap.mmap, inode: int = 0):
+        self.path = path
+        self.rows = rows
+        self.matrix = matrix
+        self.version = version
+        self._buffer = buffer
+        self._inode = inode
+
+    @staticmethod
+    def path_for(name: str, directory: str | Path | None = None) -> Path:
+        """名前に対応するファイルのパス（名前はファイル名に使える形にする）"""
+        digest = hashlib.blake2b(name.encode(), digest_size=8).hexdigest()
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)[:64]
+        return Path(directory or shared_memory_dir()) / f"embshm-{safe}-{digest}"
+
+    @classmethod
+    def publish(cls, name: str, rows: list[str], matrix: np.ndarray, version: str = "",
+                directory: str | Path | None = None) -> "SharedMatrix":
+        """行列を共有領域に書き、開き直して返す（同じ名前の古い行列は置き換える）"""
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        path = cls.path_for(name, directory)
+        header = json.dumps({"rows": list(rows), "shape": list(matrix.shape),
+                             "version": version}, ensure_ascii=False).encode("utf-8")
+        start = 16 + len(header)
+        padding = -start % 64
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(cls.MAGIC)
+                f.write(len(header).to_bytes(8, "little"))
+                f.write(header)
+                f.write(b"\0" * padding)
+                f.write(memoryview(matrix).cast("B"))
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        shared = cls.open(name, version, directory)
+        if shared is None:
+            raise OSError(f"共有行列を開けません: {path}")
+        return shared
+
+    @classmethod
+    def open(cls, name: str, version: str | None = None,
+             directory: str | Path | None = None) -> "SharedMatrix | None":
+        """共有領域の行列を開く。ない・壊れている・version が異なる場合は None"""
+        path = cls.path_for(name, directory)
+        try:
+            with open(path, "rb") as f:
+                inode = os.fstat(f.fileno()).st_ino
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            if buffer[:8] != cls.MAGIC:
+                raise ValueError("magic")
+            length = int.from_bytes(buffer[8:16], "little")
+            header = json.loads(buffer[16:16 + length])
+            start = 16 + length
+            start += -start % 64
+            shape = tuple(header["shape"])
+            matrix = np.frombuffer(buffer, dtype=np.float32, count=int(np.prod(shape)),
+                                   offset=start).reshape(shape)
+        except (ValueError, KeyError, TypeError) as e:
+            buffer.close()
+            logger.warning("共有行列を読み込めません: %s (%s)", path, e)
+            return None
+        if version is not None and header.get("version") != version:
+            del matrix
+            buffer.close()
+            return None
+        return cls(path, header["rows"], matrix, header.get("version", ""), buffer, inode)
+
+    def unlink(self) -> None:
+        """共有領域から削除する（開いているプロセスはそのまま読める）。
+
+        他のプロセスが同じ名前で公開し直した後なら、その行列は削除しない。
+        """
+        try:
+            if self.path.stat().st_ino == self._inode:
+                self.path.unlink()
+        except FileNotFoundError:
+            pass
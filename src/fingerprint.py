@@ -0,0 +1,266 @@
+"""ファイルのフィンガープリント - 内容で動画を識別する
+
+ファイル名での解析済み判定は、名前を変えた動画を再解析し、別フォルダの
+同名の動画を誤ってスキップする。ここではファイルの内容から識別子を作る。
+
+- 簡易フィンガープリント: サイズと先頭・中央・末尾の一部だけを読む blake2b
+  （数 GB の動画でも読み込みは数百 KB）
+- 完全フィンガープリント: ファイル全体の blake2b（必要なときだけ計算する）
+
+FingerprintIndex は計算結果を (パス, サイズ, 更新時刻, inode) ごとに SQLite に
+記録し、変わっていないファイルは stat だけで識別子を返す。名前を変えただけの
+ファイルも inode・サイズ・更新時刻が一致すれば再計算しない。
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# 簡易フィンガープリントで読む先頭・中央・末尾それぞれのバイト数
+SAMPLE_BYTES = 64 * 1024
+# ファイル全体を読むときのバッファサイズ
+READ_BUFFER = 1 << 20
+# これより多くのファイルを照合するときは記録を一度に読み込む
+_BULK_LOOKUP = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    sampled TEXT NOT NULL,
+    full TEXT
+);
+CREATE INDEX IF NOT EXISTS files_stat ON files (inode, size, mtime_ns);
+CREATE TABLE IF NOT EXISTS analyzed (
+    fingerprint TEXT PRIMARY KEY,
+    video_name TEXT NOT NULL,
+    video_path TEXT NOT NULL,
+    full TEXT,
+    analyzed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS legacy_names (
+    video_name TEXT PRIMARY KEY
+);
+"""
+
+
+def sampled_hash(path: str | Path, size: int | None = None,
+                 sample_bytes: int = SAMPLE_BYTES) -> str:
+    """サイズと先頭・中央・末尾の sample_bytes ずつから作るフィンガープリント。
+
+    3 × sample_bytes 以下のファイルは全体を読む。
+    """
+    if size is None:
+        size = os.stat(path).st_size
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{size}:".encode())
+    with open(path, "rb") as f:
+        if size <= 3 * sample_bytes:
+            h.update(f.read())
+        else:
+            for offset in (0, (size - sample_bytes) // 2, size - sample_bytes):
+                f.seek(offset)
+                h.update(f.read(sample_bytes))
+    return h.hexdigest()
+
+
+def full_hash(path: str | Path) -> str:
+    """ファイル全体の blake2b（1 MB ずつ読む）"""
+    h = hashlib.blake2b(digest_size=20)
+    buffer = bytearray(READ_BUFFER)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while n := f.readinto(buffer):
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+class FingerprintIndex:
+    """フィンガープリントの計算結果と、解析済みの動画の対応を記録する索引。
+
+    使い方:
+        index = FingerprintIndex("output/fingerprints.sqlite")
+        new_videos = index.unanalyzed(videos)
+        index.mark_analyzed(video, result.video_name)
+    """
+
+    def __init__(self, path: str | Path):
+        """
+        Args:
+            path: データベースファイルのパス
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30.0, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        self.computed = 0   # このインスタンスで実際にファイルを読んだ回数
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def fingerprint(self, path: str | Path) -> str:
+        """ファイルの簡易フィンガープリント（変わっていなければ記録済みの値）"""
+        return self._sampled([os.fspath(path)])[0]
+
+    def fingerprints(self, paths: Iterable[str | Path]) -> dict[Path, str]:
+        """複数ファイルの簡易フィンガープリント。
+
+        記録を一度に読み込み、stat が一致するファイルは読まずに返す。
+        """
+        paths = [Path(p) for p in paths]
+        return dict(zip(paths, self._sampled([os.fspath(p) for p in paths])))
+
+    def _sampled(self, paths: list[str]) -> list[str]:
+        if len(paths) > _BULK_LOOKUP:
+            with self._lock:
+                known = {row[0]: row[1:] for row in self._conn.execute(
+                    "SELECT path, size, mtime_ns, inode, sampled FROM files")}
+            by_stat = {(inode, size, mtime): sampled
+                       for size, mtime, inode, sampled in known.values()}
+            find_path, find_stat = known.get, by_stat.get
+        else:
+            find_path, find_stat = self._find_path, self._find_stat
+
+        fingerprints = []
+        updates = []
+        for path in paths:
+            key = os.path.abspath(path)
+            st = os.stat(key)
+            stat = (st.st_size, st.st_mtime_ns, st.st_ino)
+            row = find_path(key)
+            if row is not None and tuple(row[:3]) == stat:
+                fingerprints.append(row[3])
+                continue
+            # 名前を変えただけのファイル（inode・サイズ・更新時刻が同じ）は再計算しない
+            sampled = find_stat((st.st_ino, st.st_size, st.st_mtime_ns))
+            if sampled is None:
+                sampled = sampled_hash(key, size=st.st_size)
+                self.computed += 1
+            fingerprints.append(sampled)
+            updates.append((key, *stat, sampled))
+
+        if updates:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, sampled, full)"
+                    " VALUES (?, ?, ?, ?, ?, NULL)", updates)
+        return fingerprints
+
+    def _find_path(self, key: str) -> tuple | None:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT size, mtime_ns, inode, sampled FROM files WHERE path = ?",
+                (key,)).fetchone()
+
+    def _find_stat(self, stat: tuple[int, int, int]) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sampled FROM files WHERE inode = ? AND size = ? AND mtime_ns = ?"
+                " LIMIT 1", stat).fetchone()
+        return row[0] if row else None
+
+    def full_fingerprint(self, path: str | Path) -> str:
+        """ファイル全体のフィンガープリント（計算済みで変わっていなければ記録済みの値）"""
+        key = os.path.abspath(path)
+        st = os.stat(key)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, inode, full FROM files WHERE path = ?", (key,)).fetchone()
+        if row is not None and row[:3] == (st.st_size, st.st_mtime_ns, st.st_ino) and row[3]:
+            return row[3]
+
+        sampled = self.fingerprint(path)
+        full = full_hash(path)
+        self.computed += 1
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE files SET full = ? WHERE path = ? AND sampled = ?", (full, key, sampled))
+        return full
+
+    def mark_analyzed(self, path: str | Path, video_name: str, verify: bool = False) -> str:
+        """動画を解析済みとして記録し、その簡易フィンガープリントを返す。
+
+        同じ動画名の旧形式の結果があれば、以後は名前ではなくこの記録で判定する。
+
+        Args:
+            verify: 完全フィンガープリントも記録するか（unanalyzed の verify で照合する）
+        """
+        fingerprint = self.fingerprint(path)
+        full = self.full_fingerprint(path) if verify else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analyzed (fingerprint, video_name, video_path, full,"
+                " analyzed_at) VALUES (?, ?, ?, ?, ?)",
+                (fingerprint, video_name, os.path.abspath(path), full, time.time()))
+            self._conn.execute("DELETE FROM legacy_names WHERE video_name = ?", (video_name,))
+        return fingerprint
+
+    def lookup(self, paths: Iterable[str | Path], verify: bool = False) -> dict[Path, str | None]:
+        """各ファイルの解析結果の動画名（未解析なら None）。解析済みの記録は変えない。
+
+        Args:
+            verify: 簡易フィンガープリントが一致したファイルは、完全フィンガープリントも
+                記録されていれば照合する（記録がなければ簡易の一致で解析済みとみなす）
+        """
+        paths = [Path(p) for p in paths]
+        return dict(zip(paths, self._match([os.fspath(p) for p in paths], verify)))
+
+    def unanalyzed(self, paths: Iterable[str | Path], verify: bool = False) -> list[Path]:
+        """未解析のファイルだけを入力順に返す。"""
+        paths = list(paths)
+        names = self._match([os.fspath(p) for p in paths], verify)
+        return [Path(p) for p, name in zip(paths, names) if name is None]
+
+    def _match(self, paths: list[str], verify: bool) -> list[str | None]:
+        fingerprints = self._sampled(paths)
+        with self._lock:
+            if len(fingerprints) > _BULK_LOOKUP:
+                analyzed = {row[0]: row[1:] for row in self._conn.execute(
+                    "SELECT fingerprint, video_name, full FROM analyzed")}
+            else:
+                analyzed = {row[0]: row[1:] for f in set(fingerprints)
+                            for row in self._conn.execute(
+                                "SELECT fingerprint, video_name, full FROM analyzed"
+                                " WHERE fingerprint = ?", (f,))}
+            legacy = {row[0] for row in self._conn.execute("SELECT video_name FROM legacy_names")}
+
+        matches: list[str | None] = []
+        for path, fingerprint in zip(paths, fingerprints):
+            entry = analyzed.get(fingerprint)
+            if entry is not None and verify and entry[1]:
+                if self.full_fingerprint(path) != entry[1]:
+                    entry = None
+            name = os.path.basename(path)
+            if entry is None and name in legacy:
+                # 旧形式の結果は名前で判定する（同じ照合の中の同名の別ファイルは未解析として
+                # 扱う）。記録は変えず、mark_analyzed で内容での判定に移る
+                legacy.discard(name)
+                entry = (name, None)
+            matches.append(entry[0] if entry is not None else None)
+        return matches
+
+    def add_legacy_names(self, names: Iterable[str]) -> None:
+        """フィンガープリントのない旧形式の結果の動画名を登録する（lookup で名前で照合する）"""
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO legacy_names (video_name) VALUES (?)",
+                                   [(n,) for n in names])
+
+    def forget(self, fingerprints: Iterable[str]) -> None:
+        """解析済みの記録を削除する（再解析させる場合）"""
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM analyzed WHERE fingerprint = ?",
+                                   [(f,) for f in fingerprints])
@@ -0,0 +1,301 @@
+"""ジョブキュー - バッチ解析の進捗を SQLite に永続化する
+
+auto-analyze の進捗をメモリだけで持つと、2,000 本規模の実行が途中でクラッシュ・
+OOM した場合にどこまで終わったかが分からなくなる。JobQueue は動画ごとの
+状態・試行回数・到達したステップ・所要時間・エラー・結果を1つの SQLite ファイルに
+記録し、`auto-analyze --resume` で中断した箇所から再開できるようにする。
+
+    pending ──claim──→ running ──complete──→ done / failed
+       ↑                  │
+       └──recover / release（中断されたジョブを戻す。試行回数の上限で failed）
+
+取得（claim）は BEGIN IMMEDIATE のトランザクション内で行うため、同じキューを
+複数のプロセスが同時に処理しても同じ動画を二重に取得しない。
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+from src.pipeline import VideoAnalysisResult, decode_result, encode_result
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("pending", "running", "done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    video_path TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    stage TEXT,
+    worker TEXT,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    updated_at REAL,
+    finished_at REAL,
+    elapsed_sec REAL,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+@dataclass
+class Job:
+    """キュー内の1本の動画"""
+    id: int
+    video_path: str
+    status: str
+    attempts: int
+    stage: str | None = None
+    worker: str | None = None
+    elapsed_sec: float | None = None
+    error: str | None = None
+
+
+def worker_id() -> str:
+    """このプロセスを表すワーカーID（"ホスト名:pid"）"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """SQLite に永続化した動画解析のジョブキュー。
+
+    使い方:
+        queue = JobQueue("output/jobs.sqlite")
+        queue.enqueue(videos)
+        for path in queue.claims(worker_id()):
+            queue.complete(path, pipeline.analyze_video(path))
+    """
+
+    def __init__(self, path: str | Path, max_attempts: int = 3,
+                 stale_after_sec: float = 1800.0):
+        """
+        Args:
+            path: データベースファイルのパス
+            max_attempts: 中断されたジョブを再試行する上限回数
+            stale_after_sec: 他ホストのワーカーが進捗を更新しなくなってから
+                中断とみなすまでの秒数（同じホストはプロセスの生死で判定する）
+        """
+        if max_attempts < 1:
+            raise ValueError(f"max_attempts は1以上を指定してください: {max_attempts}")
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self.stale_after_sec = stale_after_sec
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 自動コミットにしてトランザクションは明示的に張る（スレッド間はロックで直列化）
+        self._conn = sqlite3.connect(str(self.path), timeout=30.0, isolation_level=None,
+                                     check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "JobQueue":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _transaction(self, fn):
+        """書き込みロックを取ってから fn(conn) を実行し、コミットする"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                value = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return value
+
+    def enqueue(self, videos: Iterable[str | Path], requeue: bool = False) -> int:
+        """動画をキューに追加する。
+
+        Args:
+            videos: 動画のパス（絶対パスにして記録する）
+            requeue: 既に登録済みの動画も未処理に戻すか（実行中のものは除く）
+
+        Returns:
+            新しく未処理になった件数
+        """
+        paths = [str(Path(v).resolve()) for v in videos]
+        now = time.time()
+
+        def run(conn):
+            added = 0
+            for path in paths:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (video_path, enqueued_at) VALUES (?, ?)",
+                    (path, now))
+                if not cursor.rowcount and requeue:
+                    cursor = conn.execute(
+                        "UPDATE jobs SET status = 'pending', attempts = 0, stage = NULL,"
+                        " worker = NULL, error = NULL, enqueued_at = ?"
+                        " WHERE video_path = ? AND status IN ('done', 'failed')",
+                        (now, path))
+                added += cursor.rowcount
+            return added
+
+        return self._transaction(run)
+
+    def claim(self, worker: str) -> Job | None:
+        """未処理のジョブを登録順に1件取得して実行中にする。なければ None。"""
+        now = time.time()
+
+        def run(conn):
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, stage = 'claimed',"
+                " worker = ?, started_at = ?, updated_at = ?, finished_at = NULL,"
+                " elapsed_sec = NULL WHERE id = ?",
+                (worker, now, now, row[0]))
+            return self._get(conn, row[0])
+
+        return self._transaction(run)
+
+    def claims(self, worker: str) -> Iterator[str]:
+        """未処理がなくなるまで、ジョブを1件ずつ取得して動画のパスを返す。"""
+        while (job := self.claim(worker)) is not None:
+            yield job.video_path
+
+    def set_stage(self, video_path: str | Path, stage: str) -> None:
+        """実行中のジョブが到達したステップを記録する（進捗の更新も兼ねる）"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET stage = ?, updated_at = ? WHERE video_path = ?"
+                " AND status = 'running'",
+                (stage, time.time(), str(Path(video_path).resolve())))
+
+    def complete(self, video_path: str | Path, result: VideoAnalysisResult) -> None:
+        """解析結果を記録する。結果にエラーがあれば failed（自動では再試行しない）"""
+        now = time.time()
+        status = "failed" if result.errors else "done"
+        error = "; ".join(result.errors) or None
+        data = json.dumps(encode_result(result), ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, stage = 'done', updated_at = ?, finished_at = ?,"
+                " elapsed_sec = ? - COALESCE(started_at, ?), error = ?, result = ?"
+                " WHERE video_path = ?",
+                (status, now, now, now, now, error, data, str(Path(video_path).resolve())))
+
+    def release(self, worker: str) -> int:
+        """worker が実行中のジョブを試行回数に数えずに未処理へ戻す（Ctrl+C などの中断時）"""
+        def run(conn):
+            return conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = MAX(attempts - 1, 0),"
+                " stage = NULL, worker = NULL WHERE status = 'running' AND worker = ?",
+                (worker,)).rowcount
+
+        return self._transaction(run)
+
+    def recover(self) -> int:
+        """クラッシュなどで止まったワーカーの実行中ジョブを未処理に戻す。
+
+        同じホストのワーカーはプロセスが存在しなければ、他ホストのワーカーは
+        stale_after_sec 以上進捗がなければ中断とみなす。試行回数が max_attempts に
+        達したジョブ（OOM を繰り返す動画など）は failed にする。
+
+        Returns:
+            未処理または failed に戻した件数
+        """
+        host = socket.gethostname()
+        now = time.time()
+
+        def run(conn):
+            rows = conn.execute(
+                "SELECT id, worker, attempts, stage, updated_at FROM jobs"
+                " WHERE status = 'running'").fetchall()
+            recovered = 0
+            for job_id, worker, attempts, stage, updated_at in rows:
+                worker_host, _, pid = (worker or "").rpartition(":")
+                if worker_host == host and pid.isdigit():
+                    alive = _pid_alive(int(pid))
+                else:
+                    alive = now - (updated_at or 0) < self.stale_after_sec
+                if alive:
+                    continue
+                status = "failed" if attempts >= self.max_attempts else "pending"
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = NULL, updated_at = ?, error = ?"
+                    " WHERE id = ?",
+                    (status, now, f"中断されました（{attempts} 回目, stage={stage}）", job_id))
+                recovered += 1
+            return recovered
+
+        recovered = self._transaction(run)
+        if recovered:
+            logger.info("中断されたジョブを %d 件回収しました", recovered)
+        return recovered
+
+    def retry_failed(self) -> int:
+        """failed のジョブを試行回数をリセットして未処理に戻す"""
+        def run(conn):
+            return conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, stage = NULL, worker = NULL"
+                " WHERE status = 'failed'").rowcount
+
+        return self._transaction(run)
+
+    def counts(self) -> dict[str, int]:
+        """状態ごとの件数"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update(rows)
+        return counts
+
+    def jobs(self, status: str | None = None) -> list[Job]:
+        """ジョブの一覧（登録順）"""
+        query = ("SELECT id, video_path, status, attempts, stage, worker, elapsed_sec, error"
+                 " FROM jobs")
+        params: tuple = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id", params).fetchall()
+        return [Job(*row) for row in rows]
+
+    def results(self) -> list[VideoAnalysisResult]:
+        """記録済みの解析結果（登録順。エラー付きの結果も含む）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT result FROM jobs WHERE result IS NOT NULL ORDER BY id").fetchall()
+        return [decode_result(json.loads(row[0])) for row in rows]
+
+    def _get(self, conn, job_id: int) -> Job:
+        row = conn.execute(
+            "SELECT id, video_path, status, attempts, stage, worker, elapsed_sec, error"
+            " FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(*row)
@@ -7,9 +7,10 @@ from pathlib import Path
 import click
 
 from src.network_status import get_network_status, get_traffic_status
-from src.pipeline import AnalysisPipeline
+from src.pipeline import AnalysisPipeline, list_videos
 from src.output.reporter import append_csv_log as append_csv_history
-from src.output.reporter import save_results, print_summary
+from src.output.reporter import export_results, save_results, print_summary
+from src.output.result_store import ResultStore
 
 
 def _setup_logging(verbose: bool = False) -> None:
@@ -45,7 +46,13 @@ def cli(verbose):
               help="視覚分析を有効にする")
 @click.option("--hf-token", envvar="HF_TOKEN", default=None,
               help="HuggingFace トークン（pyannote用）")
-def analyze(video, video_dir, config, output, fmt, visual, hf_token):
+@click.option("--mode", type=click.Choice(["diarize", "targeted"]), default=None,
+              help="解析モード（省略時は config の analysis.mode。targeted は話者分離を省いて高速）")
+@click.option("--workers", "-j", type=click.IntRange(min=1), default=1,
+              help="並列に解析するワーカープロセス数（各プロセスはモデルを1回だけロードする）")
+@click.option("--remote", is_flag=True,
+              help="常駐デーモン（serve）に解析を依頼する（モデルのロードを省略）")
+def analyze(video, video_dir, config, output, fmt, visual, hf_token, mode, workers, remote):
     """動画を解析して出演者を判定する。"""
     from src.preflight import run_preflight, PreflightError
 
@@ -53,25 +60,23 @@ def analyze(video, video_dir, config, output, fmt, visual, hf_token):
         click.echo("エラー: --video または --dir を指定してください。", err=True)
         sys.exit(1)
 
-    try:
-        run_preflight(check_gpu_available=visual)
-    except PreflightError as e:
-        click.echo(f"エラー: {e}", err=True)
-        sys.exit(1)
-
-    click.echo("パイプラインを初期化中...")
-    pipeline = AnalysisPipeline(config_path=config)
-    pipeline.setup(enable_visual=visual, hf_token=hf_token)
-
-    results = []
+    if not remote:
+        try:
+            run_preflight(check_gpu_available=visual)
+        except PreflightError as e:
+            click.echo(f"エラー: {e}", err=True)
+            sys.exit(1)
 
     if video:
         click.echo(f"解析中: {video}")
-        result = pipeline.analyze_video(video)
-        results.append(result)
-    elif video_dir:
+        targets = [Path(video)]
+    else:
         click.echo(f"フォルダ解析中: {video_dir}")
-        results = pipeline.analyze_batch(video_dir)
+        targets = list_videos(video_dir)
+
+    results_by_index = dict(
+        _analyze_targets(targets, config, mode, visual, hf_token, workers, remote))
+    results = [results_by_index[i] for i in sorted(results_by_index)]
 
     if not results:
         click.echo("解析対象の動画が見つかりませんでした。")
@@ -122,11 +127,14 @@ def setup(video, config, hf_token):
     from src.setup_wizard import SetupWizard
 
     wizard = SetupWizard(config_path=config)
-    wizard.run(video, hf_token=hf_token)
+    try:
+        wizard.run(video, hf_token=hf_token)
+    finally:
+        wizard.close()
 
 
 @cli.command(name="auto-analyze")
-@click.option("--dir", "-d", "video_dir", type=click.Path(exists=True), required=True,
+@click.option("--dir", "-d", "video_dir", type=click.Path(exists=True), default=None,
               help="動画フォルダのパス（中の動画を全て自動解析）")
 @click.option("--config", "-c", default="config.yaml",
               help="設定ファイルのパス")
@@ -143,7 +151,18 @@ def setup(video, config, hf_token):
               help="解析済みの動画をスキップする（デフォルト: スキップ）")
 @click.option("--recursive/--no-recursive", default=False,
               help="サブフォルダも再帰的に検索する")
-def auto_analyze(video_dir, config, output, fmt, visual, hf_token, skip_analyzed, recursive):
+@click.option("--mode", type=click.Choice(["diarize", "targeted"]), default=None,
+              help="解析モード（省略時は config の analysis.mode。targeted は話者分離を省いて高速）")
+@click.option("--workers", "-j", type=click.IntRange(min=1), default=1,
+              help="並列に解析するワーカープロセス数（各プロセスはモデルを1回だけロードする）")
+@click.option("--remote", is_flag=True,
+              help="常駐デーモン（serve）に解析を依頼する（モデルのロードを省略）")
+@click.option("--resume", is_flag=True,
+              help="フォルダを走査せず、ジョブキュー（出力先の jobs.sqlite）の続きから解析する")
+@click.option("--retry-failed", is_flag=True,
+              help="エラーになった動画も再解析する")
+def auto_analyze(video_dir, config, output, fmt, visual, hf_token, skip_analyzed, recursive,
+                 mode, workers, remote, resume, retry_failed):
     """過去の動画を全て放り込んで自動解析する。
 
     指定フォルダ内の全動画を自動で解析し、結果を出力します。
@@ -154,81 +173,161 @@ def auto_analyze(video_dir, config, output, fmt, visual, hf_token, skip_analyzed
     使い方:
       python src/main.py auto-analyze --dir /path/to/videos/
       python src/main.py auto-analyze --dir /path/to/videos/ --recursive
+      python src/main.py auto-analyze --resume   # 中断した実行の続き（別プロセスからの参加も可）
     """
+    from src.jobqueue import JobQueue, worker_id
     from src.preflight import run_preflight, PreflightError
 
-    try:
-        run_preflight(check_gpu_available=visual)
-    except PreflightError as e:
-        click.echo(f"エラー: {e}", err=True)
+    if not video_dir and not resume:
+        click.echo("エラー: --dir または --resume を指定してください。", err=True)
         sys.exit(1)
 
-    # 動画ファイルを収集
-    video_dir_path = Path(video_dir)
-    extensions = {".mp4", ".avi", ".mkv", ".mov", ".wmv", ".flv", ".webm"}
+    if not remote:
+        try:
+            run_preflight(check_gpu_available=visual)
+        except PreflightError as e:
+            click.echo(f"エラー: {e}", err=True)
+            sys.exit(1)
+
+    jobs_cfg = _load_config(config).get("jobs") or {}
+    queue = JobQueue(Path(output) / "jobs.sqlite",
+                     max_attempts=jobs_cfg.get("max_attempts", 3),
+                     stale_after_sec=jobs_cfg.get("stale_after_sec", 1800))
+
+    store = ResultStore(output)
+    if video_dir:
+        # 動画ファイルを収集してキューに追加（登録済みの動画はそのまま）
+        videos = list_videos(video_dir, recursive=recursive)
+        if not videos and not resume:
+            click.echo(f"動画ファイルが見つかりません: {video_dir}")
+            return
+        click.echo(f"\n動画 {len(videos)} 件を検出しました。")
+
+        # 解析済みの動画を除く（ファイル名ではなく内容のフィンガープリントで判定）
+        targets = videos
+        if skip_analyzed:
+            targets = store.unanalyzed(videos)
+            if len(targets) < len(videos):
+                click.echo(f"解析済み: {len(videos) - len(targets)} 件（スキップ）")
+        added = queue.enqueue(targets, requeue=not skip_analyzed)
+        if added:
+            click.echo(f"ジョブキューに {added} 件を追加しました。")
+
+    recovered = queue.recover()
+    if recovered:
+        click.echo(f"中断されていた {recovered} 件を再開します。")
+    if retry_failed:
+        click.echo(f"エラーになった {queue.retry_failed()} 件を再解析します。")
+
+    counts = queue.counts()
+    pending = counts["pending"]
+    click.echo(f"ジョブキュー: 未処理 {pending} 件 / 実行中 {counts['running']} 件 / "
+               f"完了 {counts['done']} 件 / エラー {counts['failed']} 件")
+    if not pending:
+        click.echo("\n新しく解析する動画はありません。全て解析済みです。")
+        return
+
+    # 解析実行: ジョブは解析に取りかかる直前に1件ずつ取得する（同じキューを別プロセスと分け合える）
+    worker = worker_id()
+    claimed: list[str] = []
 
-    if recursive:
-        videos = sorted(
-            f for f in video_dir_path.rglob("*")
-            if f.suffix.lower() in extensions and f.is_file()
-        )
-    else:
-        videos = sorted(
-            f for f in video_dir_path.iterdir()
-            if f.suffix.lower() in extensions and f.is_file()
-        )
+    def claim_videos():
+        for path in queue.claims(worker):
+            claimed.append(path)
+            yield path
 
-    if not videos:
-        click.echo(f"動画ファイルが見つかりません: {video_dir}")
+    new_results = []
+    try:
+        for done, (index, result) in enumerate(
+                _analyze_targets(claim_videos(), config, mode, visual, hf_token, workers,
+                                 remote, job_queue=queue), 1):
+            queue.complete(claimed[index], result)
+            click.echo(f"  [{done}/{pending}] 解析完了: {result.video_name}")
+            new_results.append(result)
+
+            # 結果ストアに1行追記（results.json / csv は最後にまとめて書き出す）
+            _save_incremental(store, result)
+    finally:
+        # Ctrl+C などで抜けた場合、取得したままのジョブを未処理に戻す
+        queue.release(worker)
+
+    # 最終サマリー
+    print_summary(new_results)
+    counts = queue.counts()
+    click.echo(f"\n新規解析: {len(new_results)} 件 / 完了 {counts['done']} 件 / "
+               f"エラー {counts['failed']} 件 / 合計: {sum(counts.values())} 件")
+
+    saved = export_results(store, fmt=fmt)
+    for path in saved:
+        click.echo(f"結果を保存しました: {path}")
+    queue.close()
+
+
+def _analyze_targets(targets, config, mode, visual, hf_token, workers, remote=False,
+                     job_queue=None):
+    """動画を解析し、完了するごとに (targets 内の番号, 結果) を返す。
+
+    remote の場合は常駐デーモンに依頼する。workers が2以上の場合はプロセスプールで
+    並列に解析し、1の場合は現在のプロセスでステージ並列に解析する
+    （いずれも完了順は入力順と限らない）。job_queue を渡すと各動画が到達した
+    ステップを記録する（remote では記録しない）。
+    """
+    if remote:
+        from src.server import RemoteClient, ServerError
+
+        client = RemoteClient(_server_address(config))
+        try:
+            yield from client.analyze(list(targets), mode=mode, visual=visual,
+                                      on_log=lambda message: click.echo(f"    {message}"))
+        except OSError as e:
+            click.echo(f"エラー: 解析デーモンに接続できません（serve で起動してください）: {e}",
+                       err=True)
+            sys.exit(1)
+        except ServerError as e:
+            click.echo(f"エラー: 解析デーモンでエラーが発生しました: {e}", err=True)
+            sys.exit(1)
         return
 
-    click.echo(f"\n動画 {len(videos)} 件を検出しました。")
+    if workers > 1:
+        from src.workers import WorkerPool
+
+        click.echo(f"ワーカーを起動中... ({workers} プロセス)")
+        with WorkerPool(config, workers=workers, mode=mode, enable_visual=visual,
+                        hf_token=hf_token,
+                        job_db=job_queue.path if job_queue is not None else None) as pool:
+            yield from pool.imap_unordered(targets)
+        return
 
-    # パイプライン初期化
     click.echo("パイプラインを初期化中...")
-    pipeline = AnalysisPipeline(config_path=config)
+    pipeline = AnalysisPipeline(config_path=config, mode=mode)
     pipeline.setup(enable_visual=visual, hf_token=hf_token)
+    if job_queue is not None:
+        pipeline.on_stage = job_queue.set_stage
+    yield from pipeline.analyze_stream(targets)
 
-    # 解析済みの動画名を取得
-    analyzed_names: set[str] = set()
-    if skip_analyzed:
-        analyzed_names = pipeline._load_analyzed_names(output)
-        if analyzed_names:
-            click.echo(f"解析済み: {len(analyzed_names)} 件（スキップ）")
-
-    # 解析実行
-    all_results = []
-    new_count = 0
-    for i, video in enumerate(videos, 1):
-        if video.name in analyzed_names:
-            click.echo(f"  [{i}/{len(videos)}] スキップ: {video.name}")
-            continue
 
-        click.echo(f"  [{i}/{len(videos)}] 解析中: {video.name}")
-        result = pipeline.analyze_video(str(video))
-        all_results.append(result)
-        new_count += 1
+def _load_config(config_path: str) -> dict:
+    """設定ファイルを読み込む（読めない場合は空の辞書）。"""
+    import yaml
 
-        # 途中結果を逐次保存（中断に備える）
-        _save_incremental(all_results, output, fmt, analyzed_names)
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f) or {}
+    except OSError:
+        return {}
 
-    if not all_results:
-        click.echo("\n新しく解析する動画はありません。全て解析済みです。")
-        return
 
-    # 最終サマリー
-    print_summary(all_results)
-    click.echo(f"\n新規解析: {new_count} 件 / 合計: {len(videos)} 件")
+def _server_address(config_path: str) -> str:
+    """設定ファイルの server.address（なければ既定のソケットパス）を返す。"""
+    from src.server import DEFAULT_ADDRESS
 
-    saved = save_results(all_results, output, fmt=fmt)
-    for path in saved:
-        click.echo(f"結果を保存しました: {path}")
+    return (_load_config(config_path).get("server") or {}).get("address", DEFAULT_ADDRESS)
 
 
-def _save_incremental(results, output_dir, fmt, existing_names):
-    """中間結果を保存する（中断復帰用）。"""
+def _save_incremental(store, result):
+    """1本の結果を結果ストアに追記する（中断復帰用）。"""
     try:
-        save_results(results, output_dir, fmt=fmt)
+        store.put(result)
     except Exception:
         pass  # 途中保存の失敗は無視
 
@@ -313,6 +412,71 @@ def web(config, output, host, port):
     app.run(host=host, port=port, debug=False)
 
 
+@cli.command()
+@click.option("--config", "-c", default="config.yaml",
+              help="設定ファイルのパス")
+@click.option("--address", default=None,
+              help="待ち受けアドレス（Unix ソケットのパス、または 127.0.0.1:ポート）。"
+                   "省略時は config の server.address")
+@click.option("--visual/--no-visual", default=False,
+              help="視覚分析を有効にする")
+@click.option("--hf-token", envvar="HF_TOKEN", default=None,
+              help="HuggingFace トークン（pyannote用）")
+@click.option("--mode", type=click.Choice(["diarize", "targeted"]), default=None,
+              help="既定の解析モード（省略時は config の analysis.mode）")
+@click.option("--status", is_flag=True, help="起動中のデーモンの状態を表示して終了する")
+@click.option("--stop", is_flag=True, help="起動中のデーモンを停止する")
+def serve(config, address, visual, hf_token, mode, status, stop):
+    """解析デーモンを常駐させる（モデルを読み込んだまま待ち受ける）。
+
+    起動後は analyze / auto-analyze / ingest-analyze / test-voice に
+    --remote を付けるとデーモンに解析を依頼します。
+
+    \b
+    使い方:
+      python -m src.main serve &
+      python -m src.main analyze --video a.mp4 --remote
+      python -m src.main serve --stop
+    """
+    from src.server import AnalysisService, RemoteClient, ServerError
+    from src.server import serve as serve_daemon
+
+    address = address or _server_address(config)
+    if status or stop:
+        client = RemoteClient(address, timeout=5.0)
+        try:
+            if stop:
+                client.shutdown()
+                click.echo(f"解析デーモンを停止しました: {address}")
+            else:
+                info = client.ping()
+                click.echo(f"解析デーモン稼働中: {address} (pid={info['pid']}, "
+                           f"処理済みジョブ={info['jobs']})")
+        except (OSError, ServerError) as e:
+            click.echo(f"解析デーモンに接続できません: {address} ({e})", err=True)
+            sys.exit(1)
+        return
+
+    from src.preflight import run_preflight, PreflightError
+
+    try:
+        run_preflight(check_gpu_available=visual)
+    except PreflightError as e:
+        click.echo(f"エラー: {e}", err=True)
+        sys.exit(1)
+
+    click.echo("パイプラインを初期化中...")
+    service = AnalysisService(config_path=config, mode=mode, enable_visual=visual,
+                              hf_token=hf_token)
+    service.warm_up()
+    click.echo(f"解析デーモンを起動しました: {address}（停止: Ctrl+C または serve --stop）")
+    try:
+        serve_daemon(service, address)
+    except RuntimeError as e:
+        click.echo(f"エラー: {e}", err=True)
+        sys.exit(1)
+
+
 @cli.command(name="ingest-analyze")
 @click.option("--config", "-c", default="config.yaml",
               help="設定ファイルのパス")
@@ -347,6 +511,12 @@ def web(config, output, host, port):
               help="Google Sheets のワークシート名")
 @click.option("--sheet-credentials", default=None,
               help="GoogleサービスアカウントJSONのパス")
+@click.option("--mode", type=click.Choice(["diarize", "targeted"]), default=None,
+              help="解析モード（省略時は config の analysis.mode。targeted は話者分離を省いて高速）")
+@click.option("--workers", "-j", type=click.IntRange(min=1), default=1,
+              help="並列に解析するワーカープロセス数（各プロセスはモデルを1回だけロードする）")
+@click.option("--remote", is_flag=True,
+              help="常駐デーモン（serve）に解析を依頼する（モデルのロードを省略）")
 def ingest_analyze(
     config,
     download_dir,
@@ -364,16 +534,20 @@ def ingest_analyze(
     sheet_id,
     sheet_name,
     sheet_credentials,
+    mode,
+    workers,
+    remote,
 ):
     """外部ソース取得→解析→CSV/Spreadsheet記録を一括実行する。"""
     from src.ingest import VideoIngestor, collect_video_files
     from src.preflight import PreflightError, run_preflight
 
-    try:
-        run_preflight(check_gpu_available=visual)
-    except PreflightError as e:
-        click.echo(f"エラー: {e}", err=True)
-        sys.exit(1)
+    if not remote:
+        try:
+            run_preflight(check_gpu_available=visual)
+        except PreflightError as e:
+            click.echo(f"エラー: {e}", err=True)
+            sys.exit(1)
 
     effective_proxy = "socks5h://127.0.0.1:1080" if mullvad_socks5 else proxy
     _print_network_status(proxy=effective_proxy, expect_proxy=bool(effective_proxy))
@@ -390,30 +564,21 @@ def ingest_analyze(
         click.echo(f"取得エラー: {e}", err=True)
         sys.exit(1)
 
-    click.echo("パイプラインを初期化中...")
-    pipeline = AnalysisPipeline(config_path=config)
-    pipeline.setup(enable_visual=visual, hf_token=hf_token)
-
     all_videos = sorted(collect_video_files(download_dir))
     if not all_videos:
         click.echo("取得先に動画が見つかりませんでした。")
         return
 
-    analyzed_names: set[str] = set()
+    targets = all_videos
     if skip_analyzed:
-        analyzed_names = pipeline._load_analyzed_names(output)
-
-    targets = [v for v in all_videos if v.name not in analyzed_names]
+        targets = ResultStore(output).unanalyzed(all_videos)
     if not targets:
         click.echo("新規解析対象の動画はありません。")
         return
 
-    results = []
-    total = len(targets)
-    for i, video in enumerate(targets, 1):
-        click.echo(f"  [{i}/{total}] 解析中: {video.name}")
-        result = pipeline.analyze_video(str(video))
-        results.append(result)
+    results_by_index = dict(
+        _analyze_targets(targets, config, mode, visual, hf_token, workers, remote))
+    results = [results_by_index[i] for i in sorted(results_by_index)]
 
     print_summary(results)
     saved = save_results(results, output, fmt=fmt)
@@ -458,7 +623,9 @@ def ingest_analyze(
 @click.option("--proxy", default=None, help="HTTP/HTTPS/SOCKS プロキシURL")
 @click.option("--mullvad-socks5/--no-mullvad-socks5", default=False,
               help="Mullvad のローカルSOCKS5 (socks5h://127.0.0.1:1080) を使う")
-def add_magnets_from_url(url, download_dir, config, output, fmt, visual, hf_token, proxy, mullvad_socks5):
+@click.pass_context
+def add_magnets_from_url(ctx, url, download_dir, config, output, fmt, visual, hf_token, proxy,
+                         mullvad_socks5):
     """指定URLからmagnetリンクを抽出し、取得と解析を実行する。"""
     from src.ingest import fetch_magnets_from_url
 
@@ -475,7 +642,9 @@ def add_magnets_from_url(url, download_dir, config, output, fmt, visual, hf_toke
 
     click.echo(f"{len(magnets)}件のmagnetリンクを取得。ダウンロード・解析を開始します。")
     effective_proxy = "socks5h://127.0.0.1:1080" if mullvad_socks5 else proxy
-    ingest_analyze(
+    # 指定しないオプション（mode・workers など）は ingest-analyze の既定値になる
+    ctx.invoke(
+        ingest_analyze,
         config=config,
         download_dir=download_dir,
         telegram_urls=(),
@@ -542,18 +711,32 @@ def organize_media_cmd(input_dir, output_dir, unknown_dir, dry_run):
               help="テスト対象の動画ファイル")
 @click.option("--config", "-c", default="config.yaml",
               help="設定ファイルのパス")
-def test_voice(video, config):
+@click.option("--remote", is_flag=True,
+              help="常駐デーモン（serve）の登録話者で照合する（モデルのロードを省略）")
+def test_voice(video, config, remote):
     """声紋照合のテスト実行（ダイアライゼーションなし）。"""
-    from src.audio.extractor import extract_audio
+    from src.audio.extractor import extract_audio_array
     from src.audio.voice_matcher import VoiceMatcher
 
+    if remote:
+        from src.server import RemoteClient, ServerError
+
+        click.echo(f"解析デーモンに照合を依頼中: {video}")
+        try:
+            reply = RemoteClient(_server_address(config)).test_voice(video)
+        except (OSError, ServerError) as e:
+            click.echo(f"エラー: {e}", err=True)
+            sys.exit(1)
+        _print_voice_scores(reply["scores"], reply["threshold"])
+        return
+
     import yaml
     with open(config, "r", encoding="utf-8") as f:
         cfg = yaml.safe_load(f)
 
     click.echo("声紋モデルを読み込み中...")
     matcher = VoiceMatcher(threshold=cfg["thresholds"]["voice_similarity"])
-    matcher.register_speakers_from_dir(cfg["paths"]["reference_voices"])
+    matcher.register_speakers_from_store(cfg["paths"]["reference_voices"])
 
     if not matcher.reference_embeddings:
         click.echo("エラー: 基準音声が登録されていません。data/reference_voices/ に音声ファイルを配置してください。")
@@ -562,20 +745,21 @@ def test_voice(video, config):
     click.echo(f"登録話者: {list(matcher.reference_embeddings.keys())}")
 
     click.echo(f"\n音声を抽出中: {video}")
-    audio_path = extract_audio(video, sample_rate=cfg["audio"]["sample_rate"])
+    sample_rate = cfg["audio"]["sample_rate"]
+    wav = extract_audio_array(video, sample_rate=sample_rate)
 
     click.echo("声紋照合中...")
-    scores = matcher.compare(str(audio_path))
+    scores = matcher.compare_wav(wav, sample_rate)
+    _print_voice_scores(scores, cfg["thresholds"]["voice_similarity"])
 
+
+def _print_voice_scores(scores: dict[str, float], threshold: float) -> None:
+    """声紋類似度スコアを閾値判定付きで表示する。"""
     click.echo(f"\n声紋類似度スコア:")
-    threshold = cfg["thresholds"]["voice_similarity"]
     for sid, score in sorted(scores.items(), key=lambda x: -x[1]):
         mark = "○" if score >= threshold else "×"
         click.echo(f"  {mark} {sid}: {score:.4f}")
 
-    # クリーンアップ
-    Path(audio_path).unlink(missing_ok=True)
-
 
 if __name__ == "__main__":
     cli()
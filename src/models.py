@@ -0,0 +1,145 @@
+"""共有モデルレジストリ - 重いモデルをプロセス内で一度だけロードして使い回す"""
+
+import logging
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# レジストリ上のモデル名
+VOICE_ENCODER = "resemblyzer.VoiceEncoder"
+PYANNOTE_DIARIZATION = "pyannote/speaker-diarization-3.1"
+# speaker-diarization-3.1 が内部で使う話者埋め込みモデル
+PYANNOTE_EMBEDDING = "pyannote/wespeaker-voxceleb-resnet34-LM"
+YOLO_PERSON = "ultralytics.YOLO:yolov8n.pt"
+OPEN_CLIP = "open_clip:ViT-B-32/laion2b_s34b_b79k"
+
+
+@dataclass
+class _Entry:
+    """レジストリ内の1モデル分の状態"""
+    model: Any = None
+    loaded: bool = False
+    refcount: int = 0
+    loads: int = 0
+    load_time: float = 0.0          # 直近のロード所要時間（秒）
+    total_load_time: float = 0.0
+    last_used: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class ModelRegistry:
+    """名前付きモデルの遅延ロード・参照カウント共有・アイドル解放を行うレジストリ。
+
+    同じ名前で acquire されたモデルは最初の1回だけ factory で構築され、
+    以降は同じインスタンスが返される。参照カウントが 0 のまま
+    idle_timeout 秒経過したモデルは unload_idle() で解放される。
+    """
+
+    def __init__(self, idle_timeout: float | None = None):
+        """
+        Args:
+            idle_timeout: 未使用モデルを解放するまでの秒数（None なら自動解放しない）
+        """
+        self.idle_timeout = idle_timeout
+        self._entries: dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, name: str, factory: Callable[[], Any]) -> Any:
+        """モデルを取得する（未ロードなら factory で構築）。参照カウントを1増やす。
+
+        Args:
+            name: モデルの識別名
+            factory: モデルを構築する引数なしの関数
+
+        Returns:
+            共有モデルインスタンス
+        """
+        with self._lock:
+            entry = self._entries.setdefault(name, _Entry())
+            entry.refcount += 1
+
+        # 構築はモデルごとのロックで行い、別モデルのロードを妨げない
+        try:
+            with entry.lock:
+                if not entry.loaded:
+                    start = time.perf_counter()
+                    entry.model = factory()
+                    entry.load_time = time.perf_counter() - start
+                    entry.total_load_time += entry.load_time
+                    entry.loads += 1
+                    entry.loaded = True
+                    logger.info("モデルロード: %s (%.2f秒)", name, entry.load_time)
+        except Exception:
+            with self._lock:
+                entry.refcount -= 1
+            raise
+
+        entry.last_used = time.monotonic()
+        self.unload_idle()
+        return entry.model
+
+    def release(self, name: str) -> None:
+        """モデルの参照カウントを1減らす。"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.refcount == 0:
+                return
+            entry.refcount -= 1
+            entry.last_used = time.monotonic()
+
+    def unload_idle(self, max_idle: float | None = None) -> list[str]:
+        """参照されておらず一定時間使われていないモデルを解放する。
+
+        Args:
+            max_idle: アイドル秒数の閾値（省略時は idle_timeout）
+
+        Returns:
+            解放したモデル名のリスト
+        """
+        max_idle = self.idle_timeout if max_idle is None else max_idle
+        if max_idle is None:
+            return []
+
+        now = time.monotonic()
+        unloaded = []
+        with self._lock:
+            for name, entry in self._entries.items():
+                if entry.loaded and entry.refcount == 0 and now - entry.last_used >= max_idle:
+                    entry.model = None
+                    entry.loaded = False
+                    unloaded.append(name)
+        for name in unloaded:
+            logger.info("モデル解放（アイドル）: %s", name)
+        return unloaded
+
+    def is_loaded(self, name: str) -> bool:
+        """モデルがロード済みか"""
+        entry = self._entries.get(name)
+        return entry is not None and entry.loaded
+
+    def clear(self) -> None:
+        """全モデルを参照カウントに関係なく破棄する（テスト・終了処理用）。"""
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def metrics(self) -> dict[str, dict]:
+        """モデルごとのロード回数・ロード時間・参照数を返す。"""
+        with self._lock:
+            return {
+                name: {
+                    "loaded": entry.loaded,
+                    "refcount": entry.refcount,
+                    "loads": entry.loads,
+                    "load_time": round(entry.load_time, 4),
+                    "total_load_time": round(entry.total_load_time, 4),
+                }
+                for name, entry in self._entries.items()
+            }
+
+
+registry = ModelRegistry()
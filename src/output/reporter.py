@@ -5,6 +5,7 @@ import json
 import logging
 from pathlib import Path
 
+from src.output.result_store import ResultStore
 from src.pipeline import VideoAnalysisResult
 
 logger = logging.getLogger(__name__)
@@ -20,12 +21,17 @@ def save_json(results: list[VideoAnalysisResult], output_path: str) -> Path:
     Returns:
         出力ファイルパス
     """
+    return write_json_records([r.to_dict() for r in results], output_path)
+
+
+def write_json_records(records: list[dict], output_path: str) -> Path:
+    """to_dict 形式の結果を JSON ファイルに出力する。"""
     output_path = Path(output_path)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
     data = {
-        "total_videos": len(results),
-        "results": [r.to_dict() for r in results],
+        "total_videos": len(records),
+        "results": records,
     }
 
     with open(output_path, "w", encoding="utf-8") as f:
@@ -48,14 +54,19 @@ def save_csv(results: list[VideoAnalysisResult], output_path: str) -> Path:
     Returns:
         出力ファイルパス
     """
+    return write_csv_records([r.to_dict() for r in results], output_path)
+
+
+def write_csv_records(records: list[dict], output_path: str) -> Path:
+    """to_dict 形式の結果を CSV ファイルに出力する。"""
     output_path = Path(output_path)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    if not results:
+    if not records:
         return output_path
 
-    # ヘッダー構築
-    performer_ids = [p.person_id for p in results[0].performers]
+    # ヘッダー構築（エラーで出演者が空の結果もあるため全件から集める）
+    performer_ids = list(dict.fromkeys(pid for r in records for pid in r["performers"]))
     header = ["動画名", "長さ"]
     for pid in performer_ids:
         header.extend([f"{pid}_出演", f"{pid}_声紋スコア", f"{pid}_視覚スコア",
@@ -67,12 +78,11 @@ def save_csv(results: list[VideoAnalysisResult], output_path: str) -> Path:
         writer = csv.writer(f)
         writer.writerow(header)
 
-        for result in results:
-            result_dict = result.to_dict()
-            row = [result.video_name, result_dict["duration"]]
+        for record in records:
+            row = [record["video"], record["duration"]]
 
             for pid in performer_ids:
-                p = result_dict["performers"].get(pid, {})
+                p = record["performers"].get(pid, {})
                 row.extend([
                     "○" if p.get("detected", False) else "×",
                     p.get("voice_score", 0.0),
@@ -81,8 +91,8 @@ def save_csv(results: list[VideoAnalysisResult], output_path: str) -> Path:
                     p.get("speaking_time", "0:00"),
                 ])
 
-            row.append(result.detected_count)
-            row.append(result_dict["summary"])
+            row.append(record["detected_count"])
+            row.append(record["summary"])
             writer.writerow(row)
 
     logger.info("CSV 出力完了: %s", output_path)
@@ -121,7 +131,9 @@ def append_csv_log(results: list[VideoAnalysisResult], output_path: str) -> Path
 
 def save_results(results: list[VideoAnalysisResult], output_dir: str,
                  fmt: str = "json") -> list[Path]:
-    """分析結果をファイルに保存する。
+    """分析結果を結果ストアに追記し、これまでの全結果をファイルに書き出す。
+
+    同じ動画の結果は新しいもので置き換わり、以前に解析した動画の結果は残る。
 
     Args:
         results: 分析結果のリスト
@@ -131,17 +143,29 @@ def save_results(results: list[VideoAnalysisResult], output_dir: str,
     Returns:
         出力ファイルパスのリスト
     """
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
+    store = ResultStore(output_dir)
+    store.put_many(results)
+    return export_results(store, fmt=fmt)
+
+
+def export_results(store: ResultStore, fmt: str = "json") -> list[Path]:
+    """結果ストアの内容を results.json / results.csv に書き出す。
+
+    古い行が溜まっていれば先に結果ストアを整理する。
+
+    Returns:
+        出力ファイルパスのリスト
+    """
+    if store.needs_compaction():
+        store.compact()
+    records = store.records()
     saved = []
 
     if fmt in ("json", "both"):
-        path = save_json(results, str(output_dir / "results.json"))
-        saved.append(path)
+        saved.append(write_json_records(records, str(store.output_dir / "results.json")))
 
     if fmt in ("csv", "both"):
-        path = save_csv(results, str(output_dir / "results.csv"))
-        saved.append(path)
+        saved.append(write_csv_records(records, str(store.output_dir / "results.csv")))
 
     return saved
 
@@ -0,0 +1,316 @@
+"""結果ストア - 解析結果を追記専用の JSONL に蓄積する
+
+results.json / results.csv は全件を毎回書き直すため、動画ごとに保存すると
+バッチ全体で O(n²) の書き込みになる。ResultStore は1本の結果を results.jsonl に
+1行追記するだけで保存し（O(1)）、同じ動画の結果が再保存された場合は後の行を
+有効とする。results.json / results.csv はバッチの終わりに export で書き出す。
+
+古い行（上書きされた結果）が有効な行より多くなったら compact で詰め直す。
+同じ出力先に複数のプロセスが書き込めるよう、追記は results.jsonl.lock の
+共有ロック、compact は排他ロックを取って行う（compact の読み込みから置き換えまでの
+間に他のプロセスが追記した行を失わない）。
+
+結果は動画ファイルの内容のフィンガープリントをキーにする（名前を変えた動画は
+同じ結果、別フォルダの同名の動画は別の結果になる）。解析済みかどうかの判定は
+出力先の fingerprints.sqlite（FingerprintIndex）だけで行い、結果の行は読まない。
+"""
+
+import fcntl
+import json
+import logging
+import os
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from src.fingerprint import FingerprintIndex
+from src.pipeline import VideoAnalysisResult
+
+logger = logging.getLogger(__name__)
+
+STORE_FILENAME = "results.jsonl"
+LOCK_FILENAME = "results.jsonl.lock"
+INDEX_FILENAME = "fingerprints.sqlite"
+# 古い行がこの件数以上、かつ有効な行以上になったら compact する
+COMPACT_MIN_STALE = 64
+
+_BAD_LINE = (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError, AttributeError)
+
+
+def _record_key(record: dict) -> str:
+    """行のキー: フィンガープリント（旧形式の行は動画名）"""
+    return record.get("fingerprint") or record["video"]
+
+
+class ResultStore:
+    """動画ファイルの内容をキーにした追記専用の結果ストア。
+
+    各行は VideoAnalysisResult.to_dict() の辞書で、キーはその "fingerprint"
+    （フィンガープリントのない旧形式の行は "video" の動画名）。
+    追記・取得で初めて必要になった時点でファイルを1回走査し、
+    キーごとの最新行の位置を索引に持つ。
+
+    使い方:
+        store = ResultStore("output")
+        targets = store.unanalyzed(videos)
+        store.put(result)           # 1行追記
+        store.records()             # 動画ごとの最新の結果
+    """
+
+    def __init__(self, output_dir: str | Path):
+        """
+        Args:
+            output_dir: 出力ディレクトリ（results.jsonl を置く）
+        """
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / STORE_FILENAME
+        self._offsets: dict[str, int] = {}
+        self._names: dict[str, str] = {}     # 動画名 → 最新の結果のキー
+        self._stale = 0
+        self._scanned = False
+        self._inode: int | None = None     # 索引を作ったときのファイル（他のプロセスの compact の検出用）
+        self._index: FingerprintIndex | None = None
+        # records() を読んだときのファイルの (inode, サイズ, 更新時刻) とその結果
+        self._records: tuple[tuple[int, int, int], list[dict]] | None = None
+        if not self.path.exists():
+            self._import_legacy()
+
+    def _import_legacy(self) -> None:
+        """results.jsonl がなく results.json だけある出力先は、その内容を取り込む。
+
+        同じ出力先を開いた別のプロセスと二重に取り込まないよう、排他ロック中に
+        results.jsonl がないことを確かめてから、一時ファイルから置き換えて作る。
+        """
+        legacy = self.output_dir / "results.json"
+        if not legacy.exists():
+            return
+        with self._locked(fcntl.LOCK_EX):
+            if self.path.exists():
+                return
+            try:
+                with open(legacy, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("既存の結果を読み込めませんでした: %s (%s)", legacy, e)
+                return
+            records = data.get("results", []) if isinstance(data, dict) else data
+            records = [r for r in records if isinstance(r, dict) and "video" in r]
+            if not records:
+                return
+            self._replace(records)
+        logger.info("既存の結果 %d 件を結果ストアに取り込みました: %s", len(records), legacy)
+
+    def _replace(self, records: list[dict]) -> None:
+        """ファイルを records の行で置き換える（排他ロック中に呼ぶ）"""
+        tmp = self.path.with_suffix(".jsonl.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _ensure_scanned(self) -> None:
+        if not self._scanned or self._inode != self._current_inode():
+            self._scan()
+
+    def _current_inode(self) -> int | None:
+        try:
+            return os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def _locked(self, operation: int) -> Iterator[None]:
+        """プロセス間のロック（追記は fcntl.LOCK_SH、compact は fcntl.LOCK_EX）"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.output_dir / LOCK_FILENAME, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, operation)
+            yield
+        finally:
+            os.close(fd)
+
+    def _scan(self) -> None:
+        """ファイルを走査して索引を作る（途中で切れた行は読み飛ばす）"""
+        self._offsets.clear()
+        self._names.clear()
+        self._stale = 0
+        self._scanned = True
+        self._inode = self._current_inode()
+        if self._inode is None:
+            return
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    key = _record_key(record)
+                except _BAD_LINE:
+                    if line.strip():
+                        logger.warning("結果ストアの壊れた行を読み飛ばします: %s (offset=%d)",
+                                       self.path, offset)
+                    self._stale += 1
+                else:
+                    self._index_line(record, key, offset)
+                offset += len(line)
+            if offset and not line.endswith(b"\n"):
+                # 書き込み途中で止まった行の後ろに追記しないよう改行で区切る
+                self._write(b"\n")
+
+    def _write(self, data: bytes) -> int:
+        """O_APPEND で1回の write として追記し、書き込み開始位置を返す"""
+        with self._locked(fcntl.LOCK_SH):
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                start = os.lseek(fd, 0, os.SEEK_END)
+                os.write(fd, data)
+                created = self._inode is None
+            finally:
+                os.close(fd)
+            if created:
+                self._inode = self._current_inode()
+        return start
+
+    def _append(self, records: list[dict]) -> None:
+        if not records:
+            return
+        self._ensure_scanned()
+        lines = [(json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8") for r in records]
+        offset = self._write(b"".join(lines))
+        for record, line in zip(records, lines):
+            self._index_line(record, _record_key(record), offset)
+            offset += len(line)
+
+    def _index_line(self, record: dict, key: str, offset: int) -> None:
+        if key in self._offsets:
+            self._stale += 1
+        self._offsets[key] = offset
+        self._names[record["video"]] = key
+
+    @property
+    def index(self) -> FingerprintIndex:
+        """出力先のフィンガープリント索引（初回アクセスで開く）。
+
+        索引を新しく作る場合は、フィンガープリントのない旧形式の結果の動画名を登録する。
+        """
+        if self._index is None:
+            path = self.output_dir / INDEX_FILENAME
+            created = not path.exists()
+            self._index = FingerprintIndex(path)
+            if created and self.path.exists():
+                self._ensure_scanned()
+                self._index.add_legacy_names(
+                    name for name, key in self._names.items() if key == name)
+        return self._index
+
+    def __len__(self) -> int:
+        self._ensure_scanned()
+        return len(self._offsets)
+
+    def __contains__(self, video_name: str) -> bool:
+        self._ensure_scanned()
+        return video_name in self._names
+
+    def _fingerprint(self, result: VideoAnalysisResult) -> None:
+        """動画ファイルがあればフィンガープリントを付けて解析済みとして記録する"""
+        if result.fingerprint is not None or not Path(result.video_path).is_file():
+            return
+        try:
+            result.fingerprint = self.index.mark_analyzed(result.video_path, result.video_name)
+        except OSError as e:
+            logger.warning("フィンガープリントを計算できません: %s (%s)", result.video_path, e)
+
+    def put(self, result: VideoAnalysisResult) -> None:
+        """1本の結果を追記する"""
+        self.put_many([result])
+
+    def put_many(self, results: Iterable[VideoAnalysisResult]) -> None:
+        """複数の結果をまとめて追記する（動画ファイルがあればフィンガープリントを付ける）"""
+        results = list(results)
+        for result in results:
+            self._fingerprint(result)
+        self._append([r.to_dict() for r in results])
+
+    def names(self) -> set[str]:
+        """結果のある動画名"""
+        self._ensure_scanned()
+        return set(self._names)
+
+    def unanalyzed(self, videos: Iterable[str | Path], verify: bool = False) -> list[Path]:
+        """結果のない動画だけを入力順に返す（ファイルの内容で判定する）。
+
+        Args:
+            verify: 完全フィンガープリントが記録されていれば照合する
+        """
+        matches = self.index.lookup(videos, verify=verify)
+        return [video for video, name in matches.items() if name is None]
+
+    def get(self, video_name: str, fingerprint: str | None = None) -> dict | None:
+        """動画の最新の結果（to_dict 形式）。なければ None。
+
+        結果は内容のフィンガープリントで区別するため、別フォルダの同名の動画は
+        動画名だけでは区別できない（最後に保存された結果を返す）。fingerprint を
+        指定するとその結果を返す。
+        """
+        self._ensure_scanned()
+        key = self._names.get(video_name) if fingerprint is None else fingerprint
+        if key is None or key not in self._offsets:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[key])
+            return json.loads(f.readline())
+
+    def records(self) -> list[dict]:
+        """動画ごとの最新の結果（初めて保存された順）。
+
+        ファイルが変わっていなければ（inode・サイズ・更新時刻が同じなら）前回の結果を返す。
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        stat = (st.st_ino, st.st_size, st.st_mtime_ns)
+        cached = self._records
+        if cached is None or cached[0] != stat:
+            # 複数のスレッドから呼ばれても対応がずれないよう組で置き換える
+            cached = self._records = (stat, self._read_records())
+        return list(cached[1])
+
+    def _read_records(self) -> list[dict]:
+        latest: dict[str, dict] = {}
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    latest[_record_key(record)] = record
+                except _BAD_LINE:
+                    continue
+        # 旧形式の行は、同じ動画名の新しい形式の結果があればそちらに置き換わっている
+        fingerprinted = {r["video"] for r in latest.values() if "fingerprint" in r}
+        return [r for key, r in latest.items()
+                if key != r["video"] or r["video"] not in fingerprinted]
+
+    @property
+    def stale_ratio(self) -> float:
+        """全行に占める古い行の割合"""
+        self._ensure_scanned()
+        total = len(self._offsets) + self._stale
+        return self._stale / total if total else 0.0
+
+    def needs_compaction(self) -> bool:
+        self._ensure_scanned()
+        return self._stale >= COMPACT_MIN_STALE and self._stale >= len(self._offsets)
+
+    def compact(self) -> None:
+        """最新の行だけを残してファイルを書き直す（一時ファイルから置き換える）。
+
+        書き直しの間は排他ロックを取り、他のプロセスの追記を待たせる。
+        """
+        self._ensure_scanned()
+        stale = self._stale
+        with self._locked(fcntl.LOCK_EX):
+            records = self.records()
+            self._replace(records)
+        logger.info("結果ストアを整理しました: %d 件（古い行 %d 件を削除）", len(records), stale)
+        self._scan()
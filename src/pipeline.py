@@ -1,14 +1,23 @@
 """分析パイプライン - 声紋分析と視覚分析を統合して出演者を判定"""
 
+import dataclasses
+import json
 import logging
 import tempfile
+from collections.abc import Callable, Iterable, Iterator
 from dataclasses import dataclass, field
 from pathlib import Path
 
+import numpy as np
 import yaml
 
+from src.models import registry
+
 logger = logging.getLogger(__name__)
 
+ANALYSIS_MODES = ("diarize", "targeted")
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mkv", ".mov", ".wmv", ".flv", ".webm"}
+
 
 @dataclass
 class PerformerResult:
@@ -31,7 +40,9 @@ class VideoAnalysisResult:
     duration: float
     performers: list[PerformerResult] = field(default_factory=list)
     detected_count: int = 0
+    skipped_ratio: float = 0.0         # VAD で非音声として除外した割合
     errors: list[str] = field(default_factory=list)
+    fingerprint: str | None = None     # 動画ファイルの内容の識別子（結果ストアへの保存時に付与）
 
     def to_dict(self) -> dict:
         """辞書形式に変換"""
@@ -50,14 +61,57 @@ class VideoAnalysisResult:
         detected_names = [p.name for p in self.performers if p.detected]
         summary = f"出演者: {', '.join(detected_names)}（{len(detected_names)}名）" if detected_names else "出演者なし"
 
-        return {
+        data = {
             "video": self.video_name,
             "duration": _format_time(self.duration),
             "performers": performers_dict,
             "detected_count": self.detected_count,
+            "skipped_ratio": round(self.skipped_ratio, 4),
             "summary": summary,
             "errors": self.errors,
         }
+        if self.fingerprint is not None:
+            data["fingerprint"] = self.fingerprint
+        return data
+
+
+def encode_result(result: VideoAnalysisResult) -> dict:
+    """VideoAnalysisResult を JSON 化できる辞書にする（decode_result で復元できる）"""
+    return dataclasses.asdict(result)
+
+
+def decode_result(data: dict) -> VideoAnalysisResult:
+    """encode_result の逆変換"""
+    data = dict(data)
+    performers = [PerformerResult(**p) for p in data.pop("performers", [])]
+    return VideoAnalysisResult(**data, performers=performers)
+
+
+@dataclass
+class DecodedAudio:
+    """Step 1 の結果: メモリ上の音声と音声区間"""
+    wav: np.ndarray | None
+    sample_rate: int
+    speech_mask: object = None      # SpeechMask（VAD 無効時は None）
+    fingerprint: str | None = None  # 区間の声紋ベクトルのキャッシュキーに使う動画のフィンガープリント
+    # 全区間の声紋ベクトルがキャッシュにあった場合の (区間数 × 次元) の行列と各区間の発話時間
+    # （このとき音声は展開しないので wav は None）
+    embeddings: np.ndarray | None = None
+    durations: list[float] | None = None
+
+
+@dataclass
+class VoiceAnalysis:
+    """Step 2-3 の結果: 出演者ごとの声紋照合結果"""
+    results: dict[str, dict]
+    threshold: float | None = None  # 統合判定の閾値（None なら thresholds.voice_similarity）
+
+
+def list_videos(video_dir: str | Path, recursive: bool = False) -> list[Path]:
+    """フォルダ内の動画ファイルをパス順に返す。"""
+    video_dir_path = Path(video_dir)
+    candidates = video_dir_path.rglob("*") if recursive else video_dir_path.iterdir()
+    return sorted(f for f in candidates if f.suffix.lower() in VIDEO_EXTENSIONS and f.is_file())
 
 
 def _format_time(seconds: float) -> str:
@@ -70,28 +124,92 @@ def _format_time(seconds: float) -> str:
 class AnalysisPipeline:
     """声紋 + 視覚分析を統合する解析パイプライン"""
 
-    def __init__(self, config_path: str = "config.yaml"):
+    def __init__(self, config_path: str = "config.yaml", mode: str | None = None):
+        """
+        Args:
+            config_path: 設定ファイルのパス
+            mode: 解析モード（"diarize" / "targeted"）。省略時は analysis.mode の値
+        """
         from src.audio.voice_matcher import VoiceMatcher
         from src.audio.diarizer import Diarizer
 
+        self.config_path = config_path
         with open(config_path, "r", encoding="utf-8") as f:
             self.config = yaml.safe_load(f)
 
+        analysis_cfg = self.config.get("analysis", {})
+        self.mode = mode or analysis_cfg.get("mode", "diarize")
+        if self.mode not in ANALYSIS_MODES:
+            raise ValueError(f"未対応の解析モードです: {self.mode}（{' / '.join(ANALYSIS_MODES)}）")
+
+        # 参照されなくなった共有モデルを解放するまでの秒数（レジストリは全パイプラインで
+        # 共有するため書き換えず、動画ごとに unload_idle に渡す）
+        self.idle_unload_sec = self.config.get("models", {}).get("idle_unload_sec")
+
+        voice_cfg = self.config.get("voice", {})
+        self.embedding_cache = self._embedding_cache()
         self.voice_matcher = VoiceMatcher(
-            threshold=self.config["thresholds"]["voice_similarity"]
-        )
-        self.diarizer = Diarizer(
-            max_speakers=self.config["diarization"]["max_speakers"],
-            min_segment_duration=self.config["diarization"]["min_segment_duration"],
+            threshold=self.config["thresholds"]["voice_similarity"],
+            cache=self.embedding_cache,
+            ann_min_speakers=voice_cfg.get("ann_min_speakers", 1000),
+            ann_probe=voice_cfg.get("ann_probe", 8),
         )
+        # targeted モードでは話者分離を行わないので Diarizer（pyannote）をロードしない
+        self.diarizer = None
+        self.targeted_detector = None
+        # pyannote の話者埋め込みで照合する場合の VoiceMatcher（setup で用意する）
+        self.pyannote_matcher = None
+        if self.mode == "diarize":
+            diarization_cfg = self.config["diarization"]
+            self.diarizer = Diarizer(
+                max_speakers=diarization_cfg["max_speakers"],
+                min_segment_duration=diarization_cfg["min_segment_duration"],
+                clustering=diarization_cfg.get("clustering", "auto"),
+                cache=self._diarization_cache(),
+                chunk_sec=diarization_cfg.get("chunk_sec"),
+                chunk_overlap_sec=diarization_cfg.get("chunk_overlap_sec", 30.0),
+                stitch_threshold=diarization_cfg.get("stitch_threshold", 0.5),
+            )
+        else:
+            from src.audio.targeted import TargetedDetector
+
+            targeted_cfg = analysis_cfg.get("targeted", {})
+            self.targeted_detector = TargetedDetector(
+                self.voice_matcher,
+                window_sec=targeted_cfg.get("window_sec", 1.5),
+                step_sec=targeted_cfg.get("step_sec", 0.75),
+                smoothing_windows=targeted_cfg.get("smoothing_windows", 5),
+                min_interval_sec=targeted_cfg.get("min_interval_sec", 1.0),
+            )
 
         # 視覚分析は任意（モデルが重いのでオプション）
         self.body_analyzer = None
         self.appearance_analyzer = None
         self.visual_enabled = False
+        self.hf_token = None
+        # 各ステップの開始時に (動画パス, ステップ名) で呼ばれる関数（ジョブキューの進捗記録用）
+        self.on_stage: Callable[[str, str], None] | None = None
 
         self.performers = self.config["performers"]
 
+    def _diarization_cache(self):
+        """設定で有効なら話者分離キャッシュを作る"""
+        from src.cache import DiarizationCache
+
+        cache_cfg = self.config.get("cache", {})
+        if not cache_cfg.get("diarization", True):
+            return None
+        return DiarizationCache(Path(cache_cfg.get("dir", ".cache")) / "diarization")
+
+    def _embedding_cache(self):
+        """設定で有効なら声紋ベクトルのキャッシュを作る"""
+        from src.cache import EmbeddingCache
+
+        cache_cfg = self.config.get("cache", {})
+        if not (cache_cfg.get("embeddings") or {}).get("enabled", False):
+            return None
+        return EmbeddingCache.from_config(cache_cfg)
+
     def setup(self, enable_visual: bool = False, hf_token: str | None = None) -> None:
         """分析の初期化。基準データの読み込みとモデル準備。
 
@@ -99,14 +217,48 @@ class AnalysisPipeline:
             enable_visual: 視覚分析を有効にするか
             hf_token: HuggingFace トークン（pyannote用）
         """
+        self.hf_token = hf_token
+
         # 声紋の基準データ登録
         ref_voices_dir = self.config["paths"]["reference_voices"]
-        self.voice_matcher.register_speakers_from_dir(ref_voices_dir)
+        if not self._setup_pyannote_matcher(ref_voices_dir, hf_token):
+            self.voice_matcher.register_speakers_from_store(
+                ref_voices_dir, shared=self._shared_references())
 
         # 視覚分析の初期化（オプション）
         if enable_visual:
             self._setup_visual()
 
+    def _setup_pyannote_matcher(self, ref_voices_dir: str, hf_token: str | None) -> bool:
+        """設定で有効なら pyannote の話者埋め込みで照合する VoiceMatcher を用意する。
+
+        基準音声も同じ埋め込みモデルで model="pyannote" の話者ストアに登録するため、
+        resemblyzer は読み込まない。pyannote が使えない場合は False を返す。
+        """
+        from src.audio.diarizer import embed_reference_files
+        from src.audio.voice_matcher import VoiceMatcher
+
+        if not self.config["diarization"].get("reuse_embeddings", False) or self.diarizer is None:
+            return False
+        if self.diarizer.pipeline is None:
+            logger.warning("pyannote が使えないため、話者埋め込みの再利用を無効にします")
+            return False
+
+        self.pyannote_matcher = VoiceMatcher(
+            threshold=self.config["thresholds"].get("voice_similarity_pyannote", 0.5),
+        )
+        self.pyannote_matcher.register_speakers_from_store(
+            ref_voices_dir,
+            model="pyannote",
+            embed_fn=lambda paths: embed_reference_files(paths, hf_token=hf_token),
+            shared=self._shared_references(),
+        )
+        return True
+
+    def _shared_references(self) -> bool:
+        """参照行列をワーカー間の共有メモリに置くか"""
+        return bool(self.config.get("cache", {}).get("shared_references", False))
+
     def _setup_visual(self) -> None:
         """視覚分析モジュールの初期化"""
         from src.visual.body_analyzer import BodyAnalyzer
@@ -125,6 +277,14 @@ class AnalysisPipeline:
 
         self.visual_enabled = True
 
+    def close(self) -> None:
+        """各モジュールが共有レジストリから取得したモデルを返却する。"""
+        for component in (self.voice_matcher, self.pyannote_matcher, self.diarizer,
+                          self.body_analyzer, self.appearance_analyzer):
+            if component is not None:
+                component.close()
+        self.visual_enabled = False
+
     def analyze_video(self, video_path: str) -> VideoAnalysisResult:
         """単一動画を解析する。
 
@@ -134,111 +294,230 @@ class AnalysisPipeline:
         Returns:
             VideoAnalysisResult
         """
-        from src.audio.extractor import extract_audio, get_video_duration
+        result = self.new_result(video_path)
+        decoded = self.decode_audio(result)
+        if decoded is None:
+            return result
+
+        voice = self.analyze_audio(result, decoded)
+        if voice is None:
+            return result
+
+        # Step 4: 視覚分析（有効な場合）
+        visual_results = self.analyze_visual(result)
+
+        # Step 5: 統合判定
+        self.finalize(result, voice, visual_results)
+        return result
+
+    def analyze_stream(self, videos: Iterable[str | Path]
+                       ) -> Iterator[tuple[int, VideoAnalysisResult]]:
+        """複数の動画を解析し、完了した順に (入力順の番号, 結果) を返す。
+
+        scheduler.enabled（既定で有効）の場合は StageScheduler で音声抽出・
+        声紋照合・視覚分析を動画間で重ねて実行する。無効なら1本ずつ analyze_video。
+        videos はジェネレータでもよく、解析に取りかかる直前に1本ずつ取り出す。
+        """
+        if self.config.get("scheduler", {}).get("enabled", True):
+            from src.scheduler import StageScheduler
+
+            yield from StageScheduler.from_config(self).run(videos)
+            return
+
+        for index, video in enumerate(videos):
+            logger.info("[%d] 解析開始: %s", index + 1, Path(video).name)
+            yield index, self.analyze_video(str(video))
 
+    @staticmethod
+    def new_result(video_path: str) -> VideoAnalysisResult:
+        """解析前の空の結果を作る"""
         video_path_obj = Path(video_path)
-        result = VideoAnalysisResult(
+        return VideoAnalysisResult(
             video_path=str(video_path_obj),
             video_name=video_path_obj.name,
             duration=0.0,
         )
 
+    def decode_audio(self, result: VideoAnalysisResult) -> DecodedAudio | None:
+        """Step 1: 動画長の取得・音声抽出（一時WAVを介さずメモリ上に展開）・音声区間検出
+
+        Returns:
+            DecodedAudio。失敗した場合は result.errors に記録して None
+        """
+        from src.audio.extractor import extract_audio_array, get_video_duration
+
+        if self.idle_unload_sec is not None:
+            registry.unload_idle(max_idle=self.idle_unload_sec)
+        fingerprint = self._video_fingerprint(result)
+        if fingerprint is not None:
+            cached = self._cached_segments(result, fingerprint)
+            if cached is not None:
+                return cached
+
         try:
-            result.duration = get_video_duration(video_path)
+            result.duration = get_video_duration(result.video_path)
         except Exception as e:
             logger.error("動画情報取得エラー: %s", e)
             result.errors.append(f"動画情報取得エラー: {e}")
-            return result
+            return None
 
-        # Step 1: 音声抽出
-        logger.info("[Step 1/5] 音声抽出中: %s", video_path_obj.name)
-        audio_path = None
+        self._enter_stage(result, "decode")
+        logger.info("[Step 1/5] 音声抽出中: %s", result.video_name)
+        sample_rate = self.config["audio"]["sample_rate"]
         try:
-            audio_path = extract_audio(
-                video_path,
-                sample_rate=self.config["audio"]["sample_rate"],
-            )
-
-            # Step 2: 話者ダイアライゼーション
-            logger.info("[Step 2/5] 話者ダイアライゼーション中...")
-            try:
-                segments = self.diarizer.diarize(str(audio_path))
-            except Exception as e:
-                logger.error("ダイアライゼーションエラー: %s", e)
-                result.errors.append(f"ダイアライゼーションエラー: {e}")
-                segments = []
-
-            # Step 3: 声紋照合
-            logger.info("[Step 3/5] 声紋照合中... (%d セグメント)", len(segments))
-            voice_results = self._analyze_voice(str(audio_path), video_path, segments)
-
-            # Step 4: 視覚分析（有効な場合）
-            visual_results = {}
-            if self.visual_enabled:
-                logger.info("[Step 4/5] 視覚分析中...")
-                try:
-                    visual_results = self._analyze_visual(video_path)
-                except Exception as e:
-                    logger.error("視覚分析エラー: %s", e)
-                    result.errors.append(f"視覚分析エラー: {e}")
-
-            # Step 5: 統合判定
-            logger.info("[Step 5/5] 統合判定中...")
-            result.performers = self._combine_results(voice_results, visual_results)
-            result.detected_count = sum(1 for p in result.performers if p.detected)
-            logger.info("解析完了: %s → %d名検出", video_path_obj.name, result.detected_count)
-
+            wav = extract_audio_array(result.video_path, sample_rate=sample_rate,
+                                      duration=result.duration)
+            speech_mask = self._detect_speech(wav, sample_rate)
         except Exception as e:
             logger.error("音声抽出エラー: %s", e)
             result.errors.append(f"音声抽出エラー: {e}")
-        finally:
-            # 一時ファイルのクリーンアップ（例外発生時も確実に実行）
-            if audio_path is not None:
+            return None
+
+        if speech_mask is not None:
+            result.skipped_ratio = speech_mask.skipped_ratio
+        return DecodedAudio(wav=wav, sample_rate=sample_rate, speech_mask=speech_mask,
+                            fingerprint=fingerprint)
+
+    def analyze_audio(self, result: VideoAnalysisResult,
+                      decoded: DecodedAudio) -> VoiceAnalysis | None:
+        """Step 2-3: 話者ダイアライゼーションと声紋照合（targeted モードでは直接照合）
+
+        Returns:
+            VoiceAnalysis。失敗した場合は result.errors に記録して None
+        """
+        self._enter_stage(result, "voice")
+        wav, sample_rate, speech_mask = decoded.wav, decoded.sample_rate, decoded.speech_mask
+        try:
+            voice_threshold = None
+            if decoded.embeddings is not None:
+                # Step 2-3: 区間と声紋ベクトルはキャッシュ済み（話者分離・埋め込みを省く）
+                logger.info("[Step 2-3/5] キャッシュ済みの声紋ベクトルで照合中... (%d セグメント)",
+                            len(decoded.embeddings))
+                matcher = self.voice_matcher
+                voice_results = matcher.summarize_scores(
+                    matcher.score_matrix(decoded.embeddings), decoded.durations)
+            elif self.mode == "targeted":
+                # Step 2-3: 話者分離を省き、ウィンドウごとに出演者と直接照合
+                logger.info("[Step 2-3/5] 対象話者検出中...")
+                voice_results = self.targeted_detector.detect(wav, sample_rate, speech_mask)
+            else:
+                # Step 2: 話者ダイアライゼーション
+                logger.info("[Step 2/5] 話者ダイアライゼーション中...")
                 try:
-                    Path(audio_path).unlink(missing_ok=True)
-                except Exception:
-                    logger.debug("一時ファイル削除失敗: %s", audio_path)
+                    segments, embeddings = self.diarizer.diarize_with_embeddings(
+                        wav, sample_rate=sample_rate, speech_mask=speech_mask)
+                except Exception as e:
+                    logger.error("ダイアライゼーションエラー: %s", e)
+                    result.errors.append(f"ダイアライゼーションエラー: {e}")
+                    segments, embeddings = [], {}
+
+                # Step 3: 声紋照合
+                logger.info("[Step 3/5] 声紋照合中... (%d セグメント)", len(segments))
+                if self.pyannote_matcher is not None:
+                    voice_results = self._analyze_voice_embeddings(
+                        segments, embeddings, wav, sample_rate, speech_mask)
+                    voice_threshold = self.pyannote_matcher.threshold
+                else:
+                    voice_results = self._analyze_voice(wav, sample_rate, segments, speech_mask,
+                                                        result=result,
+                                                        fingerprint=decoded.fingerprint)
+        except Exception as e:
+            logger.error("声紋解析エラー: %s", e)
+            result.errors.append(f"声紋解析エラー: {e}")
+            return None
+
+        return VoiceAnalysis(results=voice_results, threshold=voice_threshold)
+
+    def analyze_visual(self, result: VideoAnalysisResult) -> dict[str, dict]:
+        """Step 4: 視覚分析。無効な場合・失敗した場合は空の辞書"""
+        if not self.visual_enabled:
+            return {}
+        self._enter_stage(result, "visual")
+        logger.info("[Step 4/5] 視覚分析中...")
+        try:
+            return self._analyze_visual(result.video_path)
+        except Exception as e:
+            logger.error("視覚分析エラー: %s", e)
+            result.errors.append(f"視覚分析エラー: {e}")
+            return {}
+
+    def finalize(self, result: VideoAnalysisResult, voice: VoiceAnalysis,
+                 visual_results: dict[str, dict]) -> None:
+        """Step 5: 声紋と視覚の結果を統合して result に書き込む"""
+        self._enter_stage(result, "finalize")
+        logger.info("[Step 5/5] 統合判定中...")
+        result.performers = self._combine_results(voice.results, visual_results,
+                                                  voice_threshold=voice.threshold)
+        result.detected_count = sum(1 for p in result.performers if p.detected)
+        logger.info("解析完了: %s → %d名検出", result.video_name, result.detected_count)
+
+    def _enter_stage(self, result: VideoAnalysisResult, stage: str) -> None:
+        """on_stage に進捗を通知する（通知の失敗で解析は止めない）"""
+        if self.on_stage is None:
+            return
+        try:
+            self.on_stage(result.video_path, stage)
+        except Exception as e:
+            logger.warning("進捗の記録に失敗しました: %s", e)
+
+    def _detect_speech(self, wav, sample_rate: int):
+        """VAD で音声区間を検出する。無効化されている場合は None"""
+        from src.audio.vad import detect_speech
+
+        vad_cfg = self.config.get("vad", {})
+        if not vad_cfg.get("enabled", True):
+            return None
+        return detect_speech(
+            wav, sample_rate,
+            aggressiveness=vad_cfg.get("aggressiveness", 2),
+            min_speech_sec=vad_cfg.get("min_speech_sec", 0.3),
+            merge_gap_sec=vad_cfg.get("merge_gap_sec", 0.3),
+            pad_sec=vad_cfg.get("pad_sec", 0.1),
+        )
 
-        return result
+    def _analyze_voice(self, wav, sample_rate: int, segments: list,
+                       speech_mask=None, result: VideoAnalysisResult | None = None,
+                       fingerprint: str | None = None) -> dict[str, dict]:
+        """声紋分析を実行
 
-    def _analyze_voice(self, audio_path: str, video_path: str,
-                       segments: list) -> dict[str, dict]:
-        """声紋分析を実行"""
-        from src.audio.extractor import extract_audio_segment
+        Args:
+            wav: 動画全体のモノラル波形
+            sample_rate: 波形のサンプリングレート
+            segments: ダイアライゼーション結果の SpeakerSegment リスト
+            speech_mask: VAD の音声区間マスク（指定時は音声区間だけを照合する）
+            result: 解析中の結果（区間リストをキャッシュする場合の動画長など）
+            fingerprint: 動画のフィンガープリント。指定時は区間の声紋ベクトルを
+                キャッシュし、区間リストを保存する（次回は音声抽出から省く）
+        """
+        from src.audio.slicer import AudioSlicer
 
         if not segments:
-            # セグメントがない場合、全体を対象にする
-            scores = self.voice_matcher.compare(audio_path)
-            return {
-                sid: {
-                    "max_score": score,
-                    "avg_score": score,
-                    "matching_segments": 1 if score >= self.voice_matcher.threshold else 0,
-                    "total_segments": 1,
-                    "speaking_time": 0.0,
-                }
-                for sid, score in scores.items()
-            }
+            # セグメントがない場合、全体（VAD 有効時は音声区間のみ）を対象にする
+            voiced = speech_mask.extract(wav, sample_rate) if speech_mask is not None else wav
+            return self._whole_audio_results(
+                self.voice_matcher.compare_wav(voiced, sample_rate), self.voice_matcher.threshold)
 
-        # 各セグメントの音声を抽出して照合
+        # 音声全体はメモリ上にあるので、各セグメントはビューとして照合する
+        slicer = AudioSlicer(wav, sample_rate=sample_rate)
         segment_data = []
         for seg in segments:
-            try:
-                seg_audio = extract_audio_segment(
-                    video_path, seg.start, seg.end,
-                    sample_rate=self.config["audio"]["sample_rate"],
-                )
-                segment_data.append({
-                    "start": seg.start,
-                    "end": seg.end,
-                    "audio_path": str(seg_audio),
-                    "speaker_label": seg.speaker_label,
-                })
-            except Exception:
+            pieces = (speech_mask.clip(seg.start, seg.end) if speech_mask is not None
+                      else [(seg.start, seg.end)])
+            views = [v for v in (slicer.slice(s, e) for s, e in pieces) if len(v)]
+            if not views:
                 continue
+            segment_data.append({
+                "start": seg.start,
+                "end": seg.end,
+                "duration": sum(len(v) for v in views) / slicer.sample_rate,
+                "wav": views[0] if len(views) == 1 else np.concatenate(views),
+                "sample_rate": slicer.sample_rate,
+                "speaker_label": seg.speaker_label,
+            })
 
         if not segment_data:
-            scores = self.voice_matcher.compare(audio_path)
+            voiced = speech_mask.extract(wav, sample_rate) if speech_mask is not None else wav
+            scores = self.voice_matcher.compare_wav(voiced, sample_rate)
             return {
                 sid: {"max_score": score, "avg_score": score,
                       "matching_segments": 0, "total_segments": 0,
@@ -246,25 +525,124 @@ class AnalysisPipeline:
                 for sid, score in scores.items()
             }
 
+        if fingerprint is not None:
+            variant = self._segment_variant()
+            for data in segment_data:
+                data["cache_key"] = self.embedding_cache.segment_key(
+                    fingerprint, data["start"], data["end"], sample_rate,
+                    self.voice_matcher.model_id, variant)
+
+        # 声紋ベクトルはセグメントごとに1回だけ計算され、発話時間も同じスコア行列から求まる
         voice_results = self.voice_matcher.compare_segments(segment_data)
+        if fingerprint is not None and result is not None:
+            self.embedding_cache.put_plan(self._segment_plan_key(fingerprint), {
+                "duration": result.duration,
+                "skipped_ratio": result.skipped_ratio,
+                "segments": [{"start": d["start"], "end": d["end"], "duration": d["duration"],
+                              "key": d["cache_key"]} for d in segment_data],
+            })
+        return voice_results
 
-        # 各話者の発話時間を計算
-        for sid in voice_results:
-            speaking_time = 0.0
-            for seg in segment_data:
-                scores = self.voice_matcher.compare(seg["audio_path"])
-                if scores.get(sid, 0) >= self.voice_matcher.threshold:
-                    speaking_time += seg["end"] - seg["start"]
-            voice_results[sid]["speaking_time"] = speaking_time
-
-        # セグメント音声の一時ファイルをクリーンアップ
-        for seg in segment_data:
-            try:
-                Path(seg["audio_path"]).unlink(missing_ok=True)
-            except Exception:
-                pass
+    def _video_fingerprint(self, result: VideoAnalysisResult) -> str | None:
+        """区間の声紋ベクトルをキャッシュする場合は動画のフィンガープリント、しなければ None。
 
-        return voice_results
+        キャッシュが無効な場合、targeted モード、pyannote の話者埋め込みで照合する場合は対象外。
+        """
+        if (self.embedding_cache is None or self.mode != "diarize"
+                or self.pyannote_matcher is not None):
+            return None
+        try:
+            return self.embedding_cache.index.fingerprint(result.video_path)
+        except OSError as e:
+            logger.warning("フィンガープリントを計算できません: %s (%s)", result.video_path, e)
+            return None
+
+    def _segment_variant(self) -> str:
+        """区間の波形に影響する設定（VAD で無音を除くかどうかと、そのパラメータ）"""
+        return json.dumps(self.config.get("vad", {}), sort_keys=True)
+
+    def _segment_plan_key(self, fingerprint: str) -> str:
+        """動画の区間リストのキー（区間と声紋ベクトルに影響する設定を含める）"""
+        return self.embedding_cache.plan_key(
+            fingerprint,
+            sample_rate=self.config["audio"]["sample_rate"],
+            vad=self.config.get("vad", {}),
+            diarization=self.config.get("diarization", {}),
+            backend=self.diarizer.backend,
+            model=self.voice_matcher.model_id,
+        )
+
+    def _cached_segments(self, result: VideoAnalysisResult,
+                         fingerprint: str) -> DecodedAudio | None:
+        """区間リストと全区間の声紋ベクトルがキャッシュにあれば、音声を展開せずに返す"""
+        plan = self.embedding_cache.get_plan(self._segment_plan_key(fingerprint))
+        if not plan or not plan.get("segments"):
+            return None
+        segments = plan["segments"]
+        embeddings = self.embedding_cache.get_keys([seg["key"] for seg in segments])
+        if any(e is None for e in embeddings):
+            return None
+
+        result.duration = plan["duration"]
+        result.skipped_ratio = plan["skipped_ratio"]
+        self._enter_stage(result, "decode")
+        logger.info("[Step 1/5] 全 %d 区間の声紋ベクトルがキャッシュ済みのため音声抽出を省略: %s",
+                    len(segments), result.video_name)
+        return DecodedAudio(
+            wav=None,
+            sample_rate=self.config["audio"]["sample_rate"],
+            fingerprint=fingerprint,
+            embeddings=np.stack([np.asarray(e, dtype=np.float32) for e in embeddings]),
+            durations=[seg["duration"] for seg in segments],
+        )
+
+    @staticmethod
+    def _whole_audio_results(scores: dict[str, float], threshold: float) -> dict[str, dict]:
+        """音声全体を1セグメントとして照合したスコアを照合結果の形式にする"""
+        return {
+            sid: {
+                "max_score": score,
+                "avg_score": score,
+                "matching_segments": 1 if score >= threshold else 0,
+                "total_segments": 1,
+                "speaking_time": 0.0,
+            }
+            for sid, score in scores.items()
+        }
+
+    def _analyze_voice_embeddings(self, segments: list, embeddings: dict[str, np.ndarray],
+                                  wav=None, sample_rate: int = 16000,
+                                  speech_mask=None) -> dict[str, dict]:
+        """pyannote が返した話者ごとの声紋ベクトルで照合する（再埋め込みしない）。
+
+        各セグメントは所属する話者クラスタのスコアを引き継ぐ。使える声紋ベクトルが
+        なければ、_analyze_voice と同じく音声全体（VAD 有効時は音声区間のみ）を
+        pyannote の話者埋め込みモデルで1つのベクトルにして照合する。
+
+        Args:
+            segments: ダイアライゼーション結果の SpeakerSegment リスト
+            embeddings: {話者ラベル: 声紋ベクトル}
+            wav: 動画全体のモノラル波形（声紋ベクトルがない場合に使う）
+            sample_rate: 波形のサンプリングレート
+            speech_mask: VAD の音声区間マスク
+        """
+        matcher = self.pyannote_matcher
+        segments = [seg for seg in segments if seg.speaker_label in embeddings]
+        if not segments:
+            if wav is None:
+                return matcher.compare_segments([])
+            from src.audio.diarizer import embed_waveform
+
+            voiced = speech_mask.extract(wav, sample_rate) if speech_mask is not None else wav
+            scores = matcher.compare_embedding(
+                embed_waveform(voiced, sample_rate, hf_token=self.hf_token))
+            return self._whole_audio_results(scores, matcher.threshold)
+
+        labels = list(embeddings)
+        cluster_scores = matcher.score_matrix(np.array([embeddings[l] for l in labels]))
+        rows = {label: i for i, label in enumerate(labels)}
+        scores = cluster_scores[[rows[seg.speaker_label] for seg in segments]]
+        return matcher.summarize_scores(scores, [seg.duration for seg in segments])
 
     def _analyze_visual(self, video_path: str) -> dict[str, dict]:
         """視覚分析を実行"""
@@ -294,11 +672,17 @@ class AnalysisPipeline:
             return self.appearance_analyzer.compare_crops(all_crops)
 
     def _combine_results(self, voice_results: dict[str, dict],
-                         visual_results: dict[str, dict]) -> list[PerformerResult]:
-        """声紋と視覚のスコアを統合して最終判定を行う"""
+                         visual_results: dict[str, dict],
+                         voice_threshold: float | None = None) -> list[PerformerResult]:
+        """声紋と視覚のスコアを統合して最終判定を行う
+
+        voice_threshold を省略した場合は thresholds.voice_similarity を使う
+        （声紋モデルごとにスコアの分布が異なるため）。
+        """
         weight_voice = self.config["thresholds"]["combined_weight_voice"]
         weight_visual = self.config["thresholds"]["combined_weight_visual"]
-        voice_threshold = self.config["thresholds"]["voice_similarity"]
+        if voice_threshold is None:
+            voice_threshold = self.config["thresholds"]["voice_similarity"]
 
         results = []
         for performer in self.performers:
@@ -338,61 +722,53 @@ class AnalysisPipeline:
 
     def analyze_batch(self, video_dir: str,
                       skip_analyzed: bool = False,
-                      output_dir: str | None = None) -> list[VideoAnalysisResult]:
+                      output_dir: str | None = None,
+                      workers: int = 1) -> list[VideoAnalysisResult]:
         """フォルダ内の全動画を一括解析する。
 
         Args:
             video_dir: 動画フォルダのパス
             skip_analyzed: 既に結果が存在する動画をスキップするか
             output_dir: 結果保存先（skip_analyzed 判定にも使用）
+            workers: 並列に解析するワーカープロセス数（2以上で WorkerPool を使う）
 
         Returns:
-            VideoAnalysisResult のリスト
+            VideoAnalysisResult のリスト（動画のパス順）
         """
-        video_dir_path = Path(video_dir)
-        extensions = {".mp4", ".avi", ".mkv", ".mov", ".wmv", ".flv", ".webm"}
-
-        videos = [
-            f for f in sorted(video_dir_path.iterdir())
-            if f.suffix.lower() in extensions
-        ]
+        videos = list_videos(video_dir)
 
         if not videos:
-            logger.warning("動画が見つかりません: %s", video_dir_path)
+            logger.warning("動画が見つかりません: %s", video_dir)
             return []
 
-        # 既に解析済みの動画を特定（スキップ用）
-        analyzed_names: set[str] = set()
+        # 既に解析済みの動画を除く（名前ではなく内容で判定）
+        targets = videos
         if skip_analyzed and output_dir:
-            analyzed_names = self._load_analyzed_names(output_dir)
-            logger.info("解析済み: %d 件", len(analyzed_names))
+            targets = self._unanalyzed_videos(output_dir, videos)
+            logger.info("解析済み: %d 件", len(videos) - len(targets))
 
-        results = []
         total = len(videos)
-        skipped = 0
-        for i, video in enumerate(videos, 1):
-            if video.name in analyzed_names:
-                logger.info("[%d/%d] スキップ（解析済み）: %s", i, total, video.name)
-                skipped += 1
-                continue
-            logger.info("[%d/%d] 解析開始: %s", i, total, video.name)
-            result = self.analyze_video(str(video))
-            results.append(result)
+        skipped = total - len(targets)
+
+        if workers > 1:
+            from src.workers import WorkerPool
+
+            with WorkerPool(self.config_path, workers=workers, mode=self.mode,
+                            enable_visual=self.visual_enabled,
+                            hf_token=self.hf_token) as pool:
+                results = pool.map(targets)
+        else:
+            by_index = dict(self.analyze_stream(targets))
+            results = [by_index[i] for i in sorted(by_index)]
 
         logger.info("バッチ完了: %d 件解析, %d 件スキップ, 合計 %d 件",
                      len(results), skipped, total)
+        logger.debug("モデルロード状況: %s", registry.metrics)
         return results
 
     @staticmethod
-    def _load_analyzed_names(output_dir: str) -> set[str]:
-        """既存の結果 JSON から解析済みの動画名を取得する。"""
-        import json
-        results_file = Path(output_dir) / "results.json"
-        if not results_file.exists():
-            return set()
-        try:
-            with open(results_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return {r["video"] for r in data.get("results", [])}
-        except (json.JSONDecodeError, KeyError):
-            return set()
+    def _unanalyzed_videos(output_dir: str, videos: list[Path]) -> list[Path]:
+        """結果ストアに結果のない動画だけを返す（ファイルの内容で判定する）。"""
+        from src.output.result_store import ResultStore
+
+        return ResultStore(output_dir).unanalyzed(videos)
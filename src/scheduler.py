@@ -0,0 +1,220 @@
+"""ステージ並列スケジューラ - 動画解析の各ステップを重ねて実行する
+
+analyze_video は1本ずつ Step 1〜5 を順に実行するため、ffmpeg による音声抽出
+（I/O・サブプロセス待ち）とモデル推論（CPU）が重ならない。StageScheduler は
+解析をステージに分け、ステージ間を上限付きキューでつないで流す。
+
+    decode（音声抽出・VAD） → voice（話者分離・声紋照合） ┐
+    visual（フレーム抽出・人物検出・外見照合） ────────────┴→ 統合判定
+
+動画 N の声紋照合中に動画 N+1 の音声を抽出し、視覚分析は音声側と並行して進む。
+ffmpeg の待ちや numpy / torch の演算中は GIL が解放されるため、各ステージは
+スレッドで実行する。
+"""
+
+import logging
+import queue
+import threading
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from src.pipeline import AnalysisPipeline, DecodedAudio, VideoAnalysisResult, VoiceAnalysis
+
+logger = logging.getLogger(__name__)
+
+# キューの終端を表す番兵
+_DONE = object()
+
+
+@dataclass
+class _Job:
+    """1本の動画の解析状態"""
+    index: int
+    result: VideoAnalysisResult
+    decoded: DecodedAudio | None = None
+    voice: VoiceAnalysis | None = None
+    visual: dict[str, dict] = field(default_factory=dict)
+    remaining: int = 1              # 完了待ちの枝の数（音声 + 視覚）
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class StageScheduler:
+    """AnalysisPipeline の各ステップをステージ並列で実行するスケジューラ。
+
+    使い方:
+        scheduler = StageScheduler.from_config(pipeline)
+        for index, result in scheduler.run(videos):
+            ...
+    """
+
+    def __init__(self, pipeline: AnalysisPipeline, decode_workers: int = 2,
+                 voice_workers: int = 1, visual_workers: int = 1, queue_size: int = 2):
+        """
+        Args:
+            pipeline: setup 済みの AnalysisPipeline
+            decode_workers: 音声抽出を同時に行うスレッド数
+            voice_workers: 話者分離・声紋照合を同時に行うスレッド数
+            visual_workers: 視覚分析を同時に行うスレッド数
+            queue_size: ステージ間キューの上限（抽出済み音声をメモリに溜める本数）
+        """
+        for name, value in (("decode_workers", decode_workers), ("voice_workers", voice_workers),
+                            ("visual_workers", visual_workers), ("queue_size", queue_size)):
+            if value < 1:
+                raise ValueError(f"{name} は1以上を指定してください: {value}")
+        self.pipeline = pipeline
+        self.decode_workers = decode_workers
+        self.voice_workers = voice_workers
+        self.visual_workers = visual_workers
+        self.queue_size = queue_size
+
+    @classmethod
+    def from_config(cls, pipeline: AnalysisPipeline) -> "StageScheduler":
+        """config.yaml の scheduler セクションから作る"""
+        cfg = pipeline.config.get("scheduler", {})
+        return cls(
+            pipeline,
+            decode_workers=cfg.get("decode_workers", 2),
+            voice_workers=cfg.get("voice_workers", 1),
+            visual_workers=cfg.get("visual_workers", 1),
+            queue_size=cfg.get("queue_size", 2),
+        )
+
+    def run(self, videos: Iterable[str | Path]) -> Iterator[tuple[int, VideoAnalysisResult]]:
+        """動画を解析し、完了した順に (入力順の番号, 結果) を返す。
+
+        videos はジェネレータでもよい。次の動画は decode ステージのキューに
+        空きができてから取り出す（ジョブキューからの取得を必要な分だけにする）。
+        """
+        pipeline = self.pipeline
+        visual = pipeline.visual_enabled
+
+        decode_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        voice_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        visual_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        done_q: queue.Queue = queue.Queue()
+        stop = threading.Event()
+        # 打ち切り後に videos から取り出さないよう、取り出しと打ち切りを排他にする
+        pulling = threading.Lock()
+
+        def finish_branch(job: _Job) -> None:
+            with job.lock:
+                job.remaining -= 1
+                if job.remaining:
+                    return
+            if job.voice is not None:
+                self._call(pipeline.finalize, job.result, "統合判定エラー", job.voice, job.visual)
+            done_q.put(job)
+
+        def feed() -> None:
+            count = 0
+            try:
+                items = enumerate(videos)
+                while True:
+                    # 打ち切られたら次の動画を取り出さない（ジョブキューから余分に取得しない）
+                    with pulling:
+                        item = None if stop.is_set() else next(items, None)
+                    if item is None:
+                        break
+                    index, path = item
+                    job = _Job(index=index, result=pipeline.new_result(str(path)),
+                               remaining=2 if visual else 1)
+                    decode_q.put(job)
+                    if visual:
+                        visual_q.put(job)
+                    count += 1
+            except Exception as e:
+                logger.error("動画の取得に失敗しました: %s", e)
+            finally:
+                for _ in range(self.decode_workers):
+                    decode_q.put(_DONE)
+                if visual:
+                    for _ in range(self.visual_workers):
+                        visual_q.put(_DONE)
+                # 投入した本数（結果の待ち受けを終える目印）
+                done_q.put(count)
+
+        def decode_worker() -> None:
+            while (job := decode_q.get()) is not _DONE:
+                if stop.is_set():
+                    continue
+                job.decoded = self._call(pipeline.decode_audio, job.result, "音声抽出エラー")
+                voice_q.put(job)
+
+        def voice_worker() -> None:
+            while (job := voice_q.get()) is not _DONE:
+                if stop.is_set():
+                    job.decoded = None
+                    continue
+                if job.decoded is not None:
+                    job.voice = self._call(pipeline.analyze_audio, job.result, "声紋解析エラー",
+                                           job.decoded)
+                    job.decoded = None  # 音声は声紋照合が終われば不要
+                finish_branch(job)
+
+        def visual_worker() -> None:
+            while (job := visual_q.get()) is not _DONE:
+                if stop.is_set():
+                    continue
+                job.visual = self._call(pipeline.analyze_visual, job.result,
+                                        "視覚分析エラー") or {}
+                finish_branch(job)
+
+        decoders = [threading.Thread(target=decode_worker, name=f"decode-{i}", daemon=True)
+                    for i in range(self.decode_workers)]
+
+        def close_voice() -> None:
+            # 全 decode スレッドが終わってから voice ステージに終端を流す
+            for t in decoders:
+                t.join()
+            for _ in range(self.voice_workers):
+                voice_q.put(_DONE)
+
+        threads = [threading.Thread(target=feed, name="feed", daemon=True), *decoders,
+                   threading.Thread(target=close_voice, name="close-voice", daemon=True)]
+        threads += [threading.Thread(target=voice_worker, name=f"voice-{i}", daemon=True)
+                    for i in range(self.voice_workers)]
+        if visual:
+            threads += [threading.Thread(target=visual_worker, name=f"visual-{i}", daemon=True)
+                        for i in range(self.visual_workers)]
+
+        logger.info("ステージ並列解析 (decode=%d, voice=%d, visual=%d, queue=%d)",
+                    self.decode_workers, self.voice_workers,
+                    self.visual_workers if visual else 0, self.queue_size)
+        for t in threads:
+            t.start()
+        completed = False
+        try:
+            total, finished = None, 0
+            while total is None or finished < total:
+                item = done_q.get()
+                if isinstance(item, int):
+                    total = item
+                    continue
+                finished += 1
+                yield item.index, item.result
+            completed = True
+        finally:
+            # 途中で打ち切られた場合は新しい動画の取り出しをやめ（取り出し中なら
+            # それだけ待つ）、キューに残った動画は解析せずに捨てる。処理中のステップの
+            # 終了は待たない（スレッドはそのステップが終わると残りを読み捨てて終了する）
+            with pulling:
+                stop.set()
+            if completed:
+                for t in threads:
+                    t.join()
+
+    def map(self, videos: Iterable[str | Path]) -> list[VideoAnalysisResult]:
+        """全動画を解析し、入力と同じ順の結果リストを返す。"""
+        results = dict(self.run(videos))
+        return [results[i] for i in sorted(results)]
+
+    @staticmethod
+    def _call(fn, result: VideoAnalysisResult, label: str, *args):
+        """ステージ関数を呼ぶ。想定外の例外は結果のエラーに記録して None を返す"""
+        try:
+            return fn(result, *args)
+        except Exception as e:
+            logger.error("%s: %s", label, e)
+            result.errors.append(f"{label}: {e}")
+            return None
@@ -0,0 +1,311 @@
+"""常駐解析デーモン - モデルを読み込んだままのパイプラインでジョブを受け付ける
+
+CLI を起動するたびに torch の import・モデルのロード・基準話者の登録が走るため、
+短い動画1本の解析ではその準備が実行時間の大半を占める。`serve` で起動した
+デーモンはパイプラインを保持したまま、ローカルソケットでジョブを受け付ける。
+
+プロトコルは改行区切りの JSON。クライアントは1行のリクエストを送り、
+デーモンは進捗（log）・結果（result）を1行ずつ返して最後に done を送る。
+
+    → {"cmd": "analyze", "videos": ["/abs/a.mp4"], "mode": null, "visual": false}
+    ← {"event": "log", "level": "INFO", "message": "[Step 1/5] 音声抽出中: a.mp4"}
+    ← {"event": "result", "index": 0, "result": {...}}
+    ← {"event": "done"}
+
+アドレスは Unix ソケットのパス、または "127.0.0.1:8765" 形式の localhost TCP。
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+from src.pipeline import AnalysisPipeline, VideoAnalysisResult, decode_result, encode_result
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = ".cache/analyzer.sock"
+
+
+class ServerError(RuntimeError):
+    """デーモンがジョブの失敗を返した"""
+
+
+def parse_address(address: str) -> str | tuple[str, int]:
+    """アドレス文字列を Unix ソケットのパス、または (ホスト, ポート) に変換する。"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+class _JobLogHandler(logging.Handler):
+    """ジョブ実行中のログをクライアントに転送するハンドラ"""
+
+    def __init__(self, send: Callable[[dict], None]):
+        super().__init__(level=logging.INFO)
+        self._send = send
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self._send({"event": "log", "level": record.levelname,
+                        "message": record.getMessage()})
+        except OSError:
+            pass  # クライアントが切断済みでもジョブは続ける
+
+
+class AnalysisService:
+    """デーモンが保持するパイプライン群とジョブの実行。
+
+    パイプラインは (解析モード, 視覚分析の有無) ごとに初回のジョブで作り、
+    以降は使い回す（モデル本体は共有レジストリ経由で共有される）。
+    ジョブは1件ずつ順に実行する。
+    """
+
+    def __init__(self, config_path: str = "config.yaml", mode: str | None = None,
+                 enable_visual: bool = False, hf_token: str | None = None):
+        self.config_path = config_path
+        self.default_mode = mode
+        self.default_visual = enable_visual
+        self.hf_token = hf_token
+        self._pipelines: dict[tuple[str | None, bool], AnalysisPipeline] = {}
+        self._job_lock = threading.Lock()
+        self.jobs = 0
+
+    def warm_up(self) -> None:
+        """起動時に既定の設定でパイプラインを作っておく"""
+        self._pipeline(self.default_mode, self.default_visual)
+
+    def _pipeline(self, mode: str | None, visual: bool) -> AnalysisPipeline:
+        key = (mode, visual)
+        if key not in self._pipelines:
+            logger.info("パイプラインを初期化中 (mode=%s, visual=%s)", mode or "config", visual)
+            pipeline = AnalysisPipeline(config_path=self.config_path, mode=mode)
+            pipeline.setup(enable_visual=visual, hf_token=self.hf_token)
+            self._pipelines[key] = pipeline
+        return self._pipelines[key]
+
+    def close(self) -> None:
+        for pipeline in self._pipelines.values():
+            pipeline.close()
+        self._pipelines.clear()
+
+    def handle(self, request: dict, send: Callable[[dict], None]) -> bool:
+        """1件のリクエストを処理する。
+
+        Returns:
+            デーモンを停止すべき場合 True
+        """
+        cmd = request.get("cmd")
+        if cmd == "ping":
+            send({"event": "done", "pid": os.getpid(), "jobs": self.jobs,
+                  "pipelines": [list(k) for k in self._pipelines]})
+            return False
+        if cmd == "shutdown":
+            send({"event": "done"})
+            return True
+        if cmd not in ("analyze", "test_voice"):
+            send({"event": "error", "message": f"未対応のコマンドです: {cmd}"})
+            return False
+
+        with self._job_lock:
+            self.jobs += 1
+            handler = _JobLogHandler(send)
+            src_logger = logging.getLogger("src")
+            saved_level = src_logger.level
+            # 進捗（INFO）はデーモン側のログ設定によらずクライアントに送る
+            if src_logger.getEffectiveLevel() > logging.INFO:
+                src_logger.setLevel(logging.INFO)
+            src_logger.addHandler(handler)
+            try:
+                if cmd == "analyze":
+                    self._analyze(request, send)
+                else:
+                    self._test_voice(request, send)
+                send({"event": "done"})
+            except Exception as e:
+                logger.error("ジョブエラー: %s", e)
+                send({"event": "error", "message": str(e)})
+            finally:
+                src_logger.removeHandler(handler)
+                src_logger.setLevel(saved_level)
+        return False
+
+    def _analyze(self, request: dict, send: Callable[[dict], None]) -> None:
+        pipeline = self._pipeline(request.get("mode", self.default_mode),
+                                  bool(request.get("visual", self.default_visual)))
+        videos = [str(v) for v in request.get("videos", [])]
+        for index, result in pipeline.analyze_stream(videos):
+            send({"event": "result", "index": index, "result": encode_result(result)})
+
+    def _test_voice(self, request: dict, send: Callable[[dict], None]) -> None:
+        from src.audio.extractor import extract_audio_array
+
+        pipeline = self._pipeline(self.default_mode, self.default_visual)
+        matcher = pipeline.voice_matcher
+        if not matcher.reference_embeddings:
+            raise ServerError("基準音声が登録されていません。")
+        sample_rate = pipeline.config["audio"]["sample_rate"]
+        wav = extract_audio_array(request["video"], sample_rate=sample_rate)
+        send({"event": "scores", "threshold": matcher.threshold,
+              "scores": matcher.compare_wav(wav, sample_rate)})
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        write_lock = threading.Lock()
+
+        def send(message: dict) -> None:
+            data = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+            with write_lock:
+                self.wfile.write(data)
+                self.wfile.flush()
+
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            send({"event": "error", "message": f"不正なリクエスト: {e}"})
+            return
+        if self.server.service.handle(request, send):
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def create_server(service: AnalysisService, address: str) -> socketserver.BaseServer:
+    """アドレスで待ち受けるサーバーを作る（Unix ソケットの残骸は削除する）。
+
+    Raises:
+        RuntimeError: 同じアドレスで別のデーモンが動いている場合
+    """
+    target = parse_address(address)
+    if isinstance(target, str):
+        if Path(target).exists():
+            try:
+                RemoteClient(address, timeout=1.0).ping()
+            except OSError:
+                Path(target).unlink()
+            else:
+                raise RuntimeError(f"デーモンは既に起動しています: {address}")
+        Path(target).parent.mkdir(parents=True, exist_ok=True)
+        server = _UnixServer(target, _RequestHandler)
+    else:
+        server = _TCPServer(target, _RequestHandler)
+    server.service = service
+    return server
+
+
+def serve(service: AnalysisService, address: str) -> None:
+    """デーモンを起動し、shutdown リクエストか Ctrl+C まで待ち受ける"""
+    server = create_server(service, address)
+    logger.info("解析デーモン待ち受け中: %s", address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        target = parse_address(address)
+        if isinstance(target, str) and Path(target).exists():
+            Path(target).unlink()
+        service.close()
+        logger.info("解析デーモンを停止しました")
+
+
+class RemoteClient:
+    """解析デーモンにジョブを送るクライアント"""
+
+    def __init__(self, address: str = DEFAULT_ADDRESS, timeout: float | None = None):
+        """
+        Args:
+            address: デーモンのアドレス（Unix ソケットのパス、または "ホスト:ポート"）
+            timeout: 接続・受信のタイムアウト（秒）。None で無制限
+        """
+        self.address = address
+        self.timeout = timeout
+
+    def _connect(self) -> socket.socket:
+        target = parse_address(self.address)
+        if isinstance(target, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(target)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def request(self, payload: dict) -> Iterator[dict]:
+        """リクエストを送り、デーモンからのメッセージを done まで1件ずつ返す。
+
+        Raises:
+            OSError: デーモンに接続できない場合
+            ServerError: デーモンがエラーを返した場合
+        """
+        with self._connect() as sock, sock.makefile("rwb") as stream:
+            stream.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+            stream.flush()
+            for line in stream:
+                message = json.loads(line)
+                event = message.get("event")
+                if event == "error":
+                    raise ServerError(message.get("message", ""))
+                yield message
+                if event == "done":
+                    return
+        raise ServerError("デーモンとの接続が途中で切れました")
+
+    def ping(self) -> dict:
+        """デーモンの状態を返す"""
+        return next(self.request({"cmd": "ping"}))
+
+    def shutdown(self) -> None:
+        """デーモンを停止する"""
+        for _ in self.request({"cmd": "shutdown"}):
+            pass
+
+    def analyze(self, videos: list[str | Path], mode: str | None = None, visual: bool = False,
+                on_log: Callable[[str], None] | None = None
+                ) -> Iterator[tuple[int, VideoAnalysisResult]]:
+        """動画の解析をデーモンに依頼し、完了した順に (入力順の番号, 結果) を返す。
+
+        Args:
+            videos: 動画のパス（デーモン側で開けるよう絶対パスにして送る）
+            mode: 解析モード（省略時はデーモンの既定）
+            visual: 視覚分析を有効にするか
+            on_log: デーモンの進捗ログを受け取る関数
+        """
+        payload = {"cmd": "analyze", "videos": [str(Path(v).resolve()) for v in videos],
+                   "visual": visual}
+        if mode is not None:
+            payload["mode"] = mode
+        for message in self.request(payload):
+            if message["event"] == "log" and on_log is not None:
+                on_log(message["message"])
+            elif message["event"] == "result":
+                yield message["index"], decode_result(message["result"])
+
+    def test_voice(self, video: str | Path) -> dict:
+        """デーモンの登録話者で声紋照合を行い {"threshold", "scores"} を返す"""
+        scores = {}
+        for message in self.request({"cmd": "test_voice", "video": str(Path(video).resolve())}):
+            if message["event"] == "scores":
+                scores = message
+        return {"threshold": scores.get("threshold"), "scores": scores.get("scores", {})}
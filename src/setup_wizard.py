@@ -12,6 +12,9 @@ logger = logging.getLogger(__name__)
 
 from src.audio.extractor import extract_audio, extract_audio_segment, get_video_duration
 from src.audio.diarizer import Diarizer, SpeakerSegment
+from src.audio.embedding import embed_utterances
+from src.audio.speaker_store import SpeakerStore, store_path_for
+from src.models import VOICE_ENCODER, registry
 
 
 class SetupWizard:
@@ -22,7 +25,13 @@ class SetupWizard:
             self.config = yaml.safe_load(f)
 
         self.config_path = config_path
-        self.encoder = VoiceEncoder()
+        self.encoder = registry.acquire(VOICE_ENCODER, VoiceEncoder)
+
+    def close(self) -> None:
+        """共有レジストリから取得した VoiceEncoder を返却する。"""
+        if self.encoder is not None:
+            registry.release(VOICE_ENCODER)
+            self.encoder = None
 
     def run(self, video_path: str, hf_token: str | None = None) -> None:
         """セットアップウィザードを実行する。
@@ -56,8 +65,12 @@ class SetupWizard:
             max_speakers=self.config["diarization"]["max_speakers"],
             min_segment_duration=self.config["diarization"]["min_segment_duration"],
             hf_token=hf_token,
+            clustering=self.config["diarization"].get("clustering", "auto"),
         )
-        segments = diarizer.diarize(str(audio_path))
+        try:
+            segments = diarizer.diarize(str(audio_path))
+        finally:
+            diarizer.close()
 
         if not segments:
             print("  エラー: 話者を検出できませんでした。")
@@ -195,31 +208,21 @@ class SetupWizard:
         Returns:
             {person_id: 声紋ベクトル} の辞書。なければ空辞書。
         """
-        ref_dir = Path(self.config["paths"]["reference_voices"])
-        refs = {}
-
-        if not ref_dir.exists():
-            return refs
-
-        for person_dir in sorted(ref_dir.iterdir()):
-            if not person_dir.is_dir():
-                continue
+        ref_dir = self.config["paths"]["reference_voices"]
+        if not Path(ref_dir).exists():
+            return {}
 
-            audio_files = list(person_dir.glob("*.wav")) + list(person_dir.glob("*.mp3"))
-            if not audio_files:
-                continue
-
-            embeddings = []
-            for af in audio_files:
-                wav = preprocess_wav(af)
-                if len(wav) > 0:
-                    emb = self.encoder.embed_utterance(wav)
-                    embeddings.append(emb)
+        # 永続化ストアを使い、変更のあった基準音声だけを再計算する
+        store_path = store_path_for(ref_dir)
+        store = SpeakerStore.load(store_path)
+        if store.sync(ref_dir, self._embed_files):
+            store.save(store_path)
 
-            if embeddings:
-                refs[person_dir.name] = np.mean(embeddings, axis=0)
+        return store.centroids()
 
-        return refs
+    def _embed_files(self, paths: list[str]) -> np.ndarray:
+        """音声ファイル群の声紋ベクトルをバッチ推論で計算する。"""
+        return embed_utterances(self.encoder, [preprocess_wav(Path(p)) for p in paths])
 
     # =========================================================================
     # AI自動ラベリング（既存基準あり）
@@ -581,4 +584,7 @@ def run_auto_setup(video_path: str, config_path: str = "config.yaml",
                    hf_token: str | None = None) -> None:
     """セットアップウィザードを実行するヘルパー関数"""
     wizard = SetupWizard(config_path=config_path)
-    wizard.run(video_path, hf_token=hf_token)
+    try:
+        wizard.run(video_path, hf_token=hf_token)
+    finally:
+        wizard.close()
@@ -6,9 +6,22 @@ from pathlib import Path
 import numpy as np
 from PIL import Image
 
+from src.models import OPEN_CLIP, registry
+
 logger = logging.getLogger(__name__)
 
 
+def _load_open_clip():
+    """OpenCLIP モデル・前処理・トークナイザを構築する"""
+    import open_clip
+
+    model, _, preprocess = open_clip.create_model_and_transforms(
+        "ViT-B-32", pretrained="laion2b_s34b_b79k"
+    )
+    model.eval()
+    return model, preprocess, open_clip.get_tokenizer("ViT-B-32")
+
+
 class AppearanceAnalyzer:
     """OpenCLIP を使った外見特徴のベクトル化と比較"""
 
@@ -26,12 +39,15 @@ class AppearanceAnalyzer:
     def _ensure_model(self) -> None:
         """モデルの遅延ロード"""
         if self.model is None:
-            import open_clip
-            self.model, _, self.preprocess = open_clip.create_model_and_transforms(
-                "ViT-B-32", pretrained="laion2b_s34b_b79k"
+            self.model, self.preprocess, self.tokenizer = registry.acquire(
+                OPEN_CLIP, _load_open_clip
             )
-            self.tokenizer = open_clip.get_tokenizer("ViT-B-32")
-            self.model.eval()
+
+    def close(self) -> None:
+        """共有レジストリから取得したモデルを返却する。"""
+        if self.model is not None:
+            registry.release(OPEN_CLIP)
+            self.model = None
 
     def extract_features(self, image_path: str) -> np.ndarray:
         """画像から視覚的特徴ベクトルを抽出する。
@@ -7,6 +7,8 @@ from pathlib import Path
 import numpy as np
 from PIL import Image
 
+from src.models import YOLO_PERSON, registry
+
 logger = logging.getLogger(__name__)
 
 
@@ -35,7 +37,13 @@ class BodyAnalyzer:
         """モデルの遅延ロード"""
         if self.model is None:
             from ultralytics import YOLO
-            self.model = YOLO("yolov8n.pt")
+            self.model = registry.acquire(YOLO_PERSON, lambda: YOLO("yolov8n.pt"))
+
+    def close(self) -> None:
+        """共有レジストリから取得したモデルを返却する。"""
+        if self.model is not None:
+            registry.release(YOLO_PERSON)
+            self.model = None
 
     def detect_persons(self, image_path: str) -> list[PersonDetection]:
         """画像内の人物を検出する。
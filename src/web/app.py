@@ -1,8 +1,8 @@
 """Flask Web アプリケーション - 解析結果のダッシュボードと統計表示"""
 
 import csv
-import json
 import logging
+import os
 from pathlib import Path
 
 import yaml
@@ -12,9 +12,11 @@ from src.ingest import VideoIngestor, collect_video_files, fetch_magnets_from_ur
 from src.network_status import get_network_status, get_traffic_status
 from src.optimizer import ThresholdOptimizer
 from src.output.reporter import append_csv_log, save_results
+from src.output.result_store import ResultStore
 from src.pipeline import AnalysisPipeline
 from src.preflight import PreflightError, run_preflight
 from src.stats import ResultsAnalyzer
+from src.workers import WorkerPool
 
 logger = logging.getLogger(__name__)
 
@@ -41,13 +43,11 @@ def create_app(config_path: str = "config.yaml", output_dir: str = "output") ->
                 return yaml.safe_load(f) or {}
         return {}
 
+    # 結果一覧はファイルが変わったときだけ読み直す（リクエストごとに全行を走査しない）
+    store = ResultStore(output_dir)
+
     def _load_results() -> list[dict]:
-        results_path = Path(output_dir) / "results.json"
-        if not results_path.exists():
-            return []
-        with open(results_path, encoding="utf-8") as f:
-            data = json.load(f)
-        return data.get("results", []) if isinstance(data, dict) else data
+        return store.records()
 
     # --- ページルート ---
 
@@ -102,8 +102,9 @@ def create_app(config_path: str = "config.yaml", output_dir: str = "output") ->
     @app.route("/api/results/<path:video_name>")
     def api_result_detail(video_name):
         """個別動画の結果API"""
-        results = _load_results()
-        analyzer = ResultsAnalyzer(results_data=results)
+        record = ResultStore(output_dir).get(video_name,
+                                             fingerprint=request.args.get("fingerprint"))
+        analyzer = ResultsAnalyzer(results_data=[record] if record else [])
         detail = analyzer.get_video_details(video_name)
         if not detail:
             return jsonify({"error": "動画が見つかりません"}), 404
@@ -190,6 +191,14 @@ def create_app(config_path: str = "config.yaml", output_dir: str = "output") ->
         visual = bool(data.get("visual", False))
         skip_analyzed = bool(data.get("skip_analyzed", True))
         append_log = bool(data.get("append_csv_log", True))
+        try:
+            workers = int(data.get("workers") or 1)
+        except (TypeError, ValueError):
+            return jsonify({"error": "workers は整数で指定してください。"}), 400
+        # 上限はリクエストの config_path ではなくサーバーの設定で決める
+        max_workers = (_load_config().get("web") or {}).get("max_workers") or os.cpu_count() or 1
+        if not 1 <= workers <= max_workers:
+            return jsonify({"error": f"workers は 1〜{max_workers} で指定してください。"}), 400
 
         proxy = (data.get("proxy") or "").strip() or None
         if bool(data.get("mullvad_socks5", False)):
@@ -227,18 +236,23 @@ def create_app(config_path: str = "config.yaml", output_dir: str = "output") ->
         except Exception as e:
             return jsonify({"error": f"取得エラー: {e}"}), 500
 
-        pipeline = AnalysisPipeline(config_path=config_for_pipeline)
-        pipeline.setup(enable_visual=visual, hf_token=None)
-
         all_videos = sorted(collect_video_files(download_dir))
-        analyzed_names: set[str] = set()
-        if skip_analyzed:
-            analyzed_names = pipeline._load_analyzed_names(output)
-        targets = [v for v in all_videos if v.name not in analyzed_names]
-
-        results = []
-        for video in targets:
-            results.append(pipeline.analyze_video(str(video)))
+        # 解析済みの判定はファイル名ではなく内容のフィンガープリントで行う
+        targets = ResultStore(output).unanalyzed(all_videos) if skip_analyzed else all_videos
+        if workers > 1:
+            # 各ワーカープロセスがパイプラインを1回だけ初期化する
+            results = []
+            if targets:
+                with WorkerPool(config_for_pipeline, workers=workers,
+                                enable_visual=visual) as pool:
+                    results = pool.map(targets)
+        else:
+            pipeline = AnalysisPipeline(config_path=config_for_pipeline)
+            pipeline.setup(enable_visual=visual, hf_token=None)
+
+            results = []
+            for video in targets:
+                results.append(pipeline.analyze_video(str(video)))
 
         saved = save_results(results, output, fmt="both")
         csv_log_path = None
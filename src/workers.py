@@ -0,0 +1,232 @@
+"""並列解析ワーカー - 動画ごとの解析を複数プロセスに分散する
+
+各ワーカープロセスは起動時に一度だけ AnalysisPipeline を初期化（モデルのロード・
+基準話者の登録）し、以降は割り当てられた動画を解析して結果を返す。
+
+このモジュールはワーカー側で最初に import されるため、numpy / torch などの
+重いライブラリはスレッド数を設定した後に関数内で読み込む。
+"""
+
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from src.pipeline import AnalysisPipeline, VideoAnalysisResult
+
+logger = logging.getLogger(__name__)
+
+# ワーカーごとに上限を掛けるスレッド数の環境変数（BLAS / OpenMP 系）
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+# ワーカープロセス内で使い回すパイプライン
+_pipeline: "AnalysisPipeline | None" = None
+# 解析を始めた動画の番号を親プロセスに知らせるキュー（プールが壊れたときの切り分け用）
+_started = None
+
+
+def default_torch_threads(workers: int, cpu_count: int | None = None) -> int:
+    """ワーカー数で CPU コアを等分した、1ワーカーあたりのスレッド数を返す。"""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return max(1, cpu_count // max(1, workers))
+
+
+def _init_worker(config_path: str, mode: str | None, enable_visual: bool,
+                 hf_token: str | None, torch_threads: int, job_db: str | None = None,
+                 started=None) -> None:
+    """ワーカープロセスの初期化: スレッド数の上限設定とパイプラインの準備"""
+    global _pipeline, _started
+
+    _started = started
+    for name in _THREAD_ENV_VARS:
+        os.environ[name] = str(torch_threads)
+    try:
+        import torch
+
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+    from src.pipeline import AnalysisPipeline
+
+    _pipeline = AnalysisPipeline(config_path=config_path, mode=mode)
+    _pipeline.setup(enable_visual=enable_visual, hf_token=hf_token)
+    # ワーカーの終了時にモデルを返却し、公開した共有行列を /dev/shm から削除する
+    multiprocessing.util.Finalize(None, _pipeline.close, exitpriority=10)
+    if job_db is not None:
+        from src.jobqueue import JobQueue
+
+        # 到達したステップはワーカーから直接ジョブキューに書き込む
+        _pipeline.on_stage = JobQueue(job_db).set_stage
+    logger.info("ワーカー初期化完了 (pid=%d, スレッド数=%d)", os.getpid(), torch_threads)
+
+
+def _mark_started(index: int) -> None:
+    """解析を始めた動画の番号を親プロセスに知らせる"""
+    if _started is not None:
+        _started.put(index)
+
+
+def _analyze_in_worker(index: int, video_path: str) -> tuple[int, "VideoAnalysisResult"]:
+    """ワーカープロセスで1本の動画を解析する"""
+    _mark_started(index)
+    return index, _pipeline.analyze_video(video_path)
+
+
+def _error_result(video_path: str, message: str) -> "VideoAnalysisResult":
+    """ワーカーが異常終了した動画の結果"""
+    from src.pipeline import VideoAnalysisResult
+
+    path = Path(video_path)
+    return VideoAnalysisResult(video_path=str(path), video_name=path.name, duration=0.0,
+                               errors=[message])
+
+
+class WorkerPool:
+    """動画解析用のプロセスプール。
+
+    使い方:
+        with WorkerPool("config.yaml", workers=8) as pool:
+            for index, result in pool.imap_unordered(videos):
+                ...
+    """
+
+    def __init__(self, config_path: str = "config.yaml", workers: int = 2,
+                 mode: str | None = None, enable_visual: bool = False,
+                 hf_token: str | None = None, torch_threads: int | None = None,
+                 job_db: str | Path | None = None):
+        """
+        Args:
+            config_path: 設定ファイルのパス（各ワーカーが読み込む）
+            workers: ワーカープロセス数
+            mode: 解析モード（"diarize" / "targeted"）
+            enable_visual: 視覚分析を有効にするか
+            hf_token: HuggingFace トークン（pyannote用）
+            torch_threads: 1ワーカーあたりの torch スレッド数（省略時はコア数 / workers）
+            job_db: 各ワーカーが到達したステップを記録するジョブキューのパス
+        """
+        if workers < 1:
+            raise ValueError(f"ワーカー数は1以上を指定してください: {workers}")
+        self.workers = workers
+        self.torch_threads = torch_threads or default_torch_threads(workers)
+        # torch を読み込んだプロセスの fork は不安定なため spawn で起動する
+        self._context = multiprocessing.get_context("spawn")
+        self._started = self._context.SimpleQueue()
+        self._initargs = (str(config_path), mode, enable_visual, hf_token, self.torch_threads,
+                          str(job_db) if job_db is not None else None, self._started)
+        self._executor = self._new_executor()
+        logger.info("ワーカープール起動: %d プロセス × %d スレッド", workers, self.torch_threads)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=self._initargs,
+        )
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """ワーカープロセスを終了する。"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def imap_unordered(self, videos: Iterable[str | Path]
+                       ) -> Iterator[tuple[int, "VideoAnalysisResult"]]:
+        """動画を各ワーカーに配り、完了した順に (入力順の番号, 結果) を返す。
+
+        同時に投入するのはワーカー数の2倍までとし、完了するごとに次の動画を投入する。
+        ワーカーが例外を出した動画はエラー付きの結果になる。ワーカープロセスが
+        異常終了（OOM など）してプールが壊れた場合は、その時点で解析中だった動画だけを
+        エラー付きの結果にし、プールを作り直して残りの動画を続ける。
+        """
+        pending_videos = iter(enumerate(str(v) for v in videos))
+        retry: list[tuple[int, str]] = []
+        in_flight: dict = {}
+        started: set[int] = set()
+        self._drain_started(set())
+
+        def fill() -> None:
+            while len(in_flight) < self.workers * 2:
+                item = retry.pop(0) if retry else next(pending_videos, None)
+                if item is None:
+                    return
+                try:
+                    future = self._executor.submit(_analyze_in_worker, *item)
+                except BrokenProcessPool:
+                    retry.insert(0, item)
+                    return
+                in_flight[future] = item
+
+        fill()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            self._drain_started(started)
+            if any(isinstance(f.exception(), BrokenProcessPool) for f in done):
+                yield from self._recover(in_flight, started, retry)
+            else:
+                for future in done:
+                    index, path = in_flight.pop(future)
+                    started.discard(index)
+                    yield self._result(future, index, path)
+            fill()
+
+        # プールを作り直しても動画を受け付けない場合（ワーカーの初期化の失敗など）
+        for index, path in [*retry, *pending_videos]:
+            yield index, _error_result(path, "ワーカーエラー: プロセスプールが使用できません")
+
+    @staticmethod
+    def _result(future, index: int, path: str) -> tuple[int, "VideoAnalysisResult"]:
+        try:
+            return future.result()
+        except Exception as e:
+            logger.error("ワーカーエラー: %s (%s)", path, e)
+            return index, _error_result(path, f"ワーカーエラー: {e}")
+
+    def _drain_started(self, started: set[int]) -> None:
+        """ワーカーから届いた解析開始の通知を started に取り込む"""
+        while not self._started.empty():
+            started.add(self._started.get())
+
+    def _recover(self, in_flight: dict, started: set[int], retry: list[tuple[int, str]]
+                 ) -> Iterator[tuple[int, "VideoAnalysisResult"]]:
+        """壊れたプールを作り直す。
+
+        解析中だった動画はエラー付きの結果にし、まだ始まっていなかった動画は
+        retry に戻す。どの動画も始まっていなければ（初期化の失敗など）作り直さない。
+        """
+        wait(in_flight)
+        self._drain_started(started)
+        items = sorted(in_flight.items(), key=lambda entry: entry[1][0])
+        in_flight.clear()
+        crashed = {index for _, (index, _) in items if index in started}
+        for future, (index, path) in items:
+            started.discard(index)
+            if not isinstance(future.exception(), BrokenProcessPool):
+                yield self._result(future, index, path)
+            elif index in crashed or not crashed:
+                logger.error("ワーカーが異常終了しました: %s", path)
+                yield index, _error_result(path, f"ワーカーエラー: {future.exception()}")
+            else:
+                retry.append((index, path))
+        if not crashed:
+            return
+        logger.warning("ワーカープロセスが異常終了したためプールを作り直します（再投入 %d 本）",
+                       len(retry))
+        self._executor.shutdown(wait=True)
+        self._executor = self._new_executor()
+
+    def map(self, videos: Iterable[str | Path]) -> list["VideoAnalysisResult"]:
+        """全動画を解析し、入力と同じ順の結果リストを返す。"""
+        results = dict(self.imap_unordered(videos))
+        return [results[i] for i in sorted(results)]
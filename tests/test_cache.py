@@ -3,7 +3,7 @@
 import numpy as np
 import pytest
 
-from src.cache import EmbeddingCache
+from src.cache import DiarizationCache, EmbeddingCache, audio_fingerprint
 
 
 class TestEmbeddingCache:
@@ -63,3 +63,256 @@ class TestEmbeddingCache:
         result_b = cache.get(str(file_b), prefix="voice")
         np.testing.assert_array_almost_equal(result_a, [1.0, 0.0])
         np.testing.assert_array_almost_equal(result_b, [0.0, 1.0])
+
+
+    def test_file_hashed_once(self, tmp_path):
+        cache = EmbeddingCache(cache_dir=tmp_path / "cache")
+        test_file = tmp_path / "test.wav"
+        test_file.write_bytes(b"dummy audio data")
+
+        cache.get(str(test_file), prefix="voice")  # miss
+        computed = cache.index.computed
+        cache.put(str(test_file), np.array([1.0]), prefix="voice")
+        cache.get(str(test_file), prefix="voice")
+
+        assert cache.index.computed == computed
+        reopened = EmbeddingCache(cache_dir=tmp_path / "cache")
+        assert reopened.get(str(test_file), prefix="voice") is not None
+        assert reopened.index.computed == 0
+
+    def test_changed_file_is_rehashed(self, tmp_path):
+        cache = EmbeddingCache(cache_dir=tmp_path / "cache")
+        test_file = tmp_path / "test.wav"
+        test_file.write_bytes(b"dummy audio data")
+        cache.put(str(test_file), np.array([1.0]), prefix="voice")
+        computed = cache.index.computed
+
+        test_file.write_bytes(b"other audio data!")
+
+        assert cache.get(str(test_file), prefix="voice") is None
+        assert cache.index.computed > computed
+
+    def test_large_file_uses_sampled_hash(self, tmp_path):
+        cache = EmbeddingCache(cache_dir=tmp_path / "cache", full_hash_limit=8, backend="npy")
+        test_file = tmp_path / "test.wav"
+        test_file.write_bytes(b"dummy audio data")
+
+        cache.put(str(test_file), np.array([1.0]), prefix="voice")
+
+        assert cache.get(str(test_file), prefix="voice") is not None
+        assert [f.name.startswith("voice_s") for f in cache.cache_dir.glob("*.npy")] == [True]
+
+
+    def test_get_many_and_put_many(self, tmp_path):
+        cache = EmbeddingCache(cache_dir=tmp_path / "cache")
+        files = []
+        for i in range(3):
+            f = tmp_path / f"{i}.wav"
+            f.write_bytes(f"audio {i}".encode())
+            files.append(str(f))
+
+        cache.put_many(files[:2], [np.array([1.0, 0.0]), np.array([0.0, 1.0])], prefix="voice")
+        a, b, c = cache.get_many(files, prefix="voice")
+
+        np.testing.assert_array_equal(a, [1.0, 0.0])
+        np.testing.assert_array_equal(b, [0.0, 1.0])
+        assert c is None
+        assert cache.stats == {"hits": 2, "misses": 1}
+        assert list(cache.cache_dir.glob("*.npy")) == []
+
+    def test_legacy_npy_is_migrated(self, tmp_path):
+        test_file = tmp_path / "test.wav"
+        test_file.write_bytes(b"dummy audio data")
+        legacy = EmbeddingCache(cache_dir=tmp_path / "cache", backend="npy")
+        legacy.put(str(test_file), np.array([1.0, 2.0]), prefix="voice")
+
+        cache = EmbeddingCache(cache_dir=tmp_path / "cache")
+        np.testing.assert_array_equal(cache.get(str(test_file), prefix="voice"), [1.0, 2.0])
+
+        assert list(cache.cache_dir.glob("*.npy")) == []
+        assert len(cache.store) == 1
+
+    def test_md5_keyed_npy_removed_once(self, tmp_path):
+        cache_dir = tmp_path / "cache"
+        cache_dir.mkdir()
+        md5 = cache_dir / f"voice_{'0' * 32}.npy"
+        current = cache_dir / f"voice_{'a' * 40}.npy"
+        sampled = cache_dir / f"voice_s{'b' * 32}.npy"
+        for path in (md5, current, sampled):
+            np.save(path, np.ones(2))
+
+        EmbeddingCache(cache_dir=cache_dir, backend="npy")
+
+        assert not md5.exists() and current.exists() and sampled.exists()
+        np.save(md5, np.ones(2))
+        EmbeddingCache(cache_dir=cache_dir, backend="npy")
+        assert md5.exists()
+
+    def test_counters_include_evictions(self, tmp_path):
+        cache = EmbeddingCache(cache_dir=tmp_path / "cache", quotas={"voice": 16})
+        files = []
+        for i in range(3):
+            f = tmp_path / f"{i}.wav"
+            f.write_bytes(f"audio {i}".encode())
+            files.append(str(f))
+
+        cache.put_many(files, [np.ones(2), np.ones(2), np.ones(2)], prefix="voice")
+        cache.get_many(files, prefix="voice")
+
+        counters = cache.counters
+        assert counters["evictions"] == 2 and counters["entries"] == 1
+        assert (counters["hits"], counters["misses"]) == (1, 2)
+        assert cache.stats == {"hits": 1, "misses": 2}
+
+    def test_from_config(self, tmp_path):
+        cache = EmbeddingCache.from_config({
+            "dir": str(tmp_path),
+            "embeddings": {"max_entries": 5, "policy": "lfu", "quotas": {"voice": 1024}},
+        })
+
+        assert cache.cache_dir == tmp_path / "embeddings"
+        assert cache.store.max_entries == 5 and cache.store.policy == "lfu"
+        assert cache.store.quotas == {"voice": 1024}
+
+    def test_npy_write_is_atomic(self, tmp_path, monkeypatch):
+        cache = EmbeddingCache(cache_dir=tmp_path / "cache", backend="npy")
+        test_file = tmp_path / "test.wav"
+        test_file.write_bytes(b"dummy audio data")
+
+        def broken_save(f, array):
+            f.write(b"\x93NUMPY partial")
+            raise OSError("disk full")
+
+        monkeypatch.setattr(np, "save", broken_save)
+        with pytest.raises(OSError):
+            cache.put(str(test_file), np.array([1.0]), prefix="voice")
+
+        assert not any(p.name.startswith("voice_") for p in cache.cache_dir.iterdir())
+        assert cache.get(str(test_file), prefix="voice") is None
+
+    def test_invalid_backend(self, tmp_path):
+        with pytest.raises(ValueError):
+            EmbeddingCache(cache_dir=tmp_path / "cache", backend="zip")
+
+
+class TestSegmentKeys:
+    def test_segment_key_depends_on_inputs(self):
+        key = EmbeddingCache.segment_key("abc", 1.0, 2.5, 16000, "resemblyzer-0.1.4")
+
+        assert key.startswith("voice_")
+        assert key == EmbeddingCache.segment_key("abc", 1.0, 2.5, 16000, "resemblyzer-0.1.4")
+        assert len({
+            key,
+            EmbeddingCache.segment_key("abd", 1.0, 2.5, 16000, "resemblyzer-0.1.4"),
+            EmbeddingCache.segment_key("abc", 1.0, 2.6, 16000, "resemblyzer-0.1.4"),
+            EmbeddingCache.segment_key("abc", 1.0, 2.5, 8000, "resemblyzer-0.1.4"),
+            EmbeddingCache.segment_key("abc", 1.0, 2.5, 16000, "resemblyzer-0.2"),
+            EmbeddingCache.segment_key("abc", 1.0, 2.5, 16000, "resemblyzer-0.1.4", "vad"),
+        }) == 6
+
+    @pytest.mark.parametrize("backend", ["packed", "npy"])
+    def test_get_and_put_by_key(self, tmp_path, backend):
+        cache = EmbeddingCache(cache_dir=tmp_path / "cache", backend=backend)
+        keys = [EmbeddingCache.segment_key("abc", float(i), i + 1.0, 16000, "m") for i in range(3)]
+
+        cache.put_keys({keys[0]: np.array([1.0, 0.0]), keys[1]: np.array([0.0, 1.0])})
+        a, b, c = cache.get_keys(keys)
+
+        np.testing.assert_array_equal(a, [1.0, 0.0])
+        np.testing.assert_array_equal(b, [0.0, 1.0])
+        assert c is None
+        assert cache.stats == {"hits": 2, "misses": 1}
+
+    def test_plan_round_trip_and_clear(self, tmp_path):
+        cache = EmbeddingCache(cache_dir=tmp_path / "cache")
+        key = EmbeddingCache.plan_key("abc", sample_rate=16000, vad={"enabled": True})
+        plan = {"duration": 12.0, "skipped_ratio": 0.25,
+                "segments": [{"start": 0.0, "end": 2.0, "duration": 1.5, "key": "voice_x"}]}
+
+        assert cache.get_plan(key) is None
+        cache.put_plan(key, plan)
+
+        assert cache.get_plan(key) == plan
+        assert key != EmbeddingCache.plan_key("abc", sample_rate=16000, vad={"enabled": False})
+        cache.clear()
+        assert cache.get_plan(key) is None
+
+    def test_corrupt_plan_is_a_miss(self, tmp_path):
+        cache = EmbeddingCache(cache_dir=tmp_path / "cache")
+        cache.put_plan("k", {"segments": []})
+        (cache.cache_dir / "plans" / "k.json").write_text("{broken")
+
+        assert cache.get_plan("k") is None
+
+class TestAudioFingerprint:
+    def test_array_content_and_rate(self):
+        wav = np.arange(100, dtype=np.float32)
+        assert audio_fingerprint(wav) == audio_fingerprint(wav.copy())
+        assert audio_fingerprint(wav) != audio_fingerprint(wav + 1)
+        assert audio_fingerprint(wav, 16000) != audio_fingerprint(wav, 8000)
+
+    def test_file(self, tmp_path):
+        a = tmp_path / "a.wav"
+        b = tmp_path / "b.wav"
+        a.write_bytes(b"audio")
+        b.write_bytes(b"audio")
+        assert audio_fingerprint(str(a)) == audio_fingerprint(b)
+
+
+class TestDiarizationCache:
+    def test_put_and_get(self, tmp_path):
+        cache = DiarizationCache(cache_dir=tmp_path / "diar")
+        key = DiarizationCache.make_key("fp", "resemblyzer/auto", 3, 1.0)
+        segments = [(0.0, 1.5, "speaker_1"), (1.5, 4.0, "speaker_0"), (4.0, 5.0, "speaker_1")]
+
+        cache.put(key, segments)
+
+        assert cache.get(key) == segments
+        assert cache.stats == {"hits": 1, "misses": 0}
+
+    def test_embeddings_round_trip(self, tmp_path):
+        cache = DiarizationCache(tmp_path)
+        segments = [(0.0, 1.0, "SPEAKER_00"), (1.0, 2.0, "SPEAKER_01")]
+        embeddings = {"SPEAKER_00": np.ones(4), "SPEAKER_01": np.zeros(4)}
+        cache.put("k", segments, embeddings)
+
+        cached_segments, cached_embeddings = cache.get_entry("k")
+
+        assert cached_segments == segments
+        assert list(cached_embeddings) == ["SPEAKER_00", "SPEAKER_01"]
+        np.testing.assert_array_equal(cached_embeddings["SPEAKER_00"], np.ones(4))
+        assert cache.get("k") == segments
+
+    def test_entry_without_embeddings(self, tmp_path):
+        cache = DiarizationCache(tmp_path)
+        cache.put("k", [(0.0, 1.0, "speaker_0")])
+
+        assert cache.get_entry("k") == ([(0.0, 1.0, "speaker_0")], {})
+
+    def test_empty_segments(self, tmp_path):
+        cache = DiarizationCache(cache_dir=tmp_path / "diar")
+        cache.put("k", [])
+        assert cache.get("k") == []
+
+    def test_miss_and_corrupt(self, tmp_path):
+        cache = DiarizationCache(cache_dir=tmp_path / "diar")
+        assert cache.get("missing") is None
+        (tmp_path / "diar" / "broken.npz").write_bytes(b"not a zip")
+        assert cache.get("broken") is None
+        assert cache.stats == {"hits": 0, "misses": 2}
+
+    def test_key_depends_on_parameters(self):
+        base = DiarizationCache.make_key("fp", "pyannote", 3, 1.0)
+        assert base == DiarizationCache.make_key("fp", "pyannote", 3, 1.0)
+        assert base != DiarizationCache.make_key("fp2", "pyannote", 3, 1.0)
+        assert base != DiarizationCache.make_key("fp", "resemblyzer/auto", 3, 1.0)
+        assert base != DiarizationCache.make_key("fp", "pyannote", 4, 1.0)
+        assert base != DiarizationCache.make_key("fp", "pyannote", 3, 0.5)
+        assert base != DiarizationCache.make_key("fp", "pyannote", 3, 1.0, speech_mask="x")
+
+    def test_clear(self, tmp_path):
+        cache = DiarizationCache(cache_dir=tmp_path / "diar")
+        cache.put("a", [(0.0, 1.0, "s")])
+        cache.put("b", [])
+        assert cache.clear() == 2
+        assert cache.get("a") is None
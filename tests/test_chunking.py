@@ -0,0 +1,84 @@
+"""長時間音声の分割話者分離（チャンク計画・話者の対応付け）のテスト"""
+
+import numpy as np
+import pytest
+
+from src.audio.chunking import ChunkPlan, ChunkResult, plan_chunks, stitch_chunks
+
+A = np.array([1.0, 0.0, 0.0])
+B = np.array([0.0, 1.0, 0.0])
+C = np.array([0.0, 0.0, 1.0])
+
+
+class TestPlanChunks:
+    def test_short_audio_single_chunk(self):
+        assert plan_chunks(50.0, 60.0, 10.0) == [ChunkPlan(0.0, 50.0, 0.0, 50.0)]
+
+    def test_overlapping_chunks_cover_audio(self):
+        plans = plan_chunks(25.0, 10.0, 2.0)
+
+        assert [(p.start, p.end) for p in plans] == [(0.0, 10.0), (8.0, 18.0), (16.0, 25.0)]
+        # 担当範囲は重なりの中央で隙間なく接する
+        assert [(p.own_start, p.own_end) for p in plans] == [
+            (0.0, 9.0), (9.0, 17.0), (17.0, 25.0),
+        ]
+
+    def test_overlap_must_be_shorter(self):
+        with pytest.raises(ValueError):
+            plan_chunks(100.0, 10.0, 10.0)
+
+
+class TestStitchChunks:
+    def test_labels_matched_by_embedding(self):
+        # 2つ目のチャンクではローカルラベルが入れ替わっている
+        chunks = [
+            ChunkResult(ChunkPlan(0.0, 10.0, 0.0, 9.0),
+                        [(0.0, 5.0, "X"), (5.0, 10.0, "Y")], {"X": A, "Y": B}),
+            ChunkResult(ChunkPlan(8.0, 18.0, 9.0, 18.0),
+                        [(8.0, 12.0, "X"), (12.0, 18.0, "Y")], {"X": B, "Y": A}),
+        ]
+
+        segments, embeddings = stitch_chunks(chunks, max_speakers=3)
+
+        assert segments == [
+            (0.0, 5.0, "SPEAKER_00"),
+            (5.0, 12.0, "SPEAKER_01"),
+            (12.0, 18.0, "SPEAKER_00"),
+        ]
+        np.testing.assert_allclose(embeddings["SPEAKER_00"], A)
+        np.testing.assert_allclose(embeddings["SPEAKER_01"], B)
+
+    def test_new_speaker_in_later_chunk(self):
+        chunks = [
+            ChunkResult(ChunkPlan(0.0, 10.0, 0.0, 9.0), [(0.0, 10.0, "X")], {"X": A}),
+            ChunkResult(ChunkPlan(8.0, 18.0, 9.0, 18.0), [(8.0, 18.0, "X")], {"X": C}),
+        ]
+
+        segments, embeddings = stitch_chunks(chunks, max_speakers=3)
+
+        assert segments == [(0.0, 9.0, "SPEAKER_00"), (9.0, 18.0, "SPEAKER_01")]
+        assert set(embeddings) == {"SPEAKER_00", "SPEAKER_01"}
+
+    def test_merged_down_to_max_speakers(self):
+        near_a = np.array([0.6, 0.0, 0.8])
+        chunks = [
+            ChunkResult(ChunkPlan(0.0, 10.0, 0.0, 9.0),
+                        [(0.0, 5.0, "X"), (5.0, 10.0, "Y")], {"X": A, "Y": B}),
+            ChunkResult(ChunkPlan(8.0, 18.0, 9.0, 18.0), [(8.0, 18.0, "X")], {"X": near_a}),
+        ]
+
+        segments, _ = stitch_chunks(chunks, max_speakers=2, threshold=0.9)
+
+        assert {label for _, _, label in segments} == {"SPEAKER_00", "SPEAKER_01"}
+        assert segments[-1] == (9.0, 18.0, "SPEAKER_00")
+
+    def test_speaker_without_embedding(self):
+        chunks = [
+            ChunkResult(ChunkPlan(0.0, 10.0, 0.0, 9.0), [(0.0, 10.0, "X")], {}),
+            ChunkResult(ChunkPlan(8.0, 18.0, 9.0, 18.0), [(8.0, 18.0, "X")], {"X": A}),
+        ]
+
+        segments, embeddings = stitch_chunks(chunks, max_speakers=3)
+
+        assert [label for _, _, label in segments] == ["SPEAKER_00", "SPEAKER_01"]
+        assert list(embeddings) == ["SPEAKER_01"]
@@ -0,0 +1,81 @@
+"""声紋クラスタリングのテスト"""
+
+import numpy as np
+import pytest
+
+from src.audio.clustering import cluster_embeddings, minibatch_kmeans, two_stage, ward
+
+
+def _blobs(sizes: list[int], dim: int = 32, spread: float = 0.05, seed: int = 0):
+    """単位球面上の話者ごとの点群と正解ラベル"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((len(sizes), dim))
+    points, truth = [], []
+    for label, (center, size) in enumerate(zip(centers, sizes)):
+        pts = center / np.linalg.norm(center) + spread * rng.standard_normal((size, dim))
+        points.append(pts / np.linalg.norm(pts, axis=1, keepdims=True))
+        truth.extend([label] * size)
+    # 話者が入れ替わる会話を模して時系列をシャッフルする
+    order = rng.permutation(len(truth))
+    return np.concatenate(points)[order].astype(np.float32), np.array(truth)[order]
+
+
+def _same_partition(labels, truth) -> bool:
+    pairs = set(zip(labels, truth.tolist()))
+    return len(pairs) == len(set(labels)) == len(set(truth.tolist()))
+
+
+class TestEngines:
+    @pytest.mark.parametrize("fn", [ward, minibatch_kmeans, two_stage])
+    def test_recovers_speakers(self, fn):
+        embeddings, truth = _blobs([300, 200, 100])
+        labels = fn(embeddings, 3)
+        assert _same_partition(labels, truth)
+
+    def test_two_stage_across_chunks(self):
+        embeddings, truth = _blobs([900, 700, 400], seed=1)
+        labels = two_stage(embeddings, 3, chunk_size=250, sub_clusters=8)
+        assert _same_partition(labels, truth)
+
+    @pytest.mark.parametrize("engine", ["ward", "minibatch_kmeans", "two_stage", "auto"])
+    def test_respects_max_speakers(self, engine):
+        embeddings, _ = _blobs([50, 50, 50, 50, 50])
+        labels = cluster_embeddings(embeddings, 2, engine=engine)
+        assert len(labels) == 250
+        assert set(labels) <= {0, 1}
+
+    def test_kmeans_relabels_in_order_of_appearance(self):
+        embeddings, _ = _blobs([40, 40])
+        labels = minibatch_kmeans(embeddings, 2)
+        assert labels[0] == 0
+
+
+class TestClusterEmbeddings:
+    def test_single_embedding(self):
+        assert cluster_embeddings(np.ones((1, 4)), 3) == [0]
+        assert cluster_embeddings(np.ones((0, 4)), 3) == []
+
+    def test_unknown_engine(self):
+        with pytest.raises(ValueError, match="未対応"):
+            cluster_embeddings(np.ones((5, 4)), 2, engine="spectral")
+
+    def test_auto_switches_to_two_stage(self, monkeypatch):
+        import src.audio.clustering as clustering
+
+        called = []
+        monkeypatch.setattr(clustering, "WARD_MAX_WINDOWS", 100)
+        monkeypatch.setattr(clustering, "two_stage",
+                            lambda emb, k: called.append(len(emb)) or [0] * len(emb))
+        embeddings, _ = _blobs([80, 80])
+
+        cluster_embeddings(embeddings, 2, engine="auto")
+
+        assert called == [160]
+
+
+class TestDiarizerClustering:
+    def test_rejects_unknown_engine(self):
+        from src.audio.diarizer import Diarizer
+
+        with pytest.raises(ValueError, match="未対応"):
+            Diarizer(use_pyannote=False, clustering="spectral")
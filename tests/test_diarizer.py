@@ -0,0 +1,139 @@
+"""話者ダイアライゼーションのテスト"""
+
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from src.audio.diarizer import Diarizer, SpeakerSegment
+from src.audio.vad import SpeechMask
+from src.cache import DiarizationCache
+
+
+class TestSpeechMaskIntegration:
+    def test_segments_mapped_to_original_timeline(self):
+        diarizer = Diarizer(use_pyannote=False)
+        wav = np.zeros(10 * 16000, dtype=np.float32)
+        mask = SpeechMask(intervals=np.array([[1.0, 3.0], [6.0, 8.0]]), duration=10.0)
+        voiced_segments = [
+            SpeakerSegment(start=0.0, end=1.5, speaker_label="speaker_0"),
+            SpeakerSegment(start=1.5, end=4.0, speaker_label="speaker_1"),
+        ]
+
+        with patch.object(diarizer, "_diarize",
+                          return_value=(voiced_segments, {})) as mock_diarize:
+            segments = diarizer.diarize(wav, 16000, speech_mask=mask)
+
+        voiced = mock_diarize.call_args[0][0]
+        assert len(voiced) == 4 * 16000
+        assert mock_diarize.call_args.kwargs == {"trim_silence": False}
+        assert [(s.start, s.end, s.speaker_label) for s in segments] == [
+            (1.0, 2.5, "speaker_0"),
+            (2.5, 3.0, "speaker_1"),
+            (6.0, 8.0, "speaker_1"),
+        ]
+
+    def test_no_speech(self):
+        diarizer = Diarizer(use_pyannote=False)
+        mask = SpeechMask(intervals=np.zeros((0, 2)), duration=2.0)
+
+        with patch.object(diarizer, "_diarize") as mock_diarize:
+            assert diarizer.diarize(np.zeros(32000, dtype=np.float32), 16000, mask) == []
+        mock_diarize.assert_not_called()
+
+
+class TestDiarizationCacheIntegration:
+    def test_second_run_uses_cache(self, tmp_path):
+        diarizer = Diarizer(use_pyannote=False, cache=DiarizationCache(tmp_path))
+        wav = np.random.default_rng(0).standard_normal(32000).astype(np.float32)
+        result = [SpeakerSegment(start=0.0, end=2.0, speaker_label="speaker_0")]
+
+        with patch.object(diarizer, "_diarize_audio", return_value=(result, {})) as mock_diarize:
+            first = diarizer.diarize(wav, 16000)
+            second = diarizer.diarize(wav, 16000)
+
+        mock_diarize.assert_called_once()
+        assert first == second == result
+
+    def test_parameter_change_misses(self, tmp_path):
+        cache = DiarizationCache(tmp_path)
+        wav = np.zeros(32000, dtype=np.float32)
+        a = Diarizer(use_pyannote=False, max_speakers=2, cache=cache)
+        b = Diarizer(use_pyannote=False, max_speakers=4, cache=cache)
+
+        with patch.object(a, "_diarize_audio", return_value=([], {})), \
+                patch.object(b, "_diarize_audio", return_value=([], {})) as mock_b:
+            a.diarize(wav, 16000)
+            b.diarize(wav, 16000)
+
+        mock_b.assert_called_once()
+
+    def test_embeddings_cached(self, tmp_path):
+        diarizer = Diarizer(use_pyannote=False, cache=DiarizationCache(tmp_path))
+        wav = np.ones(32000, dtype=np.float32)
+        result = [SpeakerSegment(start=0.0, end=2.0, speaker_label="SPEAKER_00")]
+        embeddings = {"SPEAKER_00": np.array([1.0, 0.0], dtype=np.float32)}
+
+        with patch.object(diarizer, "_diarize_audio", return_value=(result, embeddings)):
+            diarizer.diarize_with_embeddings(wav, 16000)
+            _, cached = diarizer.diarize_with_embeddings(wav, 16000)
+
+        np.testing.assert_array_equal(cached["SPEAKER_00"], embeddings["SPEAKER_00"])
+
+
+class _Turn:
+    def __init__(self, start, end):
+        self.start, self.end = start, end
+
+
+def _fake_pyannote(voices):
+    """波形の値で話者を決める擬似 pyannote パイプライン（1秒単位）。
+
+    voices: {波形の値: 声紋ベクトル}。チャンクごとにラベル順が入れ替わるよう、
+    ローカルラベルは出現順の逆順に振る。
+    """
+    def run(audio, max_speakers, return_embeddings):
+        wav = audio["waveform"][0].numpy()
+        values = wav[::16000]
+        order = list(dict.fromkeys(values.tolist()))[::-1]
+        names = {v: f"SPEAKER_{i:02d}" for i, v in enumerate(order)}
+        turns = [(_Turn(float(i), float(i + 1)), None, names[v]) for i, v in enumerate(values)]
+        diarization = MagicMock()
+        diarization.itertracks.return_value = turns
+        diarization.labels.return_value = [names[v] for v in order]
+        return diarization, np.array([voices[v] for v in order])
+    return run
+
+
+class TestChunkedPyannote:
+    def _diarizer(self, **kwargs):
+        diarizer = Diarizer(use_pyannote=False, min_segment_duration=0.0, **kwargs)
+        diarizer.pipeline = MagicMock(side_effect=_fake_pyannote({
+            1.0: np.array([1.0, 0.0, 0.0]),
+            2.0: np.array([0.0, 1.0, 0.0]),
+        }))
+        return diarizer
+
+    def test_chunks_stitched_across_boundaries(self):
+        diarizer = self._diarizer(chunk_sec=10.0, chunk_overlap_sec=2.0)
+        # 0〜12秒は話者A、12〜25秒は話者B
+        wav = np.concatenate([np.full(12 * 16000, 1.0), np.full(13 * 16000, 2.0)]).astype(np.float32)
+
+        segments, embeddings = diarizer.diarize_with_embeddings(wav, 16000)
+
+        assert diarizer.pipeline.call_count == 3
+        assert [(s.start, s.end, s.speaker_label) for s in segments] == [
+            (0.0, 12.0, "SPEAKER_00"),
+            (12.0, 25.0, "SPEAKER_01"),
+        ]
+        np.testing.assert_allclose(embeddings["SPEAKER_00"], [1.0, 0.0, 0.0])
+        np.testing.assert_allclose(embeddings["SPEAKER_01"], [0.0, 1.0, 0.0])
+
+    def test_short_audio_single_call(self):
+        diarizer = self._diarizer(chunk_sec=60.0)
+        wav = np.full(5 * 16000, 1.0, dtype=np.float32)
+
+        segments, embeddings = diarizer.diarize_with_embeddings(wav, 16000)
+
+        assert diarizer.pipeline.call_count == 1
+        assert len(segments) == 5
+        assert list(embeddings) == ["SPEAKER_00"]
@@ -0,0 +1,73 @@
+"""声紋埋め込みバッチ推論のテスト"""
+
+import numpy as np
+import pytest
+
+from src.audio.embedding import embed_utterances, embed_windows, forward_mels
+
+
+@pytest.fixture(scope="module")
+def encoder():
+    """resemblyzer 同梱の学習済みモデル（CPU）"""
+    from resemblyzer import VoiceEncoder
+    return VoiceEncoder(device="cpu", verbose=False)
+
+
+def _noise(seconds: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(int(seconds * 16000)) * 0.1).astype(np.float32)
+
+
+class TestEmbedUtterances:
+    def test_matches_embed_utterance(self, encoder):
+        wavs = [_noise(0.8, 0), _noise(3.0, 1), _noise(7.3, 2)]
+
+        batched = embed_utterances(encoder, wavs, batch_size=4)
+
+        assert batched.shape == (3, 256)
+        for wav, row in zip(wavs, batched):
+            np.testing.assert_allclose(row, encoder.embed_utterance(wav), atol=1e-5)
+
+    def test_empty_wav_gives_zero_row(self, encoder):
+        batched = embed_utterances(encoder, [np.zeros(0, dtype=np.float32), _noise(2.0, 3)])
+
+        assert np.all(batched[0] == 0)
+        assert np.linalg.norm(batched[1]) == pytest.approx(1.0, abs=1e-5)
+
+    def test_all_empty(self, encoder):
+        batched = embed_utterances(encoder, [np.zeros(0, dtype=np.float32)])
+        assert batched.shape[0] == 1
+
+
+class TestEmbedWindows:
+    @pytest.mark.parametrize("window_sec,step_sec", [(1.5, 0.75), (3.0, 1.0)])
+    def test_matches_per_window_embed_utterance(self, encoder, window_sec, step_sec):
+        wav = _noise(9.0, 4)
+        window, step = int(window_sec * 16000), int(step_sec * 16000)
+
+        embeddings, starts = embed_windows(encoder, wav, window, step, batch_size=5)
+
+        expected_starts = list(range(0, len(wav) - window + 1, step))
+        assert starts.tolist() == expected_starts
+        assert embeddings.shape == (len(expected_starts), 256)
+        for pos, row in zip(expected_starts, embeddings):
+            np.testing.assert_allclose(
+                row, encoder.embed_utterance(wav[pos:pos + window]), atol=1e-5
+            )
+
+    def test_shorter_than_window(self, encoder):
+        embeddings, starts = embed_windows(encoder, _noise(1.0, 5), 24000, 12000)
+        assert len(starts) == 0
+        assert len(embeddings) == 0
+
+
+class TestForwardMels:
+    def test_batch_size_does_not_change_result(self, encoder):
+        rng = np.random.default_rng(0)
+        mels = rng.random((5, 160, 40), dtype=np.float32)
+
+        small = forward_mels(encoder, mels, batch_size=2)
+        large = forward_mels(encoder, mels, batch_size=16)
+
+        assert small.shape == (5, 256)
+        np.testing.assert_allclose(small, large, atol=1e-5)
@@ -0,0 +1,377 @@
+"""パック形式の埋め込みストアのテスト"""
+
+import multiprocessing
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from src.embedding_store import PackedEmbeddingStore, SharedMatrix
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = PackedEmbeddingStore(tmp_path / "store")
+    yield s
+    s.close()
+
+
+class TestPackedEmbeddingStore:
+    def test_put_and_get(self, store):
+        vector = np.arange(256, dtype=np.float32)
+
+        store.put("voice_a", vector)
+
+        np.testing.assert_array_equal(store.get("voice_a"), vector)
+        assert store.get("voice_b") is None
+        assert "voice_a" in store and len(store) == 1
+
+    def test_bulk_round_trip(self, store):
+        vectors = {f"k{i}": np.full(8, i, dtype=np.float32) for i in range(1200)}
+
+        store.put_many(vectors)
+        found = store.get_many([*vectors, "missing"])
+
+        assert len(found) == 1200 and "missing" not in found
+        np.testing.assert_array_equal(found["k1199"], vectors["k1199"])
+        assert store.arena_bytes == 1200 * 8 * 4
+
+    def test_shape_is_kept(self, store):
+        matrix = np.arange(6, dtype=np.float64).reshape(2, 3)
+
+        store.put("m", matrix)
+
+        result = store.get("m")
+        assert result.shape == (2, 3) and result.dtype == np.float32
+        np.testing.assert_array_equal(result, matrix)
+
+    def test_overwrite_uses_latest(self, store):
+        store.put("k", np.zeros(4))
+        store.get("k")  # マップ済みの状態から伸びたアリーナを読む
+
+        store.put("k", np.ones(4))
+
+        np.testing.assert_array_equal(store.get("k"), np.ones(4))
+        assert len(store) == 1
+
+    def test_reopen(self, tmp_path, store):
+        store.put("k", np.array([1.0, 2.0]))
+        store.close()
+
+        with PackedEmbeddingStore(tmp_path / "store") as reopened:
+            np.testing.assert_array_equal(reopened.get("k"), [1.0, 2.0])
+
+    def test_float16_keeps_creation_dtype(self, tmp_path):
+        with PackedEmbeddingStore(tmp_path / "half", dtype="float16") as half:
+            half.put("k", np.array([0.5, 1.5]))
+            assert half.arena_bytes == 4
+
+        with PackedEmbeddingStore(tmp_path / "half") as reopened:
+            assert reopened.dtype == np.float16
+            np.testing.assert_array_equal(reopened.get("k"), [0.5, 1.5])
+
+    def test_truncated_arena_is_a_miss(self, store):
+        store.put("k", np.ones(4))
+        with open(store.arena_path, "r+b") as f:
+            f.truncate(8)
+
+        assert store.get("k") is None
+
+    def test_clear(self, store):
+        store.put_many({"a": np.ones(2), "b": np.zeros(2)})
+        store.get("a")
+
+        assert store.clear() == 2
+        assert len(store) == 0 and store.arena_bytes == 0
+        store.put("c", np.ones(2))
+        np.testing.assert_array_equal(store.get("c"), np.ones(2))
+
+    def test_invalid_dtype(self, tmp_path):
+        with pytest.raises(ValueError):
+            PackedEmbeddingStore(tmp_path / "store", dtype="int8")
+
+
+def _vec(value: float) -> np.ndarray:
+    return np.full(4, value, dtype=np.float32)    # 16 バイト
+
+
+class TestEviction:
+    def test_lru_evicts_least_recently_used(self, tmp_path):
+        store = PackedEmbeddingStore(tmp_path / "s", max_entries=10, auto_compact=False)
+        store.put_many({f"k{i}": _vec(i) for i in range(10)})
+        store.get("k0")
+
+        store.put("new", _vec(10))
+
+        # 上限を超えたら上限の 9 割まで減らす
+        assert len(store) == 9 and store.stats["evictions"] == 2
+        assert "k0" in store and "new" in store
+        assert "k1" not in store and "k2" not in store
+        store.close()
+
+    def test_lfu_keeps_frequently_used(self, tmp_path):
+        store = PackedEmbeddingStore(tmp_path / "s", max_entries=10, policy="lfu",
+                                     auto_compact=False)
+        store.put_many({f"k{i}": _vec(i) for i in range(10)})
+        for i in range(9, 1, -1):
+            store.get(f"k{i}")
+        store.get("k9")
+
+        store.put("new", _vec(10))
+
+        assert "k0" not in store and "k1" not in store
+        assert "k9" in store and "new" in store
+        store.close()
+
+    def test_byte_budget(self, tmp_path):
+        store = PackedEmbeddingStore(tmp_path / "s", max_bytes=100, auto_compact=False)
+
+        for i in range(10):
+            store.put(f"k{i}", _vec(i))
+
+        assert store.live_bytes <= 100
+        assert "k9" in store and "k0" not in store
+        store.close()
+
+    def test_prefix_quota(self, tmp_path):
+        store = PackedEmbeddingStore(tmp_path / "s", quotas={"visual": 32}, auto_compact=False)
+        store.put_many({f"voice_{i}": _vec(i) for i in range(5)})
+
+        store.put_many({f"visual_{i}": _vec(i) for i in range(4)})
+        store.put("visual_4", _vec(4))
+
+        found = store.get_many([f"{p}_{i}" for p in ("voice", "visual") for i in range(5)])
+        assert sum(k.startswith("voice_") for k in found) == 5
+        assert sum(k.startswith("visual_") for k in found) <= 2
+        assert "visual_4" in found
+        store.close()
+
+    def test_ttl(self, tmp_path):
+        store = PackedEmbeddingStore(tmp_path / "s", ttl_sec=0.05, auto_compact=False)
+        store.put("k", _vec(1))
+        assert store.get("k") is not None
+
+        time.sleep(0.1)
+
+        assert store.get("k") is None and "k" not in store
+        assert store.evict() == 1
+        assert store.stats["expired"] == 1 and len(store) == 0
+        store.close()
+
+    def test_access_survives_reopen(self, tmp_path):
+        store = PackedEmbeddingStore(tmp_path / "s", auto_compact=False)
+        store.put_many({"a": _vec(1), "b": _vec(2)})
+        store.get("a")
+        store.close()
+
+        reopened = PackedEmbeddingStore(tmp_path / "s", max_entries=1, auto_compact=False)
+        reopened.put("c", _vec(3))
+
+        assert set(reopened.get_many("abc")) == {"c"}
+        reopened.close()
+
+    def test_upgrades_index_without_eviction_columns(self, tmp_path):
+        directory = tmp_path / "s"
+        directory.mkdir()
+        conn = sqlite3.connect(directory / "embeddings.sqlite")
+        conn.executescript(
+            "CREATE TABLE vectors (key TEXT PRIMARY KEY, offset INTEGER NOT NULL,"
+            " shape TEXT NOT NULL);"
+            "CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "INSERT INTO meta VALUES ('dtype', 'float32');"
+            "INSERT INTO vectors VALUES ('voice_a', 0, '4');")
+        conn.close()
+        (directory / "embeddings.arena").write_bytes(_vec(7).tobytes())
+
+        with PackedEmbeddingStore(directory) as store:
+            np.testing.assert_array_equal(store.get("voice_a"), _vec(7))
+            assert store.stats["bytes"] == 16
+
+
+class TestCompaction:
+    def test_compact_reclaims_space(self, tmp_path):
+        store = PackedEmbeddingStore(tmp_path / "s", auto_compact=False)
+        for _ in range(5):
+            store.put_many({"a": _vec(1), "b": _vec(2)})
+        assert store.arena_bytes == 160
+
+        assert store.compact() == 128
+
+        assert store.arena_bytes == 32 and store.stats["compactions"] == 1
+        np.testing.assert_array_equal(store.get("b"), _vec(2))
+        store.close()
+        with PackedEmbeddingStore(tmp_path / "s") as reopened:
+            np.testing.assert_array_equal(reopened.get("a"), _vec(1))
+        assert [p.name for p in (tmp_path / "s").glob("*.arena")] == ["embeddings.1.arena"]
+
+    def test_put_and_get_during_copy(self, tmp_path, monkeypatch):
+        store = PackedEmbeddingStore(tmp_path / "s", auto_compact=False)
+        for _ in range(5):
+            store.put_many({"a": _vec(1), "b": _vec(2)})
+        copying, resume = threading.Event(), threading.Event()
+        copy_records = PackedEmbeddingStore._copy_records
+
+        def slow_copy(*args):
+            copying.set()
+            assert resume.wait(5)
+            return copy_records(*args)
+
+        monkeypatch.setattr(PackedEmbeddingStore, "_copy_records", staticmethod(slow_copy))
+        compactor = store.compact_in_background()
+        assert copying.wait(5)
+
+        # コピー中も書き込みロックを待たずに読み書きできる
+        started = time.monotonic()
+        store.put_many({"b": _vec(3), "c": _vec(4)})
+        np.testing.assert_array_equal(store.get("a"), _vec(1))
+        assert time.monotonic() - started < 1
+        resume.set()
+        compactor.join()
+
+        # コピー中に上書きされた b の古いデータは次の compact まで残る
+        assert store.stats["compactions"] == 1
+        assert store.arena_bytes == 64
+        for key, value in {"a": 1, "b": 3, "c": 4}.items():
+            np.testing.assert_array_equal(store.get(key), _vec(value))
+        store.close()
+        with PackedEmbeddingStore(tmp_path / "s") as reopened:
+            np.testing.assert_array_equal(reopened.get("b"), _vec(3))
+        assert [p.name for p in (tmp_path / "s").iterdir() if "arena" in p.name] \
+            == ["embeddings.1.arena"]
+
+    def test_compaction_abandoned_after_clear(self, tmp_path, monkeypatch):
+        store = PackedEmbeddingStore(tmp_path / "s", auto_compact=False)
+        store.put_many({"a": _vec(1), "b": _vec(2)})
+        copy_records = PackedEmbeddingStore._copy_records
+
+        def clear_then_copy(*args):
+            result = copy_records(*args)
+            store.clear()
+            return result
+
+        monkeypatch.setattr(PackedEmbeddingStore, "_copy_records", staticmethod(clear_then_copy))
+
+        assert store.compact() == 0
+        assert store.get("a") is None and store.stats["compactions"] == 0
+        assert not list((tmp_path / "s").glob("*.tmp"))
+        store.close()
+
+    def test_background_compaction_after_eviction(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("src.embedding_store.COMPACT_MIN_DEAD", 64)
+        store = PackedEmbeddingStore(tmp_path / "s", max_entries=2)
+
+        for i in range(20):
+            store.put(f"k{i}", _vec(i))
+        if store._compactor is not None:
+            store._compactor.join()
+
+        assert store.stats["compactions"] >= 1
+        assert store.arena_bytes < 20 * 16
+        np.testing.assert_array_equal(store.get("k19"), _vec(19))
+        store.close()
+
+
+def _hammer(directory: str, worker: int, rounds: int) -> list[str]:
+    """同じキーを複数プロセスから読み書きし、壊れた読み出しを返す"""
+    store = PackedEmbeddingStore(directory, max_entries=40)
+    errors = []
+    for i in range(rounds):
+        keys = [(i * 7 + worker + j) % 50 for j in range(1 + (i + worker) % 8)]
+        # 値にキーの番号を埋め込み、全要素を同じ値にする。別のキー・書きかけ・
+        # 別の世代のデータを読めば、番号が合わないか要素が混ざる
+        store.put_many({f"voice_{n}": np.full(64, n * 1_000_000 + worker * 1000 + i,
+                                              dtype=np.float32) for n in keys})
+        for key, vector in store.get_many(f"voice_{n}" for n in range(50)).items():
+            if (vector.shape != (64,) or not np.all(vector == vector[0])
+                    or int(vector[0]) // 1_000_000 != int(key.split("_")[1])):
+                errors.append(f"{key}: {vector[:4]}")
+        if worker == 0 and i % 10 == 0:
+            store.compact()
+    store.close()
+    return errors
+
+
+class TestMultiProcess:
+    def test_processes_hammering_same_keys(self, tmp_path):
+        directory = str(tmp_path / "s")
+        PackedEmbeddingStore(directory).close()
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=6, mp_context=ctx) as pool:
+            futures = [pool.submit(_hammer, directory, w, 60) for w in range(6)]
+            errors = [e for f in futures for e in f.result(timeout=120)]
+
+        assert errors == []
+        with PackedEmbeddingStore(directory) as store:
+            assert 0 < len(store) <= 40
+            assert store.stats["bytes"] == len(store) * 64 * 4
+            for key, vector in store.get_many(f"voice_{n}" for n in range(50)).items():
+                assert int(vector[0]) // 1_000_000 == int(key.split("_")[1])
+
+    def test_reader_keeps_old_generation_after_compaction(self, tmp_path):
+        writer = PackedEmbeddingStore(tmp_path / "s", auto_compact=False)
+        reader = PackedEmbeddingStore(tmp_path / "s", auto_compact=False)
+        writer.put_many({"a": _vec(1), "b": _vec(2)})
+        writer.put("a", _vec(3))
+        np.testing.assert_array_equal(reader.get("a"), _vec(3))
+
+        writer.compact()
+
+        np.testing.assert_array_equal(reader.get("a"), _vec(3))
+        np.testing.assert_array_equal(reader.get("b"), _vec(2))
+        assert reader.arena_path == writer.arena_path
+        writer.close()
+        reader.close()
+
+    def test_totals_shared_between_processes(self, tmp_path):
+        first = PackedEmbeddingStore(tmp_path / "s", max_entries=10, auto_compact=False)
+        second = PackedEmbeddingStore(tmp_path / "s", max_entries=10, auto_compact=False)
+
+        first.put_many({f"a{i}": _vec(i) for i in range(6)})
+        second.put_many({f"b{i}": _vec(i) for i in range(6)})
+
+        assert len(first) == len(second) == 9
+        first.close()
+        second.close()
+
+
+class TestSharedMatrix:
+    def test_publish_and_open(self, tmp_path):
+        matrix = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+        SharedMatrix.publish("speakers", ["a", "b", "c"], matrix, "v1", directory=tmp_path)
+        shared = SharedMatrix.open("speakers", "v1", directory=tmp_path)
+
+        assert shared.rows == ["a", "b", "c"]
+        np.testing.assert_array_equal(shared.matrix, matrix)
+        assert not shared.matrix.flags.writeable
+        assert shared.matrix.ctypes.data % 64 == 0
+
+    def test_version_mismatch_and_missing(self, tmp_path):
+        SharedMatrix.publish("speakers", ["a"], np.ones((1, 4)), "v1", directory=tmp_path)
+
+        assert SharedMatrix.open("speakers", "v2", directory=tmp_path) is None
+        assert SharedMatrix.open("other", directory=tmp_path) is None
+
+    def test_republish_keeps_open_readers(self, tmp_path):
+        old = SharedMatrix.publish("speakers", ["a"], np.ones((1, 4)), "v1", directory=tmp_path)
+
+        SharedMatrix.publish("speakers", ["a", "b"], np.zeros((2, 4)), "v2", directory=tmp_path)
+
+        np.testing.assert_array_equal(old.matrix, np.ones((1, 4)))
+        assert SharedMatrix.open("speakers", "v2", directory=tmp_path).rows == ["a", "b"]
+        assert len(list(tmp_path.iterdir())) == 1
+
+    def test_unlink_keeps_republished_matrix(self, tmp_path):
+        old = SharedMatrix.publish("speakers", ["a"], np.ones((1, 4)), "v1", directory=tmp_path)
+        new = SharedMatrix.publish("speakers", ["a"], np.zeros((1, 4)), "v2", directory=tmp_path)
+
+        old.unlink()
+        assert SharedMatrix.open("speakers", "v2", directory=tmp_path) is not None
+
+        new.unlink()
+        new.unlink()
+        assert list(tmp_path.iterdir()) == []
+        np.testing.assert_array_equal(new.matrix, np.zeros((1, 4)))
@@ -1,13 +1,35 @@
 """音声抽出モジュールのテスト"""
 
+import io
 import subprocess
+import sys
 import tempfile
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 
+import numpy as np
 import pytest
 
-from src.audio.extractor import extract_audio, extract_audio_segment, get_video_duration
+from src.audio.extractor import (
+    extract_audio,
+    extract_audio_array,
+    extract_audio_segment,
+    get_video_duration,
+    iter_audio_chunks,
+)
+
+
+def _mock_popen(pcm: bytes, returncode: int = 0, stderr: bytes = b""):
+    """Popen の side_effect: stderr は渡されたファイルに書き込む"""
+    def popen(cmd, **kwargs):
+        kwargs["stderr"].write(stderr)
+        proc = MagicMock()
+        proc.stdout = io.BytesIO(pcm)
+        proc.wait.return_value = returncode
+        proc.poll.return_value = returncode
+        return proc
+
+    return popen
 
 
 class TestExtractAudio:
@@ -56,6 +78,93 @@ class TestExtractAudio:
         assert "44100" in cmd
 
 
+class TestIterAudioChunks:
+    def test_file_not_found(self):
+        with pytest.raises(FileNotFoundError):
+            list(iter_audio_chunks("/nonexistent/video.mp4"))
+
+    @patch("src.audio.extractor.subprocess.Popen")
+    def test_chunks_are_float32(self, mock_popen, tmp_path):
+        video_file = tmp_path / "test.mp4"
+        video_file.touch()
+        pcm = np.array([0, 16384, -32768, 8192, 0], dtype="<i2").tobytes()
+        mock_popen.side_effect = _mock_popen(pcm)
+
+        chunks = list(iter_audio_chunks(str(video_file), sample_rate=2, chunk_sec=1.0))
+
+        assert [len(c) for c in chunks] == [2, 2, 1]
+        assert all(c.dtype == np.float32 for c in chunks)
+        np.testing.assert_allclose(np.concatenate(chunks), [0.0, 0.5, -1.0, 0.25, 0.0])
+
+        cmd = mock_popen.call_args[0][0]
+        assert cmd[0] == "ffmpeg"
+        assert "s16le" in cmd
+        assert cmd[-1] == "pipe:1"
+
+    @patch("src.audio.extractor.subprocess.Popen")
+    def test_ffmpeg_error(self, mock_popen, tmp_path):
+        video_file = tmp_path / "test.mp4"
+        video_file.touch()
+        mock_popen.side_effect = _mock_popen(b"", returncode=1, stderr=b"codec error")
+
+        with pytest.raises(RuntimeError, match="FFmpeg エラー: codec error"):
+            list(iter_audio_chunks(str(video_file)))
+
+    def test_verbose_stderr_does_not_block(self, tmp_path):
+        video_file = tmp_path / "test.mp4"
+        video_file.touch()
+        # 壊れた入力の ffmpeg の代わり: パイプの容量を超える量のエラーを出しながら音声を出力する
+        script = ("import sys\n"
+                  "for _ in range(2000):\n"
+                  "    sys.stderr.write('Invalid data found when processing input' * 4 + '\\n')\n"
+                  "    sys.stdout.buffer.write(b'\\0\\0' * 100)\n"
+                  "sys.exit(1)\n")
+        real_popen = subprocess.Popen
+
+        with patch("src.audio.extractor.subprocess.Popen",
+                   side_effect=lambda cmd, **kw: real_popen([sys.executable, "-c", script], **kw)):
+            with pytest.raises(RuntimeError, match="Invalid data") as excinfo:
+                list(iter_audio_chunks(str(video_file), sample_rate=100))
+
+        assert len(str(excinfo.value)) < 5000
+
+
+class TestExtractAudioArray:
+    @patch("src.audio.extractor.subprocess.Popen")
+    def test_concatenates_chunks(self, mock_popen, tmp_path):
+        video_file = tmp_path / "test.mp4"
+        video_file.touch()
+        pcm = np.full(40000, 16384, dtype="<i2").tobytes()
+        mock_popen.side_effect = _mock_popen(pcm)
+
+        wav = extract_audio_array(str(video_file))
+
+        assert wav.shape == (40000,)
+        assert wav.dtype == np.float32
+        assert wav[0] == pytest.approx(0.5)
+
+    @pytest.mark.parametrize("duration", [None, 0.5, 2.5, 60.0])
+    @patch("src.audio.extractor.iter_audio_chunks")
+    def test_fills_buffer_sized_from_duration(self, mock_chunks, duration):
+        # 見積もりより長い・短い・見積もりなしのいずれでもチャンクを順に並べる
+        chunks = [np.full(16000, i, dtype=np.float32) for i in range(3)]
+        mock_chunks.return_value = iter(chunks)
+
+        wav = extract_audio_array("video.mp4", duration=duration)
+
+        np.testing.assert_array_equal(wav, np.concatenate(chunks))
+
+    @patch("src.audio.extractor.subprocess.Popen")
+    def test_empty_audio(self, mock_popen, tmp_path):
+        video_file = tmp_path / "test.mp4"
+        video_file.touch()
+        mock_popen.side_effect = _mock_popen(b"")
+
+        wav = extract_audio_array(str(video_file))
+
+        assert wav.shape == (0,)
+
+
 class TestExtractAudioSegment:
     def test_file_not_found(self):
         with pytest.raises(FileNotFoundError):
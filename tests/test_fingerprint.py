@@ -0,0 +1,114 @@
+"""ファイルのフィンガープリントのテスト"""
+
+import os
+
+import pytest
+
+from src.fingerprint import FingerprintIndex, full_hash, sampled_hash
+
+
+def _write(path, data: bytes):
+    path.write_bytes(data)
+    return path
+
+
+@pytest.fixture
+def index(tmp_path):
+    idx = FingerprintIndex(tmp_path / "fingerprints.sqlite")
+    yield idx
+    idx.close()
+
+
+class TestHashes:
+    def test_sampled_hash_reads_head_middle_tail(self, tmp_path):
+        data = bytearray(os.urandom(1_000_000))
+        a = _write(tmp_path / "a.bin", bytes(data))
+        data[300_000] ^= 0xFF  # サンプル範囲外の変更
+        b = _write(tmp_path / "b.bin", bytes(data))
+        data[500_000] ^= 0xFF  # 中央のサンプル範囲内の変更
+        c = _write(tmp_path / "c.bin", bytes(data))
+
+        assert sampled_hash(a, sample_bytes=1024) == sampled_hash(b, sample_bytes=1024)
+        assert sampled_hash(a, sample_bytes=1024) != sampled_hash(c, sample_bytes=1024)
+        assert full_hash(a) != full_hash(b)
+
+    def test_size_is_part_of_hash(self, tmp_path):
+        a = _write(tmp_path / "a.bin", b"x" * 10)
+        b = _write(tmp_path / "b.bin", b"x" * 11)
+
+        assert sampled_hash(a) != sampled_hash(b)
+
+
+class TestFingerprintIndex:
+    def test_unchanged_files_are_not_reread(self, tmp_path, index):
+        videos = [_write(tmp_path / f"v{i}.mp4", os.urandom(1000)) for i in range(100)]
+
+        first = index.fingerprints(videos)
+        index.computed = 0
+        second = index.fingerprints(videos)
+
+        assert first == second
+        assert index.computed == 0
+
+    def test_modified_file_is_rehashed(self, tmp_path, index):
+        video = _write(tmp_path / "v.mp4", b"a" * 100)
+        before = index.fingerprint(video)
+
+        _write(video, b"b" * 100)
+        os.utime(video, ns=(1, 1))
+
+        assert index.fingerprint(video) != before
+
+    def test_rename_survives_without_rehash(self, tmp_path, index):
+        video = _write(tmp_path / "old.mp4", os.urandom(1000))
+        index.mark_analyzed(video, "old.mp4")
+        renamed = video.rename(tmp_path / "new.mp4")
+        index.computed = 0
+
+        assert index.lookup([renamed]) == {renamed: "old.mp4"}
+        assert index.computed == 0
+
+    def test_same_name_in_other_folder_is_new(self, tmp_path, index):
+        (tmp_path / "a").mkdir()
+        (tmp_path / "b").mkdir()
+        first = _write(tmp_path / "a" / "clip.mp4", os.urandom(1000))
+        second = _write(tmp_path / "b" / "clip.mp4", os.urandom(1000))
+        index.mark_analyzed(first, "clip.mp4")
+
+        assert index.unanalyzed([first, second]) == [second]
+
+    def test_verify_compares_full_hash(self, tmp_path, index):
+        data = bytearray(os.urandom(1_000_000))
+        original = _write(tmp_path / "a.mp4", bytes(data))
+        index.mark_analyzed(original, "a.mp4", verify=True)
+        data[300_000] ^= 0xFF  # 簡易フィンガープリントでは区別できない変更
+        lookalike = _write(tmp_path / "b.mp4", bytes(data))
+
+        assert index.unanalyzed([lookalike]) == []
+        assert index.unanalyzed([lookalike], verify=True) == [lookalike]
+
+    def test_full_fingerprint_is_memoised(self, tmp_path, index):
+        video = _write(tmp_path / "v.mp4", os.urandom(1000))
+
+        first = index.full_fingerprint(video)
+        index.computed = 0
+
+        assert index.full_fingerprint(video) == first == full_hash(video)
+        assert index.computed == 0
+
+    def test_legacy_names_claim_one_file(self, tmp_path, index):
+        (tmp_path / "a").mkdir()
+        (tmp_path / "b").mkdir()
+        first = _write(tmp_path / "a" / "clip.mp4", os.urandom(1000))
+        second = _write(tmp_path / "b" / "clip.mp4", os.urandom(1000))
+        index.add_legacy_names(["clip.mp4"])
+
+        assert index.unanalyzed([first, second]) == [second]
+        # 照合では記録を変えない
+        assert index.lookup([first, second]) == {first: "clip.mp4", second: None}
+        assert index.unanalyzed([second, first]) == [first]
+
+        index.mark_analyzed(first, "clip.mp4")
+
+        # 以後は内容で判定される
+        assert index.unanalyzed([second, first]) == [second]
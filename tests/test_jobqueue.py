@@ -0,0 +1,178 @@
+"""ジョブキューのテスト"""
+
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from src.jobqueue import JobQueue, worker_id
+from src.pipeline import PerformerResult, VideoAnalysisResult
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(tmp_path / "jobs.sqlite", max_attempts=2)
+    yield q
+    q.close()
+
+
+def _videos(tmp_path, n):
+    return [tmp_path / f"v{i}.mp4" for i in range(n)]
+
+
+def _result(path, errors=None):
+    return VideoAnalysisResult(
+        video_path=str(path), video_name=path.name, duration=10.0,
+        performers=[PerformerResult(person_id="person_a", name="A", detected=True)],
+        detected_count=1, errors=errors or [])
+
+
+def _dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+class TestJobQueue:
+    def test_enqueue_is_idempotent(self, tmp_path, queue):
+        videos = _videos(tmp_path, 3)
+
+        assert queue.enqueue(videos) == 3
+        assert queue.enqueue(videos) == 0
+        assert queue.counts() == {"pending": 3, "running": 0, "done": 0, "failed": 0}
+
+    def test_claim_in_order_and_count_attempts(self, tmp_path, queue):
+        videos = _videos(tmp_path, 2)
+        queue.enqueue(videos)
+
+        job = queue.claim("w1")
+
+        assert job.video_path == str(videos[0])
+        assert (job.status, job.attempts, job.worker) == ("running", 1, "w1")
+        assert list(queue.claims("w1")) == [str(videos[1])]
+        assert queue.claim("w1") is None
+
+    def test_complete_records_result_and_status(self, tmp_path, queue):
+        ok, bad = _videos(tmp_path, 2)
+        queue.enqueue([ok, bad])
+        for path in queue.claims("w1"):
+            queue.set_stage(path, "voice")
+        queue.complete(str(ok), _result(ok))
+        queue.complete(str(bad), _result(bad, errors=["音声抽出エラー: broken"]))
+
+        jobs = {j.video_path: j for j in queue.jobs()}
+        assert jobs[str(ok)].status == "done" and jobs[str(ok)].stage == "done"
+        assert jobs[str(ok)].elapsed_sec >= 0
+        assert jobs[str(bad)].status == "failed"
+        assert jobs[str(bad)].error == "音声抽出エラー: broken"
+        assert queue.results() == [_result(ok), _result(bad, errors=["音声抽出エラー: broken"])]
+
+    def test_set_stage(self, tmp_path, queue):
+        (video,) = _videos(tmp_path, 1)
+        queue.enqueue([video])
+        queue.claim("w1")
+
+        queue.set_stage(video, "decode")
+
+        assert queue.jobs()[0].stage == "decode"
+
+    def test_state_survives_reopen(self, tmp_path, queue):
+        videos = _videos(tmp_path, 2)
+        queue.enqueue(videos)
+        queue.claim("w1")
+        queue.complete(str(videos[0]), _result(videos[0]))
+
+        reopened = JobQueue(queue.path)
+
+        assert reopened.counts()["done"] == 1
+        assert reopened.claim("w2").video_path == str(videos[1])
+        reopened.close()
+
+    def test_concurrent_claims_are_unique(self, tmp_path, queue):
+        queue.enqueue(_videos(tmp_path, 40))
+        claimed: list[str] = []
+        lock = threading.Lock()
+
+        def work(name):
+            # ワーカーごとに別の接続（別プロセスと同じ条件）で取得する
+            own = JobQueue(queue.path)
+            for path in own.claims(name):
+                with lock:
+                    claimed.append(path)
+            own.close()
+
+        threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(claimed) == 40 and len(set(claimed)) == 40
+
+
+class TestRecovery:
+    def test_dead_local_worker_is_requeued(self, tmp_path, queue):
+        (video,) = _videos(tmp_path, 1)
+        queue.enqueue([video])
+        dead = f"{worker_id().rpartition(':')[0]}:{_dead_pid()}"
+        queue.claim(dead)
+        queue.set_stage(video, "voice")
+
+        assert queue.recover() == 1
+
+        job = queue.jobs()[0]
+        assert (job.status, job.attempts) == ("pending", 1)
+        assert "stage=voice" in job.error
+
+    def test_live_worker_is_left_alone(self, tmp_path, queue):
+        queue.enqueue(_videos(tmp_path, 1))
+        queue.claim(worker_id())
+
+        assert queue.recover() == 0
+        assert queue.jobs()[0].status == "running"
+
+    def test_attempt_limit_marks_failed(self, tmp_path, queue):
+        queue.enqueue(_videos(tmp_path, 1))
+        dead = f"{worker_id().rpartition(':')[0]}:{_dead_pid()}"
+        for _ in range(2):
+            queue.claim(dead)
+            queue.recover()
+
+        job = queue.jobs()[0]
+        assert (job.status, job.attempts) == ("failed", 2)
+
+    def test_remote_worker_judged_by_staleness(self, tmp_path, queue):
+        queue.enqueue(_videos(tmp_path, 1))
+        queue.claim("other-host:123")
+
+        assert queue.recover() == 0
+        impatient = JobQueue(queue.path, stale_after_sec=0)
+        assert impatient.recover() == 1
+        impatient.close()
+
+    def test_release_does_not_count_attempt(self, tmp_path, queue):
+        queue.enqueue(_videos(tmp_path, 2))
+        queue.claim("w1")
+        queue.claim("w2")
+
+        assert queue.release("w1") == 1
+
+        jobs = queue.jobs()
+        assert (jobs[0].status, jobs[0].attempts) == ("pending", 0)
+        assert jobs[1].status == "running"
+
+    def test_retry_failed_and_requeue(self, tmp_path, queue):
+        ok, bad = _videos(tmp_path, 2)
+        queue.enqueue([ok, bad])
+        list(queue.claims("w1"))
+        queue.complete(str(ok), _result(ok))
+        queue.complete(str(bad), _result(bad, errors=["x"]))
+
+        assert queue.retry_failed() == 1
+        assert queue.enqueue([ok], requeue=True) == 1
+        assert queue.counts()["pending"] == 2
+
+    def test_invalid_attempts(self, tmp_path):
+        with pytest.raises(ValueError):
+            JobQueue(tmp_path / "jobs.sqlite", max_attempts=0)
@@ -0,0 +1,137 @@
+"""共有モデルレジストリのテスト"""
+
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from src.models import VOICE_ENCODER, ModelRegistry, registry
+
+
+class TestModelRegistry:
+    def test_factory_called_once(self):
+        reg = ModelRegistry()
+        factory = MagicMock(return_value="model")
+
+        assert reg.acquire("m", factory) == "model"
+        assert reg.acquire("m", factory) == "model"
+
+        factory.assert_called_once()
+        assert reg.metrics["m"]["refcount"] == 2
+        assert reg.metrics["m"]["loads"] == 1
+
+    def test_concurrent_acquire_loads_once(self):
+        reg = ModelRegistry()
+        calls = []
+
+        def factory():
+            calls.append(1)
+            time.sleep(0.05)
+            return object()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(reg.acquire("m", factory)))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(calls) == 1
+        assert len({id(r) for r in results}) == 1
+        assert reg.metrics["m"]["refcount"] == 8
+
+    def test_release_and_unload_idle(self):
+        reg = ModelRegistry()
+        reg.acquire("m", lambda: "model")
+
+        # 参照中は解放されない
+        assert reg.unload_idle(max_idle=0) == []
+        reg.release("m")
+        assert reg.unload_idle(max_idle=0) == ["m"]
+        assert not reg.is_loaded("m")
+
+        # 再取得で再ロードされる
+        factory = MagicMock(return_value="model2")
+        assert reg.acquire("m", factory) == "model2"
+        assert reg.metrics["m"]["loads"] == 2
+
+    def test_unload_idle_respects_timeout(self):
+        reg = ModelRegistry(idle_timeout=3600)
+        reg.acquire("m", lambda: "model")
+        reg.release("m")
+
+        assert reg.unload_idle() == []
+        assert reg.is_loaded("m")
+
+    def test_no_timeout_never_unloads(self):
+        reg = ModelRegistry()
+        reg.acquire("m", lambda: "model")
+        reg.release("m")
+        assert reg.unload_idle() == []
+
+    def test_release_unknown_is_noop(self):
+        reg = ModelRegistry()
+        reg.release("missing")
+        reg.acquire("m", lambda: "model")
+        reg.release("m")
+        reg.release("m")
+        assert reg.metrics["m"]["refcount"] == 0
+
+    def test_factory_error_does_not_register(self):
+        reg = ModelRegistry()
+
+        def broken():
+            raise RuntimeError("load failed")
+
+        with pytest.raises(RuntimeError):
+            reg.acquire("m", broken)
+
+        assert not reg.is_loaded("m")
+        assert reg.metrics["m"]["refcount"] == 0
+        assert reg.acquire("m", lambda: "model") == "model"
+
+
+class TestSharedEncoder:
+    @pytest.fixture(autouse=True)
+    def clean_registry(self):
+        registry.clear()
+        yield
+        registry.clear()
+
+    def test_matcher_and_diarizer_share_encoder(self):
+        from src.audio.diarizer import Diarizer
+        from src.audio.voice_matcher import VoiceMatcher
+
+        with patch("src.audio.voice_matcher.VoiceEncoder") as MockEncoder, \
+                patch("src.audio.diarizer.preprocess_wav", return_value=np.zeros(0)):
+            matcher = VoiceMatcher()
+            assert matcher.encoder is not None
+            diarizer = Diarizer(use_pyannote=False)
+            for _ in range(3):
+                diarizer.diarize(np.zeros(16000, dtype=np.float32))
+
+        MockEncoder.assert_called_once()
+        assert diarizer.encoder is matcher.encoder
+        assert registry.metrics[VOICE_ENCODER]["refcount"] == 2
+
+        matcher.close()
+        diarizer.close()
+        assert registry.metrics[VOICE_ENCODER]["refcount"] == 0
+
+    def test_setup_wizard_returns_encoder(self, tmp_path):
+        from src.setup_wizard import SetupWizard
+
+        config = tmp_path / "config.yaml"
+        config.write_text("audio: {sample_rate: 16000}\n", encoding="utf-8")
+        with patch("src.setup_wizard.VoiceEncoder"):
+            wizard = SetupWizard(config_path=str(config))
+        assert registry.metrics[VOICE_ENCODER]["refcount"] == 1
+
+        wizard.close()
+        wizard.close()
+
+        assert registry.metrics[VOICE_ENCODER]["refcount"] == 0
+        assert registry.unload_idle(max_idle=0) == [VOICE_ENCODER]
@@ -1,8 +1,14 @@
 """パイプラインのテスト"""
 
+from unittest.mock import MagicMock
+
+import numpy as np
 import pytest
 
-from src.pipeline import PerformerResult, VideoAnalysisResult, _format_time
+from src.audio.diarizer import SpeakerSegment
+from src.audio.vad import SpeechMask
+from src.models import PYANNOTE_DIARIZATION
+from src.pipeline import AnalysisPipeline, PerformerResult, VideoAnalysisResult, _format_time
 
 
 class TestFormatTime:
@@ -103,3 +109,234 @@ class TestVideoAnalysisResult:
 
         d = result.to_dict()
         assert len(d["errors"]) == 1
+
+    def test_skipped_ratio_included(self):
+        result = VideoAnalysisResult(
+            video_path="/tmp/test.mp4",
+            video_name="test.mp4",
+            duration=60.0,
+            skipped_ratio=0.123456,
+        )
+
+        assert result.to_dict()["skipped_ratio"] == 0.1235
+
+
+class TestAnalyzeVoiceWithSpeechMask:
+    @pytest.fixture
+    def pipeline(self):
+        pipeline = AnalysisPipeline.__new__(AnalysisPipeline)
+        pipeline.voice_matcher = MagicMock(threshold=0.75)
+        pipeline.voice_matcher.compare_segments.return_value = {}
+        pipeline.voice_matcher.compare_wav.return_value = {"person_a": 0.5}
+        return pipeline
+
+    def test_segments_keep_only_voiced_audio(self, pipeline):
+        wav = np.arange(10 * 16000, dtype=np.float32)
+        mask = SpeechMask(intervals=np.array([[1.0, 2.0], [3.0, 3.5]]), duration=10.0)
+        segments = [
+            SpeakerSegment(start=0.0, end=4.0, speaker_label="speaker_0"),
+            SpeakerSegment(start=5.0, end=9.0, speaker_label="speaker_1"),  # 無音のみ
+        ]
+
+        pipeline._analyze_voice(wav, 16000, segments, mask)
+
+        segment_data = pipeline.voice_matcher.compare_segments.call_args[0][0]
+        assert len(segment_data) == 1
+        assert segment_data[0]["duration"] == pytest.approx(1.5)
+        np.testing.assert_array_equal(
+            segment_data[0]["wav"],
+            np.concatenate([wav[16000:32000], wav[48000:56000]]),
+        )
+
+    def test_whole_file_uses_voiced_audio(self, pipeline):
+        wav = np.zeros(4 * 16000, dtype=np.float32)
+        mask = SpeechMask(intervals=np.array([[1.0, 2.0]]), duration=4.0)
+
+        pipeline._analyze_voice(wav, 16000, [], mask)
+
+        voiced = pipeline.voice_matcher.compare_wav.call_args[0][0]
+        assert len(voiced) == 16000
+
+
+class TestAnalyzeVoiceEmbeddings:
+    @pytest.fixture
+    def pipeline(self):
+        from src.audio.voice_matcher import VoiceMatcher
+
+        pipeline = AnalysisPipeline.__new__(AnalysisPipeline)
+        pipeline.pyannote_matcher = VoiceMatcher(threshold=0.5)
+        pipeline.pyannote_matcher.reference_embeddings = {
+            "person_a": np.array([1.0, 0.0]),
+            "person_b": np.array([0.0, 1.0]),
+        }
+        return pipeline
+
+    def test_segments_inherit_cluster_scores(self, pipeline):
+        segments = [
+            SpeakerSegment(start=0.0, end=2.0, speaker_label="SPEAKER_00"),
+            SpeakerSegment(start=2.0, end=3.0, speaker_label="SPEAKER_01"),
+            SpeakerSegment(start=3.0, end=6.0, speaker_label="SPEAKER_00"),
+        ]
+        embeddings = {"SPEAKER_00": np.array([0.9, 0.1]), "SPEAKER_01": np.array([0.1, -1.0])}
+
+        results = pipeline._analyze_voice_embeddings(segments, embeddings)
+
+        assert results["person_a"]["matching_segments"] == 2
+        assert results["person_a"]["speaking_time"] == pytest.approx(5.0)
+        assert results["person_a"]["total_segments"] == 3
+        assert results["person_b"]["matching_segments"] == 0
+        assert pipeline.pyannote_matcher._encoder is None
+
+    def test_no_embeddings_falls_back_to_whole_audio(self, pipeline, monkeypatch):
+        import src.audio.diarizer as diarizer
+
+        embedded = []
+
+        def embed_waveform(wav, sample_rate, hf_token=None):
+            embedded.append(len(wav))
+            return np.array([0.8, 0.2])
+
+        monkeypatch.setattr(diarizer, "embed_waveform", embed_waveform)
+        pipeline.hf_token = None
+        wav = np.zeros(4 * 16000, dtype=np.float32)
+        mask = SpeechMask(intervals=np.array([[1.0, 2.0]]), duration=4.0)
+        segments = [SpeakerSegment(start=0.0, end=2.0, speaker_label="SPEAKER_00")]
+
+        results = pipeline._analyze_voice_embeddings(segments, {}, wav, 16000, mask)
+
+        # 話者分離の結果が使えなくても「誰も一致しない」にはせず、音声区間全体で照合する
+        assert embedded == [16000]
+        assert results["person_a"]["max_score"] > 0.9
+        assert results["person_a"]["matching_segments"] == 1
+        assert results["person_b"]["total_segments"] == 1
+        assert pipeline.pyannote_matcher._encoder is None
+
+    def test_no_embeddings_and_silence(self, pipeline, monkeypatch):
+        import src.audio.diarizer as diarizer
+
+        monkeypatch.setattr(diarizer, "embed_waveform", lambda wav, sr, hf_token=None: None)
+        pipeline.hf_token = None
+
+        results = pipeline._analyze_voice_embeddings([], {}, np.zeros(0, dtype=np.float32))
+
+        assert results["person_a"]["max_score"] == 0.0
+        assert results["person_b"]["matching_segments"] == 0
+
+
+class TestIdleUnload:
+    def test_pipeline_timeout_does_not_change_shared_registry(self, monkeypatch):
+        import src.audio.extractor as extractor
+        from src.models import registry
+
+        registry.clear()
+        registry.acquire("idle_model", object)
+        registry.release("idle_model")
+        pipeline = AnalysisPipeline.__new__(AnalysisPipeline)
+        pipeline.idle_unload_sec = 0
+        pipeline.embedding_cache = None
+        monkeypatch.setattr(extractor, "get_video_duration", MagicMock(side_effect=OSError))
+
+        assert pipeline.decode_audio(AnalysisPipeline.new_result("video.mp4")) is None
+
+        # このパイプラインの秒数で解放するが、他のパイプラインの既定値は変えない
+        assert not registry.is_loaded("idle_model")
+        assert registry.idle_timeout is None
+        registry.clear()
+
+
+class TestCachedSegments:
+    @pytest.fixture
+    def pipeline(self, tmp_path):
+        from unittest.mock import patch
+
+        from src.audio.voice_matcher import VoiceMatcher
+        from src.cache import EmbeddingCache
+        from src.models import registry
+
+        registry.clear()
+        pipeline = AnalysisPipeline.__new__(AnalysisPipeline)
+        pipeline.config = {"audio": {"sample_rate": 16000}, "vad": {"enabled": False},
+                           "diarization": {"max_speakers": 2}}
+        pipeline.mode = "diarize"
+        pipeline.on_stage = None
+        pipeline.idle_unload_sec = None
+        pipeline.pyannote_matcher = None
+        pipeline.embedding_cache = EmbeddingCache(cache_dir=tmp_path / "cache")
+        pipeline.voice_matcher = VoiceMatcher(threshold=0.5, cache=pipeline.embedding_cache)
+        pipeline.voice_matcher.reference_embeddings = {
+            "person_a": np.array([1.0, 0.0]),
+            "person_b": np.array([0.0, 1.0]),
+        }
+        pipeline.diarizer = MagicMock()
+        pipeline.diarizer.backend = "resemblyzer/auto"
+        pipeline.diarizer.diarize_with_embeddings.return_value = ([
+            SpeakerSegment(start=0.0, end=2.0, speaker_label="speaker_0"),
+            SpeakerSegment(start=2.0, end=3.0, speaker_label="speaker_1"),
+        ], {})
+
+        def embed_utterances(encoder, wavs, **kwargs):
+            # 正の波形は person_a、負の波形は person_b の声として埋め込む
+            return np.array([[1.0, 0.0] if w.mean() > 0 else [0.0, 1.0] for w in wavs])
+
+        with patch("src.audio.voice_matcher.VoiceEncoder"), \
+                patch("src.audio.voice_matcher.preprocess_wav", side_effect=lambda w, **kw: w), \
+                patch("src.audio.voice_matcher.embed_utterances",
+                      side_effect=embed_utterances) as embed:
+            yield pipeline, embed
+        pipeline.embedding_cache.close()
+        registry.clear()
+
+    def _analyze(self, pipeline, video):
+        result = AnalysisPipeline.new_result(str(video))
+        decoded = pipeline.decode_audio(result)
+        return result, decoded, pipeline.analyze_audio(result, decoded)
+
+    def test_second_analysis_skips_decoding(self, pipeline, tmp_path, monkeypatch):
+        import src.audio.extractor as extractor
+
+        pipeline, embed = pipeline
+        video = tmp_path / "video.mp4"
+        video.write_bytes(b"video data")
+        wav = np.concatenate([np.ones(32000), -np.ones(16000)]).astype(np.float32)
+        monkeypatch.setattr(extractor, "get_video_duration", lambda path: 3.0)
+        monkeypatch.setattr(extractor, "extract_audio_array", lambda path, sample_rate, duration: wav)
+        _, _, first = self._analyze(pipeline, video)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("ffmpeg/ffprobe を呼ばないはず")
+
+        monkeypatch.setattr(extractor, "get_video_duration", fail)
+        monkeypatch.setattr(extractor, "extract_audio_array", fail)
+        result, decoded, second = self._analyze(pipeline, video)
+
+        assert decoded.wav is None
+        assert result.duration == 3.0 and result.errors == []
+        assert embed.call_count == 1
+        assert pipeline.diarizer.diarize_with_embeddings.call_count == 1
+        assert second.results == first.results
+        assert second.results["person_a"]["speaking_time"] == pytest.approx(2.0)
+        assert second.results["person_b"]["matching_segments"] == 1
+
+    @pytest.mark.parametrize("change", [
+        lambda p: p.config["diarization"].update(max_speakers=3),
+        # HF トークンを設定して resemblyzer から pyannote の分離に切り替わった場合
+        lambda p: setattr(p.diarizer, "backend", PYANNOTE_DIARIZATION),
+    ], ids=["settings", "backend"])
+    def test_changed_settings_reanalyze(self, pipeline, tmp_path, monkeypatch, change):
+        import src.audio.extractor as extractor
+
+        pipeline, embed = pipeline
+        video = tmp_path / "video.mp4"
+        video.write_bytes(b"video data")
+        monkeypatch.setattr(extractor, "get_video_duration", lambda path: 3.0)
+        monkeypatch.setattr(extractor, "extract_audio_array",
+                            lambda path, sample_rate, duration: np.ones(48000, dtype=np.float32))
+        self._analyze(pipeline, video)
+
+        change(pipeline)
+        _, decoded, _ = self._analyze(pipeline, video)
+
+        # 区間リストは作り直すが、同じ区間の声紋ベクトルは再計算しない
+        assert decoded.wav is not None
+        assert pipeline.diarizer.diarize_with_embeddings.call_count == 2
+        assert embed.call_count == 1
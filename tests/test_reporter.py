@@ -1,6 +1,9 @@
 """結果出力モジュールのテスト"""
 
-from src.output.reporter import append_csv_log
+import json
+
+from src.output.reporter import append_csv_log, save_results
+from src.output.result_store import ResultStore
 from src.pipeline import PerformerResult, VideoAnalysisResult
 
 
@@ -28,3 +31,24 @@ def test_append_csv_log_creates_header_and_rows(tmp_path):
     assert "動画名" in lines[0]
     assert "v1.mp4" in lines[1]
     assert "v2.mp4" in lines[2]
+
+
+def test_save_results_keeps_earlier_results(tmp_path):
+    save_results([_sample_result("v1.mp4")], str(tmp_path), fmt="both")
+    save_results([_sample_result("v2.mp4")], str(tmp_path), fmt="both")
+
+    data = json.loads((tmp_path / "results.json").read_text(encoding="utf-8"))
+    assert [r["video"] for r in data["results"]] == ["v1.mp4", "v2.mp4"]
+    rows = (tmp_path / "results.csv").read_text(encoding="utf-8").strip().splitlines()
+    assert len(rows) == 3
+    assert ResultStore(str(tmp_path)).names() == {"v1.mp4", "v2.mp4"}
+
+
+def test_csv_header_covers_results_without_performers(tmp_path):
+    failed = VideoAnalysisResult(video_path="/tmp/x.mp4", video_name="x.mp4", duration=0.0,
+                                 errors=["音声抽出エラー"])
+
+    save_results([failed, _sample_result("v1.mp4")], str(tmp_path), fmt="csv")
+
+    header = (tmp_path / "results.csv").read_text(encoding="utf-8").splitlines()[0]
+    assert "person_a_出演" in header
@@ -0,0 +1,218 @@
+"""結果ストアのテスト"""
+
+import json
+import multiprocessing
+import os
+
+from src.output.result_store import COMPACT_MIN_STALE, ResultStore
+from src.pipeline import PerformerResult, VideoAnalysisResult
+
+
+def _result(video_name: str, detected: bool = True) -> VideoAnalysisResult:
+    return VideoAnalysisResult(
+        video_path=f"/tmp/{video_name}",
+        video_name=video_name,
+        duration=60.0,
+        performers=[PerformerResult("person_a", "A", detected, voice_score=0.8)],
+        detected_count=int(detected),
+    )
+
+
+def _append_results(output_dir, prefix: str, count: int) -> None:
+    """別プロセスから1件ずつ追記する"""
+    store = ResultStore(output_dir)
+    for i in range(count):
+        store.put(_result(f"{prefix}{i}.mp4"))
+
+
+def _open_store(output_dir, start) -> None:
+    """別プロセスで一斉に結果ストアを開く"""
+    start.wait()
+    ResultStore(output_dir)
+
+
+class TestResultStore:
+    def test_put_appends_one_line(self, tmp_path):
+        store = ResultStore(tmp_path)
+        store.put(_result("a.mp4"))
+        size = store.path.stat().st_size
+
+        store.put(_result("b.mp4"))
+
+        lines = store.path.read_text(encoding="utf-8").splitlines()
+        assert len(lines) == 2
+        assert store.path.stat().st_size - size == len(lines[1].encode("utf-8")) + 1
+
+    def test_latest_result_wins(self, tmp_path):
+        store = ResultStore(tmp_path)
+        store.put_many([_result("a.mp4", detected=False), _result("b.mp4")])
+        store.put(_result("a.mp4", detected=True))
+
+        reopened = ResultStore(tmp_path)
+
+        assert reopened.names() == {"a.mp4", "b.mp4"}
+        assert [r["video"] for r in reopened.records()] == ["a.mp4", "b.mp4"]
+        assert reopened.get("a.mp4")["detected_count"] == 1
+        assert reopened.get("missing.mp4") is None
+        assert reopened.stale_ratio == 1 / 3
+
+    def test_truncated_line_is_skipped(self, tmp_path):
+        store = ResultStore(tmp_path)
+        store.put(_result("a.mp4"))
+        with open(store.path, "a", encoding="utf-8") as f:
+            f.write('{"video": "b.mp4", "dura')  # 書き込み途中で停止
+
+        reopened = ResultStore(tmp_path)
+        reopened.put(_result("c.mp4"))
+
+        assert [r["video"] for r in ResultStore(tmp_path).records()] == ["a.mp4", "c.mp4"]
+
+    def test_compact_keeps_latest(self, tmp_path):
+        store = ResultStore(tmp_path)
+        for _ in range(COMPACT_MIN_STALE + 1):
+            store.put(_result("a.mp4", detected=False))
+        store.put(_result("a.mp4", detected=True))
+        assert store.needs_compaction()
+
+        store.compact()
+
+        assert len(store.path.read_text(encoding="utf-8").splitlines()) == 1
+        assert store.get("a.mp4")["detected_count"] == 1
+        assert not store.needs_compaction()
+
+    def test_imports_legacy_results_json(self, tmp_path):
+        legacy = {"total_videos": 1, "results": [_result("old.mp4").to_dict()]}
+        (tmp_path / "results.json").write_text(json.dumps(legacy), encoding="utf-8")
+
+        store = ResultStore(tmp_path)
+
+        assert store.names() == {"old.mp4"}
+        assert store.path.exists()
+
+    def test_legacy_imported_once_by_concurrent_processes(self, tmp_path):
+        legacy = {"results": [_result(f"old{i}.mp4").to_dict() for i in range(3000)]}
+        (tmp_path / "results.json").write_text(json.dumps(legacy), encoding="utf-8")
+        ctx = multiprocessing.get_context("spawn")
+        start = ctx.Event()
+        openers = [ctx.Process(target=_open_store, args=(tmp_path, start)) for _ in range(4)]
+        for p in openers:
+            p.start()
+        start.set()
+        for p in openers:
+            p.join()
+
+        assert len(ResultStore(tmp_path).path.read_text(encoding="utf-8").splitlines()) == 3000
+
+    def test_records_reread_only_after_change(self, tmp_path, monkeypatch):
+        store = ResultStore(tmp_path)
+        store.put(_result("a.mp4"))
+        reads = []
+        read_records = store._read_records
+        monkeypatch.setattr(store, "_read_records", lambda: reads.append(1) or read_records())
+
+        assert [r["video"] for r in store.records()] == ["a.mp4"]
+        store.records()
+        assert len(reads) == 1
+
+        ResultStore(tmp_path).put(_result("b.mp4"))
+
+        assert [r["video"] for r in store.records()] == ["a.mp4", "b.mp4"]
+        assert len(reads) == 2
+
+
+class TestFingerprintKeys:
+    def _video(self, path, data=None):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data or os.urandom(1000))
+        return path
+
+    def test_results_keyed_by_content(self, tmp_path):
+        out = tmp_path / "out"
+        a = self._video(tmp_path / "x" / "clip.mp4")
+        b = self._video(tmp_path / "y" / "clip.mp4")
+        store = ResultStore(out)
+
+        for video in (a, b):
+            store.put(VideoAnalysisResult(video_path=str(video), video_name=video.name,
+                                          duration=1.0))
+
+        records = ResultStore(out).records()
+        assert len(records) == 2
+        assert records[0]["fingerprint"] != records[1]["fingerprint"]
+
+    def test_get_same_name_by_fingerprint(self, tmp_path):
+        out = tmp_path / "out"
+        store = ResultStore(out)
+        fingerprints = []
+        for folder, count in (("x", 1), ("y", 2)):
+            video = self._video(tmp_path / folder / "clip.mp4")
+            result = VideoAnalysisResult(video_path=str(video), video_name="clip.mp4",
+                                         duration=1.0, detected_count=count)
+            store.put(result)
+            fingerprints.append(result.fingerprint)
+
+        reopened = ResultStore(out)
+        # 動画名だけでは区別できず、最後に保存された結果を返す
+        assert reopened.get("clip.mp4")["detected_count"] == 2
+        assert reopened.get("clip.mp4", fingerprint=fingerprints[0])["detected_count"] == 1
+        assert reopened.get("clip.mp4", fingerprint=fingerprints[1])["detected_count"] == 2
+        assert reopened.get("clip.mp4", fingerprint="unknown") is None
+
+    def test_renamed_video_is_skipped(self, tmp_path):
+        out = tmp_path / "out"
+        video = self._video(tmp_path / "v" / "old.mp4")
+        ResultStore(out).put(VideoAnalysisResult(video_path=str(video), video_name="old.mp4",
+                                                 duration=1.0))
+        renamed = video.rename(tmp_path / "v" / "new.mp4")
+        other = self._video(tmp_path / "v" / "other.mp4")
+
+        assert ResultStore(out).unanalyzed([renamed, other]) == [other]
+
+    def test_legacy_results_matched_by_name_once(self, tmp_path):
+        out = tmp_path / "out"
+        legacy = {"total_videos": 1, "results": [_result("clip.mp4").to_dict()]}
+        out.mkdir()
+        (out / "results.json").write_text(json.dumps(legacy), encoding="utf-8")
+        first = self._video(tmp_path / "a" / "clip.mp4")
+        second = self._video(tmp_path / "b" / "clip.mp4")
+
+        assert ResultStore(out).unanalyzed([first, second]) == [second]
+
+    def test_fingerprinted_result_replaces_legacy_row(self, tmp_path):
+        out = tmp_path / "out"
+        ResultStore(out).put(_result("clip.mp4", detected=False))
+        video = self._video(tmp_path / "v" / "clip.mp4")
+
+        ResultStore(out).put(VideoAnalysisResult(video_path=str(video), video_name="clip.mp4",
+                                                 duration=1.0, detected_count=1))
+
+        records = ResultStore(out).records()
+        assert [(r["video"], r["detected_count"]) for r in records] == [("clip.mp4", 1)]
+
+    def test_compact_keeps_lines_appended_by_other_processes(self, tmp_path):
+        store = ResultStore(tmp_path)
+        for _ in range(3):
+            store.put_many([_result(f"old{i}.mp4") for i in range(20)])
+        ctx = multiprocessing.get_context("spawn")
+        writers = [ctx.Process(target=_append_results, args=(tmp_path, f"w{n}_", 150))
+                   for n in range(2)]
+        for p in writers:
+            p.start()
+        while any(p.is_alive() for p in writers):
+            store.put(_result("old0.mp4"))
+            store.compact()
+        for p in writers:
+            p.join()
+
+        names = ResultStore(tmp_path).names()
+        assert len(names) == 20 + 2 * 150
+
+    def test_index_follows_compaction_by_other_process(self, tmp_path):
+        store = ResultStore(tmp_path)
+        store.put_many([_result("a.mp4", detected=False), _result("a.mp4"), _result("b.mp4")])
+        assert store.get("b.mp4")["video"] == "b.mp4"
+
+        ResultStore(tmp_path).compact()
+
+        assert store.get("b.mp4")["video"] == "b.mp4"
+        assert store.get("a.mp4")["detected_count"] == 1
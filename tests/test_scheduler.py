@@ -0,0 +1,200 @@
+"""ステージ並列スケジューラのテスト"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.pipeline import AnalysisPipeline, DecodedAudio, VideoAnalysisResult, VoiceAnalysis
+from src.scheduler import StageScheduler
+
+
+class _FakePipeline:
+    """各ステージの実行区間を記録する擬似パイプライン"""
+
+    def __init__(self, visual_enabled=False, decode_sec=0.03, voice_sec=0.06, visual_sec=0.06):
+        self.config = {}
+        self.visual_enabled = visual_enabled
+        self.decode_sec, self.voice_sec, self.visual_sec = decode_sec, voice_sec, visual_sec
+        self.spans: list[tuple[str, str, float, float]] = []
+        self.finalized: list[str] = []
+        self._lock = threading.Lock()
+        self.decoded_waiting = 0
+        self.max_decoded_waiting = 0
+
+    def _span(self, stage, result, seconds):
+        start = time.perf_counter()
+        time.sleep(seconds)
+        with self._lock:
+            self.spans.append((stage, result.video_name, start, time.perf_counter()))
+
+    new_result = staticmethod(AnalysisPipeline.new_result)
+
+    def decode_audio(self, result):
+        if result.video_name.startswith("missing"):
+            result.errors.append("音声抽出エラー: not found")
+            return None
+        self._span("decode", result, self.decode_sec)
+        with self._lock:
+            self.decoded_waiting += 1
+            self.max_decoded_waiting = max(self.max_decoded_waiting, self.decoded_waiting)
+        return DecodedAudio(wav=np.zeros(16000, dtype=np.float32), sample_rate=16000)
+
+    def analyze_audio(self, result, decoded):
+        with self._lock:
+            self.decoded_waiting -= 1
+        if result.video_name.startswith("bad"):
+            raise RuntimeError("model crashed")
+        self._span("voice", result, self.voice_sec)
+        return VoiceAnalysis(results={"person_a": {"max_score": 0.9}})
+
+    def analyze_visual(self, result):
+        self._span("visual", result, self.visual_sec)
+        return {"person_a": {"max_score": 0.5}}
+
+    def finalize(self, result, voice, visual_results):
+        if result.video_name.startswith("unfinished"):
+            raise ValueError("broken threshold")
+        result.detected_count = 1
+        with self._lock:
+            self.finalized.append(result.video_name)
+
+    def span(self, stage, name):
+        return next((s, e) for st, n, s, e in self.spans if st == stage and n == name)
+
+
+class TestStageScheduler:
+    def test_results_cover_all_videos(self):
+        pipeline = _FakePipeline()
+        videos = [f"v{i}.mp4" for i in range(5)]
+
+        results = StageScheduler(pipeline).map(videos)
+
+        assert [r.video_name for r in results] == videos
+        assert all(isinstance(r, VideoAnalysisResult) and r.detected_count == 1 for r in results)
+
+    def test_decode_overlaps_voice(self):
+        pipeline = _FakePipeline()
+
+        StageScheduler(pipeline, decode_workers=1).map(["v0.mp4", "v1.mp4"])
+
+        # 動画0の声紋照合中に動画1の音声抽出が始まっている
+        voice0 = pipeline.span("voice", "v0.mp4")
+        decode1 = pipeline.span("decode", "v1.mp4")
+        assert decode1[0] < voice0[1]
+
+    def test_visual_runs_alongside_audio(self):
+        pipeline = _FakePipeline(visual_enabled=True)
+
+        results = StageScheduler(pipeline).map(["v0.mp4"])
+
+        voice0 = pipeline.span("voice", "v0.mp4")
+        visual0 = pipeline.span("visual", "v0.mp4")
+        assert visual0[0] < voice0[1] and voice0[0] < visual0[1]
+        assert results[0].detected_count == 1
+
+    def test_decoded_audio_bounded_by_queue(self):
+        pipeline = _FakePipeline(decode_sec=0.0, voice_sec=0.02)
+
+        StageScheduler(pipeline, decode_workers=2, queue_size=1).map(
+            [f"v{i}.mp4" for i in range(10)])
+
+        # キュー + 各ステージで処理中の分を超えて音声を溜め込まない
+        assert pipeline.max_decoded_waiting <= 1 + 2 + 1
+
+    def test_failures_recorded_per_video(self):
+        pipeline = _FakePipeline(visual_enabled=True)
+
+        results = StageScheduler(pipeline).map(["missing.mp4", "bad.mp4", "ok.mp4"])
+
+        assert results[0].errors == ["音声抽出エラー: not found"]
+        assert results[1].errors == ["声紋解析エラー: model crashed"]
+        assert results[2].errors == []
+        assert pipeline.finalized == ["ok.mp4"]
+
+    @pytest.mark.parametrize("visual_enabled", [False, True])
+    def test_finalize_error_recorded(self, visual_enabled):
+        pipeline = _FakePipeline(visual_enabled=visual_enabled)
+
+        results = StageScheduler(pipeline).map(["unfinished.mp4", "ok.mp4"])
+
+        assert results[0].errors == ["統合判定エラー: broken threshold"]
+        assert results[1].errors == [] and results[1].detected_count == 1
+
+    def test_early_stop(self):
+        pipeline = _FakePipeline(decode_sec=0.0, voice_sec=0.01)
+
+        for _ in StageScheduler(pipeline).run([f"v{i}.mp4" for i in range(20)]):
+            break
+
+        assert len(pipeline.finalized) < 20
+        deadline = time.monotonic() + 5
+        while [t for t in threading.enumerate() if t.name.startswith(("decode-", "voice-"))]:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+    def test_early_stop_skips_queued_videos(self):
+        pipeline = _FakePipeline(visual_enabled=True, decode_sec=0.0, voice_sec=0.3,
+                                 visual_sec=0.0)
+        pulled = []
+
+        def videos():
+            for i in range(20):
+                pulled.append(i)
+                yield f"v{i}.mp4"
+
+        results = StageScheduler(pipeline, queue_size=2).run(videos())
+        next(results)
+        pulled_before = len(pulled)
+        start = time.perf_counter()
+        results.close()
+
+        # 処理中の声紋照合（0.3 秒）の終了を待たずに戻り、キューに残った動画は解析しない
+        assert time.perf_counter() - start < 0.2
+        time.sleep(0.5)
+        assert len(pulled) == pulled_before
+        assert not [t for t in threading.enumerate() if t.name.startswith(("decode-", "voice-"))]
+        assert len({n for st, n, _, _ in pipeline.spans if st == "voice"}) <= 2
+
+    def test_videos_pulled_lazily(self):
+        pipeline = _FakePipeline(decode_sec=0.0, voice_sec=0.02)
+        pulled = []
+
+        def videos():
+            for i in range(10):
+                pulled.append(i)
+                yield f"v{i}.mp4"
+
+        results = StageScheduler(pipeline, decode_workers=1, queue_size=1).run(videos())
+        next(results)
+
+        # 1本目の完了時点では、キューとステージで処理中の分しか取り出していない
+        assert len(pulled) < 10
+        assert len(list(results)) == 9
+
+    def test_empty_input(self):
+        assert StageScheduler(_FakePipeline()).map([]) == []
+
+    def test_from_config(self):
+        pipeline = _FakePipeline()
+        pipeline.config = {"scheduler": {"decode_workers": 3, "queue_size": 4}}
+
+        scheduler = StageScheduler.from_config(pipeline)
+
+        assert (scheduler.decode_workers, scheduler.voice_workers, scheduler.queue_size) == (3, 1, 4)
+
+    def test_invalid_concurrency(self):
+        with pytest.raises(ValueError):
+            StageScheduler(_FakePipeline(), voice_workers=0)
+
+
+class TestAnalyzeStream:
+    def test_sequential_when_disabled(self):
+        pipeline = AnalysisPipeline.__new__(AnalysisPipeline)
+        pipeline.config = {"scheduler": {"enabled": False}}
+        pipeline.analyze_video = lambda path: AnalysisPipeline.new_result(path)
+
+        results = list(pipeline.analyze_stream(["a.mp4", "b.mp4"]))
+
+        assert [(i, r.video_name) for i, r in results] == [(0, "a.mp4"), (1, "b.mp4")]
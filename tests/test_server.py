@@ -0,0 +1,151 @@
+"""常駐解析デーモンのテスト"""
+
+import logging
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from src.pipeline import AnalysisPipeline, PerformerResult, VideoAnalysisResult
+from src.server import (
+    AnalysisService,
+    RemoteClient,
+    ServerError,
+    create_server,
+    decode_result,
+    encode_result,
+    parse_address,
+)
+
+_pipeline_logger = logging.getLogger("src.pipeline")
+
+
+class _FakePipeline:
+    instances = 0
+
+    def __init__(self, config_path, mode=None):
+        type(self).instances += 1
+        self.mode = mode
+
+    def setup(self, enable_visual=False, hf_token=None):
+        pass
+
+    def close(self):
+        pass
+
+    def analyze_stream(self, videos):
+        for index, video in reversed(list(enumerate(videos))):
+            _pipeline_logger.info("解析中: %s", video)
+            result = AnalysisPipeline.new_result(video)
+            result.performers = [PerformerResult(person_id="person_a", name="A", detected=True,
+                                                 voice_score=0.9)]
+            yield index, result
+
+
+@pytest.fixture
+def service():
+    _FakePipeline.instances = 0
+    with patch("src.server.AnalysisPipeline", _FakePipeline):
+        yield AnalysisService("config.yaml")
+
+
+class TestParseAddress:
+    def test_unix_socket(self):
+        assert parse_address(".cache/analyzer.sock") == ".cache/analyzer.sock"
+        assert parse_address("/tmp/a:1/sock") == "/tmp/a:1/sock"
+
+    def test_tcp(self):
+        assert parse_address("127.0.0.1:8765") == ("127.0.0.1", 8765)
+        assert parse_address(":8765") == ("127.0.0.1", 8765)
+
+
+class TestResultEncoding:
+    def test_round_trip(self):
+        result = VideoAnalysisResult(
+            video_path="/v/a.mp4", video_name="a.mp4", duration=12.5,
+            performers=[PerformerResult(person_id="person_a", name="A", detected=True)],
+            detected_count=1, errors=["x"],
+        )
+        assert decode_result(encode_result(result)) == result
+
+
+class TestAnalysisService:
+    def test_analyze_streams_logs_and_results(self, service):
+        messages = []
+        service.handle({"cmd": "analyze", "videos": ["/v/a.mp4", "/v/b.mp4"]}, messages.append)
+
+        events = [m["event"] for m in messages]
+        assert events.count("result") == 2
+        assert "log" in events
+        assert events[-1] == "done"
+
+    def test_pipeline_reused_across_jobs(self, service):
+        for _ in range(3):
+            service.handle({"cmd": "analyze", "videos": ["/v/a.mp4"]}, lambda m: None)
+        service.handle({"cmd": "analyze", "videos": ["/v/a.mp4"], "mode": "targeted"},
+                       lambda m: None)
+
+        assert _FakePipeline.instances == 2
+        assert service.jobs == 4
+
+    def test_unknown_command(self, service):
+        messages = []
+        service.handle({"cmd": "explode"}, messages.append)
+        assert messages[0]["event"] == "error"
+
+    def test_shutdown(self, service):
+        assert service.handle({"cmd": "shutdown"}, lambda m: None) is True
+
+
+class TestDaemon:
+    @pytest.fixture
+    def daemon(self, service, tmp_path):
+        address = str(tmp_path / "analyzer.sock")
+        server = create_server(service, address)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield address
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    def test_remote_analyze(self, daemon, tmp_path):
+        logs = []
+        client = RemoteClient(daemon, timeout=10.0)
+
+        results = dict(client.analyze([tmp_path / "a.mp4", tmp_path / "b.mp4"],
+                                      on_log=logs.append))
+
+        assert [results[i].video_name for i in sorted(results)] == ["a.mp4", "b.mp4"]
+        assert results[0].performers[0].voice_score == 0.9
+        assert any("a.mp4" in line for line in logs)
+        assert client.ping()["jobs"] == 1
+
+    def test_second_daemon_refused(self, daemon, service):
+        with pytest.raises(RuntimeError):
+            create_server(service, daemon)
+
+    def test_server_error_raised(self, daemon):
+        with pytest.raises(ServerError):
+            list(RemoteClient(daemon, timeout=10.0).request({"cmd": "explode"}))
+
+    def test_stale_socket_replaced(self, service, tmp_path):
+        stale = tmp_path / "stale.sock"
+        stale.touch()
+        server = create_server(service, str(stale))
+        server.server_close()
+
+    def test_tcp(self, service):
+        server = create_server(service, "127.0.0.1:0")
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            host, port = server.server_address
+            assert RemoteClient(f"{host}:{port}", timeout=10.0).ping()["event"] == "done"
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_not_running(self, tmp_path):
+        with pytest.raises(OSError):
+            RemoteClient(str(tmp_path / "none.sock"), timeout=1.0).ping()
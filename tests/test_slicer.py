@@ -0,0 +1,36 @@
+"""音声区間スライサーのテスト"""
+
+import numpy as np
+
+from src.audio.slicer import AudioSlicer, pcm_to_float32
+
+
+class TestPcmToFloat32:
+    def test_int16_scaled(self):
+        out = pcm_to_float32(np.array([0, 16384, -32768], dtype=np.int16))
+        assert out.dtype == np.float32
+        np.testing.assert_allclose(out, [0.0, 0.5, -1.0])
+
+    def test_float_passthrough(self):
+        wav = np.array([0.1, -0.2], dtype=np.float32)
+        assert pcm_to_float32(wav) is wav
+
+
+class TestAudioSlicer:
+    def test_slice_is_view(self):
+        samples = np.arange(16000 * 3, dtype=np.int16)
+        slicer = AudioSlicer(samples, sample_rate=16000)
+
+        view = slicer.slice(1.0, 2.0)
+
+        assert len(view) == 16000
+        assert view[0] == 16000
+        assert np.shares_memory(view, samples)
+
+    def test_slice_clipped_to_bounds(self):
+        slicer = AudioSlicer(np.zeros(16000, dtype=np.int16), sample_rate=16000)
+
+        assert len(slicer.slice(-1.0, 0.5)) == 8000
+        assert len(slicer.slice(0.5, 10.0)) == 8000
+        assert len(slicer.slice(2.0, 3.0)) == 0
+
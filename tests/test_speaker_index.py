@@ -0,0 +1,57 @@
+"""話者近似最近傍インデックスのテスト"""
+
+import numpy as np
+import pytest
+
+from src.audio.speaker_index import SpeakerIndex, index_path_for
+
+
+def _clustered_speakers(n_speakers: int = 2000, dim: int = 64, n_groups: int = 40,
+                        seed: int = 0) -> tuple[list[str], np.ndarray]:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_groups, dim))
+    groups = rng.integers(0, n_groups, n_speakers)
+    matrix = centers[groups] + 0.3 * rng.standard_normal((n_speakers, dim))
+    return [f"person_{i}" for i in range(n_speakers)], matrix.astype(np.float32)
+
+
+class TestSpeakerIndex:
+    def test_exact_search_finds_self(self):
+        ids, matrix = _clustered_speakers(200)
+        index = SpeakerIndex.build(ids, matrix, n_lists=10)
+
+        top = index.exact_search(matrix[5], k=3)
+
+        assert top[0][0][0] == "person_5"
+        assert top[0][0][1] == pytest.approx(1.0, abs=1e-5)
+        assert len(top[0]) == 3
+
+    def test_recall_against_exact(self):
+        ids, matrix = _clustered_speakers()
+        index = SpeakerIndex.build(ids, matrix)
+        rng = np.random.default_rng(1)
+        queries = matrix[rng.choice(len(matrix), 100, replace=False)]
+        queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+
+        assert index.recall_at_k(queries, k=5, n_probe=8) >= 0.9
+        assert index.recall_at_k(queries, k=5, n_probe=index.n_lists) == pytest.approx(1.0)
+
+    def test_save_and_load(self, tmp_path):
+        ids, matrix = _clustered_speakers(300)
+        index = SpeakerIndex.build(ids, matrix)
+        path = index.save(tmp_path / "refs.index.npz")
+
+        loaded = SpeakerIndex.load(path)
+
+        assert loaded.ids == ids
+        assert loaded.matches(ids, matrix)
+        assert not loaded.matches(ids, matrix * 2)
+        assert loaded.search(matrix[7], k=1) == index.search(matrix[7], k=1)
+
+    def test_length_mismatch(self):
+        with pytest.raises(ValueError, match="一致しません"):
+            SpeakerIndex.build(["a"], np.zeros((2, 4)))
+
+    def test_index_path_for(self):
+        path = index_path_for("data/reference_voices")
+        assert str(path).replace("\\", "/") == "data/reference_voices.index.npz"
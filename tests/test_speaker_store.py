@@ -0,0 +1,115 @@
+"""基準話者ストアのテスト"""
+
+import os
+
+import numpy as np
+import pytest
+
+from src.audio.speaker_store import SpeakerStore, scan_reference_dir, store_path_for
+
+
+@pytest.fixture
+def reference_dir(tmp_path):
+    ref = tmp_path / "reference_voices"
+    for person, files in {"person_a": ["a1.wav", "a2.wav"], "person_b": ["b1.mp3"]}.items():
+        (ref / person).mkdir(parents=True)
+        for name in files:
+            (ref / person / name).write_bytes(name.encode())
+    (ref / "person_c").mkdir()  # 未登録
+    return ref
+
+
+class FakeEmbedder:
+    """ファイル名の先頭文字から決まる声紋ベクトルを返す"""
+
+    def __init__(self):
+        self.calls: list[list[str]] = []
+
+    def __call__(self, paths):
+        self.calls.append(list(paths))
+        rows = []
+        for p in paths:
+            name = os.path.basename(p)
+            rows.append([1.0, 0.0] if name.startswith("a") else [0.0, 1.0])
+            if name.endswith("2.wav"):
+                rows[-1] = [0.5, 0.5]
+        return np.array(rows, dtype=np.float32)
+
+
+class TestScanReferenceDir:
+    def test_scan(self, reference_dir):
+        entries = scan_reference_dir(str(reference_dir))
+        assert [(sid, p.name) for sid, p in entries] == [
+            ("person_a", "a1.wav"), ("person_a", "a2.wav"), ("person_b", "b1.mp3"),
+        ]
+
+    def test_missing_dir(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            scan_reference_dir(str(tmp_path / "missing"))
+
+
+class TestSpeakerStore:
+    def test_sync_and_centroids(self, reference_dir):
+        store = SpeakerStore()
+        embed = FakeEmbedder()
+
+        assert store.sync(str(reference_dir), embed) is True
+
+        centroids = store.centroids()
+        assert set(centroids) == {"person_a", "person_b"}
+        np.testing.assert_allclose(centroids["person_a"], [0.75, 0.25])
+        assert store.file_counts() == {"person_a": 2, "person_b": 1}
+
+    def test_incremental_sync(self, reference_dir, tmp_path):
+        path = store_path_for(str(reference_dir))
+        embed = FakeEmbedder()
+        store = SpeakerStore()
+        store.sync(str(reference_dir), embed)
+        store.save(path)
+
+        reloaded = SpeakerStore.load(path)
+        assert reloaded.sync(str(reference_dir), embed) is False
+        assert len(embed.calls) == 1
+
+        (reference_dir / "person_a" / "a1.wav").write_bytes(b"changed content")
+        (reference_dir / "person_b" / "b1.mp3").unlink()
+        assert reloaded.sync(str(reference_dir), embed) is True
+
+        assert embed.calls[-1] == [str(reference_dir / "person_a" / "a1.wav")]
+        assert set(reloaded.centroids()) == {"person_a"}
+
+    def test_model_mismatch_starts_empty(self, reference_dir, tmp_path):
+        path = tmp_path / "store.npz"
+        store = SpeakerStore(model="resemblyzer")
+        store.sync(str(reference_dir), FakeEmbedder())
+        store.save(path)
+
+        other = SpeakerStore.load(path, model="pyannote")
+        assert other.files == []
+
+    def test_silent_file_excluded_from_centroid(self, reference_dir):
+        store = SpeakerStore()
+        store.sync(str(reference_dir),
+                   lambda paths: np.array([[0.0, 0.0] if "a2" in p else [1.0, 0.0] for p in paths]))
+
+        np.testing.assert_allclose(store.centroids()["person_a"], [1.0, 0.0])
+
+    def test_unembeddable_file_added_to_existing_store(self, reference_dir):
+        store = SpeakerStore()
+        store.sync(str(reference_dir), FakeEmbedder())
+        (reference_dir / "person_b" / "b2.wav").write_bytes(b"")
+
+        # 短すぎる音声だけを計算すると embed_utterances は (N × 0) の行列を返す
+        empty = lambda paths: np.zeros((len(paths), 0), dtype=np.float32)  # noqa: E731
+        assert store.sync(str(reference_dir), empty) is False
+        assert "person_b/b2.wav" not in store.files
+        assert store.embeddings.shape == (3, 2)
+
+        (reference_dir / "person_a" / "a1.wav").write_bytes(b"changed content")
+        assert store.sync(str(reference_dir), empty) is True
+        assert store.files == ["person_a/a2.wav", "person_b/b1.mp3"]
+        assert store.sizes.tolist() == [6, 6] and store.embeddings.shape == (2, 2)
+
+    def test_store_path_for(self):
+        path = store_path_for("data/reference_voices")
+        assert path.as_posix() == "data/reference_voices.resemblyzer.npz"
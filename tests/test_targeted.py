@@ -0,0 +1,113 @@
+"""対象話者検出のテスト"""
+
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from src.audio.targeted import TargetedDetector, active_intervals, smooth_scores
+from src.audio.vad import SpeechMask
+
+SR = 16000
+
+
+class TestSmoothScores:
+    def test_moving_average(self):
+        scores = np.array([[0.0], [0.0], [3.0], [0.0], [0.0]], dtype=np.float32)
+        smoothed = smooth_scores(scores, 3)
+        np.testing.assert_allclose(smoothed[:, 0], [0.0, 1.0, 1.0, 1.0, 0.0])
+
+    def test_edges_use_valid_range(self):
+        scores = np.ones((4, 2), dtype=np.float32)
+        np.testing.assert_allclose(smooth_scores(scores, 5), 1.0)
+
+    def test_width_one_is_identity(self):
+        scores = np.random.default_rng(0).random((6, 3))
+        assert smooth_scores(scores, 1) is scores
+
+
+class TestActiveIntervals:
+    def test_runs_become_intervals(self):
+        active = np.array([True, True, False, False, True, False, True, True, True])
+        starts = np.arange(len(active)) * 0.75
+        intervals = active_intervals(active, starts, 1.5, min_interval_sec=2.0)
+        # 単独ウィンドウ（1.5秒）の区間は捨てられる
+        assert intervals == [(0.0, 2.25), (4.5, 7.5)]
+
+
+@pytest.fixture
+def matcher():
+    """2人の基準話者を持つ VoiceMatcher のモック"""
+    m = MagicMock()
+    m.reference_embeddings = {"person_a": np.array([1.0, 0.0]), "person_b": np.array([0.0, 1.0])}
+    m.speaker_ids = ["person_a", "person_b"]
+    m.threshold = 0.75
+    m.batch_size = 8
+    m.score_matrix.side_effect = lambda emb: emb @ np.eye(2, dtype=np.float32)
+    return m
+
+
+def _fake_windows(pattern):
+    """ウィンドウごとに person_a / person_b / 無関係のベクトルを返す embed_windows"""
+    vectors = {"a": [1.0, 0.0], "b": [0.0, 1.0], "-": [0.5, 0.5]}
+
+    def fake(encoder, wav, window, step, batch_size):
+        n = len(range(0, len(wav) - window + 1, step))
+        assert n == len(pattern)
+        return (np.array([vectors[c] for c in pattern], dtype=np.float32),
+                np.arange(n, dtype=np.int64) * step)
+    return fake
+
+
+class TestTargetedDetector:
+    def test_detects_speaking_intervals(self, matcher):
+        # 1.5秒窓 / 0.75秒刻みで 12 秒 → 15 ウィンドウ
+        pattern = "aaaaaa---bbbb--"
+        wav = np.zeros(12 * SR, dtype=np.float32)
+        detector = TargetedDetector(matcher, smoothing_windows=1)
+
+        with patch("src.audio.targeted.normalize_wav", side_effect=lambda w, sr: w), \
+                patch("src.audio.targeted.embed_windows", side_effect=_fake_windows(pattern)):
+            results = detector.detect(wav, SR)
+
+        assert results["person_a"]["intervals"] == [(0.0, 5.25)]
+        assert results["person_b"]["intervals"] == [(6.75, 10.5)]
+        assert results["person_a"]["speaking_time"] == pytest.approx(5.25)
+        assert results["person_b"]["matching_segments"] == 1
+        assert results["person_a"]["total_segments"] == 15
+        assert results["person_a"]["max_score"] == pytest.approx(1.0)
+
+    def test_smoothing_removes_isolated_window(self, matcher):
+        pattern = "---a---"
+        wav = np.zeros(6 * SR, dtype=np.float32)
+        detector = TargetedDetector(matcher, smoothing_windows=3, min_interval_sec=0.0)
+
+        with patch("src.audio.targeted.normalize_wav", side_effect=lambda w, sr: w), \
+                patch("src.audio.targeted.embed_windows", side_effect=_fake_windows(pattern)):
+            results = detector.detect(wav, SR)
+
+        assert results["person_a"]["intervals"] == []
+
+    def test_intervals_mapped_through_speech_mask(self, matcher):
+        pattern = "aaaa"  # 音声区間の合計 4 秒 → 4 ウィンドウ（連結後 0〜3.75 秒）
+        wav = np.zeros(20 * SR, dtype=np.float32)
+        mask = SpeechMask(intervals=np.array([[2.0, 4.0], [10.0, 12.0]]), duration=20.0)
+        detector = TargetedDetector(matcher, smoothing_windows=1)
+
+        with patch("src.audio.targeted.normalize_wav", side_effect=lambda w, sr: w), \
+                patch("src.audio.targeted.embed_windows", side_effect=_fake_windows(pattern)):
+            results = detector.detect(wav, SR, mask)
+
+        assert results["person_a"]["intervals"] == [(2.0, 4.0), (10.0, 11.75)]
+        assert results["person_a"]["speaking_time"] == pytest.approx(3.75)
+
+    def test_no_speech(self, matcher):
+        mask = SpeechMask(intervals=np.zeros((0, 2)), duration=5.0)
+        results = TargetedDetector(matcher).detect(np.zeros(5 * SR, dtype=np.float32), SR, mask)
+        assert results["person_a"]["max_score"] == 0.0
+        assert results["person_b"]["intervals"] == []
+
+    def test_requires_references(self, matcher):
+        matcher.reference_embeddings = {}
+        with pytest.raises(RuntimeError, match="基準話者"):
+            TargetedDetector(matcher).detect(np.zeros(SR, dtype=np.float32), SR)
@@ -0,0 +1,99 @@
+"""音声区間検出のテスト"""
+
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from src.audio.vad import SpeechMask, detect_speech
+
+SR = 16000
+
+
+def _speech_like(seconds: float, seed: int = 0) -> np.ndarray:
+    """倍音と振幅変調を持つ音声らしい合成波形"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SR)) / SR
+    f0 = 140 * (1 + 0.1 * np.sin(2 * np.pi * 2 * t))
+    phase = 2 * np.pi * np.cumsum(f0) / SR
+    tone = sum(np.sin(k * phase) / k for k in range(1, 10))
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+    return (0.2 * tone * envelope + 0.002 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def _with_silence() -> np.ndarray:
+    """無音 2秒 → 音声 3秒 → 無音 3秒 → 音声 2秒"""
+    silence = lambda sec: np.zeros(int(sec * SR), dtype=np.float32)
+    return np.concatenate([silence(2), _speech_like(3, 1), silence(3), _speech_like(2, 2)])
+
+
+class TestSpeechMask:
+    @pytest.fixture
+    def mask(self):
+        return SpeechMask(intervals=np.array([[1.0, 2.0], [4.0, 6.0]]), duration=10.0)
+
+    def test_ratios(self, mask):
+        assert mask.speech_time == pytest.approx(3.0)
+        assert mask.skipped_ratio == pytest.approx(0.7)
+
+    def test_extract(self, mask):
+        wav = np.arange(10 * SR, dtype=np.float32)
+        voiced = mask.extract(wav, SR)
+        assert len(voiced) == 3 * SR
+        assert voiced[0] == SR and voiced[SR] == 4 * SR
+
+    def test_extract_single_interval_is_view(self):
+        wav = np.zeros(4 * SR, dtype=np.float32)
+        voiced = SpeechMask(intervals=np.array([[1.0, 2.0]]), duration=4.0).extract(wav, SR)
+        assert np.shares_memory(voiced, wav)
+
+    def test_clip(self, mask):
+        assert mask.clip(1.5, 5.0) == [(1.5, 2.0), (4.0, 5.0)]
+        assert mask.clip(2.5, 3.5) == []
+
+    def test_to_original_splits_across_gaps(self, mask):
+        # 連結後の 0.5〜2.0 秒 = 元の 1.5〜2.0 秒 + 4.0〜5.0 秒
+        assert mask.to_original(0.5, 2.0) == [(1.5, 2.0), (4.0, 5.0)]
+
+    def test_full(self):
+        mask = SpeechMask.full(5.0)
+        assert mask.skipped_ratio == 0.0
+        assert SpeechMask.full(0.0).speech_time == 0.0
+
+
+class TestDetectSpeech:
+    def test_finds_speech_regions(self):
+        mask = detect_speech(_with_silence(), SR)
+
+        assert len(mask.intervals) == 2
+        np.testing.assert_allclose(mask.intervals, [[2.0, 5.0], [8.0, 10.0]], atol=0.2)
+        assert mask.skipped_ratio == pytest.approx(0.5, abs=0.05)
+
+    def test_energy_fallback(self):
+        with patch("src.audio.vad._webrtc_flags", return_value=None):
+            mask = detect_speech(_with_silence(), SR)
+
+        assert len(mask.intervals) == 2
+        np.testing.assert_allclose(mask.intervals, [[2.0, 5.0], [8.0, 10.0]], atol=0.2)
+
+    def test_unsupported_rate_uses_energy(self):
+        wav = np.concatenate([np.zeros(22050, dtype=np.float32),
+                              _speech_like(2)[:44100]])
+        mask = detect_speech(wav, 22050)
+        assert len(mask.intervals) == 1
+        assert mask.intervals[0, 0] == pytest.approx(1.0, abs=0.2)
+
+    def test_silence(self):
+        mask = detect_speech(np.zeros(3 * SR, dtype=np.float32), SR)
+        assert len(mask.intervals) == 0
+        assert mask.skipped_ratio == 1.0
+
+    def test_short_bursts_dropped(self):
+        wav = np.zeros(3 * SR, dtype=np.float32)
+        wav[SR:SR + 1600] = _speech_like(0.1)
+        mask = detect_speech(wav, SR, min_speech_sec=0.5, pad_sec=0.0)
+        assert len(mask.intervals) == 0
+
+    def test_int16_input(self):
+        wav = (_with_silence() * 32767).astype(np.int16)
+        assert len(detect_speech(wav, SR).intervals) == 2
@@ -6,15 +6,24 @@ import numpy as np
 import pytest
 
 from src.audio.voice_matcher import VoiceMatcher
+from src.models import registry
 
 
 @pytest.fixture
 def mock_encoder():
     """VoiceEncoder のモック"""
-    with patch("src.audio.voice_matcher.VoiceEncoder") as MockEncoder:
+    # 共有レジストリに前のテストのモックが残らないようにする
+    registry.clear()
+    with patch("src.audio.voice_matcher.VoiceEncoder") as MockEncoder, \
+            patch("src.audio.voice_matcher.embed_utterances") as mock_batch:
         encoder_instance = MagicMock()
         MockEncoder.return_value = encoder_instance
+        # バッチ推論は発話ごとの embed_utterance の結果を並べたものとして扱う
+        mock_batch.side_effect = lambda encoder, wavs, **kwargs: np.array(
+            [encoder.embed_utterance(w) for w in wavs]
+        )
         yield encoder_instance
+    registry.clear()
 
 
 @pytest.fixture
@@ -127,3 +136,264 @@ class TestCompareSegments:
         assert "person_b" in results
         assert results["person_a"]["total_segments"] == 2
         assert results["person_b"]["total_segments"] == 2
+
+    @patch("src.audio.voice_matcher.preprocess_wav")
+    def test_compare_segments_in_memory(self, mock_preprocess, matcher, mock_encoder):
+        matcher.reference_embeddings = {
+            "person_a": np.array([1.0, 0.0, 0.0]),
+        }
+
+        mock_preprocess.side_effect = lambda wav, source_sr=None: wav
+        mock_encoder.embed_utterance.return_value = np.array([0.9, 0.1, 0.0])
+
+        pcm = np.full(16000, 1000, dtype=np.int16)
+        segments = [
+            {"start": 0.0, "end": 0.5, "wav": pcm[:8000], "sample_rate": 16000},
+            {"start": 0.5, "end": 1.0, "wav": pcm[8000:], "sample_rate": 16000},
+        ]
+
+        results = matcher.compare_segments(segments)
+
+        assert results["person_a"]["total_segments"] == 2
+        passed = mock_preprocess.call_args[0][0]
+        assert passed.dtype == np.float32
+        assert mock_preprocess.call_args[1]["source_sr"] is None
+
+    @patch("src.audio.voice_matcher.preprocess_wav")
+    def test_compare_segments_embeds_each_segment_once(self, mock_preprocess, matcher, mock_encoder):
+        matcher.reference_embeddings = {
+            "person_a": np.array([1.0, 0.0, 0.0]),
+            "person_b": np.array([0.0, 1.0, 0.0]),
+            "person_c": np.array([0.0, 0.0, 1.0]),
+        }
+
+        mock_preprocess.return_value = np.zeros(16000)
+        mock_encoder.embed_utterance.side_effect = [
+            np.array([0.9, 0.1, 0.0]),   # person_a
+            np.array([0.1, 0.9, 0.0]),   # person_b
+            np.array([0.95, 0.05, 0.0]), # person_a
+        ]
+
+        segments = [
+            {"start": 0.0, "end": 2.0, "audio_path": "seg1.wav"},
+            {"start": 2.0, "end": 5.0, "audio_path": "seg2.wav"},
+            {"start": 5.0, "end": 6.5, "audio_path": "seg3.wav"},
+        ]
+
+        results = matcher.compare_segments(segments)
+
+        assert mock_encoder.embed_utterance.call_count == 3
+        assert results["person_a"]["matching_segments"] == 2
+        assert results["person_a"]["speaking_time"] == pytest.approx(3.5)
+        assert results["person_b"]["speaking_time"] == pytest.approx(3.0)
+        assert results["person_c"]["speaking_time"] == 0.0
+        assert results["person_c"]["max_score"] == pytest.approx(0.0)
+
+    @patch("src.audio.voice_matcher.preprocess_wav")
+    def test_compare_segments_silent_segment_scores_zero(self, mock_preprocess, matcher, mock_encoder):
+        matcher.reference_embeddings = {
+            "person_a": np.array([1.0, 0.0, 0.0]),
+        }
+
+        mock_preprocess.side_effect = [np.array([]), np.zeros(16000)]
+        mock_encoder.embed_utterance.return_value = np.array([1.0, 0.0, 0.0])
+
+        segments = [
+            {"start": 0.0, "end": 1.0, "audio_path": "silent.wav"},
+            {"start": 1.0, "end": 2.0, "audio_path": "voice.wav"},
+        ]
+
+        results = matcher.compare_segments(segments)
+
+        assert results["person_a"]["avg_score"] == pytest.approx(0.5)
+        assert results["person_a"]["matching_segments"] == 1
+
+
+    @patch("src.audio.voice_matcher.preprocess_wav")
+    def test_embed_segments_uses_cache_in_bulk(self, mock_preprocess, mock_encoder, tmp_path):
+        from src.cache import EmbeddingCache
+
+        cache = EmbeddingCache(cache_dir=tmp_path / "cache")
+        matcher = VoiceMatcher(threshold=0.75, cache=cache)
+        mock_preprocess.return_value = np.zeros(16000)
+        mock_encoder.embed_utterance.return_value = np.array([0.9, 0.1, 0.0])
+        segments = []
+        for i in range(3):
+            path = tmp_path / f"seg{i}.wav"
+            path.write_bytes(f"segment {i}".encode())
+            segments.append({"start": float(i), "end": i + 1.0, "audio_path": str(path)})
+
+        first = matcher.embed_segments(segments)
+        second = matcher.embed_segments(segments)
+
+        assert mock_encoder.embed_utterance.call_count == 3
+        np.testing.assert_array_almost_equal(first, second)
+        assert cache.stats == {"hits": 3, "misses": 3}
+
+    @patch("src.audio.voice_matcher.preprocess_wav")
+    def test_embed_segments_by_cache_key(self, mock_preprocess, mock_encoder, tmp_path):
+        from src.cache import EmbeddingCache
+
+        cache = EmbeddingCache(cache_dir=tmp_path / "cache")
+        matcher = VoiceMatcher(threshold=0.75, cache=cache)
+        mock_preprocess.side_effect = lambda wav, **kwargs: wav
+        mock_encoder.embed_utterance.return_value = np.array([0.9, 0.1, 0.0])
+        segments = [
+            {"start": float(i), "end": i + 1.0, "sample_rate": 16000,
+             "wav": np.zeros(16000 if i else 0, dtype=np.float32),
+             "cache_key": EmbeddingCache.segment_key("video", float(i), i + 1.0, 16000, "m")}
+            for i in range(3)
+        ]
+
+        first = matcher.embed_segments(segments)
+        # 2回目は区間の波形がなくてもキーだけで引ける（無音の区間もゼロベクトルとして記録済み）
+        second = matcher.embed_segments([{**s, "wav": None} for s in segments])
+
+        assert mock_encoder.embed_utterance.call_count == 2
+        assert mock_preprocess.call_count == 3
+        np.testing.assert_array_almost_equal(first, second)
+        np.testing.assert_array_equal(second[0], 0.0)
+        assert cache.stats == {"hits": 3, "misses": 3}
+
+
+class TestReferenceMatrix:
+    def test_matrix_is_normalized_and_ordered(self, matcher):
+        matcher.reference_embeddings = {
+            "person_b": np.array([0.0, 2.0, 0.0]),
+            "person_a": np.array([3.0, 4.0, 0.0]),
+        }
+
+        matrix = matcher.reference_matrix
+
+        assert matcher.speaker_ids == ["person_b", "person_a"]
+        assert matrix.dtype == np.float32
+        assert matrix.flags["C_CONTIGUOUS"]
+        np.testing.assert_allclose(matrix, [[0.0, 1.0, 0.0], [0.6, 0.8, 0.0]], atol=1e-6)
+
+    def test_matrix_rebuilt_after_register(self, matcher, mock_encoder):
+        matcher.reference_embeddings = {"person_a": np.array([1.0, 0.0, 0.0])}
+        assert matcher.reference_matrix.shape == (1, 3)
+
+        with patch("src.audio.voice_matcher.preprocess_wav", return_value=np.zeros(16000)):
+            mock_encoder.embed_utterance.return_value = np.array([0.0, 1.0, 0.0])
+            matcher.register_speaker("person_b", ["b.wav"])
+
+        assert matcher.reference_matrix.shape == (2, 3)
+        assert matcher.speaker_ids == ["person_a", "person_b"]
+
+    def test_score_matrix(self, matcher):
+        matcher.reference_embeddings = {
+            "person_a": np.array([1.0, 0.0, 0.0]),
+            "person_b": np.array([0.0, 1.0, 0.0]),
+        }
+        embeddings = np.array([[2.0, 0.0, 0.0], [0.0, 0.0, 0.0], [1.0, 1.0, 0.0]])
+
+        scores = matcher.score_matrix(embeddings)
+
+        assert scores.shape == (3, 2)
+        assert scores.dtype == np.float32
+        np.testing.assert_allclose(scores[0], [1.0, 0.0], atol=1e-6)
+        np.testing.assert_allclose(scores[1], [0.0, 0.0])
+        np.testing.assert_allclose(scores[2], [0.70710677, 0.70710677], atol=1e-6)
+
+    def test_top_k(self, matcher):
+        matcher.reference_embeddings = {
+            f"person_{i}": np.eye(4)[i] for i in range(4)
+        }
+        query = np.array([[0.1, 0.7, 0.0, 0.3]])
+
+        top = matcher.top_k(query, k=2)
+
+        assert [sid for sid, _ in top[0]] == ["person_1", "person_3"]
+        assert top[0][0][1] > top[0][1][1]
+
+    @patch("src.audio.voice_matcher.preprocess_wav")
+    def test_compare_top_k(self, mock_preprocess, matcher, mock_encoder):
+        matcher.reference_embeddings = {
+            f"person_{i}": np.eye(4)[i] for i in range(4)
+        }
+        mock_preprocess.return_value = np.zeros(16000)
+        mock_encoder.embed_utterance.return_value = np.array([0.0, 0.2, 0.9, 0.0])
+
+        scores = matcher.compare("test.wav", top_k=1)
+
+        assert list(scores) == ["person_2"]
+
+
+class TestSpeakerIndexIntegration:
+    @patch("src.audio.voice_matcher.preprocess_wav")
+    def test_compare_top_k_uses_index(self, mock_preprocess, matcher, mock_encoder, tmp_path):
+        matcher.reference_embeddings = {
+            f"person_{i}": np.eye(8)[i] for i in range(8)
+        }
+        index = matcher.build_index(n_lists=4, path=tmp_path / "refs.index.npz")
+        assert matcher.index is index
+
+        mock_preprocess.return_value = np.zeros(16000)
+        mock_encoder.embed_utterance.return_value = np.eye(8)[3]
+
+        assert list(matcher.compare("test.wav", top_k=1)) == ["person_3"]
+        speaker, score = matcher.identify("test.wav")
+        assert speaker == "person_3"
+        assert score == pytest.approx(1.0)
+
+    def test_saved_index_reused(self, matcher, tmp_path):
+        matcher.reference_embeddings = {
+            f"person_{i}": np.eye(8)[i] for i in range(8)
+        }
+        path = tmp_path / "refs.index.npz"
+        built = matcher.build_index(path=path)
+
+        matcher.reference_embeddings = dict(matcher.reference_embeddings)
+        assert matcher.index is None
+        reused = matcher.build_index(path=path)
+
+        assert reused is not built
+        assert reused.checksum == built.checksum
+
+
+class TestRegisterFromStore:
+    @patch("src.audio.voice_matcher.preprocess_wav")
+    def test_second_start_reuses_store(self, mock_preprocess, matcher, mock_encoder, tmp_path):
+        ref = tmp_path / "reference_voices"
+        (ref / "person_a").mkdir(parents=True)
+        (ref / "person_a" / "ref.wav").write_bytes(b"voice")
+        mock_preprocess.return_value = np.zeros(16000)
+        mock_encoder.embed_utterance.return_value = np.array([1.0, 0.0, 0.0])
+
+        matcher.register_speakers_from_store(str(ref))
+        assert mock_encoder.embed_utterance.call_count == 1
+        assert (tmp_path / "reference_voices.resemblyzer.npz").exists()
+
+        fresh = VoiceMatcher(threshold=0.75)
+        fresh.register_speakers_from_store(str(ref))
+
+        assert mock_encoder.embed_utterance.call_count == 1
+        np.testing.assert_allclose(fresh.reference_embeddings["person_a"], [1.0, 0.0, 0.0])
+
+    @patch("src.audio.voice_matcher.preprocess_wav")
+    def test_shared_references(self, mock_preprocess, matcher, mock_encoder, tmp_path,
+                               monkeypatch):
+        monkeypatch.setattr("src.embedding_store.shared_memory_dir", lambda: tmp_path / "shm")
+        (tmp_path / "shm").mkdir()
+        ref = tmp_path / "reference_voices"
+        (ref / "person_a").mkdir(parents=True)
+        (ref / "person_a" / "ref.wav").write_bytes(b"voice")
+        mock_preprocess.return_value = np.zeros(16000)
+        mock_encoder.embed_utterance.return_value = np.array([2.0, 0.0, 0.0])
+
+        matcher.register_speakers_from_store(str(ref), shared=True)
+        fresh = VoiceMatcher(threshold=0.75)
+        fresh.register_speakers_from_store(str(ref), shared=True)
+
+        assert len(list((tmp_path / "shm").iterdir())) == 1
+        np.testing.assert_allclose(fresh.reference_matrix, [[1.0, 0.0, 0.0]])
+        assert not fresh.reference_matrix.flags.writeable
+        assert fresh._score(np.array([1.0, 0.0, 0.0])) == pytest.approx({"person_a": 1.0})
+
+        # 公開したプロセスが閉じると共有メモリから削除する（開いている側は読み続けられる）
+        fresh.close()
+        assert len(list((tmp_path / "shm").iterdir())) == 1
+        matcher.close()
+        assert list((tmp_path / "shm").iterdir()) == []
+        np.testing.assert_allclose(fresh.reference_matrix, [[1.0, 0.0, 0.0]])
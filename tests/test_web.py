@@ -149,6 +149,10 @@ class TestAPI:
         resp = client.get("/api/results/nonexistent.mp4")
         assert resp.status_code == 404
 
+    def test_result_detail_unknown_fingerprint(self, client):
+        resp = client.get("/api/results/test.mp4?fingerprint=unknown")
+        assert resp.status_code == 404
+
     def test_performers(self, client):
         resp = client.get("/api/performers")
         assert resp.status_code == 200
@@ -216,7 +220,6 @@ class TestAPI:
         monkeypatch.setattr(web_app, "VideoIngestor", lambda download_dir: mock_ingestor)
 
         mock_pipeline = MagicMock()
-        mock_pipeline._load_analyzed_names.return_value = set()
         mock_pipeline.analyze_video.return_value = {"video": "x.mp4"}
         mock_pipeline.setup.return_value = None
         monkeypatch.setattr(web_app, "AnalysisPipeline", lambda config_path: mock_pipeline)
@@ -301,3 +304,63 @@ class TestAPI:
         assert resp.status_code == 200
         data = resp.get_json()
         assert data["bytes_sent_total"] == 1000
+
+    def test_ingest_run_with_workers(self, client, monkeypatch):
+        monkeypatch.setattr(web_app.os, "cpu_count", lambda: 8)
+        monkeypatch.setattr(web_app, "run_preflight", lambda check_gpu_available=False: None)
+        monkeypatch.setattr(web_app, "VideoIngestor", lambda download_dir: MagicMock())
+        monkeypatch.setattr(
+            web_app, "collect_video_files",
+            lambda download_dir: {Path("/tmp/b.mp4"), Path("/tmp/a.mp4")},
+        )
+        monkeypatch.setattr(web_app, "save_results", lambda results, output, fmt="both": [])
+        monkeypatch.setattr(web_app, "append_csv_log", lambda results, output_path: Path(output_path))
+
+        pool = MagicMock()
+        pool.__enter__.return_value = pool
+        pool.map.side_effect = lambda videos: [{"video": v.name} for v in videos]
+        pool_cls = MagicMock(return_value=pool)
+        monkeypatch.setattr(web_app, "WorkerPool", pool_cls)
+        monkeypatch.setattr(web_app, "AnalysisPipeline", MagicMock(side_effect=AssertionError))
+
+        resp = client.post(
+            "/api/ingest/run",
+            json={"magnets": "magnet:?xt=urn:btih:AAAA", "download_dir": "/tmp",
+                  "output_dir": "/tmp", "skip_analyzed": False, "workers": 4},
+        )
+
+        assert resp.status_code == 200
+        assert resp.get_json()["analyzed_count"] == 2
+        assert pool_cls.call_args.kwargs["workers"] == 4
+        assert pool.map.call_args[0][0] == [Path("/tmp/a.mp4"), Path("/tmp/b.mp4")]
+
+    @pytest.mark.parametrize("workers", [500, 9, -1])
+    def test_ingest_run_rejects_worker_count_out_of_range(self, client, monkeypatch, workers):
+        monkeypatch.setattr(web_app.os, "cpu_count", lambda: 8)
+        pool_cls = MagicMock(side_effect=AssertionError)
+        monkeypatch.setattr(web_app, "WorkerPool", pool_cls)
+        monkeypatch.setattr(web_app, "VideoIngestor", MagicMock(side_effect=AssertionError))
+
+        resp = client.post(
+            "/api/ingest/run",
+            json={"magnets": "magnet:?xt=urn:btih:AAAA", "workers": workers},
+        )
+
+        assert resp.status_code == 400
+        assert "1〜8" in resp.get_json()["error"]
+        pool_cls.assert_not_called()
+
+    def test_ingest_run_worker_limit_from_config(self, app_with_data, monkeypatch):
+        config_path = app_with_data.config["CONFIG_PATH"]
+        with open(config_path, encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        config["web"] = {"max_workers": 2}
+        with open(config_path, "w", encoding="utf-8") as f:
+            yaml.dump(config, f, allow_unicode=True)
+        monkeypatch.setattr(web_app.os, "cpu_count", lambda: 64)
+
+        resp = app_with_data.test_client().post(
+            "/api/ingest/run", json={"magnets": "magnet:?xt=urn:btih:AAAA", "workers": 3})
+
+        assert resp.status_code == 400
+        assert "1〜2" in resp.get_json()["error"]
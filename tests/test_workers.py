@@ -0,0 +1,140 @@
+"""並列解析ワーカーのテスト"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+import yaml
+
+from src.pipeline import VideoAnalysisResult
+from src.workers import WorkerPool, default_torch_threads
+
+
+class TestDefaultTorchThreads:
+    def test_cores_split_between_workers(self):
+        assert default_torch_threads(4, cpu_count=32) == 8
+        assert default_torch_threads(3, cpu_count=32) == 10
+
+    def test_at_least_one(self):
+        assert default_torch_threads(64, cpu_count=32) == 1
+
+
+class _FakePipeline:
+    """動画名の数字だけ待ってから結果を返す擬似パイプライン"""
+    instances = 0
+
+    def __init__(self, config_path, mode=None):
+        type(self).instances += 1
+
+    def setup(self, enable_visual=False, hf_token=None):
+        pass
+
+    def close(self):
+        pass
+
+    def analyze_video(self, video_path):
+        name = os.path.basename(video_path)
+        if name.startswith("broken"):
+            raise RuntimeError("decode failed")
+        time.sleep(int(name.split(".")[0]) * 0.02)
+        return VideoAnalysisResult(video_path=video_path, video_name=name, duration=1.0)
+
+
+def _init_crash_test(*initargs):
+    """_init_worker の代わり: パイプラインは作らず、解析開始の通知先だけ受け取る"""
+    import src.workers as workers
+
+    workers._started = initargs[-1]
+
+
+def _crash_or_finish(index, video_path):
+    """"crash" を含む動画ではワーカープロセスごと落ちる（OOM・segfault の代わり）"""
+    import src.workers as workers
+
+    workers._mark_started(index)
+    if "crash" in video_path:
+        os._exit(1)
+    name = os.path.basename(video_path)
+    return index, VideoAnalysisResult(video_path=video_path, video_name=name, duration=1.0)
+
+
+def _thread_executor(max_workers, mp_context, initializer, initargs):
+    return ThreadPoolExecutor(max_workers=max_workers, initializer=initializer,
+                              initargs=initargs)
+
+
+class TestWorkerPool:
+    @pytest.fixture(autouse=True)
+    def in_process_pool(self):
+        fake_torch = SimpleNamespace(set_num_threads=MagicMock())
+        _FakePipeline.instances = 0
+        with patch("src.workers.ProcessPoolExecutor", _thread_executor), \
+                patch("src.pipeline.AnalysisPipeline", _FakePipeline), \
+                patch.dict(sys.modules, {"torch": fake_torch}), \
+                patch.dict(os.environ):
+            yield fake_torch
+
+    def test_results_merged_in_input_order(self):
+        videos = ["5.mp4", "1.mp4", "3.mp4", "0.mp4"]
+        with WorkerPool("config.yaml", workers=2) as pool:
+            completion = [index for index, _ in pool.imap_unordered(videos)]
+            ordered = pool.map(videos)
+
+        assert sorted(completion) == [0, 1, 2, 3]
+        assert completion != [0, 1, 2, 3]
+        assert [r.video_name for r in ordered] == videos
+
+    def test_pipeline_initialised_once_per_worker(self, in_process_pool):
+        with WorkerPool("config.yaml", workers=2, torch_threads=3) as pool:
+            pool.map([f"{i % 2}.mp4" for i in range(8)])
+
+        assert _FakePipeline.instances == 2
+        in_process_pool.set_num_threads.assert_called_with(3)
+        assert os.environ["OMP_NUM_THREADS"] == "3"
+
+    def test_worker_error_becomes_result(self):
+        with WorkerPool("config.yaml", workers=2) as pool:
+            results = pool.map(["0.mp4", "broken.mp4"])
+
+        assert results[0].errors == []
+        assert results[1].video_name == "broken.mp4"
+        assert "decode failed" in results[1].errors[0]
+
+    def test_invalid_worker_count(self):
+        with pytest.raises(ValueError):
+            WorkerPool("config.yaml", workers=0)
+
+
+class TestWorkerPoolProcesses:
+    def test_spawned_workers_analyze_videos(self, tmp_path):
+        ref_dir = tmp_path / "reference_voices"
+        ref_dir.mkdir()
+        config_path = tmp_path / "config.yaml"
+        with open("config.yaml", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        config["paths"]["reference_voices"] = str(ref_dir)
+        config["analysis"] = {"mode": "targeted"}
+        config_path.write_text(yaml.dump(config, allow_unicode=True), encoding="utf-8")
+        videos = [tmp_path / "a.mp4", tmp_path / "b.mp4", tmp_path / "c.mp4"]
+
+        with WorkerPool(config_path, workers=2) as pool:
+            results = pool.map(videos)
+
+        # 動画が存在しないので各ワーカーのパイプラインがエラー付きの結果を返す
+        assert [r.video_name for r in results] == ["a.mp4", "b.mp4", "c.mp4"]
+        assert all(r.errors for r in results)
+
+    def test_crashed_worker_fails_only_its_video(self):
+        videos = ["0.mp4", "crash.mp4", "2.mp4", "3.mp4", "crash2.mp4", "5.mp4"]
+        with patch("src.workers._init_worker", _init_crash_test), \
+                patch("src.workers._analyze_in_worker", _crash_or_finish), \
+                WorkerPool("config.yaml", workers=1) as pool:
+            results = pool.map(videos)
+
+        assert [r.video_name for r in results] == videos
+        assert [bool(r.errors) for r in results] == [False, True, False, False, True, False]
+        assert "ワーカーエラー" in results[1].errors[0]